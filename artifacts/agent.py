@@ -0,0 +1,61 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Runs the long-running edge agent of the Home Assistant component, which applies config-only updates and
+watches the configuration secret for changes.
+
+The Startup lifecycle step starts the agent in the background once Home Assistant is ready, because the
+component has no Run lifecycle step. The agent runs until it is sent SIGTERM, as the Shutdown lifecycle
+step does. The agent exits with an error if it is not given the core device thing name, which the
+configuration topics it subscribes to are named by.
+
+Example execution:
+python3 agent.py --thing-name MyCoreDeviceThingName
+python3 agent.py --secret-arn arn:aws:secretsmanager:REGION:ACCOUNT:secret:greengrass-home-assistant-ID
+python3 agent.py --url https://localhost:8123/
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+from awsiot.greengrasscoreipc.clientv2 import GreengrassCoreIPCClientV2
+from config_sync import ConfigSync
+from health import URL
+from secret import MAX_STALENESS_SECONDS
+from secret_watcher import DEFAULT_POLL_INTERVAL, SecretWatcher
+
+parser = argparse.ArgumentParser(description='Run the Home Assistant edge agent')
+parser.add_argument('--thing-name', default=os.environ.get('AWS_IOT_THING_NAME'), help='Core device thing name')
+parser.add_argument('--secret-arn', help='Configuration secret to watch for changes')
+parser.add_argument('--secret-poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                    help='Seconds between polls of the configuration secret, or 0 to not watch it')
+parser.add_argument('--secret-max-staleness', type=float, default=MAX_STALENESS_SECONDS,
+                    help='Seconds for which the locally stored secret may be used while it cannot be refreshed')
+parser.add_argument('--url', default=URL, help='Home Assistant HTTP endpoint to call reload services at')
+args = parser.parse_args()
+
+if not args.thing_name:
+    print('No core device thing name. Pass --thing-name, or set AWS_IOT_THING_NAME.', file=sys.stderr)
+    sys.exit(1)
+
+stopped = threading.Event()
+signal.signal(signal.SIGTERM, lambda signal_number, frame: stopped.set())
+
+ipc_client = GreengrassCoreIPCClientV2()
+config_sync = ConfigSync(ipc_client, args.thing_name)
+config_sync.url = args.url
+config_sync.subscribe()
+
+if args.secret_arn and args.secret_poll_interval > 0:
+    watcher = SecretWatcher(ipc_client, args.secret_arn, args.secret_poll_interval)
+    watcher.url = args.url
+    watcher.max_staleness = args.secret_max_staleness
+    threading.Thread(target=watcher.run, args=(stopped,), daemon=True).start()
+
+print('Agent is running')
+stopped.wait()
+print('Agent stopped')
+ipc_client.close()
@@ -0,0 +1,56 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Stops the edge agent (agent.py) of the Home Assistant component on the Greengrass edge runtime.
+
+The process ID of the agent is kept in agent.pid. The file can outlive the agent, such as after a crash or
+a reboot, and its process ID can then belong to an unrelated process. So the process is only sent SIGTERM
+if its command line in /proc shows that it is still running agent.py.
+
+This module uses only the standard library.
+"""
+
+import os
+import signal
+
+AGENT_PID_FILE = 'agent.pid'
+AGENT_SCRIPT = 'agent.py'
+
+def is_agent(pid):
+    """ Determines whether a process is running the agent script, from its command line """
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as cmdline_file:
+            arguments = cmdline_file.read().split(b'\0')
+    except OSError:
+        return False
+
+    return any(os.path.basename(argument.decode('utf-8', 'replace')) == AGENT_SCRIPT for argument in arguments)
+
+def stop_agent():
+    """
+    Stops the agent recorded in the process ID file, if it is still running, and removes the file. Gets whether
+    the agent was stopped.
+    """
+    try:
+        with open(AGENT_PID_FILE, encoding='utf-8') as pid_file:
+            pid = int(pid_file.read())
+    except (OSError, ValueError):
+        return False
+
+    stopped = False
+    if is_agent(pid):
+        try:
+            os.kill(pid, signal.SIGTERM)
+            stopped = True
+        except OSError:
+            pass
+    else:
+        print(f'Process {pid} in {AGENT_PID_FILE} is not the agent. Not stopping it.')
+
+    try:
+        os.remove(AGENT_PID_FILE)
+    except OSError:
+        pass
+
+    return stopped
@@ -0,0 +1,88 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Prepares the Python virtual environment of the Home Assistant component on the Greengrass edge runtime.
+
+The virtual environment lives in the component work directory, so it survives from one component version
+to the next. It is reused as is when the hash of the requirements, the Python version and the machine
+architecture match those it was built for. Otherwise it is rebuilt from the wheelhouse shipped in the
+artifacts, without reaching PyPI, falling back to PyPI if the wheelhouse lacks a suitable wheel.
+
+This script uses only the standard library, as it runs before the virtual environment exists.
+
+Example execution:
+python3 bootstrap_venv.py venv requirements.txt wheelhouse
+"""
+
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+MARKER_FILE = '.requirements.json'
+
+def requirements_hash(requirements_file):
+    """ Gets the hash of the requirements, the Python version and the machine architecture """
+    with open(requirements_file, 'rb') as requirements:
+        digest = hashlib.sha256(requirements.read())
+    digest.update(f'{platform.python_implementation()} {sys.version_info[0]}.{sys.version_info[1]} '
+                  f'{platform.machine()}'.encode('utf-8'))
+    return digest.hexdigest()
+
+def load_marker(venv_directory):
+    """ Loads the record of the requirements the virtual environment was built for """
+    try:
+        with open(os.path.join(venv_directory, MARKER_FILE), encoding='utf-8') as marker:
+            return json.load(marker)
+    except (OSError, ValueError):
+        return {}
+
+def build_venv(venv_directory, requirements_file, wheelhouse_directory):
+    """ Creates the virtual environment and installs the requirements, offline if possible """
+    subprocess.run([sys.executable, '-m', 'venv', '--clear', venv_directory], check=True)
+    pip = [os.path.join(venv_directory, 'bin', 'python'), '-m', 'pip', 'install', '--disable-pip-version-check']
+
+    if os.path.isdir(wheelhouse_directory):
+        try:
+            print(f'Installing requirements offline from {wheelhouse_directory}')
+            subprocess.run(pip + ['--no-index', '--find-links', wheelhouse_directory, '-r', requirements_file],
+                           check=True)
+            return 'wheelhouse'
+        except subprocess.CalledProcessError:
+            print('The wheelhouse lacks a wheel for this core. Falling back to PyPI.')
+
+    print('Installing requirements from PyPI')
+    subprocess.run(pip + ['-r', requirements_file], check=True)
+    return 'PyPI'
+
+
+venv_dir = sys.argv[1] if len(sys.argv) > 1 else 'venv'
+requirements_filename = sys.argv[2] if len(sys.argv) > 2 else 'requirements.txt'
+wheelhouse_dir = sys.argv[3] if len(sys.argv) > 3 else 'wheelhouse'
+
+snapshot = time.monotonic()
+expected_hash = requirements_hash(requirements_filename)
+marker_record = load_marker(venv_dir)
+
+if marker_record.get('requirementsHash') == expected_hash and\
+        os.path.isfile(os.path.join(venv_dir, 'bin', 'python')):
+    elapsed = time.monotonic() - snapshot
+    print(f'Reusing the virtual environment, as the requirements are unchanged. Took {elapsed:.2f} seconds, '
+          f'saving about {marker_record["installSeconds"] - elapsed:.1f} seconds.')
+else:
+    try:
+        source = build_venv(venv_dir, requirements_filename, wheelhouse_dir)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f'Failed to prepare the virtual environment\nException: {e}', file=sys.stderr)
+        sys.exit(1)
+
+    install_seconds = time.monotonic() - snapshot
+    with open(os.path.join(venv_dir, MARKER_FILE), 'w', encoding='utf-8') as marker_file:
+        json.dump({'requirementsHash': expected_hash, 'installSeconds': round(install_seconds, 2),
+                   'source': source}, marker_file)
+
+    print(f'Built the virtual environment from {source} in {install_seconds:.1f} seconds')
@@ -0,0 +1,150 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Applies config-only updates, published by sync_config.py, to the Home Assistant configuration directory.
+
+A config delta arrives as an MQTT message on the homeassistant/THING_NAME/config topic, through Greengrass
+IPC. It holds the changed files in the envelope format of the configuration secret, the removed files and,
+unless forced, the hash of each file that it expects to replace. If any file on disk differs from what the
+delta expects, such as an automation edited in the Home Assistant UI, nothing is applied. Otherwise every
+file is written atomically, and if any write fails, the files already written are restored. Home Assistant
+then reloads the changed files. Deltas are applied in sequence, so a redelivered delta is ignored.
+
+The outcome of each delta is published on the homeassistant/THING_NAME/config/result topic.
+"""
+
+import json
+import os
+import time
+import traceback
+from awsiot.greengrasscoreipc.model import QOS
+
+try:
+    from envelope import unpack
+    from files import check_filename, content_hash, write_atomic
+    from health import URL
+    from home_assistant import reload
+except ImportError:  # Imported as part of the artifacts package, as by the unit tests
+    from artifacts.envelope import unpack
+    from artifacts.files import check_filename, content_hash, write_atomic
+    from artifacts.health import URL
+    from artifacts.home_assistant import reload
+
+TOPIC_FORMAT = 'homeassistant/{}/config'
+RESULT_TOPIC_FORMAT = 'homeassistant/{}/config/result'
+STATE_FILE = 'config_sync.json'
+CONFIG_DIRECTORY = 'config'
+SUPPORTED_DELTA_VERSIONS = [1]
+
+class ConfigConflict(Exception):
+    """ Files on disk differ from those that a config delta expects to replace """
+
+class ConfigSync():
+    """ Subscribes to config deltas for a core device, and applies them to the configuration directory """
+
+    def __init__(self, ipc_client, thing_name, config_directory=CONFIG_DIRECTORY, state_file=STATE_FILE):
+        self.ipc_client = ipc_client
+        self.thing_name = thing_name
+        self.config_directory = config_directory
+        self.state_file = state_file
+        # The Home Assistant URL to call reload services at, which the agent sets from its configuration
+        self.url = URL
+
+    def subscribe(self):
+        """ Subscribes to the config deltas of the core device """
+        topic = TOPIC_FORMAT.format(self.thing_name)
+        print(f'Subscribing to config deltas on {topic}')
+        self.ipc_client.subscribe_to_iot_core(topic_name=topic, qos=QOS.AT_LEAST_ONCE,
+                                              on_stream_event=self.on_message)
+
+    def on_message(self, event):
+        """ Applies the config delta of a message, and publishes the outcome """
+        try:
+            result = self.apply(json.loads(event.message.payload))
+        except ConfigConflict as e:
+            print(f'Config delta conflicts with the configuration on disk: {e}')
+            result = {'status': 'conflict', 'error': str(e)}
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            traceback.print_exc()
+            result = {'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+
+        self.ipc_client.publish_to_iot_core(topic_name=RESULT_TOPIC_FORMAT.format(self.thing_name),
+                                            qos=QOS.AT_LEAST_ONCE, payload=json.dumps(result).encode('utf-8'))
+
+    def apply(self, delta):
+        """ Applies a config delta, and gets its outcome """
+        start = time.monotonic()
+        if delta.get('configDeltaVersion') not in SUPPORTED_DELTA_VERSIONS:
+            raise ValueError(f'Unsupported config delta version {delta.get("configDeltaVersion")}')
+
+        state = self.load_state()
+        if delta['sequence'] <= state.get('sequence', 0):
+            print(f'Ignoring config delta {delta["sequence"]}, as delta {state["sequence"]} is already applied')
+            return {'status': 'ignored', 'sequence': delta['sequence']}
+
+        files, modes = unpack(delta['envelope'])
+        removed = [filename for filename in delta.get('removed', []) if filename not in files]
+        for filename in list(files) + removed:
+            check_filename(filename)
+
+        if 'base' in delta:
+            conflicts = [filename for filename in list(files) + removed
+                         if self.current_hash(filename) != delta['base'].get(filename)]
+            if conflicts:
+                raise ConfigConflict(', '.join(sorted(conflicts)))
+
+        print(f'Applying config delta {delta["sequence"]}: {len(files)} changed and {len(removed)} removed files')
+        self.write(files, modes, removed)
+        self.save_state({'sequence': delta['sequence'], 'applied': time.time()})
+
+        actions = reload(list(files) + removed, delta.get('restart', False),
+                         os.path.join(self.config_directory, 'secrets.yaml'), self.url)
+
+        return {'status': 'applied', 'sequence': delta['sequence'], 'written': sorted(files), 'removed': removed,
+                'actions': actions, 'durationMs': round((time.monotonic() - start) * 1000)}
+
+    def write(self, files, modes, removed):
+        """ Writes and removes files atomically, restoring the files already changed if any change fails """
+        originals = []
+
+        try:
+            for filename in list(files) + removed:
+                path = os.path.join(self.config_directory, filename)
+                original = None
+                if os.path.isfile(path):
+                    with open(path, 'rb') as file:
+                        original = (file.read(), os.stat(path).st_mode & 0o777)
+                originals.append((path, original))
+
+                if filename in files:
+                    write_atomic(path, files[filename], modes.get(filename, 0o644))
+                elif original is not None:
+                    os.remove(path)
+        except BaseException:
+            for path, original in reversed(originals):
+                if original is not None:
+                    write_atomic(path, *original)
+                elif os.path.isfile(path):
+                    os.remove(path)
+            raise
+
+    def current_hash(self, filename):
+        """ Gets the hash of a file in the configuration directory, or None if it does not exist """
+        try:
+            with open(os.path.join(self.config_directory, filename), 'rb') as file:
+                return content_hash(file.read())
+        except FileNotFoundError:
+            return None
+
+    def load_state(self):
+        """ Loads the record of the last config delta applied """
+        try:
+            with open(self.state_file, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self, state):
+        """ Saves the record of the last config delta applied """
+        write_atomic(self.state_file, json.dumps(state).encode('utf-8'))
@@ -0,0 +1,90 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unpacks the files of the Home Assistant configuration secret. Understands both the versioned envelope
+format and the older flat {filename: contents} format. A large configuration is split into shard secrets,
+listed by an index in the Home Assistant secret, and is reassembled before unpacking.
+"""
+
+import base64
+import hashlib
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SUPPORTED_ENVELOPE_VERSIONS = [1]
+SUPPORTED_SHARDED_VERSIONS = [1]
+
+def is_shard_index(secret_json):
+    """ Determines whether the secret is the index of a configuration split into shard secrets """
+    return 'shardedVersion' in secret_json and isinstance(secret_json.get('shards'), list)
+
+def reassemble(index, shard_strings):
+    """ Joins the shards listed by the index, verifying their hashes, and gets the configuration secret """
+    if index['shardedVersion'] not in SUPPORTED_SHARDED_VERSIONS:
+        raise ValueError(f'Unsupported secret sharded version {index["shardedVersion"]}')
+    if len(shard_strings) != len(index['shards']):
+        raise ValueError(f'Expected {len(index["shards"])} shards, but got {len(shard_strings)}')
+
+    for shard, shard_string in zip(index['shards'], shard_strings):
+        if content_hash(shard_string) != shard['sha256']:
+            raise ValueError(f'Shard {shard["name"]} does not match its hash in the index')
+
+    secret_string = ''.join(shard_strings)
+    if content_hash(secret_string) != index['sha256']:
+        raise ValueError('Reassembled secret does not match its hash in the index')
+
+    print(f'Reassembled secret of {len(secret_string)} characters from {len(shard_strings)} shards')
+    return json.loads(secret_string)
+
+def content_hash(secret_string):
+    """ Gets the SHA-256 hash of secret content """
+    return hashlib.sha256(secret_string.encode('utf-8')).hexdigest()
+
+def is_envelope(secret_json):
+    """ Determines whether the secret is in the envelope format, rather than the flat format """
+    return 'envelopeVersion' in secret_json and isinstance(secret_json.get('files'), dict)
+
+def unpack(secret_json):
+    """ Gets the files of the secret as a dictionary of filename to data, and a dictionary of filename to mode """
+    if not is_envelope(secret_json):
+        return {filename: contents.encode('utf-8') for filename, contents in secret_json.items()}, {}
+
+    if secret_json['envelopeVersion'] not in SUPPORTED_ENVELOPE_VERSIONS:
+        raise ValueError(f'Unsupported secret envelope version {secret_json["envelopeVersion"]}')
+
+    files = {}
+    modes = {}
+
+    for filename, entry in secret_json['files'].items():
+        if entry['encoding'] == 'text':
+            data = entry['data'].encode('utf-8')
+        elif entry['encoding'] == 'base64':
+            data = base64.b64decode(entry['data'])
+        else:
+            raise ValueError(f'Unknown encoding {entry["encoding"]} for {filename}')
+
+        files[filename] = decompress(data, entry.get('compression', 'none'), filename)
+
+        if 'mode' in entry:
+            modes[filename] = entry['mode']
+
+    return files, modes
+
+def decompress(data, compression, filename):
+    """ Decompresses data with the given algorithm """
+    if compression == 'none':
+        return data
+    if compression == 'zlib':
+        return zlib.decompress(data)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError(f'{filename} is zstd compressed, but the zstandard package is not installed')
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    raise ValueError(f'Unknown compression {compression} for {filename}')
@@ -0,0 +1,125 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Materializes files on disk incrementally. A manifest of content hashes records what was last written,
+so that only files whose content differs are written. Writes are atomic, and files that are no longer
+wanted are removed. Also keeps bounded records in JSON Lines files.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+MANIFEST_FILE = '.greengrass_manifest.json'
+LAYER_MANIFEST_FORMAT = '.layer_{}_manifest.json'
+MAX_RECORDS = 100
+DEFAULT_MODE = 0o644
+
+def materialize(files, modes=None, manifest_file=MANIFEST_FILE, directory='.', keep=None):
+    """
+    Creates the files, given as a dictionary of relative filename to contents, in the directory.
+    File modes can be given as a dictionary of relative filename to mode. Files that are no longer wanted
+    are removed, except for those in keep, such as those now materialized with another manifest.
+    Returns the counts of files and bytes written and skipped, and of files removed.
+    """
+    modes = modes or {}
+    keep = keep or set()
+    manifest_file = os.path.join(directory, manifest_file)
+    manifest = load_manifest(manifest_file)
+    new_manifest = {}
+    stats = {'written': 0, 'writtenBytes': 0, 'skipped': 0, 'skippedBytes': 0, 'removed': 0}
+
+    for filename, contents in files.items():
+        check_filename(filename)
+        path = os.path.join(directory, filename)
+        data = contents.encode('utf-8') if isinstance(contents, str) else contents
+        digest = content_hash(data)
+        new_manifest[filename] = digest
+
+        mode = modes.get(filename, DEFAULT_MODE)
+
+        if manifest.get(filename) == digest and os.path.isfile(path):
+            if os.stat(path).st_mode & 0o777 != mode:
+                os.chmod(path, mode)
+            stats['skipped'] += 1
+            stats['skippedBytes'] += len(data)
+            continue
+
+        print(f'Creating {filename}')
+        write_atomic(path, data, mode)
+        stats['written'] += 1
+        stats['writtenBytes'] += len(data)
+
+    for filename in manifest:
+        if filename not in new_manifest and filename not in keep and os.path.isfile(os.path.join(directory, filename)):
+            print(f'Removing {filename}')
+            os.remove(os.path.join(directory, filename))
+            stats['removed'] += 1
+
+    if new_manifest != manifest:
+        save_manifest(manifest_file, new_manifest)
+
+    print(f'Wrote {stats["written"]} files ({stats["writtenBytes"]} bytes), '
+          f'skipped {stats["skipped"]} unchanged files ({stats["skippedBytes"]} bytes), '
+          f'removed {stats["removed"]} files')
+
+    return stats
+
+def check_filename(filename):
+    """ Rejects filenames that would be created outside the current directory """
+    normalized = os.path.normpath(filename)
+    if os.path.isabs(normalized) or normalized == '..' or normalized.startswith('..' + os.sep):
+        raise ValueError(f'Refusing to create {filename} outside the configuration directory')
+
+def content_hash(data):
+    """ Gets the SHA-256 hash of file content """
+    return hashlib.sha256(data).hexdigest()
+
+def load_manifest(manifest_file):
+    """ Loads the manifest of the files last written """
+    if not os.path.exists(manifest_file):
+        return {}
+
+    try:
+        with open(manifest_file, encoding="utf-8") as file:
+            return json.load(file)
+    except ValueError:
+        print(f'Ignoring corrupt manifest {manifest_file}')
+        return {}
+
+def save_manifest(manifest_file, manifest):
+    """ Saves the manifest of the files written """
+    write_atomic(manifest_file, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+def load_records(record_file_name):
+    """ Loads the records in a JSON Lines file """
+    try:
+        with open(record_file_name, encoding='utf-8') as record_file:
+            return [json.loads(line) for line in record_file if line.strip()]
+    except (OSError, ValueError):
+        return []
+
+def append_record(record_file_name, record, limit=MAX_RECORDS):
+    """ Appends a record to a JSON Lines file, keeping only the most recent records """
+    records = (load_records(record_file_name) + [record])[-limit:]
+    write_atomic(record_file_name, ''.join(json.dumps(entry) + '\n' for entry in records).encode('utf-8'))
+
+def write_atomic(filename, data, mode=DEFAULT_MODE):
+    """ Writes a file atomically, by writing a temporary file in the same directory and renaming it """
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    file_descriptor, temp_filename = tempfile.mkstemp(dir=directory or '.', prefix='.tmp-')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(temp_filename, mode)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        os.remove(temp_filename)
+        raise
@@ -0,0 +1,105 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Checks the health of the Home Assistant container on the Greengrass edge runtime.
+
+Home Assistant is ready when its container is running, and healthy if the image defines a health check,
+and its HTTP server responds. Readiness is polled with exponential backoff until a deadline. The URL of the
+HTTP server is set by the homeAssistantUrl configuration parameter, which is https for a server with its own
+SSL certificate.
+
+This module uses only the standard library.
+"""
+
+import json
+import ssl
+import subprocess
+import time
+import urllib.error
+import urllib.request
+
+CONTAINER_NAME = 'homeassistant'
+STARTUP_RECORD_FILE = 'startup.jsonl'
+URL = 'http://localhost:8123/'
+# The Timeout of the Startup lifecycle step in recipe.yaml, and the time kept within it for the work after Home
+# Assistant is ready
+STARTUP_STEP_TIMEOUT = 900
+STARTUP_STEP_MARGIN = 60
+MAX_STARTUP_TIMEOUT = STARTUP_STEP_TIMEOUT - STARTUP_STEP_MARGIN
+BACKOFF_INITIAL_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 10
+REQUEST_TIMEOUT_SECONDS = 5
+
+def container_state(name=CONTAINER_NAME):
+    """
+    Gets the status of a container, its health if its image defines a health check, its restart count
+    and its image ID. Gets None if there is no such container.
+    """
+    try:
+        result = subprocess.run(['docker', 'inspect', name], check=True, capture_output=True, text=True)
+        container = json.loads(result.stdout)[0]
+    except (OSError, subprocess.CalledProcessError, ValueError, IndexError):
+        return None
+
+    state = container.get('State', {})
+    return {'status': state.get('Status'), 'health': (state.get('Health') or {}).get('Status'),
+            'restarts': container.get('RestartCount', 0), 'image': container.get('Image')}
+
+def container_ready(state):
+    """ Determines whether a container is running, and healthy if it has a health check """
+    return state is not None and state['status'] == 'running' and state['health'] in (None, 'healthy')
+
+def local_ssl_context():
+    """
+    Gets the SSL context for requests to the local Home Assistant server. Its certificate is issued for the
+    server's public name, or is self-signed, and the server is reached on localhost, so it is not verified.
+    """
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+def http_ready(url=URL):
+    """ Determines whether the Home Assistant HTTP server responds to a request, with anything but a server error """
+    try:
+        with urllib.request.urlopen(url, timeout=REQUEST_TIMEOUT_SECONDS, context=local_ssl_context()) as response:
+            return response.status < 500
+    except urllib.error.HTTPError as e:
+        # An authentication or not found error still shows that the server is up
+        return e.code < 500
+    except (urllib.error.URLError, OSError):
+        return False
+
+def wait_until_ready(timeout, url=URL, name=CONTAINER_NAME):
+    """
+    Polls the container and the HTTP server, with exponential backoff, until both are ready or the timeout
+    in seconds expires. Gets whether Home Assistant became ready, the seconds taken for the container and
+    for the HTTP server to become ready, the number of polls, and the container's restart count and image.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    delay = BACKOFF_INITIAL_SECONDS
+    result = {'ready': False, 'containerSeconds': None, 'httpSeconds': None, 'polls': 0, 'restarts': 0, 'image': None}
+
+    while True:
+        result['polls'] += 1
+        state = container_state(name)
+        if state:
+            result['restarts'], result['image'] = state['restarts'], state['image']
+
+        if result['containerSeconds'] is None and container_ready(state):
+            result['containerSeconds'] = time.monotonic() - start
+            print(f'Container {name} is running after {result["containerSeconds"]:.1f} seconds')
+
+        if result['containerSeconds'] is not None and container_ready(state) and http_ready(url):
+            result['httpSeconds'] = time.monotonic() - start
+            result['ready'] = True
+            return result
+
+        if time.monotonic() + delay > deadline:
+            print(f'Container {name} state after {time.monotonic() - start:.1f} seconds: {state}')
+            return result
+
+        time.sleep(delay)
+        delay = min(delay * 2, BACKOFF_MAX_SECONDS)
@@ -0,0 +1,97 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Reloads Home Assistant after its configuration files change, without restarting the container.
+
+Each changed file is mapped to the Home Assistant service that reloads it: the reload service of its
+integration for the files that the UI editors manage, homeassistant.reload_all for other YAML files, and
+homeassistant.restart for anything else, such as certificates. Services are called through the Home
+Assistant REST API, with the long-lived access token in the greengrass_access_token entry of secrets.yaml.
+Without a token, or if a service call fails, the container is restarted instead.
+
+This module uses only the standard library.
+"""
+
+import json
+import re
+import subprocess
+import urllib.request
+
+try:
+    from health import CONTAINER_NAME, URL, local_ssl_context
+except ImportError:  # Imported as part of the artifacts package, as by the unit tests
+    from artifacts.health import CONTAINER_NAME, URL, local_ssl_context
+
+SECRETS_FILE = 'config/secrets.yaml'
+TOKEN_SECRET = 'greengrass_access_token'
+REQUEST_TIMEOUT_SECONDS = 60
+RELOAD_SERVICES = {
+    'automations.yaml': 'automation.reload',
+    'scripts.yaml': 'script.reload',
+    'scenes.yaml': 'scene.reload',
+    'groups.yaml': 'group.reload',
+    'customize.yaml': 'homeassistant.reload_core_config'
+}
+RELOAD_ALL = 'homeassistant.reload_all'
+RESTART = 'homeassistant.restart'
+
+def reload_services(filenames, restart=False):
+    """ Gets the services that reload the changed files, in the order to call them """
+    services = set()
+
+    for filename in filenames:
+        if filename in RELOAD_SERVICES:
+            services.add(RELOAD_SERVICES[filename])
+        elif filename.endswith(('.yaml', '.yml')):
+            services.add(RELOAD_ALL)
+        else:
+            services.add(RESTART)
+
+    # A restart or a full reload covers everything else
+    if restart or RESTART in services:
+        return [RESTART]
+    return [RELOAD_ALL] if RELOAD_ALL in services else sorted(services)
+
+def read_token(secrets_file=SECRETS_FILE):
+    """ Gets the access token from secrets.yaml, or None if there is none. Avoids needing a YAML parser. """
+    try:
+        with open(secrets_file, encoding='utf-8') as file:
+            match = re.search(rf'^{TOKEN_SECRET}:\s*["\']?([^"\'\s#]+)', file.read(), re.MULTILINE)
+    except OSError:
+        return None
+
+    return match.group(1) if match else None
+
+def call_service(service, token, url=URL):
+    """ Calls a Home Assistant service, such as automation.reload, raising OSError if the call fails """
+    domain, name = service.split('.', 1)
+    request = urllib.request.Request(f'{url.rstrip("/")}/api/services/{domain}/{name}', data=b'{}', method='POST',
+                                     headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'})
+
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_SECONDS, context=local_ssl_context()) as response:
+        json.loads(response.read() or b'[]')
+
+def reload(filenames, restart=False, secrets_file=SECRETS_FILE, url=URL):
+    """ Reloads Home Assistant for the changed files, and gets the actions taken """
+    services = reload_services(filenames, restart)
+    token = read_token(secrets_file)
+    actions = []
+
+    if not services:
+        return actions
+
+    if token:
+        try:
+            for service in services:
+                print(f'Calling {service}')
+                call_service(service, token, url)
+                actions.append(service)
+            return actions
+        except (OSError, ValueError) as e:
+            print(f'Failed to call {service}. Restarting the container instead.\nException: {e}')
+    else:
+        print(f'There is no {TOKEN_SECRET} in secrets.yaml. Restarting the container instead of reloading.')
+
+    subprocess.run(['docker', 'restart', CONTAINER_NAME], check=True)
+    return actions + ['docker restart']
@@ -4,33 +4,49 @@
 """
 Initializes and installs the Home Assistant component on the Greengrass edge runtime.
 
+The optional second argument is the secret version ID that was current when the component was built.
+If the Secret manager component already holds that version, the secret is not refreshed from the cloud.
+The optional third argument is the staleness limit in seconds: if the refresh fails, the locally stored
+secret is used as long as it was last confirmed current within that limit.
+If the secret is the index of a sharded configuration, the shards are fetched and reassembled.
+Each step is traced, and a summary of the step timings is printed at the end.
+
 Example execution:
-python3 install.py arn:aws:secretsmanager:REGION:ACCOUNT:secret:greengrass-home-assistant-ID
+python3 install.py arn:aws:secretsmanager:REGION:ACCOUNT:secret:greengrass-home-assistant-ID VERSION_ID 604800
 """
 
 import sys
 import os
-from secret import get_secret
+from secret import MAX_STALENESS_SECONDS, get_secret, get_shard_strings
+from envelope import is_shard_index, reassemble, unpack
+from files import materialize
+from tracing import tracer
 
+@tracer.traced('create_files_from_secret')
 def create_files_from_secret():
-    """ Extracts files from the configuration secret and creates them on disk """
+    """ Extracts files from the configuration secret and creates on disk those that have changed """
     print('Creating files from secret')
-    for filename, contents in secret.items():
-        print(f'Creating {filename}')
-        if '/' in filename:
-            os.makedirs(os.path.dirname(filename), exist_ok=True)
-        with open(filename, 'w', encoding="utf-8") as file:
-            file.write(contents)
+    files, modes = unpack(secret)
+    materialize(files, modes)
 
 if len(sys.argv) == 1:
     print('Secret ARN argument is missing', file=sys.stderr)
     sys.exit(1)
 
+max_staleness = float(sys.argv[3]) if len(sys.argv) > 3 else MAX_STALENESS_SECONDS
+
 # Get the secure configuration from Secret Manager
-secret = get_secret(sys.argv[1])
+with tracer.span('get_secret'):
+    secret = get_secret(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None, max_staleness)
+
+if is_shard_index(secret):
+    with tracer.span('get_shards', shards=len(secret['shards'])):
+        secret = reassemble(secret, get_shard_strings(secret['shards'], sys.argv[1], max_staleness))
 
 os.chdir('config')
 print('getcwd: ', os.getcwd())
 
 # Extracts secrets.yaml and any optional TLS certificates
 create_files_from_secret()
+
+tracer.report()
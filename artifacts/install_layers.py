@@ -0,0 +1,110 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Installs the component artifact layers on the Greengrass edge runtime, skipping those that are unchanged.
+
+Each layer is a ZIP artifact named by its layer and content hash. A layer whose artifact is the one last
+installed is skipped without being opened, so an upgrade that only changes the Home Assistant configuration
+unpacks only the configuration layer. Within a changed layer, only the files whose content differs are
+written, atomically, and the files no longer in any layer are removed. The layers installed are recorded
+in layers.json.
+
+This script uses only the standard library, as it runs before the virtual environment exists.
+
+Example execution:
+python3 install_layers.py /greengrass/v2/packages/artifacts/COMPONENT_NAME/COMPONENT_VERSION
+"""
+
+import collections.abc
+import json
+import os
+import re
+import sys
+import time
+import zipfile
+from files import DEFAULT_MODE, LAYER_MANIFEST_FORMAT, materialize, write_atomic
+
+LAYERS_FILE = 'layers.json'
+LAYER_FILE = re.compile(r'^home-assistant-([a-z]+)-([0-9a-f]+)\.zip$')
+
+class ZipFiles(collections.abc.Mapping):
+    """ The files of a ZIP archive, read as they are materialized so that a large layer is not held in memory """
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.infos = {info.filename: info for info in archive.infolist() if not info.is_dir()}
+
+    def __getitem__(self, filename):
+        return self.archive.read(self.infos[filename])
+
+    def __iter__(self):
+        return iter(self.infos)
+
+    def __len__(self):
+        return len(self.infos)
+
+    def modes(self):
+        """ Gets the permissions of each file """
+        return {filename: (info.external_attr >> 16) & 0o777 or DEFAULT_MODE for filename, info in self.infos.items()}
+
+def load_layers():
+    """ Loads the record of the layer artifact last installed for each layer """
+    try:
+        with open(LAYERS_FILE, encoding='utf-8') as layers_file:
+            return json.load(layers_file)
+    except (OSError, ValueError):
+        return {}
+
+def layer_files(artifacts_path):
+    """ Gets the artifact of each layer in the artifacts path, keyed by layer """
+    layers = {}
+
+    for filename in sorted(os.listdir(artifacts_path)):
+        match = LAYER_FILE.match(filename)
+        if match:
+            layers[match.group(1)] = filename
+
+    return layers
+
+def install_layers(artifacts_path):
+    """ Installs the layers whose artifact differs from that last installed. Gets the layers changed. """
+    installed = load_layers()
+    layers = layer_files(artifacts_path)
+    changed = [layer for layer, filename in layers.items() if installed.get(layer) != filename]
+    removed = [layer for layer in installed if layer not in layers]
+
+    # The names of the files of every layer, so that a file moving from one layer to another is kept
+    filenames = {}
+    for layer, filename in layers.items():
+        with zipfile.ZipFile(os.path.join(artifacts_path, filename)) as archive:
+            filenames[layer] = set(ZipFiles(archive))
+    all_filenames = set().union(*filenames.values())
+
+    for layer, filename in layers.items():
+        if layer not in changed:
+            print(f'Layer {layer} is unchanged. Skipping it.')
+            continue
+
+        print(f'Installing layer {layer} from {filename}')
+        with zipfile.ZipFile(os.path.join(artifacts_path, filename)) as archive:
+            files = ZipFiles(archive)
+            materialize(files, files.modes(), LAYER_MANIFEST_FORMAT.format(layer),
+                        keep=all_filenames - filenames[layer])
+
+    for layer in removed:
+        print(f'Removing layer {layer}')
+        materialize({}, manifest_file=LAYER_MANIFEST_FORMAT.format(layer), keep=all_filenames)
+
+    write_atomic(LAYERS_FILE, json.dumps(layers, indent=2, sort_keys=True).encode('utf-8'))
+    return changed + removed
+
+
+if len(sys.argv) != 2:
+    print('Artifacts path argument is missing', file=sys.stderr)
+    sys.exit(1)
+
+start = time.monotonic()
+changed_layers = install_layers(sys.argv[1])
+print(f'Installed {len(changed_layers)} changed layers ({", ".join(changed_layers) or "none"}) '
+      f'in {time.monotonic() - start:.2f} seconds')
@@ -0,0 +1,162 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Migrates the Home Assistant recorder history from the SQLite database to the external recorder database.
+
+This is a one-time helper, to be run on the core device in the component work directory once a component
+version built with an external recorder database has started, so that Home Assistant has created the schema
+in the external database. Home Assistant must not be upgraded in between, so that both schemas match.
+
+The script stops Home Assistant, writes the rows of every table of the SQLite database as a SQL script,
+and runs the script with the database client in the database container. The script replaces the contents
+of the external database's tables in one transaction. Home Assistant is then started again, and the SQLite
+database is renamed, so that the migration cannot run twice.
+
+This script uses only the standard library, and needs no database driver.
+
+Example execution:
+sudo python3 migrate_recorder.py mariadb
+sudo python3 migrate_recorder.py postgresql --no-apply
+"""
+
+import argparse
+import contextlib
+import glob
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+SQLITE_DATABASE = 'config/home-assistant_v2.db'
+SQL_FILE = 'recorder_migration.sql'
+MIGRATED_SUFFIX = '.migrated'
+CONTAINER_NAME = 'homeassistant'
+DATABASE_CONTAINER_NAME = 'recorder-db'
+BATCH_ROWS = 500
+
+# The clients take the credentials from the environment of the database container
+CLIENTS = {
+    'mariadb': 'exec mariadb --user="$MARIADB_USER" --password="$MARIADB_PASSWORD" "$MARIADB_DATABASE"',
+    'postgresql': 'exec psql --quiet --set ON_ERROR_STOP=1 --username="$POSTGRES_USER" "$POSTGRES_DB"'
+}
+
+def table_order(connection):
+    """ Gets the tables of the SQLite database, with each table after the tables its foreign keys reference """
+    tables = [row[0] for row in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    references = {table: {row[2] for row in connection.execute(f'PRAGMA foreign_key_list("{table}")')} - {table}
+                  for table in tables}
+    ordered = []
+
+    while len(ordered) < len(tables):
+        ready = [table for table in tables if table not in ordered and references[table] <= set(ordered)]
+        # Reference cycles cannot be ordered, but the foreign key checks are off during the load anyway
+        ordered += ready or [table for table in tables if table not in ordered]
+
+    return ordered
+
+def quote_identifier(name, engine):
+    """ Quotes a table or column name """
+    return f'`{name}`' if engine == 'mariadb' else f'"{name}"'
+
+def literal(value, engine):
+    """ Gets the SQL literal of a SQLite value """
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bytes):
+        return f"X'{value.hex()}'" if engine == 'mariadb' else f"'\\x{value.hex()}'"
+    if isinstance(value, (int, float)) and engine == 'mariadb':
+        return repr(value)
+
+    # PostgreSQL casts untyped string literals to the type of the column, including booleans stored as 0 and 1
+    text = str(value).replace("'", "''")
+    return "'" + (text.replace('\\', '\\\\') if engine == 'mariadb' else text) + "'"
+
+def primary_key(connection, table):
+    """ Gets the integer primary key column of a table, or None if it has none """
+    columns = [row for row in connection.execute(f'PRAGMA table_info("{table}")') if row[5]]
+    return columns[0][1] if len(columns) == 1 and columns[0][2].upper() == 'INTEGER' else None
+
+def write_sql(connection, engine, sql_file, batch_rows=BATCH_ROWS):
+    """ Writes the SQL script that replaces the tables' contents with the SQLite rows, and gets the row counts """
+    tables = table_order(connection)
+    quoted_tables = [quote_identifier(table, engine) for table in tables]
+    counts = {}
+
+    if engine == 'mariadb':
+        sql_file.write('SET NAMES utf8mb4;\nSET FOREIGN_KEY_CHECKS = 0;\nSTART TRANSACTION;\n')
+        sql_file.writelines(f'DELETE FROM {table};\n' for table in reversed(quoted_tables))
+    else:
+        sql_file.write('BEGIN;\nSET session_replication_role = replica;\n')
+        sql_file.write(f'TRUNCATE {", ".join(quoted_tables)};\n')
+
+    for table, quoted_table in zip(tables, quoted_tables):
+        cursor = connection.execute(f'SELECT * FROM "{table}"')
+        columns = ', '.join(quote_identifier(column[0], engine) for column in cursor.description)
+        counts[table] = 0
+
+        while rows := cursor.fetchmany(batch_rows):
+            values = ',\n'.join('(' + ', '.join(literal(value, engine) for value in row) + ')' for row in rows)
+            sql_file.write(f'INSERT INTO {quoted_table} ({columns}) VALUES\n{values};\n')
+            counts[table] += len(rows)
+
+        key = primary_key(connection, table)
+        if engine == 'postgresql' and key:
+            # Continue the identity sequence after the migrated rows
+            sql_file.write(f"SELECT setval(pg_get_serial_sequence('{quoted_table}', '{key}'), "
+                           f'COALESCE((SELECT MAX("{key}") FROM {quoted_table}), 0) + 1, false);\n')
+
+    sql_file.write('COMMIT;\nSET FOREIGN_KEY_CHECKS = 1;\n' if engine == 'mariadb' else 'COMMIT;\n')
+    return counts
+
+def docker(*arguments, **kwargs):
+    """ Runs a Docker command, failing if it fails """
+    subprocess.run(['docker'] + list(arguments), check=True, **kwargs)
+
+
+parser = argparse.ArgumentParser(description='Migrate the recorder history from SQLite to the external database')
+parser.add_argument('engine', choices=list(CLIENTS), help='External recorder database engine')
+parser.add_argument('--sqlite', default=SQLITE_DATABASE, help='SQLite recorder database')
+parser.add_argument('--output', default=SQL_FILE, help='SQL script to write')
+parser.add_argument('--no-apply', action='store_true', help='Only write the SQL script')
+args = parser.parse_args()
+
+if not os.path.isfile(args.sqlite):
+    previous = os.path.isfile(args.sqlite + MIGRATED_SUFFIX)
+    print('The SQLite database was already migrated' if previous else f'There is no SQLite database {args.sqlite}')
+    sys.exit(0)
+
+start = time.monotonic()
+
+try:
+    if not args.no_apply:
+        print('Stopping Home Assistant')
+        docker('stop', CONTAINER_NAME)
+
+    with contextlib.closing(sqlite3.connect(f'file:{args.sqlite}?mode=ro', uri=True)) as sqlite_connection,\
+            open(args.output, 'w', encoding='utf-8') as output_file:
+        row_counts = write_sql(sqlite_connection, args.engine, output_file)
+    for table_name, count in row_counts.items():
+        print(f'  {table_name}: {count} rows')
+    print(f'Wrote {sum(row_counts.values())} rows to {args.output}')
+
+    if not args.no_apply:
+        print(f'Loading the rows into the {args.engine} database')
+        with open(args.output, 'rb') as input_file:
+            docker('exec', '-i', DATABASE_CONTAINER_NAME, 'sh', '-c', CLIENTS[args.engine], stdin=input_file)
+except (OSError, sqlite3.Error, subprocess.CalledProcessError) as e:
+    print(f'Failed to migrate the recorder database.\nException: {e}', file=sys.stderr)
+    sys.exit(1)
+finally:
+    if not args.no_apply:
+        print('Starting Home Assistant')
+        subprocess.run(['docker', 'start', CONTAINER_NAME], check=False)
+
+if not args.no_apply:
+    for database_file in glob.glob(glob.escape(args.sqlite) + '*'):
+        if not database_file.endswith(MIGRATED_SUFFIX):
+            os.replace(database_file, database_file + MIGRATED_SUFFIX)
+    os.remove(args.output)
+    print(f'Migrated the recorder database in {time.monotonic() - start:.1f} seconds')
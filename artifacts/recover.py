@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Recovers the Home Assistant component on the Greengrass edge runtime, after it fails, by rolling back to the
+last-known-good configuration.
+
+The last-known-good snapshot is taken each time Home Assistant starts successfully. If the installed
+configuration or Docker Compose file differ from the snapshot, the snapshot is restored and the container
+is recreated from it, which takes seconds rather than a rollback deployment. Otherwise, the Docker Compose
+project is stopped. Either way, Greengrass then restarts the component.
+
+The reason for the recovery, whether it rolled back and the time taken are appended to rollback.jsonl in
+the work directory.
+
+This script uses only the standard library, so that it runs without the virtual environment.
+
+Example execution:
+python3 recover.py
+"""
+
+import subprocess
+import sys
+import time
+from files import append_record, load_records
+from health import STARTUP_RECORD_FILE, container_state
+from snapshot import load_snapshot, restore_snapshot
+from tracing import tracer
+
+ROLLBACK_RECORD_FILE = 'rollback.jsonl'
+
+def failure_reason():
+    """ Describes the failure being recovered from, from the last startup and the container state """
+    startups = load_records(STARTUP_RECORD_FILE)
+    if startups and not startups[-1]['ready']:
+        reason = f'Home Assistant was not ready after {startups[-1]["readySeconds"]:.0f} seconds'
+    else:
+        reason = 'The component failed'
+
+    state = container_state()
+    if state is None:
+        return f'{reason}, with no container'
+    return f'{reason}, with the container {state["health"] or state["status"]} after {state["restarts"]} restarts'
+
+def run_compose(*arguments):
+    """ Runs a Docker Compose command, getting whether it succeeded """
+    try:
+        with tracer.span(' '.join(('docker-compose',) + arguments)):
+            subprocess.run(['docker-compose', *arguments], check=True)
+        return True
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f'Failed to run docker-compose {" ".join(arguments)}.\nException: {e}', file=sys.stderr)
+        return False
+
+
+start = time.monotonic()
+snapshot = load_snapshot()
+rollback_record = {'timestamp': time.time(), 'reason': failure_reason(), 'rolledBack': False,
+                   'snapshotTimestamp': snapshot and snapshot['timestamp'], 'restored': 0, 'removed': 0}
+print(f'Recovering: {rollback_record["reason"]}')
+
+if snapshot is None:
+    print('There is no last-known-good snapshot to roll back to')
+else:
+    with tracer.span('restore_snapshot'):
+        rollback_record.update(restore_snapshot(snapshot))
+    rollback_record['restoreSeconds'] = time.monotonic() - start
+
+if rollback_record['restored'] or rollback_record['removed']:
+    print(f'Rolled back to the last-known-good snapshot: restored {rollback_record["restored"]} files, '
+          f'removed {rollback_record["removed"]} files')
+    rollback_record['rolledBack'] = run_compose('up', '-d', '--force-recreate')
+    if rollback_record['rolledBack']:
+        print(f'Recreated the container in {time.monotonic() - start:.1f} seconds')
+    else:
+        run_compose('down')
+else:
+    if snapshot is not None:
+        print('The installed configuration is the last known good. Stopping the Docker Compose project.')
+    run_compose('down')
+
+rollback_record['seconds'] = time.monotonic() - start
+append_record(ROLLBACK_RECORD_FILE, rollback_record)
+tracer.report()
@@ -2,27 +2,173 @@
 # SPDX-License-Identifier: Apache-2.0
 
 """
-Gets a secret from the Secret manager component
+Gets a secret from the Secret manager component.
+
+The version ID and content hash of each secret fetched are cached in a local file. When the caller knows
+the expected version ID (the version current when the component was built), the locally stored value is
+used without a cloud refresh if it is that version. When a cloud refresh fails, the locally stored value
+is used as long as it was last confirmed current no longer ago than the staleness limit.
+
+The shard secrets of a sharded configuration are fetched concurrently, through one IPC client. The index
+lists the shard ARNs in the primary region, so each shard is fetched in the region of the index secret.
 """
 
+import hashlib
 import json
+import os
 import sys
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from awsiot.greengrasscoreipc.clientv2 import GreengrassCoreIPCClientV2
 
-def get_secret(secret_id):
+try:
+    from tracing import tracer
+except ImportError:  # Imported as part of the artifacts package, as by the unit tests
+    from artifacts.tracing import tracer
+
+CACHE_FILE = 'secret_cache.json'
+MAX_STALENESS_SECONDS = 7 * 24 * 60 * 60
+MAX_CONCURRENT_SHARDS = 8
+
+cache_lock = threading.Lock()
+
+def get_secret(secret_id, expected_version_id=None, max_staleness=MAX_STALENESS_SECONDS):
     """ Gets a locally stored secret from the Secret Manager component """
     try:
         print('Getting IPC client')
         ipc_client = GreengrassCoreIPCClientV2()
-
-        print('Refreshing and getting secret: ' + secret_id)
-        response = ipc_client.get_secret_value(secret_id=secret_id, refresh=True)
-        secret_json = json.loads(response.secret_value.secret_string)
-        print('Successfully got secret: ' + secret_id)
+        secret_json = json.loads(fetch_secret_string(ipc_client, secret_id, expected_version_id, max_staleness))
     except Exception:
         print('Exception', file=sys.stderr)
         traceback.print_exc()
         sys.exit(1)
 
     return secret_json
+
+def get_shard_strings(shards, secret_id, max_staleness=MAX_STALENESS_SECONDS):
+    """
+    Gets the shard secrets listed by the sharded secret index with the given ID, as strings in index order. The
+    shards are fetched concurrently, each skipping the cloud refresh if its expected version is stored locally.
+    """
+    try:
+        print(f'Getting IPC client to fetch {len(shards)} shards')
+        ipc_client = GreengrassCoreIPCClientV2()
+        snapshot = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=min(len(shards), MAX_CONCURRENT_SHARDS) or 1) as executor:
+            fetch = tracer.bind(fetch_secret_string)
+            futures = [executor.submit(fetch, ipc_client, shard_arn(shard, secret_id), shard.get('versionId'),
+                                       max_staleness) for shard in shards]
+            shard_strings = [future.result() for future in futures]
+
+        print(f'Fetched {len(shards)} shards in {time.monotonic() - snapshot:.2f} seconds')
+    except Exception:
+        print('Exception', file=sys.stderr)
+        traceback.print_exc()
+        sys.exit(1)
+
+    return shard_strings
+
+def shard_arn(shard, secret_id):
+    """
+    Gets the ARN of a shard secret in the region of the index secret. The replica of a shard secret differs
+    from the shard ARN listed in a replicated index only in its region.
+    """
+    shard_parts, secret_parts = shard['arn'].split(':'), secret_id.split(':')
+    if len(shard_parts) < 7 or len(secret_parts) < 7:
+        return shard['arn']
+    return ':'.join(shard_parts[:3] + secret_parts[3:4] + shard_parts[4:])
+
+def fetch_secret_string(ipc_client, secret_id, expected_version_id, max_staleness):
+    """ Gets the string of a locally stored secret, refreshing it from the cloud unless it is the expected version """
+    with cache_lock:
+        record = load_cache().get(secret_id)
+
+    response = None
+    confirmed = True
+
+    if expected_version_id:
+        response = get_expected_secret(ipc_client, secret_id, expected_version_id)
+
+    if response is None:
+        try:
+            print('Refreshing and getting secret: ' + secret_id)
+            tracer.api_call()
+            response = ipc_client.get_secret_value(secret_id=secret_id, refresh=True)
+        except Exception:
+            traceback.print_exc()
+            response = get_stale_secret(ipc_client, secret_id, record, max_staleness)
+            confirmed = False
+
+    secret_string = response.secret_value.secret_string
+
+    # Only record when the value was confirmed current, so that staleness accrues while offline
+    if confirmed:
+        with cache_lock:
+            cache = load_cache()
+            cache[secret_id] = {'versionId': response.version_id, 'sha256': content_hash(secret_string),
+                                'confirmed': time.time()}
+            save_cache(cache)
+
+    print('Successfully got secret: ' + secret_id)
+    return secret_string
+
+def get_expected_secret(ipc_client, secret_id, expected_version_id):
+    """ Gets the locally stored secret if it is the expected version, otherwise None """
+    try:
+        print('Getting locally stored secret: ' + secret_id)
+        tracer.api_call()
+        response = ipc_client.get_secret_value(secret_id=secret_id, refresh=False)
+    except Exception as e:
+        print(f'Failed to get locally stored secret: {e}')
+        return None
+
+    if response.version_id != expected_version_id:
+        print(f'Locally stored secret is version {response.version_id}, not {expected_version_id}')
+        return None
+
+    print(f'Locally stored secret is the expected version {expected_version_id}. Skipping refresh.')
+    return response
+
+def get_stale_secret(ipc_client, secret_id, record, max_staleness):
+    """ Gets the locally stored secret when the cloud cannot be reached, subject to the staleness limit """
+    if record is None:
+        raise RuntimeError('Secret refresh failed and no cached secret version is known')
+
+    staleness = time.time() - record['confirmed']
+    if staleness > max_staleness:
+        raise RuntimeError(f'Secret refresh failed and the cached secret is {staleness:.0f} seconds old, '
+                           f'exceeding the {max_staleness} second staleness limit')
+
+    print(f'Secret refresh failed. Using locally stored secret, last confirmed {staleness:.0f} seconds ago.')
+    tracer.api_call()
+    response = ipc_client.get_secret_value(secret_id=secret_id, refresh=False)
+
+    if content_hash(response.secret_value.secret_string) != record['sha256']:
+        print('Locally stored secret differs from the cached version')
+
+    return response
+
+def content_hash(secret_string):
+    """ Gets the SHA-256 hash of the secret content """
+    return hashlib.sha256(secret_string.encode('utf-8')).hexdigest()
+
+def load_cache():
+    """ Loads the secret version cache """
+    if not os.path.exists(CACHE_FILE):
+        return {}
+
+    try:
+        with open(CACHE_FILE, encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+    except ValueError:
+        print(f'Ignoring corrupt secret cache {CACHE_FILE}')
+        return {}
+
+def save_cache(cache):
+    """ Saves the secret version cache atomically """
+    with open(CACHE_FILE + '.tmp', 'w', encoding="utf-8") as cache_file:
+        json.dump(cache, cache_file)
+    os.replace(CACHE_FILE + '.tmp', CACHE_FILE)
@@ -0,0 +1,121 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Watches the configuration secret for changes, and applies them in place without reinstalling the component.
+
+The Secret manager component is asked to refresh the secret from the cloud at each poll interval. This is
+one IPC call, and nothing more is done unless the version ID differs from that last applied, so a poll of
+an unchanged secret writes nothing. When the version changes, any shards are fetched, only the files
+whose content changed are rewritten in the configuration directory and Home Assistant reloads them. A
+new MQTT password in secrets.yaml, for example, takes a reload rather than a container restart. If the
+refresh fails, such as while the core device is offline, the poll interval backs off exponentially.
+
+The version ID and content hash of the secret applied are recorded in the secret cache, as by install.py.
+"""
+
+import json
+import os
+import random
+import time
+import traceback
+
+try:
+    from envelope import is_shard_index, reassemble, unpack
+    from files import MANIFEST_FILE, content_hash, load_manifest, materialize
+    from health import URL
+    from home_assistant import reload
+    from secret import MAX_STALENESS_SECONDS, cache_lock, fetch_secret_string, load_cache, save_cache
+    from secret import shard_arn
+    from secret import content_hash as secret_hash
+    from tracing import tracer
+except ImportError:  # Imported as part of the artifacts package, as by the unit tests
+    from artifacts.envelope import is_shard_index, reassemble, unpack
+    from artifacts.files import MANIFEST_FILE, content_hash, load_manifest, materialize
+    from artifacts.health import URL
+    from artifacts.home_assistant import reload
+    from artifacts.secret import MAX_STALENESS_SECONDS, cache_lock, fetch_secret_string, load_cache, save_cache
+    from artifacts.secret import shard_arn
+    from artifacts.secret import content_hash as secret_hash
+    from artifacts.tracing import tracer
+
+DEFAULT_POLL_INTERVAL = 300.0
+MAX_POLL_INTERVAL = 3600.0
+BACKOFF_MULTIPLIER = 2.0
+CONFIG_DIRECTORY = 'config'
+
+class SecretWatcher():
+    """ Polls the configuration secret, applying each new version to the configuration directory """
+
+    def __init__(self, ipc_client, secret_id, poll_interval=DEFAULT_POLL_INTERVAL, config_directory=CONFIG_DIRECTORY):
+        self.ipc_client = ipc_client
+        self.secret_id = secret_id
+        self.poll_interval = poll_interval
+        self.config_directory = config_directory
+        # The Home Assistant URL to call reload services at, which the agent sets from its configuration
+        self.url = URL
+        # The staleness limit of the shards fetched, which the agent sets from its configuration
+        self.max_staleness = MAX_STALENESS_SECONDS
+        # The version installed by install.py
+        self.version_id = load_cache().get(secret_id, {}).get('versionId')
+
+    def run(self, stopped):
+        """ Polls the secret until the stopped event is set """
+        print(f'Watching secret {self.secret_id} every {self.poll_interval:.0f} seconds')
+        interval = self.poll_interval
+
+        while not stopped.wait(interval / 2 + random.uniform(0, interval / 2)):
+            try:
+                self.poll()
+                interval = self.poll_interval
+            except Exception:  # pylint: disable=broad-exception-caught
+                traceback.print_exc()
+                interval = min(interval * BACKOFF_MULTIPLIER, MAX_POLL_INTERVAL)
+                print(f'Failed to poll the secret. Backing off for {interval:.0f} seconds.')
+
+    def poll(self):
+        """ Refreshes the secret from the cloud, and applies it if its version changed. Gets the outcome. """
+        with tracer.span('poll_secret') as span:
+            tracer.api_call()
+            response = self.ipc_client.get_secret_value(secret_id=self.secret_id, refresh=True)
+            if response.version_id == self.version_id:
+                return None
+
+            span['attributes']['versionId'] = response.version_id
+            return self.apply(response.version_id, response.secret_value.secret_string)
+
+    def apply(self, version_id, secret_string):
+        """ Rewrites the changed files of a new secret version, and reloads Home Assistant. Gets the outcome. """
+        start = time.monotonic()
+        print(f'Secret changed from version {self.version_id} to {version_id}')
+        secret = json.loads(secret_string)
+
+        if is_shard_index(secret):
+            shard_strings = [fetch_secret_string(self.ipc_client, shard_arn(shard, self.secret_id),
+                                                 shard.get('versionId'), self.max_staleness)
+                             for shard in secret['shards']]
+            secret = reassemble(secret, shard_strings)
+
+        files, modes = unpack(secret)
+        changed = self.changed_files(files)
+        materialize(files, modes, directory=self.config_directory)
+
+        with cache_lock:
+            cache = load_cache()
+            cache[self.secret_id] = {'versionId': version_id, 'sha256': secret_hash(secret_string),
+                                     'confirmed': time.time()}
+            save_cache(cache)
+        self.version_id = version_id
+
+        actions = reload(changed, secrets_file=os.path.join(self.config_directory, 'secrets.yaml'),
+                         url=self.url) if changed else []
+        print(f'Applied secret version {version_id} in {time.monotonic() - start:.2f} seconds: '
+              f'{len(changed)} changed files, actions {actions}')
+
+        return {'versionId': version_id, 'changed': changed, 'actions': actions}
+
+    def changed_files(self, files):
+        """ Gets the files that differ from those last written, including those no longer wanted """
+        manifest = load_manifest(os.path.join(self.config_directory, MANIFEST_FILE))
+        changed = [filename for filename, data in files.items() if manifest.get(filename) != content_hash(data)]
+        return sorted(changed + [filename for filename in manifest if filename not in files])
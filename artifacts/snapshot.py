@@ -0,0 +1,148 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Keeps a snapshot of the last-known-good configuration on the Greengrass edge runtime, and restores it.
+
+The snapshot holds the files in the config directory that the component installed, and the Docker Compose
+file, as recorded in the install manifests. Files are hard linked into the snapshot, so that it takes almost
+no space, and copied where the filesystem does not allow a link. A hard link keeps the content it was
+taken with, because the component and Home Assistant replace these files rather than modifying them in place.
+
+Restoring the snapshot restores the manifest entries of its files too, so that the next install writes
+exactly the files that differ from those restored.
+
+This module uses only the standard library.
+"""
+
+import filecmp
+import glob
+import json
+import os
+import shutil
+import time
+
+try:
+    from files import LAYER_MANIFEST_FORMAT, MANIFEST_FILE, load_manifest, save_manifest, write_atomic
+except ImportError:  # Imported as part of the artifacts package, as by the unit tests
+    from artifacts.files import LAYER_MANIFEST_FORMAT, MANIFEST_FILE, load_manifest, save_manifest, write_atomic
+
+SNAPSHOT_DIRECTORY = 'last_known_good'
+SNAPSHOT_FILE = 'snapshot.json'
+CONFIG_DIRECTORY = 'config'
+COMPOSE_FILE = 'docker-compose.yml'
+
+def manifest_files():
+    """ Gets the install manifests of the layers and of the files created from the configuration secret """
+    return sorted(glob.glob(LAYER_MANIFEST_FORMAT.format('*'))) + [os.path.join(CONFIG_DIRECTORY, MANIFEST_FILE)]
+
+def in_snapshot(path):
+    """ Determines whether an installed file, relative to the work directory, belongs in the snapshot """
+    return path == COMPOSE_FILE or path.startswith(CONFIG_DIRECTORY + os.sep)
+
+def installed_files():
+    """ Gets the installed files that belong in the snapshot, with their manifest and content hash, keyed by path """
+    files = {}
+
+    for manifest_file in manifest_files():
+        for filename, digest in load_manifest(manifest_file).items():
+            path = os.path.normpath(os.path.join(os.path.dirname(manifest_file), filename))
+            if in_snapshot(path):
+                files[path] = {'manifest': manifest_file, 'filename': filename, 'digest': digest}
+
+    return files
+
+def link_or_copy(source, target):
+    """ Hard links a file in place of the target, or copies it if it cannot be linked. Gets whether it was linked. """
+    directory = os.path.dirname(target)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    temp_file = os.path.join(directory, '.tmp-' + os.path.basename(target))
+    if os.path.lexists(temp_file):
+        os.remove(temp_file)
+
+    try:
+        os.link(source, temp_file)
+        linked = True
+    except OSError:
+        shutil.copy2(source, temp_file)
+        linked = False
+
+    os.replace(temp_file, target)
+    return linked
+
+def save_snapshot(image=None):
+    """ Snapshots the installed files as the last-known-good configuration. Gets the snapshot. """
+    temp_directory = SNAPSHOT_DIRECTORY + '.tmp'
+    old_directory = SNAPSHOT_DIRECTORY + '.old'
+    shutil.rmtree(temp_directory, ignore_errors=True)
+    snapshot = {'timestamp': time.time(), 'image': image, 'files': {}, 'linked': 0, 'copied': 0}
+
+    for path, entry in installed_files().items():
+        if os.path.isfile(path):
+            linked = link_or_copy(path, os.path.join(temp_directory, path))
+            snapshot['linked' if linked else 'copied'] += 1
+            snapshot['files'][path] = entry
+
+    write_atomic(os.path.join(temp_directory, SNAPSHOT_FILE),
+                 json.dumps(snapshot, indent=2, sort_keys=True).encode('utf-8'))
+
+    # Swap the snapshots, leaving the old one in place until the new one is complete
+    shutil.rmtree(old_directory, ignore_errors=True)
+    if os.path.isdir(SNAPSHOT_DIRECTORY):
+        os.rename(SNAPSHOT_DIRECTORY, old_directory)
+    os.rename(temp_directory, SNAPSHOT_DIRECTORY)
+    shutil.rmtree(old_directory, ignore_errors=True)
+    return snapshot
+
+def load_snapshot():
+    """ Loads the last-known-good snapshot, or gets None if there is none """
+    try:
+        with open(os.path.join(SNAPSHOT_DIRECTORY, SNAPSHOT_FILE), encoding='utf-8') as snapshot_file:
+            return json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None
+
+def snapshot_changes(snapshot):
+    """ Gets the paths of the snapshot files that differ from those installed, and of the installed files not in it """
+    installed = installed_files()
+    changed = []
+
+    for path, entry in snapshot['files'].items():
+        snapshot_path = os.path.join(SNAPSHOT_DIRECTORY, path)
+        if installed.get(path) != entry or not os.path.isfile(path) or \
+                not (os.path.samefile(path, snapshot_path) or filecmp.cmp(path, snapshot_path, shallow=False)):
+            changed.append(path)
+
+    return changed, [path for path in installed if path not in snapshot['files']]
+
+def restore_snapshot(snapshot):
+    """
+    Restores the snapshot files that differ from those installed, and removes the installed files not in it.
+    Gets the counts of files restored and removed.
+    """
+    changed, added = snapshot_changes(snapshot)
+
+    for path in changed:
+        print(f'Restoring {path}')
+        link_or_copy(os.path.join(SNAPSHOT_DIRECTORY, path), path)
+
+    for path in added:
+        if os.path.isfile(path):
+            print(f'Removing {path}')
+            os.remove(path)
+
+    # Each manifest keeps its entries for other files, and gets back those it had for the snapshot files
+    manifests = set(manifest_files()) | {entry['manifest'] for entry in snapshot['files'].values()}
+    for manifest_file in manifests:
+        manifest = load_manifest(manifest_file)
+        directory = os.path.dirname(manifest_file)
+        new_manifest = {filename: digest for filename, digest in manifest.items()
+                        if not in_snapshot(os.path.normpath(os.path.join(directory, filename)))}
+        new_manifest.update({entry['filename']: entry['digest'] for entry in snapshot['files'].values()
+                             if entry['manifest'] == manifest_file})
+        if new_manifest != manifest:
+            save_manifest(manifest_file, new_manifest)
+
+    return {'restored': len(changed), 'removed': len(added)}
@@ -0,0 +1,137 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Starts the Home Assistant component on the Greengrass edge runtime, and waits until Home Assistant is ready.
+
+The Docker Compose project is started, then the container and the Home Assistant HTTP endpoint are polled
+with backoff. The script exits only once Home Assistant is ready, so that Greengrass reports the component
+as RUNNING only when Home Assistant is serving. If Home Assistant is not ready within the timeout, the
+script fails, and so does the Startup lifecycle step. The timeout must leave a margin within the Startup
+step's own Greengrass timeout in recipe.yaml, so that a slow startup is reported by this script rather than
+killed by Greengrass. A longer timeout is rejected before anything is started.
+
+The time to ready is appended to startup.jsonl in the work directory, along with the image ID, so that
+startup times can be compared across Home Assistant image upgrades. Once Home Assistant is ready, the
+installed configuration is snapshotted as the last known good, for the Recover lifecycle step to roll back to.
+
+Once Home Assistant is ready, the edge agent (agent.py) is started in the background, replacing any agent
+left running, and given the core device thing name. Its output goes to agent.log, and its process ID to agent.pid. A process left in agent.pid is
+only stopped if it is still the agent, as the process ID may since have been reused. The agent watches the
+configuration secret, if one is given, for changes to apply without reinstalling the component.
+
+Example execution:
+python3 startup.py --timeout 600 --url https://localhost:8123/
+python3 startup.py --thing-name MyCoreDeviceThingName
+python3 startup.py --secret-arn arn:aws:secretsmanager:REGION:ACCOUNT:secret:greengrass-home-assistant-ID
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from agent_process import AGENT_PID_FILE, stop_agent
+from files import append_record, load_records
+from health import MAX_STARTUP_TIMEOUT, STARTUP_RECORD_FILE, URL, wait_until_ready
+from secret import MAX_STALENESS_SECONDS
+from snapshot import save_snapshot
+from tracing import tracer
+
+AGENT_LOG_FILE = 'agent.log'
+
+def report(record):
+    """ Prints the time to ready, compared with the last successful startup """
+    previous = [entry for entry in load_records(STARTUP_RECORD_FILE) if entry['ready']]
+    print(f'Home Assistant is ready after {record["readySeconds"]:.1f} seconds '
+          f'(Docker Compose {record["composeSeconds"]:.1f} seconds, container {record["containerSeconds"]:.1f} '
+          f'seconds, {record["polls"]} polls, {record["restarts"]} restarts)')
+
+    if previous:
+        change = 'same image' if previous[-1]['image'] == record['image'] else 'previous image'
+        print(f'Last startup took {previous[-1]["readySeconds"]:.1f} seconds ({change})')
+
+@tracer.traced('save_snapshot')
+def snapshot_configuration(image):
+    """ Snapshots the installed configuration as the last known good, warning rather than failing """
+    try:
+        snapshot = save_snapshot(image)
+        print(f'Saved the last-known-good snapshot of {len(snapshot["files"])} files '
+              f'({snapshot["linked"]} linked, {snapshot["copied"]} copied)')
+    except OSError as e:
+        print(f'Failed to save the last-known-good snapshot.\nException: {e}', file=sys.stderr)
+
+def start_agent(agent_arguments):
+    """ Starts the edge agent in the background, stopping any agent left running """
+    if stop_agent():
+        print('Stopped the previous agent')
+
+    with open(AGENT_LOG_FILE, 'a', encoding='utf-8') as log_file:
+        # The agent outlives this script
+        agent = subprocess.Popen(  # pylint: disable=consider-using-with
+            [sys.executable, '-u', 'agent.py', *agent_arguments], stdout=log_file, stderr=subprocess.STDOUT,
+            start_new_session=True)
+
+    with open(AGENT_PID_FILE, 'w', encoding='utf-8') as pid_file:
+        pid_file.write(str(agent.pid))
+    print(f'Started the agent with process ID {agent.pid}')
+
+
+parser = argparse.ArgumentParser(description='Start Home Assistant and wait until it is ready')
+parser.add_argument('--timeout', type=float, default=600, help='Seconds to wait for Home Assistant to be ready')
+parser.add_argument('--url', default=URL, help='Home Assistant HTTP endpoint')
+parser.add_argument('--thing-name', default=os.environ.get('AWS_IOT_THING_NAME'),
+                    help='Core device thing name, for the agent\'s configuration topics')
+parser.add_argument('--secret-arn', help='Configuration secret for the agent to watch for changes')
+parser.add_argument('--secret-poll-interval', type=float, default=300,
+                    help='Seconds between the agent\'s polls of the configuration secret, or 0 to not watch it')
+parser.add_argument('--secret-max-staleness', type=float, default=MAX_STALENESS_SECONDS,
+                    help='Seconds for which the agent may use the locally stored secret while it cannot be refreshed')
+args = parser.parse_args()
+
+if args.timeout > MAX_STARTUP_TIMEOUT:
+    print(f'Timeout of {args.timeout:.0f} seconds exceeds the maximum of {MAX_STARTUP_TIMEOUT} seconds, which '
+          'leaves a margin within the timeout of the Startup lifecycle step', file=sys.stderr)
+    sys.exit(1)
+
+start = time.monotonic()
+print('Starting the Docker Compose project')
+
+try:
+    with tracer.span('docker-compose up'):
+        subprocess.run(['docker-compose', 'up', '-d'], check=True)
+except (OSError, subprocess.CalledProcessError) as e:
+    print(f'Failed to start the Docker Compose project.\nException: {e}', file=sys.stderr)
+    sys.exit(1)
+
+compose_seconds = time.monotonic() - start
+print(f'Waiting up to {args.timeout:.0f} seconds for Home Assistant to be ready at {args.url}')
+with tracer.span('wait_until_ready', url=args.url) as span:
+    result = wait_until_ready(max(args.timeout - compose_seconds, 0), args.url)
+    span['attributes']['polls'] = result['polls']
+
+startup_record = {'timestamp': time.time(), 'ready': result['ready'], 'image': result['image'],
+                  'readySeconds': time.monotonic() - start, 'composeSeconds': compose_seconds,
+                  'containerSeconds': None, 'polls': result['polls'], 'restarts': result['restarts']}
+if result['containerSeconds'] is not None:
+    startup_record['containerSeconds'] = compose_seconds + result['containerSeconds']
+
+if not result['ready']:
+    append_record(STARTUP_RECORD_FILE, startup_record)
+    tracer.report()
+    print(f'Home Assistant was not ready within {args.timeout:.0f} seconds', file=sys.stderr)
+    sys.exit(1)
+
+report(startup_record)
+append_record(STARTUP_RECORD_FILE, startup_record)
+snapshot_configuration(result['image'])
+agent_arguments = ['--url', args.url]
+if args.thing_name:
+    agent_arguments += ['--thing-name', args.thing_name]
+else:
+    print('No core device thing name to give the agent, so it will not start', file=sys.stderr)
+if args.secret_arn:
+    agent_arguments += ['--secret-arn', args.secret_arn, '--secret-poll-interval', str(args.secret_poll_interval),
+                        '--secret-max-staleness', str(args.secret_max_staleness)]
+start_agent(agent_arguments)
+tracer.report()
@@ -0,0 +1,17 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Stops the edge agent of the Home Assistant component on the Greengrass edge runtime, as the Shutdown and
+Recover lifecycle steps do. The process recorded in agent.pid is only stopped if it is still the agent.
+
+This script uses only the standard library, so that it runs without the virtual environment.
+
+Example execution:
+python3 stop_agent.py
+"""
+
+from agent_process import stop_agent
+
+if stop_agent():
+    print('Stopped the agent')
@@ -0,0 +1,156 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Records nested, timed spans of work, with the API calls made within them and their outcome.
+
+Each span finishes with its duration, the number of API calls made within it (including those of nested
+spans) and its outcome, which is an error if an exception escaped it. If the HA_TRACE_FILE environment
+variable names a file, each finished span is appended to it as a JSON line. At the end of a run, the
+spans are summarized in a table.
+
+Spans nest within a thread. Work handed to other threads can be bound to the current span, so that the
+spans and API calls of those threads count toward it.
+
+This module uses only the standard library, so it is shared by the edge runtime and the developer scripts.
+"""
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+
+TRACE_FILE_VARIABLE = 'HA_TRACE_FILE'
+
+class Tracer():
+    """ Records nested spans, and writes them as JSON lines and a summary table """
+
+    def __init__(self, trace_file=None):
+        self.trace_file = trace_file or os.environ.get(TRACE_FILE_VARIABLE)
+        self.spans = []
+        self.open_spans = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name, parent=None, **attributes):
+        """ Records a span for the work within the context. The parent defaults to the current span. """
+        stack = self.stack()
+        parent = parent or self.current()
+        span = {'name': name, 'spanId': uuid.uuid4().hex[:16], 'parentId': parent['spanId'] if parent else None,
+                'path': f'{parent["path"]} > {name}' if parent else name, 'start': time.time(), 'durationMs': None,
+                'apiCalls': 0, 'outcome': 'ok', 'attributes': attributes}
+
+        with self.lock:
+            self.open_spans[span['spanId']] = span
+        stack.append(span)
+        snapshot = time.perf_counter()
+
+        try:
+            yield span
+        except SystemExit as e:
+            # Exiting successfully is not an error
+            if e.code not in (None, 0):
+                span.update(outcome='error', error=f'{type(e).__name__}: {e}')
+            raise
+        except BaseException as e:
+            span.update(outcome='error', error=f'{type(e).__name__}: {e}')
+            raise
+        finally:
+            span['durationMs'] = round((time.perf_counter() - snapshot) * 1000, 3)
+            stack.pop()
+            with self.lock:
+                del self.open_spans[span['spanId']]
+                self.spans.append(span)
+                self.write(span)
+
+    def traced(self, name):
+        """ Decorates a function so that each call is recorded as a span """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def bind(self, function):
+        """ Binds a function to the current span, for calls in other threads, such as from a thread pool """
+        parent = self.current()
+
+        @functools.wraps(function)
+        def bound(*args, **kwargs):
+            if parent is None:
+                return function(*args, **kwargs)
+
+            stack = self.stack()
+            stack.append(parent)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stack.pop()
+
+        return bound
+
+    def api_call(self):
+        """ Counts an API call in the current span and each of its ancestors """
+        with self.lock:
+            stack = self.stack()
+            span_id = stack[-1]['spanId'] if stack else None
+            while span_id in self.open_spans:
+                self.open_spans[span_id]['apiCalls'] += 1
+                span_id = self.open_spans[span_id]['parentId']
+
+    def current(self):
+        """ Gets the current span of this thread, or None if there is none """
+        stack = self.stack()
+        return stack[-1] if stack else None
+
+    def stack(self):
+        """ Gets the stack of open spans of this thread """
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def write(self, span):
+        """ Appends a finished span to the trace file, if there is one """
+        if self.trace_file:
+            record = {key: value for key, value in span.items() if key != 'path'}
+            with open(self.trace_file, 'a', encoding='utf-8') as trace_file:
+                trace_file.write(json.dumps(record) + '\n')
+
+    def summary(self):
+        """ Gets the count, total duration, API calls and errors of the spans of each path, in start order """
+        rows = {}
+
+        for span in sorted(self.spans, key=lambda span: span['start']):
+            row = rows.setdefault(span['path'], {'path': span['path'], 'count': 0, 'durationMs': 0.0,
+                                                 'apiCalls': 0, 'errors': 0})
+            row['count'] += 1
+            row['durationMs'] += span['durationMs']
+            row['apiCalls'] += span['apiCalls']
+            row['errors'] += span['outcome'] != 'ok'
+
+        return list(rows.values())
+
+    def report(self):
+        """ Prints the summary table, with nested spans indented under their parents """
+        rows = self.summary()
+        names = ['  ' * row['path'].count(' > ') + row['path'].split(' > ')[-1] for row in rows]
+        width = max([len(name) for name in names] + [len('Span')])
+
+        print('Trace summary:')
+        print(f'  {"Span":<{width}}  {"Count":>5}  {"Total ms":>10}  {"API calls":>9}  {"Errors":>6}')
+        for name, row in zip(names, rows):
+            print(f'  {name:<{width}}  {row["count"]:5d}  {row["durationMs"]:10.1f}  {row["apiCalls"]:9d}  '
+                  f'{row["errors"]:6d}')
+
+    def reset(self):
+        """ Forgets all finished spans """
+        with self.lock:
+            self.spans = []
+
+tracer = Tracer()
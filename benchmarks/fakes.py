@@ -0,0 +1,177 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+In-memory stand-ins for the AWS services and the Greengrass IPC client, for the benchmarks.
+
+The AWS stand-in serves canned responses to real boto3 clients, from their before-call event as the
+botocore Stubber does, so that the benchmarks include the cost of creating clients and of validating and
+serializing requests. Unlike the Stubber, it answers calls in any order and from any thread, and it
+counts the calls and the bytes sent.
+"""
+
+import collections
+import json
+import threading
+import boto3
+from botocore.awsrequest import AWSResponse
+
+ACCOUNT = '123456789012'
+COMPONENT_VERSIONS = [f'2.{minor}.{patch}' for minor in range(12) for patch in range(10)]
+COMPONENT_VERSIONS_PAGE_SIZE = 50
+
+SecretValue = collections.namedtuple('SecretValue', 'secret_string')
+
+class FakeAws():
+    """ Serves Secrets Manager, Greengrass V2, IoT and STS calls from memory, counting them """
+
+    def __init__(self, region):
+        self.region = region
+        self.session = boto3.session.Session(aws_access_key_id='benchmark', aws_secret_access_key='benchmark',
+                                             region_name=region)
+        self.secrets = {}
+        self.versions = 0
+        self.calls = collections.Counter()
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    def client(self, service, region_name=None, config=None):
+        """ Creates a real boto3 client whose calls are answered from memory """
+        client = self.session.client(service, region_name=region_name or self.region, config=config)
+        client.meta.events.register('before-parameter-build', self.record)
+        client.meta.events.register('before-call', self.respond)
+        return client
+
+    def record(self, params, model, context, **kwargs):
+        """ Records the parameters of an API call, which the call's response depends on """
+        del kwargs
+        context['fake_aws_params'] = dict(params)
+        with self.lock:
+            self.calls[f'{model.service_model.service_name}.{model.name}'] += 1
+            self.bytes_sent += len(json.dumps(params, default=str).encode('utf-8'))
+
+    def respond(self, model, params, context, **kwargs):
+        """ Answers an API call, with an HTTP response and the parsed response """
+        del kwargs
+        handler = getattr(self, f'{model.service_model.service_name}_{model.name}')
+        response = handler(context['fake_aws_params'])
+        status_code = 400 if 'Error' in response else 200
+        return AWSResponse(params['url'], status_code, {}, None), response
+
+    def api_calls(self):
+        """ Gets the total number of API calls """
+        return sum(self.calls.values())
+
+    def add_secret(self, name, secret_string):
+        """ Creates a secret, as if by an earlier run """
+        return self.secretsmanager_CreateSecret({'Name': name, 'SecretString': secret_string})
+
+    def secretsmanager_UpdateSecret(self, request):  # pylint: disable=invalid-name
+        """ Updates a secret, if it exists """
+        with self.lock:
+            if request['SecretId'] not in self.secrets:
+                return {'Error': {'Code': 'ResourceNotFoundException', 'Message': 'Not found'}}
+            return self.store(request['SecretId'], request['SecretString'])
+
+    def secretsmanager_CreateSecret(self, request):  # pylint: disable=invalid-name
+        """ Creates a secret """
+        with self.lock:
+            response = self.store(request['Name'], request['SecretString'])
+            self.secrets[request['Name']]['Tags'] = request.get('Tags', [])
+            return response
+
+    def secretsmanager_GetSecretValue(self, request):  # pylint: disable=invalid-name
+        """ Gets the current value of a secret """
+        with self.lock:
+            return {key: value for key, value in self.secrets[request['SecretId']].items() if key != 'Tags'}
+
+    def secretsmanager_DescribeSecret(self, request):  # pylint: disable=invalid-name
+        """ Describes a secret, with its current version and tags, if it exists """
+        with self.lock:
+            if request['SecretId'] not in self.secrets:
+                return {'Error': {'Code': 'ResourceNotFoundException', 'Message': 'Not found'}}
+            secret = self.secrets[request['SecretId']]
+            return {'ARN': secret['ARN'], 'Name': secret['Name'], 'Tags': secret.get('Tags', []),
+                    'VersionIdsToStages': {secret['VersionId']: ['AWSCURRENT']}}
+
+    def secretsmanager_TagResource(self, request):  # pylint: disable=invalid-name
+        """ Adds or replaces tags of a secret """
+        keys = [tag['Key'] for tag in request['Tags']]
+        with self.lock:
+            secret = self.secrets[request['SecretId']]
+            secret['Tags'] = [tag for tag in secret.get('Tags', []) if tag['Key'] not in keys] + request['Tags']
+            return {}
+
+    def store(self, name, secret_string):
+        """ Stores a new version of a secret """
+        self.versions += 1
+        response = {'ARN': f'arn:aws:secretsmanager:{self.region}:{ACCOUNT}:secret:{name}-AbCdEf', 'Name': name,
+                    'VersionId': f'v{self.versions}'}
+        self.secrets[name] = dict(response, SecretString=secret_string)
+        return response
+
+    @staticmethod
+    def greengrassv2_ListComponentVersions(request):  # pylint: disable=invalid-name
+        """ Lists the versions of a public component, a page at a time """
+        start = int(request.get('nextToken', 0))
+        page = COMPONENT_VERSIONS[start:start + COMPONENT_VERSIONS_PAGE_SIZE]
+        response = {'componentVersions': [{'componentVersion': version} for version in page]}
+        if start + COMPONENT_VERSIONS_PAGE_SIZE < len(COMPONENT_VERSIONS):
+            response['nextToken'] = str(start + COMPONENT_VERSIONS_PAGE_SIZE)
+        return response
+
+    @staticmethod
+    def greengrassv2_ListDeployments(request):  # pylint: disable=invalid-name
+        """ Lists the latest deployment to a core device """
+        return {'deployments': [{'deploymentId': 'old-' + request['targetArn'].split('/')[-1]}]}
+
+    def greengrassv2_GetDeployment(self, request):  # pylint: disable=invalid-name
+        """ Gets a deployment, which finishes as soon as it is created """
+        deployment_id = request['deploymentId']
+        thing_name = deployment_id.split('-', 1)[1]
+        return {'deploymentId': deployment_id, 'deploymentStatus': 'COMPLETED',
+                'targetArn': f'arn:aws:iot:{self.region}:{ACCOUNT}:thing/{thing_name}',
+                'components': {'aws.greengrass.Nucleus': {'componentVersion': '2.12.0'}}}
+
+    @staticmethod
+    def greengrassv2_CreateDeployment(request):  # pylint: disable=invalid-name
+        """ Creates a deployment """
+        return {'deploymentId': 'new-' + request['targetArn'].split('/')[-1]}
+
+    @staticmethod
+    def greengrassv2_ListEffectiveDeployments(request):  # pylint: disable=invalid-name
+        """ Lists the deployments on a core device, which have all succeeded """
+        thing_name = request['coreDeviceThingName']
+        return {'effectiveDeployments': [{'deploymentId': 'new-' + thing_name,
+                                          'coreDeviceExecutionStatus': 'SUCCEEDED'}]}
+
+    @staticmethod
+    def sts_GetCallerIdentity(*_):  # pylint: disable=invalid-name
+        """ Gets the caller's account """
+        return {'Account': ACCOUNT}
+
+class FakeSecretValue():  # pylint: disable=too-few-public-methods
+    """ A Greengrass IPC secret value response """
+
+    def __init__(self, secret_string, version_id):
+        self.secret_value = SecretValue(secret_string)
+        self.version_id = version_id
+
+class FakeIpcClient():
+    """ Serves the Greengrass IPC get_secret_value call from the secrets of a FakeAws, counting the calls """
+
+    aws = None
+    calls = 0
+
+    def get_secret_value(self, secret_id, refresh=False):
+        """ Gets a secret by name or ARN """
+        del refresh
+        FakeIpcClient.calls += 1
+        secret = next(secret for secret in self.aws.secrets.values() if secret_id in (secret['ARN'], secret['Name']))
+        return FakeSecretValue(secret['SecretString'], secret['VersionId'])
+
+    @classmethod
+    def serve(cls, aws):
+        """ Serves the secrets of a FakeAws, and resets the call count """
+        cls.aws = aws
+        cls.calls = 0
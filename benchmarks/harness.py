@@ -0,0 +1,132 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Measures the benchmark scenarios, and compares the measurements with the baselines.
+
+Wall time is the median of several runs. Peak memory is measured with tracemalloc in a separate run,
+because tracing slows everything down. Bytes written are the sizes of the project files that a run
+created or changed. API calls and bytes are counted by the stand-ins for the AWS services and the
+Greengrass IPC client.
+
+Wall times depend on the machine, so their baselines are kept apart from the others, on the machine that
+recorded them, rather than in the committed baselines.
+"""
+
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+# A metric regresses if it exceeds its baseline times the ratio plus the slack. Wall time has no slack,
+# because a fixed slack would be larger than the fastest scenarios take.
+TOLERANCES = {
+    'wallSeconds': (1.5, 0),
+    'apiCalls': (1.0, 0),
+    'apiBytes': (1.1, 1024),
+    'bytesWritten': (1.1, 64 * 1024),
+    'peakMemoryBytes': (1.25, 1024 * 1024)
+}
+MACHINE_METRICS = ['wallSeconds']
+
+def measure(scenario, repeat=3):
+    """ Measures a scenario over a number of runs """
+    wall_seconds = []
+
+    for _ in range(repeat):
+        scenario.prepare()
+        before = snapshot(scenario.project)
+        start = time.perf_counter()
+        scenario.run()
+        wall_seconds.append(time.perf_counter() - start)
+        bytes_written = written_bytes(before, snapshot(scenario.project))
+
+    scenario.prepare()
+    tracemalloc.start()
+    try:
+        scenario.run()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'wallSeconds': round(statistics.median(wall_seconds), 4), 'apiCalls': scenario.api_calls(),
+            'apiBytes': scenario.api_bytes(), 'bytesWritten': bytes_written, 'peakMemoryBytes': peak_memory}
+
+def snapshot(directory):
+    """ Gets the size and modification time of every file in a directory tree """
+    files = {}
+
+    for path, _, filenames in os.walk(directory):
+        for filename in filenames:
+            stat = os.stat(os.path.join(path, filename))
+            files[os.path.join(path, filename)] = (stat.st_size, stat.st_mtime_ns)
+
+    return files
+
+def written_bytes(before, after):
+    """ Gets the total size of the files that were created or changed between two snapshots """
+    return sum(size for path, (size, mtime) in after.items() if before.get(path) != (size, mtime))
+
+def regressions(results, baselines, time_tolerance=None):
+    """ Gets a description of each metric that regressed from its baseline """
+    found = []
+
+    for key, metrics in results.items():
+        for metric, value in metrics.items():
+            if metric not in baselines.get(key, {}):
+                continue
+
+            ratio, slack = TOLERANCES[metric]
+            if metric == 'wallSeconds' and time_tolerance is not None:
+                ratio = time_tolerance
+
+            limit = baselines[key][metric] * ratio + slack
+            if value > limit:
+                found.append(f'{key} {metric}: {value} exceeds the baseline {baselines[key][metric]} '
+                             f'(limit {limit:.4g})')
+
+    return found
+
+def load_baselines(baselines_file):
+    """ Loads the baselines, keyed by scenario and size """
+    try:
+        with open(baselines_file, encoding='utf-8') as file:
+            return json.load(file)
+    except OSError:
+        return {}
+
+def merge_baselines(*all_baselines):
+    """ Merges the metrics of several sets of baselines, keyed by scenario and size """
+    merged = {}
+
+    for baselines in all_baselines:
+        for key, metrics in baselines.items():
+            merged.setdefault(key, {}).update(metrics)
+
+    return merged
+
+def select_metrics(results, machine):
+    """ Gets the metrics of the results that depend on the machine, or those that do not """
+    return {key: {metric: value for metric, value in metrics.items() if (metric in MACHINE_METRICS) == machine}
+            for key, metrics in results.items()}
+
+def save_baselines(baselines_file, baselines):
+    """ Saves the baselines """
+    if os.path.dirname(baselines_file):
+        os.makedirs(os.path.dirname(baselines_file), exist_ok=True)
+    with open(baselines_file, 'w', encoding='utf-8') as file:
+        json.dump(baselines, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+def report(results, baselines):
+    """ Prints a table of the measurements, with the change in wall time from the baseline """
+    print(f'{"Benchmark":<36} {"Wall ms":>9} {"Change":>7} {"API calls":>9} {"API KB":>8} {"Written KB":>10} '
+          f'{"Peak MB":>8}')
+
+    for key, metrics in results.items():
+        baseline = baselines.get(key, {}).get('wallSeconds')
+        change = f'{(metrics["wallSeconds"] / baseline - 1) * 100:+.0f}%' if baseline else 'new'
+        print(f'{key:<36} {metrics["wallSeconds"] * 1000:9.1f} {change:>7} {metrics["apiCalls"]:9d} '
+              f'{metrics["apiBytes"] / 1024:8.1f} {metrics["bytesWritten"] / 1024:10.1f} '
+              f'{metrics["peakMemoryBytes"] / 1024 / 1024:8.1f}')
@@ -0,0 +1,103 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Measures the latency of Home Assistant history queries, to compare recorder databases.
+
+The history of the given entities is queried through the Home Assistant REST API, over windows of an hour,
+a day and a week ending now, and the median and 95th percentile latencies of each window are recorded
+under a label. Run it against the same Home Assistant before and after moving the recorder to an external
+database, with a different label each time, and the results of every label are compared. This needs a
+running Home Assistant and a long-lived access token, so it is not part of benchmarks.run.
+
+Example execution:
+python3 -m benchmarks.history --url http://core:8123 --token TOKEN --entities sensor.temperature --label sqlite
+python3 -m benchmarks.history --url http://core:8123 --token TOKEN --entities sensor.temperature --label mariadb
+"""
+
+import argparse
+import datetime
+import json
+import statistics
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+WINDOWS = {'hour': datetime.timedelta(hours=1), 'day': datetime.timedelta(days=1),
+           'week': datetime.timedelta(days=7)}
+FILE_RESULTS = 'history_latency.json'
+REQUEST_TIMEOUT_SECONDS = 120
+
+def query_history(url, token, entities, window):
+    """ Queries the history of the entities over a window ending now, and gets the latency and state count """
+    end = datetime.datetime.now(datetime.timezone.utc)
+    query = urllib.parse.urlencode({'filter_entity_id': ','.join(entities), 'end_time': end.isoformat(),
+                                    'minimal_response': '', 'no_attributes': ''})
+    request = urllib.request.Request(f'{url.rstrip("/")}/api/history/period/{(end - window).isoformat()}?{query}',
+                                     headers={'Authorization': f'Bearer {token}'})
+
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+        body = response.read()
+    latency = time.perf_counter() - start
+
+    return latency, sum(len(entity_states) for entity_states in json.loads(body))
+
+def measure(url, token, entities, repeat):
+    """ Measures the median and 95th percentile latencies of each window """
+    results = {}
+
+    for name, window in WINDOWS.items():
+        latencies = []
+        states = 0
+        for _ in range(repeat):
+            latency, states = query_history(url, token, entities, window)
+            latencies.append(latency)
+        percentile = sorted(latencies)[max(round(len(latencies) * 0.95) - 1, 0)]
+        results[name] = {'p50Ms': round(statistics.median(latencies) * 1000, 1), 'p95Ms': round(percentile * 1000, 1),
+                         'states': states}
+
+    return results
+
+def load_results(results_file):
+    """ Loads the results of every label """
+    try:
+        with open(results_file, encoding='utf-8') as file:
+            return json.load(file)
+    except OSError:
+        return {}
+
+def report(results):
+    """ Prints the latencies of every label, with the change from the first label """
+    first = next(iter(results.values()))
+    print(f'{"Label":<16} {"Window":<6} {"States":>8} {"p50 ms":>9} {"p95 ms":>9} {"Change":>7}')
+
+    for label, windows in results.items():
+        for name, metrics in windows.items():
+            change = f'{(metrics["p50Ms"] / first[name]["p50Ms"] - 1) * 100:+.0f}%' if first[name]['p50Ms'] else '-'
+            print(f'{label:<16} {name:<6} {metrics["states"]:8d} {metrics["p50Ms"]:9.1f} {metrics["p95Ms"]:9.1f} '
+                  f'{change:>7}')
+
+
+parser = argparse.ArgumentParser(description='Measure the latency of Home Assistant history queries')
+parser.add_argument('--url', default='http://localhost:8123', help='Home Assistant URL')
+parser.add_argument('--token', required=True, help='Home Assistant long-lived access token')
+parser.add_argument('--entities', nargs='+', required=True, help='Entities to query the history of')
+parser.add_argument('--label', required=True, help='Label of the results, such as the recorder database')
+parser.add_argument('--repeat', type=int, default=10, help='Queries of each window')
+parser.add_argument('--results', default=FILE_RESULTS, help='Results file')
+args = parser.parse_args()
+
+all_results = load_results(args.results)
+
+try:
+    all_results[args.label] = measure(args.url, args.token, args.entities, args.repeat)
+except (OSError, ValueError) as e:
+    print(f'Failed to query the history.\nException: {e}', file=sys.stderr)
+    sys.exit(1)
+
+with open(args.results, 'w', encoding='utf-8') as output_file:
+    json.dump(all_results, output_file, indent=2)
+
+report(all_results)
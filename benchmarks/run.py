@@ -0,0 +1,77 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Runs the benchmarks of the build, secret, install and deploy paths, and fails if any regressed.
+
+Each scenario runs in a synthetic project whose secrets and artifacts/config trees have 10 (small),
+200 (medium) or 1000 (large) files, or which deploys to 1, 20 or 200 core devices. The measurements are
+compared with those in benchmarks/baselines.json. Wall times depend on the machine, so they are compared
+with the baselines in .build-cache/benchmark_times.json, which are recorded on this machine by
+--update-baselines and never committed. Loosen the time tolerance on noisy machines.
+
+Example execution:
+python3 -m benchmarks.run
+python3 -m benchmarks.run --sizes small --scenarios gdk_build install
+python3 -m benchmarks.run --update-baselines
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from benchmarks.harness import load_baselines, measure, merge_baselines, regressions, report, save_baselines
+from benchmarks.harness import select_metrics
+from benchmarks.scenarios import SCENARIOS, create_project
+
+SIZES = {'small': {'files': 10, 'devices': 1},
+         'medium': {'files': 200, 'devices': 20},
+         'large': {'files': 1000, 'devices': 200}}
+FILE_BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+FILE_MACHINE_BASELINES = '.build-cache/benchmark_times.json'
+
+parser = argparse.ArgumentParser(description='Run the benchmarks and check them against the baselines')
+parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES), help='Sizes to run')
+parser.add_argument('--scenarios', nargs='+', choices=[scenario.name for scenario in SCENARIOS],
+                    default=[scenario.name for scenario in SCENARIOS], help='Scenarios to run')
+parser.add_argument('--repeat', type=int, default=3, help='Runs to take the median wall time of')
+parser.add_argument('--time-tolerance', type=float, help='Ratio of the baseline wall time that is a regression')
+parser.add_argument('--update-baselines', action='store_true', help='Save the measurements as the baselines')
+parser.add_argument('--baselines', default=FILE_BASELINES, help='Baselines file')
+parser.add_argument('--machine-baselines', default=FILE_MACHINE_BASELINES,
+                    help='Baselines file of the wall times on this machine')
+args = parser.parse_args()
+
+baselines = merge_baselines(load_baselines(args.baselines), load_baselines(args.machine_baselines))
+results = {}
+
+for size in args.sizes:
+    project = tempfile.mkdtemp(prefix='benchmark-')
+    try:
+        create_project(project, SIZES[size]['files'])
+        for scenario_class in SCENARIOS:
+            if scenario_class.name in args.scenarios:
+                key = f'{scenario_class.name}/{size}'
+                print(f'Running {key}')
+                results[key] = measure(scenario_class(project, SIZES[size][scenario_class.unit]), args.repeat)
+    finally:
+        shutil.rmtree(project)
+
+report(results, baselines)
+
+if args.update_baselines:
+    save_baselines(args.baselines, merge_baselines(load_baselines(args.baselines), select_metrics(results, False)))
+    save_baselines(args.machine_baselines,
+                   merge_baselines(load_baselines(args.machine_baselines), select_metrics(results, True)))
+    print(f'Updated the baselines in {args.baselines}, and the wall times in {args.machine_baselines}')
+    sys.exit(0)
+
+failures = regressions(results, baselines, args.time_tolerance)
+for failure in failures:
+    print(f'REGRESSION: {failure}')
+
+if failures:
+    sys.exit(1)
+
+print('No regressions')
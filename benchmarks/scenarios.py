@@ -0,0 +1,245 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+The benchmarked code paths, each run as its script would be, in a synthetic project directory.
+
+The project holds synthetic secrets and artifacts/config trees of a given number of files, a Docker
+Compose file whose image is already pinned, and a seeded wheelhouse, so that nothing reaches the
+network. AWS and Greengrass IPC calls are answered by the stand-ins in benchmarks.fakes.
+"""
+
+import abc
+import contextlib
+import os
+import random
+import runpy
+import shutil
+import sys
+from unittest import mock
+from benchmarks.fakes import FakeAws, FakeIpcClient
+from libs.aws import aws_clients
+from libs.component_versions import ComponentVersionResolver
+from libs.envelope import Envelope
+from libs.secret import Secret
+from libs.tracing import tracer
+from libs.wheelhouse import Wheelhouse, MARKER_FILE
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REGION = 'us-east-1'
+IMAGE = 'homeassistant/home-assistant@sha256:' + '0' * 64
+WORDS = ['light', 'switch', 'sensor', 'automation', 'trigger', 'platform', 'state', 'entity_id', 'service',
+         'condition', 'kitchen', 'garage', 'temperature', 'humidity', 'motion', 'door', 'on', 'off', 'true']
+WHEEL_SIZE = 512 * 1024
+WHEELS = 2
+
+def synthetic_tree(directory, files, seed):
+    """ Creates a tree of YAML files, with a binary certificate every fiftieth file """
+    generator = random.Random(seed)
+
+    for index in range(files):
+        path = os.path.join(directory, f'package{index % 10}')
+        os.makedirs(path, exist_ok=True)
+
+        if index % 50 == 49:
+            with open(os.path.join(path, f'cert{index}.p12'), 'wb') as file:
+                file.write(generator.randbytes(512))
+        else:
+            lines = [f'{generator.choice(WORDS)}_{index}:'] +\
+                [f'  {generator.choice(WORDS)}: {generator.choice(WORDS)}' for _ in range(generator.randint(2, 6))]
+            with open(os.path.join(path, f'file{index}.yaml'), 'w', encoding='utf-8') as file:
+                file.write('\n'.join(lines) + '\n')
+
+def create_project(directory, files):
+    """ Creates a synthetic project, with secrets and artifacts/config trees of the given number of files """
+    shutil.copy(os.path.join(REPOSITORY, 'gdk-config.json'), directory)
+    shutil.copy(os.path.join(REPOSITORY, 'recipe.yaml'), directory)
+    shutil.copytree(os.path.join(REPOSITORY, 'artifacts'), os.path.join(directory, 'artifacts'),
+                    ignore=shutil.ignore_patterns('config', '__pycache__'))
+
+    with open(os.path.join(directory, 'artifacts', 'docker-compose.yml'), 'w', encoding='utf-8') as compose_file:
+        compose_file.write(f'services:\n  homeassistant:\n    container_name: homeassistant\n    image: "{IMAGE}"\n')
+
+    synthetic_tree(os.path.join(directory, 'secrets'), files, seed=1)
+    synthetic_tree(os.path.join(directory, 'artifacts', 'config'), files, seed=2)
+
+    # Seed the wheelhouse cache, so that the build does not download wheels
+    with working_directory(directory):
+        wheelhouse = os.path.join('.build-cache', 'wheelhouse', Wheelhouse('artifacts/requirements.txt').key())
+        os.makedirs(wheelhouse)
+        generator = random.Random(3)
+        for index in range(WHEELS):
+            with open(os.path.join(wheelhouse, f'wheel{index}-1.0-py3-none-any.whl'), 'wb') as wheel_file:
+                wheel_file.write(generator.randbytes(WHEEL_SIZE))
+        with open(os.path.join(wheelhouse, MARKER_FILE), 'w', encoding='utf-8') as marker_file:
+            marker_file.write('{"targets": [], "missing": []}')
+
+@contextlib.contextmanager
+def working_directory(directory):
+    """ Runs the context in a directory, restoring the working directory afterwards """
+    previous = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def run_script(module, arguments):
+    """ Runs a script module quietly with the given arguments, failing if it exits with an error """
+    sys.argv[1:] = arguments
+
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull),\
+            contextlib.redirect_stderr(devnull):
+        try:
+            runpy.run_module(module)
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                raise RuntimeError(f'{module} exited with status {e.code}') from e
+
+class Scenario(abc.ABC):
+    """ A benchmarked code path, run in a synthetic project directory with a size in files or devices """
+
+    name = None
+    unit = 'files'
+
+    def __init__(self, project, size):
+        self.project = project
+        self.size = size
+        self.aws = FakeAws(REGION)
+
+    def prepare(self):
+        """ Resets the state that a run depends on, before each run """
+        self.aws = FakeAws(REGION)
+        aws_clients.reset()
+        tracer.reset()
+
+    def run(self):
+        """ Runs the code path in the project directory """
+        with working_directory(self.project), mock.patch('boto3.client', self.aws.client):
+            self.run_in_project()
+
+    @abc.abstractmethod
+    def run_in_project(self):
+        """ Runs the code path, in the project directory """
+
+    def api_calls(self):
+        """ Gets the number of API calls that the last run made """
+        return self.aws.api_calls()
+
+    def api_bytes(self):
+        """ Gets the number of bytes of API call parameters that the last run sent """
+        return self.aws.bytes_sent
+
+    def remove(self, *paths):
+        """ Removes files and directories of the project, if they exist """
+        for path in paths:
+            path = os.path.join(self.project, path)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+
+class CreateConfigSecret(Scenario):
+    """ Creates the configuration secret from the secrets tree """
+
+    name = 'create_config_secret'
+
+    def run_in_project(self):
+        run_script('create_config_secret', [])
+
+class GdkBuild(Scenario):
+    """ Builds the component from scratch, apart from the wheelhouse """
+
+    name = 'gdk_build'
+
+    def prepare(self):
+        super().prepare()
+        self.aws.add_secret(Secret.SECRET_NAME, '{}')
+        self.remove('greengrass-build', os.path.join('.build-cache', 'archives'),
+                    os.path.join('.build-cache', 'build.json'))
+        os.makedirs(os.path.join(self.project, 'greengrass-build', 'recipes'))
+
+    def run_in_project(self):
+        run_script('gdk_build', [])
+
+class GdkRebuild(GdkBuild):
+    """ Rebuilds the component with nothing changed, reusing the build cache """
+
+    name = 'gdk_rebuild'
+
+    def prepare(self):
+        super().prepare()
+        self.run()
+        self.remove('greengrass-build')
+        os.makedirs(os.path.join(self.project, 'greengrass-build', 'recipes'))
+        self.aws.calls.clear()
+        self.aws.bytes_sent = 0
+
+class Install(Scenario):
+    """ Installs the component on a core device, fetching the secret through IPC and creating the files """
+
+    name = 'install'
+
+    def __init__(self, project, size):
+        super().__init__(project, size)
+        self.version_id = None
+        self.work_directory = os.path.join(project, 'work')
+        self.secret_string = self.create_secret_string()
+        # The edge scripts import their modules from the artifacts directory
+        if os.path.join(REPOSITORY, 'artifacts') not in sys.path:
+            sys.path.insert(0, os.path.join(REPOSITORY, 'artifacts'))
+
+    def create_secret_string(self):
+        """ Creates the configuration secret of the secrets tree, as create_config_secret.py does """
+        envelope = Envelope()
+        secrets_directory = os.path.join(self.project, 'secrets')
+
+        for directory, _, filenames in os.walk(secrets_directory):
+            for filename in filenames:
+                with open(os.path.join(directory, filename), 'rb') as file:
+                    envelope.add(os.path.relpath(os.path.join(directory, filename), secrets_directory), file.read())
+
+        return envelope.to_json()
+
+    def prepare(self):
+        super().prepare()
+
+        with mock.patch('boto3.client', self.aws.client), open(os.devnull, 'w', encoding='utf-8') as devnull,\
+                contextlib.redirect_stdout(devnull):
+            self.version_id = Secret(REGION).put(self.secret_string)['VersionId']
+
+        self.remove('work')
+        os.makedirs(os.path.join(self.work_directory, 'config'))
+        self.aws.calls.clear()
+        self.aws.bytes_sent = 0
+        FakeIpcClient.serve(self.aws)
+
+    def run_in_project(self):
+        with working_directory(self.work_directory), mock.patch('secret.GreengrassCoreIPCClientV2', FakeIpcClient):
+            run_script('artifacts.install', [Secret.SECRET_NAME, self.version_id])
+
+    def api_calls(self):
+        return FakeIpcClient.calls
+
+class DeployComponentVersion(Scenario):
+    """ Deploys a component version to core devices, one device or a fleet """
+
+    name = 'deploy_component_version'
+    unit = 'devices'
+
+    def prepare(self):
+        super().prepare()
+        self.aws.add_secret(Secret.SECRET_NAME, '{}')
+        self.remove(ComponentVersionResolver.CACHE_FILE)
+
+        with open(os.path.join(self.project, 'things.txt'), 'w', encoding='utf-8') as things_file:
+            things_file.writelines(f'thing-{index}\n' for index in range(self.size))
+
+    def run_in_project(self):
+        if self.size == 1:
+            run_script('deploy_component_version', ['1.0.0', 'thing-0', '--pollInterval', '0.01'])
+        else:
+            run_script('deploy_component_version', ['1.0.0', '--thingsFile', 'things.txt', '--rateLimit', '1000000',
+                                                    '--pollInterval', '0.01'])
+
+SCENARIOS = [CreateConfigSecret, GdkBuild, GdkRebuild, Install, DeployComponentVersion]
@@ -9,37 +9,98 @@ SSL or MQTT certificates, these files should be placed into the secrets director
 to creating the secret; these are also bundled into the secret. The gdk-config.json file
 should be updated with the desired AWS region prior to running this script.
 
+Files are stored in a versioned envelope that holds text files as text and binary files
+(such as DER or PKCS#12 certificates) as base64, compressing files where that is smaller.
+Before anything is uploaded, the secret is checked against the size limit and decoded to
+confirm that it reproduces the files on disk exactly. A secret larger than the Secrets Manager
+limit for one secret is split across shard secrets, listed by an index in the Home Assistant secret.
+If gdk-config.json lists further regions, the secret and any shard secrets are replicated to them.
+
 Example execution:
 python3 create_config_secret.py
+python3 create_config_secret.py --compression none
 """
 
+import argparse
 import glob
+import json
+import os
+import sys
+from artifacts.envelope import unpack
 from libs.secret import Secret
 from libs.gdk_config import GdkConfig
+from libs.envelope import Envelope, EDGE_COMPRESSIONS, COMPRESSION_ZLIB, SECRET_SIZE_LIMIT
+from libs.build_cache import BuildCache
+from libs.tracing import tracer
 
 DIRECTORY_CONFIG = 'secrets/'
 
-def escape(in_str):
-    """ Escapes a string to make it suitable for storage in JSON """
-    return in_str.replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+def secret_filename(path):
+    """ Gets the name of a file in the secret from its path on disk """
+    return path.replace(DIRECTORY_CONFIG, '')
+
+def file_mode(path):
+    """ Gets the permission bits of a file on disk """
+    return os.stat(path).st_mode & 0o777
+
+@tracer.traced('verify_round_trip')
+def verify_round_trip(secret_string):
+    """ Confirms that the secret decodes to exactly the files on disk, as it will on the core device """
+    files, modes = unpack(json.loads(secret_string))
+
+    if sorted(files) != sorted(secret_filename(path) for path in filenames):
+        print('Secret does not contain exactly the files on disk')
+        sys.exit(1)
+
+    for path in filenames:
+        with open(path, 'rb') as disk_file:
+            if files[secret_filename(path)] != disk_file.read() or modes.get(secret_filename(path)) != file_mode(path):
+                print(f'Secret does not reproduce {path}')
+                sys.exit(1)
+
+    print('Verified that the secret reproduces the files on disk')
+
 
-secret_string = '{'
+parser = argparse.ArgumentParser(description='Create or update the Home Assistant configuration secret')
+parser.add_argument('--compression', choices=EDGE_COMPRESSIONS, default=COMPRESSION_ZLIB,
+                    help='Compression for files in the secret, which the core device can decode')
+args = parser.parse_args()
 
-filenames = glob.glob(DIRECTORY_CONFIG + '/**/*.*', recursive=True)
+envelope = Envelope(args.compression)
+
+filenames = sorted(glob.glob(DIRECTORY_CONFIG + '/**/*.*', recursive=True))
 
 print(f'Files to add to secret: {filenames}')
 
-for filename in filenames:
-    with open(filename, encoding="utf-8") as file:
-        file_str = file.read()
-        secret_string += f'"{filename.replace(DIRECTORY_CONFIG, "")}":"{escape(file_str)}",'
+with tracer.span('create_envelope', files=len(filenames)):
+    for filename in filenames:
+        with open(filename, 'rb') as file:
+            envelope.add(secret_filename(filename), file.read(), file_mode(filename))
+
+    # Fail before making any network calls if the secret is too large, even for sharding
+    size = envelope.report()
+
+if size > Secret.MAX_SIZE:
+    print(f'Secret exceeds the {Secret.MAX_SIZE} byte limit of {Secret.MAX_SHARDS} shards. Abort.')
+    sys.exit(1)
 
-secret_string = secret_string[:-1] + '}'
+verify_round_trip(envelope.to_json())
 
 gdk_config = GdkConfig()
 
 secret = Secret(gdk_config.region())
-secret_response = secret.put(secret_string)
+secret_response = secret.put(envelope.to_json())
+
+replica_regions = gdk_config.replica_regions()
+if replica_regions:
+    secret.replicate(replica_regions)
+
+# The next component build must pick up the new secret version
+BuildCache().invalidate_secret()
 
 print('\nBEFORE DEPLOYING COMPONENT:')
 print(f'Add secretsmanager:GetSecretValue for {secret_response["ARN"]} to the Greengrass device role')
+if size > SECRET_SIZE_LIMIT:
+    print(f'The secret is sharded, so also add {Secret.SHARD_NAME_FORMAT.format("*")} to the Greengrass device role')
+
+tracer.report()
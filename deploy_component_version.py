@@ -7,152 +7,158 @@ called after "gdk component build" and "gdk component publish".
 
 Example execution:
 python3 deploy_component_version.py 1.0.0 MyCoreDeviceThingName
+
+Fleet example execution, with a canary device and waves of 20 devices:
+python3 deploy_component_version.py 1.0.0 --thingGroup MyThingGroup --canary 1 --waveSize 20 --summary fleet.json
+
+The changes to the existing deployment of each core device are printed, and no deployment is created for a core
+device that already has the component version. To only print the changes, as JSON as well:
+python3 deploy_component_version.py 1.0.0 MyCoreDeviceThingName --dryRun --json
+
+To deploy to the thing group in the region in gdk-config.json and every further region that it lists, concurrently,
+after publishing with publish_component_version.py:
+python3 deploy_component_version.py 1.0.0 --thingGroup MyThingGroup --allRegions --summary regions.json
 """
 
 import argparse
+import functools
 import json
 import sys
-import time
-import boto3
-from libs.secret import Secret
+from concurrent.futures import ThreadPoolExecutor
+from libs.aws import POLLING_CLIENT_CONFIG, aws_clients
+from libs.secret import Secret, secret_arns
 from libs.gdk_config import GdkConfig
+from libs.deployer import Deployer, DeploymentError
+from libs.deployment_watcher import DeploymentWatcher
+from libs.fleet import FleetRollout, RateLimiter
+from libs.tracing import tracer
 
-ACCOUNT = boto3.client('sts').get_caller_identity().get('Account')
-COMPONENT_DOCKER_APPLICATION_MANAGER = 'aws.greengrass.DockerApplicationManager'
-COMPONENT_SECRET_MANAGER = 'aws.greengrass.SecretManager'
-
-def get_newest_component_version(component_name):
-    """ Gets the newest version of a component """
-    component_arn = f'arn:aws:greengrass:{gdk_config.region()}:aws:components:{component_name}'
+def get_thing_names():
+    """ Gets the core device thing names from the arguments, the thing names file and the thing group """
+    thing_names = [args.coreDeviceThingName] if args.coreDeviceThingName else []
 
-    try:
-        response = greengrassv2_client.list_component_versions(arn=component_arn)
-    except Exception as e:
-        print(f'Failed to get component versions for {component_name}\nException: {e}')
-        sys.exit(1)
+    if args.thingsFile:
+        with open(args.thingsFile, encoding="utf-8") as things_file:
+            thing_names += [line.strip() for line in things_file if line.strip() and not line.startswith('#')]
 
-    return response['componentVersions'][0]['componentVersion']
+    if args.thingGroup:
+        try:
+            thing_names += list_thing_group(gdk_config.region())
+        except Exception as e:
+            print(f'Failed to list things in thing group {args.thingGroup}\nException: {e}')
+            sys.exit(1)
 
-def get_deployment():
-    """ Gets the details of the existing deployment """
-    thing_arn = f'arn:aws:iot:{gdk_config.region()}:{ACCOUNT}:thing/{args.coreDeviceThingName}'
+    # Remove duplicates, preserving order
+    return list(dict.fromkeys(thing_names))
+
+def list_thing_group(region):
+    """ Gets the things in the thing group in a region """
+    iot_client = aws_clients.client('iot', region)
+    request = {'thingGroupName': args.thingGroup, 'recursive': True}
+    thing_names = []
+
+    while True:
+        response = iot_client.list_things_in_thing_group(**request)
+        thing_names += response['things']
+        if 'nextToken' not in response:
+            return thing_names
+        request['nextToken'] = response['nextToken']
+
+def deploy_to_device(thing_name, device_deployer=None, polling_client=None):
+    """
+    Deploys the component version to one core device, by default in the region in gdk-config.json. The deployment
+    is polled through a client with standard retries, so that the watcher sees throttling and backs off.
+    """
+    watcher = DeploymentWatcher(polling_client or greengrassv2_polling_client, args.pollInterval,
+                                args.maxPollInterval)
+    result = (device_deployer or deployer).deploy(thing_name, args.version, watcher, args.timeout)
+    print_changes(thing_name, result['changes'])
+    return result
+
+def attach_rate_limiter(*clients):
+    """ Makes the API calls of the clients, which share a region, take tokens from one rate limiter """
+    rate_limiter = RateLimiter(args.rateLimit)
+    for client in clients:
+        rate_limiter.attach(client)
+
+def dry_run(thing_names):
+    """ Prints the changes that deploying the component version would make, without deploying it """
+    for thing_name in thing_names:
+        try:
+            _, changes = deployer.plan(thing_name, args.version)
+        except DeploymentError:
+            sys.exit(1)
+        print_changes(thing_name, changes)
 
-    print(f'Searching for existing single Thing deployment for {args.coreDeviceThingName}')
+    print('Dry run. No deployments were created.')
 
-    try:
-        # Get the latest deployment for the specified core device name
-        response = greengrassv2_client.list_deployments(
-            targetArn=thing_arn,
-            historyFilter='LATEST_ONLY',
-            maxResults=1
-        )
-    except Exception as e:
-        print(f'Failed to list deployments\nException: {e}')
-        sys.exit(1)
+def print_changes(thing_name, changes):
+    """ Prints the deployment changes of a core device as JSON, if asked to """
+    if args.json:
+        print(json.dumps({'thingName': thing_name, 'changes': changes}))
 
-    # We expect to update an existing deployment, not create a new one
-    if len(response['deployments']) == 0:
-        print('No existing Thing deployment for this Core Device. Abort.')
-        sys.exit(1)
+def deploy_to_fleet(thing_names):
+    """ Deploys the component version to a fleet of core devices """
+    print(f'Attempting deployment of version {args.version} to {len(thing_names)} core devices')
+    rollout = FleetRollout(deploy_to_device, args.concurrency, args.maxFailureRate)
+    rollout.run(thing_names, args.canary, args.waveSize)
+    summary = rollout.summary()
 
-    # We expect at most one result in the list
-    deployment_id = response['deployments'][0]['deploymentId']
+    print(f'Fleet deployment finished: {json.dumps(summary["counts"])}')
+    for result in summary['devices']:
+        print(f'{result["thingName"]}: {result["status"]} {result.get("error", "")}')
 
-    try:
-        response = greengrassv2_client.get_deployment(deploymentId=deployment_id)
-
-        if 'deploymentName' in response:
-            print(f'Found existing named deployment "{response["deploymentName"]}"')
-        else:
-            print(f'Found existing unnamed deployment {deployment_id}')
-    except Exception as e:
-        print(f'Failed to get deployment\nException: {e}')
-        sys.exit(1)
+    if args.summary:
+        with open(args.summary, 'w', encoding="utf-8") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+        print(f'Wrote fleet deployment summary to {args.summary}')
 
-    return response
-
-def update_deployment(deployment):
-    """ Updates the current deplyment with the desired versions of the components """
-
-    # If Docker Application manager is not in the deployment, add the latest version
-    if COMPONENT_DOCKER_APPLICATION_MANAGER not in deployment['components']:
-        version = get_newest_component_version(COMPONENT_DOCKER_APPLICATION_MANAGER)
-        print(f'Adding {COMPONENT_DOCKER_APPLICATION_MANAGER} {version} to the deployment')
-        deployment['components'].update({COMPONENT_DOCKER_APPLICATION_MANAGER: {'componentVersion': version}})
-
-    # If Secret manager is not in the deployment, add the latest version
-    if COMPONENT_SECRET_MANAGER not in deployment['components']:
-        version = get_newest_component_version(COMPONENT_SECRET_MANAGER)
-        print(f'Adding {COMPONENT_SECRET_MANAGER} {version} to the deployment')
-        cloud_secrets = [{"arn": secret_value['ARN']}]
-    else:
-        # If it's already in the deployment, use the current version
-        version = deployment['components'][COMPONENT_SECRET_MANAGER]['componentVersion']
-        merge_str = deployment['components'][COMPONENT_SECRET_MANAGER]['configurationUpdate']['merge']
-        cloud_secrets = json.loads(merge_str)['cloudSecrets']
-
-        # Add our secret to the list of configured secrets
-        if secret_value['ARN'] not in merge_str:
-            print(f'Adding secret {secret_value["ARN"]} to Secret Manager configuration')
-            cloud_secrets.append({"arn": secret_value['ARN']})
-
-    # Update Secret Manager with the appropriate version and configuration
-    deployment['components'].update({COMPONENT_SECRET_MANAGER: {
-        'componentVersion': version,
-        'configurationUpdate': {'merge': '{"cloudSecrets":' + json.dumps(cloud_secrets) + '}'}}
-    })
-
-    # Add or update our component to the specified version
-    if gdk_config.name() not in deployment['components']:
-        print(f'Adding {gdk_config.name()} {args.version} to the deployment')
-    else:
-        print(f'Updating deployment with {gdk_config.name()} {args.version}')
-    deployment['components'].update({gdk_config.name(): {'componentVersion': args.version}})
-
-def create_deployment(deployment):
-    """ Creates a deployment of the component to the given Greengrass core device """
-
-    # Give the deployment a name if it doesn't already have one
-    if 'deploymentName' in deployment:
-        deployment_name = deployment['deploymentName']
-    else:
-        deployment_name = f'Deployment for {args.coreDeviceThingName}'
-        print(f'Renaming deployment to "{deployment_name}"')
+    tracer.report()
 
-    try:
-        # We deploy to a single Thing and hence without an IoT job configuration
-        # Deploy with default deployment policies and no tags
-        response = greengrassv2_client.create_deployment(
-            targetArn=deployment['targetArn'],
-            deploymentName=deployment_name,
-            components=deployment['components']
-        )
-    except Exception as e:
-        print(f'Failed to create deployment\nException: {e}')
+    if rollout.failed() or rollout.tripped:
         sys.exit(1)
 
-    return response['deploymentId']
-
-def wait_for_deployment_to_finish(deploy_id):
-    """ Waits for the deployment to complete """
-    deployment_status = 'ACTIVE'
-    snapshot = time.time()
-
-    while deployment_status == 'ACTIVE' and (time.time() - snapshot) < 900:
+def deploy_to_region(region):
+    """ Deploys the component version to the thing group in one region, getting the summary rather than raising """
+    with tracer.span('deploy_to_region', region=region):
         try:
-            response = greengrassv2_client.get_deployment(deploymentId=deploy_id)
-            deployment_status = response['deploymentStatus']
-        except Exception as e:
-            print(f'Failed to get deployment\nException: {e}')
-            sys.exit(1)
-
-    if deployment_status == 'COMPLETED':
-        print(f'Deployment completed successfully in {time.time() - snapshot:.1f} seconds')
-    elif deployment_status == 'ACTIVE':
-        print('Deployment timed out')
-        sys.exit(1)
-    else:
-        print(f'Deployment error: {deployment_status}')
+            client = aws_clients.client('greengrassv2', region)
+            polling_client = aws_clients.client('greengrassv2', region, config=POLLING_CLIENT_CONFIG)
+            attach_rate_limiter(client, polling_client)
+            region_deployer = Deployer(client, gdk_config.for_region(region), aws_clients.account_id(),
+                                       secret_arns(Secret(region).get()))
+            thing_names = list(dict.fromkeys(list_thing_group(region)))
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f'{region}: Failed to prepare the deployment\nException: {e}')
+            return {'status': 'FAILED', 'error': str(e)}
+
+        print(f'{region}: Attempting deployment of version {args.version} to {len(thing_names)} core devices')
+        rollout = FleetRollout(functools.partial(deploy_to_device, device_deployer=region_deployer,
+                                                 polling_client=polling_client),
+                               args.concurrency, args.maxFailureRate)
+        rollout.run(thing_names, args.canary, args.waveSize)
+
+        failed = rollout.failed() or rollout.tripped
+        return dict(rollout.summary(), status='FAILED' if failed else 'SUCCEEDED')
+
+def deploy_to_regions(regions):
+    """ Deploys the component version to the thing group in each region concurrently """
+    with ThreadPoolExecutor(len(regions)) as executor:
+        summaries = dict(zip(regions, executor.map(tracer.bind(deploy_to_region), regions)))
+
+    print('Multi-region deployment finished')
+    for region, summary in summaries.items():
+        counts = json.dumps(summary.get('counts', {}))
+        print(f'{region}: {summary["status"]} {counts} {summary.get("error", "")}'.rstrip())
+
+    if args.summary:
+        with open(args.summary, 'w', encoding="utf-8") as summary_file:
+            json.dump({'regions': summaries}, summary_file, indent=2)
+        print(f'Wrote multi-region deployment summary to {args.summary}')
+
+    tracer.report()
+
+    if any(summary['status'] == 'FAILED' for summary in summaries.values()):
         sys.exit(1)
 
 
@@ -160,23 +166,63 @@ gdk_config = GdkConfig()
 
 parser = argparse.ArgumentParser(description=f'Deploy a version of the {gdk_config.name()} component')
 parser.add_argument('version', help='Version of the component to be deployed (Example: 1.0.0)')
-parser.add_argument('coreDeviceThingName', help='Greengrass core device to deploy to')
+parser.add_argument('coreDeviceThingName', nargs='?', help='Greengrass core device to deploy to')
+parser.add_argument('--thingsFile', help='File listing Greengrass core devices to deploy to, one per line')
+parser.add_argument('--thingGroup', help='Thing group of Greengrass core devices to deploy to')
+parser.add_argument('--timeout', type=float, default=DeploymentWatcher.DEFAULT_TIMEOUT,
+                    help='Seconds to wait for the deployment to finish')
+parser.add_argument('--pollInterval', type=float, default=DeploymentWatcher.DEFAULT_POLL_INTERVAL,
+                    help='Initial seconds between deployment status polls')
+parser.add_argument('--maxPollInterval', type=float, default=DeploymentWatcher.DEFAULT_MAX_POLL_INTERVAL,
+                    help='Maximum seconds between deployment status polls')
+parser.add_argument('--concurrency', type=int, default=10, help='Maximum concurrent core device deployments')
+parser.add_argument('--rateLimit', type=float, default=5.0, help='Maximum Greengrass API calls per second')
+parser.add_argument('--canary', type=int, default=0, help='Core devices to deploy to before the waves')
+parser.add_argument('--waveSize', type=int, default=0, help='Core devices per wave (default: all remaining)')
+parser.add_argument('--maxFailureRate', type=float, default=0.1,
+                    help='Failure rate that opens the circuit breaker and stops the rollout')
+parser.add_argument('--summary', help='File to write the JSON per-device result summary to')
+parser.add_argument('--dryRun', action='store_true', help='Print the deployment changes without deploying')
+parser.add_argument('--json', action='store_true', help='Print the deployment changes as JSON as well')
+parser.add_argument('--allRegions', action='store_true',
+                    help='Deploy to the thing group in every region in gdk-config.json concurrently')
 args = parser.parse_args()
 
-greengrassv2_client = boto3.client('greengrassv2', region_name=gdk_config.region())
+if args.allRegions:
+    if not args.thingGroup or args.coreDeviceThingName or args.thingsFile or args.dryRun:
+        print('--allRegions deploys to a thing group only. Give --thingGroup alone.')
+        sys.exit(1)
+
+    deploy_to_regions([gdk_config.region()] + list(gdk_config.replica_regions()))
+    sys.exit(0)
+
+with tracer.span('get_thing_names'):
+    core_device_thing_names = get_thing_names()
+
+if len(core_device_thing_names) == 0:
+    print('No core devices to deploy to. Abort.')
+    sys.exit(1)
+
+greengrassv2_client = aws_clients.client('greengrassv2', gdk_config.region())
+greengrassv2_polling_client = aws_clients.client('greengrassv2', gdk_config.region(), config=POLLING_CLIENT_CONFIG)
 
 secret = Secret(gdk_config.region())
 secret_value = secret.get()
 
-print(f'Attempting deployment of version {args.version} to core device {args.coreDeviceThingName}')
+if args.dryRun:
+    deployer = Deployer(greengrassv2_client, gdk_config, aws_clients.account_id(), secret_arns(secret_value))
+    dry_run(core_device_thing_names)
+elif len(core_device_thing_names) == 1 and not args.thingsFile and not args.thingGroup:
+    deployer = Deployer(greengrassv2_client, gdk_config, aws_clients.account_id(), secret_arns(secret_value))
 
-# Get the latest (single Thing) deployment for the specified core device
-current_deployment = get_deployment()
-
-# Update the components of the current deployment
-update_deployment(current_deployment)
+    try:
+        deploy_to_device(args.coreDeviceThingName)
+    except DeploymentError:
+        tracer.report()
+        sys.exit(1)
 
-# Create a new deployment
-new_deployment_id = create_deployment(current_deployment)
-print(f'Deployment {new_deployment_id} successfully created. Waiting for completion ...')
-wait_for_deployment_to_finish(new_deployment_id)
+    tracer.report()
+else:
+    attach_rate_limiter(greengrassv2_client, greengrassv2_polling_client)
+    deployer = Deployer(greengrassv2_client, gdk_config, aws_clients.account_id(), secret_arns(secret_value))
+    deploy_to_fleet(core_device_thing_names)
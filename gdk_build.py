@@ -10,58 +10,257 @@ Prior to running "gdk component build", the user should:
 2) Set the desired AWS region in ggk-config.json.
 3) Create or update the Home Assistant secret by running create_config_secret.py
 
+The Home Assistant Docker image tag in artifacts/docker-compose.yml is resolved to the immutable digest
+of its manifest, and the image is pinned to that digest in the recipe and in the Docker Compose file of
+the archive. If the registry cannot be reached, the build warns and uses the mutable tag.
+
+The artifacts are archived in layers: the runtime scripts, the other project files, the wheelhouse, the
+Home Assistant configuration and its static assets. The recipe lists each layer archive at an S3 key named
+by its content hash, and the Install lifecycle unpacks only the layers that changed since the last install.
+The build reports the size of each layer and which layers changed since the last build.
+
+Build steps whose inputs are unchanged since the last build are skipped, by restoring their output from
+the local build cache in .build-cache. The secret identifiers are cached for an hour, so that repeat
+builds need not call Secrets Manager, and the image digests for ten minutes, because tags move. Pass
+--no-cache to run every step from scratch.
+
+A device profile (low-flash-wear, in-memory, balanced or high-throughput) tunes the Home Assistant recorder
+and logger, and the resource limits and log rotation of its container, to a class of core device. Select
+it with --profile or the HA_DEVICE_PROFILE environment variable. The profile is recorded in the recipe.
+
+A MariaDB or PostgreSQL service can be added to the Docker Compose project to hold the recorder database,
+with --recorder-database. Its credentials must be in the secrets directory, so that they are delivered
+in the configuration secret. The database engine is recorded in the recipe.
+
+If gdk-config.json lists further regions, a recipe is also rendered for each region, with the ARN and
+version ID of the secret replica in that region, in greengrass-build/regions/REGION/recipe.yaml. The
+layers are content-identical across regions, so they are built once. Publish to every region with
+publish_component_version.py.
+
+The time taken by each step is summarized at the end of the build, and each step is also written as a
+JSON line to the file named by the HA_TRACE_FILE environment variable, if it is set.
+
 Example execution:
 gdk component build
+python3 gdk_build.py --no-cache
+python3 gdk_build.py --profile low-flash-wear
+python3 gdk_build.py --recorder-database mariadb
 """
 
+import argparse
+import json
+import os
+import re
 import shutil
+import sys
 import yaml
+from libs.archive import ArtifactLayers, LAYER_RUNTIME
+from libs.build_cache import BuildCache
+from libs.device_profile import DeviceProfile, PROFILES, PROFILE_NONE, PACKAGE_FILE as DEVICE_PROFILE_PACKAGE
+from libs.recorder_database import RecorderDatabase, ENGINES, ENGINE_NONE, PACKAGE_FILE as RECORDER_DATABASE_PACKAGE
+from libs.registry import RegistryError, RegistryResolver, pin
+from libs.wheelhouse import Wheelhouse
+from libs.publisher import REGION_RECIPE_FORMAT
 from libs.secret import Secret
 from libs.gdk_config import GdkConfig
+from libs.tracing import tracer
 
 DIRECTORY_ARTIFACTS = 'artifacts/'
 DIRECTORY_BUILD = 'greengrass-build/artifacts/'
 FILE_RECIPE_TEMPLATE = 'recipe.yaml'
 FILE_RECIPE = 'greengrass-build/recipes/recipe.yaml'
-FILE_ZIP_BASE = 'home-assistant'
-FILE_ZIP_EXT = 'zip'
 FILE_DOCKER_COMPOSE = DIRECTORY_ARTIFACTS + 'docker-compose.yml'
+FILE_REQUIREMENTS = DIRECTORY_ARTIFACTS + 'requirements.txt'
+DIRECTORY_WHEELHOUSE = 'wheelhouse'
+DIRECTORY_GENERATED = '.build-cache/generated/'
+DIRECTORY_SECRETS = 'secrets/'
+PROFILE_VARIABLE = 'HA_DEVICE_PROFILE'
+# The artifact of the recipe template that is repeated for each layer, with its indented properties
+LAYER_ARTIFACT = re.compile(r'^  - Uri: s3://BUCKET_NAME/layers/\$LAYER_FILE\n(?:    .*\n)*', re.MULTILINE)
 
 
-def create_recipe():
-    """ Creates the component recipe, filling in the Docker images and Secret ARN """
-    print(f'Creating recipe {FILE_RECIPE}')
-
+def resolve_docker_image():
+    """
+    Gets the Home Assistant Docker image pinned to its digest, and writes the Docker Compose file for
+    the archive with the pinned image. Gets the image as is if it cannot be resolved.
+    """
     with open(FILE_DOCKER_COMPOSE, encoding="utf-8") as docker_compose_file:
-        docker_compose_yaml = yaml.safe_load(docker_compose_file)
+        docker_compose_str = docker_compose_file.read()
+
+    image = yaml.safe_load(docker_compose_str)['services']['homeassistant']['image']
+    shutil.rmtree(DIRECTORY_GENERATED, ignore_errors=True)
+
+    if '@' in image:
+        print(f'Docker image {image} is already pinned to a digest')
+        return image
+
+    try:
+        digests = build_cache.get_image_digest(image, RegistryResolver().resolve)
+    except RegistryError as e:
+        print(f'WARNING: Failed to resolve Docker image {image} to a digest. Using the mutable tag.\nException: {e}')
+        return image
+
+    pinned_image = pin(image, digests['digest'])
+    print(f'Resolved Docker image {image} to {pinned_image}')
+    for platform, digest in sorted(digests['platforms'].items()):
+        print(f'  {platform}: {digest}')
+
+    os.makedirs(DIRECTORY_GENERATED)
+    with open(DIRECTORY_GENERATED + os.path.basename(FILE_DOCKER_COMPOSE), 'w', encoding="utf-8") as generated_file:
+        generated_file.write(docker_compose_str.replace(image, pinned_image))
+
+    return pinned_image
+
+def apply_device_profile():
+    """ Writes the Home Assistant package and the Docker Compose file of the device profile, if one is selected """
+    if args.profile == PROFILE_NONE:
+        print('No device profile selected. Using the configuration as is.')
+        return
+
+    print(f'Applying the {args.profile} device profile: {PROFILES[args.profile]["description"]}')
+    write_generated(DeviceProfile(args.profile), DEVICE_PROFILE_PACKAGE)
+
+def add_recorder_database():
+    """ Writes the recorder package and the Docker Compose file with the recorder database, if one is selected """
+    if args.recorder_database == ENGINE_NONE:
+        return
+
+    if 'db_url' in PROFILES.get(args.profile, {}).get('recorder', {}):
+        print(f'The {args.profile} device profile sets its own recorder database. Abort.')
+        sys.exit(1)
+
+    print(f'Adding the {args.recorder_database} recorder database service')
+    recorder_database = RecorderDatabase(args.recorder_database)
+    for problem in recorder_database.check_secrets(DIRECTORY_SECRETS):
+        print(f'WARNING: {problem}. Update the secrets and run create_config_secret.py before deploying.')
+    write_generated(recorder_database, RECORDER_DATABASE_PACKAGE)
+
+def write_generated(overlay, package_file):
+    """
+    Writes the Home Assistant package of a device profile or recorder database, and applies it to the
+    Docker Compose file, starting from the generated Docker Compose file if there is one
+    """
+    generated_compose_file = DIRECTORY_GENERATED + os.path.basename(FILE_DOCKER_COMPOSE)
+    compose_file = generated_compose_file if os.path.isfile(generated_compose_file) else FILE_DOCKER_COMPOSE
+
+    with open(compose_file, encoding="utf-8") as source_file:
+        compose = yaml.safe_load(source_file)
+
+    os.makedirs(os.path.dirname(DIRECTORY_GENERATED + package_file), exist_ok=True)
+    with open(DIRECTORY_GENERATED + package_file, 'w', encoding="utf-8") as generated_file:
+        generated_file.write(overlay.package_text())
+
+    with open(generated_compose_file, 'w', encoding="utf-8") as generated_file:
+        yaml.safe_dump(overlay.apply(compose), generated_file, sort_keys=False)
+
+def get_replica_secrets():
+    """ Gets the secret identifiers in each replica region, warning of replicas not yet at the current version """
+    replica_secret_values = {}
+
+    for replica_region in replica_regions:
+        replica_secret_values[replica_region] = build_cache.get_secret(replica_region, Secret(replica_region))
+        if replica_secret_values[replica_region]['VersionId'] != secret_value['VersionId']:
+            print(f'WARNING: The secret replica in {replica_region} is not the version in {region}. '
+                  'Replication may still be in progress.')
+
+    return replica_secret_values
+
+def create_recipe(region_secret_value, recipe_file, step):
+    """
+    Creates the component recipe, filling in the Docker image, secret details, device profile, database and
+    artifact layers
+    """
+    print(f'Creating recipe {recipe_file}')
 
     with open(FILE_RECIPE_TEMPLATE, encoding="utf-8") as recipe_template_file:
         recipe_str = recipe_template_file.read()
 
+    key = BuildCache.key(recipe_str, docker_image, gdk_config.name(), gdk_config.version(),
+                         json.dumps(region_secret_value, sort_keys=True), args.profile, args.recorder_database,
+                         json.dumps([layer['file'] for layer in layers.values()]))
+    if build_cache.restore(step, key, recipe_file):
+        print('Recipe inputs are unchanged. Restored the cached recipe.')
+        return
+
     recipe_str = recipe_str.replace('COMPONENT_NAME', gdk_config.name())
     if gdk_config.version() != 'NEXT_PATCH':
         recipe_str = recipe_str.replace('COMPONENT_VERSION', gdk_config.version())
 
-    recipe_str = recipe_str.replace('$SECRET_ARN', secret_value['ARN'])
-    recipe_str = recipe_str.replace('$DOCKER_IMAGE', docker_compose_yaml['services']['homeassistant']['image'])
+    # The access control resources must cover the shard secrets of a sharded configuration too
+    recipe_str = recipe_str.replace('$SECRET_ARNS', json.dumps(region_secret_value['arns']))
+    recipe_str = recipe_str.replace('$SECRET_ARN', region_secret_value['ARN'])
+    recipe_str = recipe_str.replace('$SECRET_VERSION_ID', region_secret_value['VersionId'])
+    recipe_str = recipe_str.replace('$DOCKER_IMAGE', docker_image)
+    recipe_str = recipe_str.replace('$DEVICE_PROFILE', args.profile)
+    recipe_str = recipe_str.replace('$RECORDER_DATABASE', args.recorder_database)
+    recipe_str = recipe_str.replace('$RUNTIME_LAYER', layers[LAYER_RUNTIME]['file'])
+    # Each layer archive is at an S3 key named by its content hash
+    recipe_str = LAYER_ARTIFACT.sub(lambda match: ''.join(match.group(0).replace('$LAYER_FILE', layer['file'])
+                                                          for layer in layers.values()), recipe_str)
 
-    with open(FILE_RECIPE, 'w', encoding="utf-8") as recipe_file:
-        recipe_file.write(recipe_str)
+    os.makedirs(os.path.dirname(recipe_file), exist_ok=True)
+    with open(recipe_file, 'w', encoding="utf-8") as recipe_file_handle:
+        recipe_file_handle.write(recipe_str)
 
+    build_cache.store(step, key, recipe_file)
     print('Created recipe')
 
 def create_artifacts():
-    """ Creates the artifacts archive as a ZIP file """
-    file_name = DIRECTORY_BUILD + gdk_config.name() + '/' + gdk_config.version() + '/' + FILE_ZIP_BASE
-    print(f'Creating artifacts archive {file_name}')
-    shutil.make_archive(file_name, FILE_ZIP_EXT, DIRECTORY_ARTIFACTS)
-    print('Created artifacts archive')
+    """
+    Creates the archive of each artifacts layer as a reproducible ZIP file, including the wheelhouse and any
+    generated Docker Compose file, and reusing the cached layer archives whose inputs are unchanged. Gets
+    the layers.
+    """
+    directory = DIRECTORY_BUILD + gdk_config.name() + '/' + gdk_config.version() + '/'
+    print(f'Creating artifacts layers in {directory}')
+    extra_directories = {DIRECTORY_WHEELHOUSE: wheelhouse_directory}
+    if os.path.isdir(DIRECTORY_GENERATED):
+        # The generated files replace their templates in the artifacts directory
+        extra_directories[''] = DIRECTORY_GENERATED
+    artifact_layers = ArtifactLayers(DIRECTORY_ARTIFACTS, extra_directories=extra_directories)
+    built_layers = artifact_layers.build(directory, gdk_config.version(), reuse=build_cache.enabled)
+    print('Created artifacts layers')
+    return built_layers
+
+parser = argparse.ArgumentParser(description='Build the Home Assistant component')
+parser.add_argument('--no-cache', action='store_true', help='Run every build step, ignoring the build cache')
+parser.add_argument('--profile', choices=[PROFILE_NONE] + list(PROFILES),
+                    default=os.environ.get(PROFILE_VARIABLE, PROFILE_NONE), help='Device profile')
+parser.add_argument('--recorder-database', choices=[ENGINE_NONE] + list(ENGINES), default=ENGINE_NONE,
+                    help='External recorder database service')
+args = parser.parse_args()
 
+build_cache = BuildCache(enabled=not args.no_cache)
 
 gdk_config = GdkConfig()
+region = gdk_config.region()
+replica_regions = list(gdk_config.replica_regions())
+
+with tracer.span('get_secret', regions=1 + len(replica_regions)):
+    secret_value = build_cache.get_secret(region, Secret(region))
+    region_secret_values = {region: secret_value, **get_replica_secrets()}
+
+with tracer.span('resolve_docker_image'):
+    docker_image = resolve_docker_image()
+
+with tracer.span('apply_device_profile', profile=args.profile):
+    apply_device_profile()
+
+with tracer.span('add_recorder_database', engine=args.recorder_database):
+    add_recorder_database()
+
+with tracer.span('create_wheelhouse'):
+    wheelhouse_directory = Wheelhouse(FILE_REQUIREMENTS).build(reuse=build_cache.enabled)
+
+# The recipe lists the layers, so they are created first
+with tracer.span('create_artifacts'):
+    layers = create_artifacts()
 
-secret = Secret(gdk_config.region())
-secret_value = secret.get()
+with tracer.span('create_recipe'):
+    create_recipe(secret_value, FILE_RECIPE, 'recipe.yaml')
+    if replica_regions:
+        for recipe_region, recipe_secret_value in region_secret_values.items():
+            create_recipe(recipe_secret_value, REGION_RECIPE_FORMAT.format(recipe_region),
+                          f'recipe-{recipe_region}.yaml')
 
-create_recipe()
-create_artifacts()
+tracer.report()
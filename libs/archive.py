@@ -0,0 +1,231 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for building the component artifacts archive reproducibly.
+
+The archive lists its entries in sorted order, with fixed timestamps and normalized permissions,
+so identical inputs always produce a byte-identical ZIP file. Archives are cached under a key that
+is the hash of the input files, so a rebuild with unchanged inputs copies the cached archive rather
+than creating it again.
+
+The artifacts are split into layers, each archived separately: the runtime scripts, the other project files
+such as the Docker Compose file, the wheelhouse, the Home Assistant configuration and its large static
+assets (themes, custom components and web files). Each layer archive is named by its content hash, so
+a build that only changes the configuration leaves the other layer archives, and their names, as they were.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+CACHE_DIRECTORY = '.build-cache/archives/'
+LAST_BUILD_FILE = 'last_build.json'
+MAX_CACHED_ARCHIVES = 5
+ARCHIVE_FORMAT_VERSION = 1
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+MODE_FILE = 0o644
+MODE_EXECUTABLE = 0o755
+EXCLUDED_DIRECTORIES = ['__pycache__']
+EXCLUDED_SUFFIXES = ['.pyc']
+LAYER_RUNTIME = 'runtime'
+LAYER_PROJECT = 'project'
+# The layers holding the files under each path prefix. The runtime layer holds the Python scripts at the top
+# level, and the project layer every other file.
+LAYER_PREFIXES = [
+    ('assets', ('config/themes/', 'config/custom_components/', 'config/www/')),
+    ('config', ('config/',)),
+    ('wheelhouse', ('wheelhouse/',))
+]
+LAYERS = [LAYER_RUNTIME, LAYER_PROJECT] + [layer for layer, _ in LAYER_PREFIXES]
+LAYER_FILE_FORMAT = 'home-assistant-{}-{}.zip'
+LAYER_HASH_LENGTH = 16
+
+def layer_of(path):
+    """ Gets the layer of a file from its path in the archive """
+    for layer, prefixes in LAYER_PREFIXES:
+        if path.startswith(prefixes):
+            return layer
+
+    return LAYER_RUNTIME if '/' not in path and path.endswith('.py') else LAYER_PROJECT
+
+class ArtifactArchive():
+    """ Builds a reproducible ZIP archive of a directory, reusing a cached archive when the inputs are unchanged """
+
+    def __init__(self, source_directory, cache_directory=CACHE_DIRECTORY, extra_directories=None, include=None):
+        """
+        Extra directories are given as a dictionary of path in the archive to directory on disk. Their
+        files replace any files of the source directory with the same path in the archive. If given, the
+        include function selects the files to archive by their path in the archive.
+        """
+        self.directories = [('', source_directory)] + sorted((extra_directories or {}).items())
+        self.cache_directory = cache_directory
+        self.include = include
+        self.hash = None
+
+    def files(self):
+        """ Gets the paths in the archive of the files to archive, in sorted order """
+        return [path for path, _ in self.entries()]
+
+    def entries(self):
+        """ Gets the path in the archive and the path on disk of each file to archive, sorted by the former """
+        entries = {}
+
+        for prefix, source_directory in self.directories:
+            for directory, directories, filenames in os.walk(source_directory):
+                directories[:] = [name for name in directories if name not in EXCLUDED_DIRECTORIES]
+                for filename in filenames:
+                    if not any(filename.endswith(suffix) for suffix in EXCLUDED_SUFFIXES):
+                        full_path = os.path.join(directory, filename)
+                        path = os.path.join(prefix, os.path.relpath(full_path, source_directory))
+                        entries[path.replace(os.sep, '/')] = full_path
+
+        return sorted((path, full_path) for path, full_path in entries.items()
+                      if self.include is None or self.include(path))
+
+    def inputs_hash(self):
+        """ Gets the hash of the names, permissions and contents of the files to archive """
+        if self.hash is None:
+            digest = hashlib.sha256(f'format {ARCHIVE_FORMAT_VERSION}\n'.encode('utf-8'))
+
+            for path, full_path in self.entries():
+                with open(full_path, 'rb') as file:
+                    content_digest = hashlib.sha256(file.read()).hexdigest()
+                digest.update(f'{path}\0{self.mode(full_path):o}\0{content_digest}\n'.encode('utf-8'))
+
+            self.hash = digest.hexdigest()
+
+        return self.hash
+
+    def cache(self, reuse=True):
+        """
+        Creates the cached archive, unless reuse is allowed and the archive of the inputs is cached already.
+        Returns the cached archive file and whether it was reused.
+        """
+        cached_file = os.path.join(self.cache_directory, self.inputs_hash() + '.zip')
+        reused = reuse and os.path.isfile(cached_file)
+
+        if reused:
+            os.utime(cached_file)
+        else:
+            self.write(cached_file)
+
+        return cached_file, reused
+
+    def write(self, archive_file):
+        """ Writes the archive atomically, with sorted entries, fixed timestamps and normalized permissions """
+        os.makedirs(os.path.dirname(archive_file) or '.', exist_ok=True)
+        file_descriptor, temp_file = tempfile.mkstemp(dir=os.path.dirname(archive_file) or '.', suffix='.tmp')
+        os.close(file_descriptor)
+
+        try:
+            with zipfile.ZipFile(temp_file, 'w') as archive:
+                for path, full_path in self.entries():
+                    info = zipfile.ZipInfo(path, date_time=ZIP_DATE_TIME)
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    info.create_system = 3
+                    info.external_attr = (0o100000 | self.mode(full_path)) << 16
+                    with open(full_path, 'rb') as file:
+                        archive.writestr(info, file.read(), compresslevel=9)
+            os.replace(temp_file, archive_file)
+        except BaseException:
+            os.remove(temp_file)
+            raise
+
+    def prune(self, keep=MAX_CACHED_ARCHIVES):
+        """ Removes all but the most recently used cached archives """
+        archives = [os.path.join(self.cache_directory, name) for name in os.listdir(self.cache_directory)
+                    if name.endswith('.zip')]
+        archives.sort(key=os.path.getmtime, reverse=True)
+
+        for archive_file in archives[keep:]:
+            os.remove(archive_file)
+
+    def load_last_build(self):
+        """ Loads the record of the last archive built """
+        try:
+            with open(os.path.join(self.cache_directory, LAST_BUILD_FILE), encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_last_build(self, last_build):
+        """ Saves the record of the last archive built """
+        with open(os.path.join(self.cache_directory, LAST_BUILD_FILE), 'w', encoding='utf-8') as file:
+            json.dump(last_build, file)
+
+    @staticmethod
+    def mode(path):
+        """ Gets the normalized permissions of a file: executable or not """
+        return MODE_EXECUTABLE if os.stat(path).st_mode & 0o111 else MODE_FILE
+
+class ArtifactLayers():
+    """ Builds a reproducible ZIP archive of each layer of a directory, reusing cached layer archives """
+
+    def __init__(self, source_directory, cache_directory=CACHE_DIRECTORY, extra_directories=None):
+        """ The source and extra directories are as for ArtifactArchive """
+        self.archive = ArtifactArchive(source_directory, cache_directory, extra_directories)
+        self.layers = {layer: ArtifactArchive(source_directory, cache_directory, extra_directories,
+                                              lambda path, layer=layer: layer_of(path) == layer) for layer in LAYERS}
+
+    def inputs_hash(self):
+        """ Gets the hash of the inputs of every layer """
+        digest = hashlib.sha256(f'format {ARCHIVE_FORMAT_VERSION}\n'.encode('utf-8'))
+
+        for layer, archive in self.layers.items():
+            digest.update(f'{layer}\0{archive.inputs_hash()}\n'.encode('utf-8'))
+
+        return digest.hexdigest()
+
+    def build(self, build_directory, version, reuse=True):
+        """
+        Creates the archive file of each layer that has files in the build directory, named by its content
+        hash, copying the cached layer archives whose inputs are unchanged if reuse is allowed. Prints the
+        size of each layer and whether it changed since the last build. Returns the file, hash, size and
+        change of each layer, keyed by layer in the order that the layers are installed.
+        """
+        last_layers = self.archive.load_last_build().get('layers', {})
+        os.makedirs(build_directory, exist_ok=True)
+        layers = {}
+
+        for layer, archive in self.layers.items():
+            files = archive.files()
+            if not files:
+                continue
+
+            cached_file, reused = archive.cache(reuse)
+            archive_hash = file_hash(cached_file)
+            layer_file = LAYER_FILE_FORMAT.format(layer, archive_hash[:LAYER_HASH_LENGTH])
+            shutil.copyfile(cached_file, os.path.join(build_directory, layer_file))
+            layers[layer] = {'file': layer_file, 'sha256': archive_hash, 'size': os.path.getsize(cached_file),
+                             'files': len(files), 'inputsHash': archive.inputs_hash(), 'reused': reused,
+                             'changed': last_layers.get(layer, {}).get('sha256') != archive_hash}
+
+        self.report(layers)
+        self.archive.save_last_build({'inputsHash': self.inputs_hash(), 'version': version, 'layers': {
+            layer: {'inputsHash': value['inputsHash'], 'sha256': value['sha256']} for layer, value in layers.items()}})
+        self.archive.prune(MAX_CACHED_ARCHIVES * len(LAYERS))
+
+        return layers
+
+    @staticmethod
+    def report(layers):
+        """ Prints the size of each layer and whether it changed since the last build """
+        print(f'{"Layer":<12} {"Files":>6} {"Bytes":>12}  Change')
+        for layer, value in layers.items():
+            change = 'changed' if value['changed'] else 'unchanged'
+            print(f'{layer:<12} {value["files"]:>6} {value["size"]:>12}  {change}')
+
+        changed = [layer for layer, value in layers.items() if value['changed']]
+        changed_size = sum(layers[layer]['size'] for layer in changed)
+        total_size = sum(value['size'] for value in layers.values())
+        print(f'{len(changed)} of {len(layers)} layers changed since the last build '
+              f'({changed_size} of {total_size} bytes): {", ".join(changed) or "none"}')
+
+def file_hash(filename):
+    """ Gets the SHA-256 hash of a file """
+    with open(filename, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
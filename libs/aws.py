@@ -0,0 +1,62 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Shared factory for AWS clients.
+
+Clients are created from the one default boto3 session on first use, and are then cached per service,
+region, endpoint and configuration, so that every part of a script reuses the same clients and their
+connection pools. Nothing touches the network until a client makes its first call. The account ID is
+likewise only resolved when it is first needed. Each client's API calls are counted in the current tracing span.
+"""
+
+import threading
+import boto3
+from botocore.config import Config
+from libs.tracing import count_api_calls
+
+# Enough pooled connections for the fleet deployment thread pool, and adaptive retries for throttling
+CLIENT_CONFIG = Config(max_pool_connections=32, connect_timeout=5, read_timeout=30,
+                       retries={'max_attempts': 8, 'mode': 'adaptive'})
+# Standard retries for polling, so that persistent throttling reaches the poller, which backs off for longer
+POLLING_CLIENT_CONFIG = CLIENT_CONFIG.merge(Config(retries={'max_attempts': 3, 'mode': 'standard'}))
+
+class AwsClients():
+    """ Lazily created AWS clients, cached per service and region """
+
+    def __init__(self, config=CLIENT_CONFIG):
+        self.config = config
+        self.clients = {}
+        self.account = None
+        self.lock = threading.Lock()
+
+    def client(self, service, region=None, endpoint_url=None, config=None):
+        """
+        Gets the client for a service, region, optional endpoint and optional configuration in place of the
+        default, creating it on first use
+        """
+        config = config or self.config
+        key = (service, region, endpoint_url, config)
+
+        with self.lock:
+            if key not in self.clients:
+                endpoint = {'endpoint_url': endpoint_url} if endpoint_url else {}
+                client = boto3.client(service, region_name=region, config=config, **endpoint)
+                self.clients[key] = count_api_calls(client)
+
+            return self.clients[key]
+
+    def account_id(self):
+        """ Gets the AWS account ID of the caller, only asking STS the first time """
+        if self.account is None:
+            self.account = self.client('sts').get_caller_identity().get('Account')
+
+        return self.account
+
+    def reset(self):
+        """ Forgets all clients and the account ID """
+        with self.lock:
+            self.clients = {}
+            self.account = None
+
+aws_clients = AwsClients()
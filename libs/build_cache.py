@@ -0,0 +1,129 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for the local cache of component build steps.
+
+Each cached step output is stored with a key that is the hash of the step's inputs, so a step whose
+inputs are unchanged can be skipped by restoring its output. The identifiers of the Home Assistant
+secret (never its value) are cached with the version ID they were got for. The current version ID is
+always resolved, because it is baked into the recipe and install.py skips the refresh of that version,
+but a repeat build need not get the secret value. The digests of the Docker image are cached with a time
+to live, so repeat builds need not call the image registry.
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+from libs.secret import secret_arns
+
+CACHE_DIRECTORY = '.build-cache/'
+STATE_FILE = 'build.json'
+IMAGE_TTL_SECONDS = 10 * 60
+
+class BuildCache():
+    """ Local cache of build step outputs, keyed on the hash of their inputs """
+
+    def __init__(self, cache_directory=CACHE_DIRECTORY, enabled=True):
+        self.cache_directory = cache_directory
+        self.enabled = enabled
+        self.state = self.load() if enabled else {}
+
+    def get_secret(self, region, secret):
+        """
+        Gets the ARN, version ID and ARNs (including any shards) of the Home Assistant secret in a region,
+        from a libs.secret.Secret. Uses the cached identifiers if they were got for the same region and the
+        current version ID, and otherwise gets the secret value.
+        """
+        def get_identifiers():
+            secret_value = secret.get()
+            return {'ARN': secret_value['ARN'], 'VersionId': secret_value['VersionId'],
+                    'arns': secret_arns(secret_value)}
+
+        # The identifiers of a version never change, so they do not expire
+        return self.remember(f'secret-{region}', f'{region}/{secret.current_version_id()}', get_identifiers,
+                             math.inf)
+
+    def get_image_digest(self, image, resolve, ttl=IMAGE_TTL_SECONDS):
+        """
+        Gets the digests of a Docker image reference, as returned by resolve. Uses the cached digests if
+        the same image was resolved within the time to live, which is short because tags move.
+        """
+        return self.remember('image', image, lambda: resolve(image), ttl)
+
+    def remember(self, name, scope, get, ttl):
+        """
+        Gets the value cached under a name if it was got for the same scope within the time to live, and
+        otherwise calls get and caches the value it returns
+        """
+        record = self.state.get(name)
+
+        if self.enabled and record and record.get('scope') == scope and time.time() - record['cached'] < ttl:
+            print(f'Using the {name} details cached {time.time() - record["cached"]:.0f} seconds ago')
+            return record['value']
+
+        value = get()
+
+        if self.enabled:
+            self.state[name] = {'scope': scope, 'cached': time.time(), 'value': value}
+            self.save()
+
+        return value
+
+    def restore(self, step, key, output_file):
+        """ Restores the cached output of a step to the output file if the step's inputs key matches """
+        cached_file = os.path.join(self.cache_directory, step)
+
+        if not self.enabled or self.state.get('steps', {}).get(step) != key or not os.path.isfile(cached_file):
+            return False
+
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+        shutil.copyfile(cached_file, output_file)
+        return True
+
+    def store(self, step, key, output_file):
+        """ Stores the output of a step in the cache, with the step's inputs key """
+        if not self.enabled:
+            return
+
+        os.makedirs(self.cache_directory, exist_ok=True)
+        shutil.copyfile(output_file, os.path.join(self.cache_directory, step))
+        self.state.setdefault('steps', {})[step] = key
+        self.save()
+
+    def invalidate_secret(self):
+        """ Forgets the cached secret identifiers, for example because the secret was just updated """
+        secrets = [name for name in self.state if name == 'secret' or name.startswith('secret-')]
+        for name in secrets:
+            del self.state[name]
+
+        if secrets:
+            self.save()
+
+    def load(self):
+        """ Loads the cache state """
+        try:
+            with open(os.path.join(self.cache_directory, STATE_FILE), encoding='utf-8') as state_file:
+                return json.load(state_file)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """ Saves the cache state atomically """
+        os.makedirs(self.cache_directory, exist_ok=True)
+        state_file_name = os.path.join(self.cache_directory, STATE_FILE)
+        with open(state_file_name + '.tmp', 'w', encoding='utf-8') as state_file:
+            json.dump(self.state, state_file, indent=2)
+        os.replace(state_file_name + '.tmp', state_file_name)
+
+    @staticmethod
+    def key(*inputs):
+        """ Gets the key of a step from its inputs, which are strings """
+        digest = hashlib.sha256()
+        for value in inputs:
+            data = value.encode('utf-8')
+            digest.update(f'{len(data)}:'.encode('utf-8') + data)
+        return digest.hexdigest()
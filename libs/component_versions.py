@@ -0,0 +1,167 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for resolving the version of a public Greengrass component to deploy.
+
+Resolution lists every version of the component, page by page, and picks the newest by semantic
+version that satisfies the component's version requirement in the ComponentDependencies of the
+recipe. Requirements use the npm-style syntax of Greengrass recipes, for example '>=2.0.0 <3.0.0',
+'^2.1.0', '~2.1.0' or '2.0.0 || >=2.2.0'. The version lists are cached on disk with a time to live,
+so that repeat deployments and multi-device deployments need no further API calls.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import yaml
+
+SEMVER_PATTERN = re.compile(r'^v?(\d+)\.(\d+)\.(\d+)(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$')
+COMPARATOR_PATTERN = re.compile(r'^(>=|<=|>|<|=|\^|~)?\s*(\S+)$')
+
+class ComponentVersionResolver():
+    """ Resolves the newest version of a public component that satisfies the recipe's requirements """
+
+    CACHE_FILE = '.build-cache/component_versions.json'
+    CACHE_TTL_SECONDS = 60 * 60
+    RECIPE_FILE = 'recipe.yaml'
+
+    def __init__(self, greengrassv2_client, region):
+        self.greengrassv2_client = greengrassv2_client
+        self.region = region
+        self.requirements = load_requirements(self.RECIPE_FILE)
+        self.api_calls = 0
+        self.lock = threading.Lock()
+
+    def resolve(self, component_name, requirement=None):
+        """
+        Gets the newest version of a component that satisfies the requirement, which defaults to the
+        requirement in the recipe. Raises ValueError if no version satisfies it.
+        """
+        requirement = requirement or self.requirements.get(component_name)
+        versions = sorted((version for version in self.versions(component_name)
+                           if SEMVER_PATTERN.match(version) and (not requirement or satisfies(version, requirement))),
+                          key=version_key)
+
+        if not versions:
+            raise ValueError(f'No version of {component_name} satisfies the requirement {requirement}')
+
+        print(f'Resolved {component_name} to version {versions[-1]}' +
+              (f' (requirement {requirement})' if requirement else ''))
+        return versions[-1]
+
+    def versions(self, component_name):
+        """ Gets all versions of a component, from the disk cache if they are recent enough """
+        with self.lock:
+            cache = self.load_cache()
+            key = f'{self.region}/{component_name}'
+            record = cache.get(key)
+
+            if record and time.time() - record['cached'] < self.CACHE_TTL_SECONDS:
+                return record['versions']
+
+            component_arn = f'arn:aws:greengrass:{self.region}:aws:components:{component_name}'
+            request = {'arn': component_arn}
+            versions = []
+
+            while True:
+                response = self.greengrassv2_client.list_component_versions(**request)
+                self.api_calls += 1
+                versions += [version['componentVersion'] for version in response['componentVersions']]
+                if not response.get('nextToken'):
+                    break
+                request['nextToken'] = response['nextToken']
+
+            cache[key] = {'versions': versions, 'cached': time.time()}
+            self.save_cache(cache)
+
+        return versions
+
+    def load_cache(self):
+        """ Loads the component version cache """
+        try:
+            with open(self.CACHE_FILE, encoding='utf-8') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_cache(self, cache):
+        """ Saves the component version cache atomically """
+        os.makedirs(os.path.dirname(self.CACHE_FILE) or '.', exist_ok=True)
+        with open(self.CACHE_FILE + '.tmp', 'w', encoding='utf-8') as cache_file:
+            json.dump(cache, cache_file, indent=2)
+        os.replace(self.CACHE_FILE + '.tmp', self.CACHE_FILE)
+
+def load_requirements(recipe_file):
+    """ Gets the version requirements of the component dependencies in a recipe """
+    try:
+        with open(recipe_file, encoding='utf-8') as file:
+            recipe = yaml.safe_load(file)
+    except OSError:
+        return {}
+
+    dependencies = recipe.get('ComponentDependencies') or {}
+    return {name: str(dependency['VersionRequirement']) for name, dependency in dependencies.items()
+            if dependency and 'VersionRequirement' in dependency}
+
+def parse_version(version):
+    """ Parses a semantic version into its major, minor and patch numbers and its prerelease identifiers """
+    match = SEMVER_PATTERN.match(version.strip())
+    if not match:
+        raise ValueError(f'{version} is not a semantic version')
+
+    prerelease = match.group(4).split('.') if match.group(4) else []
+    return int(match.group(1)), int(match.group(2)), int(match.group(3)), prerelease
+
+def version_key(version):
+    """ Gets a sort key that orders semantic versions by precedence """
+    major, minor, patch, prerelease = parse_version(version)
+    # A release sorts after its prereleases, and numeric identifiers sort before alphanumeric ones
+    identifiers = [(0, int(identifier), '') if identifier.isdigit() else (1, 0, identifier)
+                   for identifier in prerelease]
+    return major, minor, patch, 0 if prerelease else 1, identifiers
+
+def satisfies(version, requirement):
+    """ Determines whether a version satisfies a requirement, such as '>=2.0.0 <3.0.0' or '^2.1.0' """
+    return any(satisfies_all(version, alternative.split()) for alternative in requirement.split('||'))
+
+def satisfies_all(version, comparators):
+    """ Determines whether a version satisfies every comparator of a requirement """
+    key = version_key(version)
+    explicit_prerelease = False
+
+    for comparator in comparators:
+        if comparator in ('*', 'x', 'X'):
+            continue
+
+        match = COMPARATOR_PATTERN.match(comparator)
+        if not match:
+            raise ValueError(f'Invalid version requirement {comparator}')
+
+        operator, target = match.group(1) or '=', match.group(2)
+        target_key = version_key(target)
+        explicit_prerelease = explicit_prerelease or bool(parse_version(target)[3])
+
+        if not compare(key, operator, target_key):
+            return False
+
+    # Prereleases only satisfy requirements that name a prerelease
+    return not parse_version(version)[3] or explicit_prerelease
+
+def compare(key, operator, target_key):
+    """ Compares a version sort key with a target version sort key """
+    major, minor, patch = target_key[:3]
+    checks = {
+        '=': lambda: key == target_key,
+        '>': lambda: key > target_key,
+        '>=': lambda: key >= target_key,
+        '<': lambda: key < target_key,
+        '<=': lambda: key <= target_key,
+        # ~1.2.3 allows patch changes, ^1.2.3 allows changes that do not modify the leftmost non-zero number
+        '~': lambda: target_key <= key < (major, minor + 1, 0, 0, []),
+        '^': lambda: target_key <= key < ((major + 1, 0, 0, 0, []) if major else
+                                          (0, minor + 1, 0, 0, []) if minor else (0, 0, patch + 1, 0, [])),
+    }
+    return checks[operator]()
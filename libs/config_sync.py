@@ -0,0 +1,101 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for config-only updates, which apply changes to the Home Assistant configuration on a core device
+without publishing a new component version.
+
+The configuration is that of the artifacts layers: artifacts/config, with any files generated by the
+component build replacing their templates. A config delta holds the files that differ from a base, which
+is the configuration last synced to the core device or else the configuration of the last build, in the
+envelope format of the configuration secret. It also lists the removed files and, unless forced, the
+base hash of each file that it replaces, so that the core device can refuse a delta that does not match
+what it holds.
+"""
+
+import hashlib
+import json
+import os
+import zipfile
+from libs.archive import CACHE_DIRECTORY, ArtifactArchive
+from libs.envelope import Envelope
+
+DELTA_VERSION = 1
+TOPIC_FORMAT = 'homeassistant/{}/config'
+# The size limit of an AWS IoT Core MQTT message
+MESSAGE_SIZE_LIMIT = 128 * 1024
+CONFIG_PREFIX = 'config/'
+
+class ConfigDelta():
+    """ The delta between the configuration of the artifacts and a base configuration """
+
+    def __init__(self, archive):
+        """ The archive is the ArtifactArchive of the artifacts, including the generated files """
+        self.archive = archive
+
+    def files(self):
+        """ Gets the data and archive permissions of each configuration file, keyed by its path in config """
+        files = {}
+
+        for path, full_path in self.archive.entries():
+            if path.startswith(CONFIG_PREFIX):
+                with open(full_path, 'rb') as file:
+                    files[path[len(CONFIG_PREFIX):]] = (file.read(), self.archive.mode(full_path))
+
+        return files
+
+    def hashes(self):
+        """ Gets the hash of each configuration file """
+        return {filename: content_hash(data) for filename, (data, _) in self.files().items()}
+
+    def build(self, base, sequence, force=False, restart=False):
+        """
+        Builds the config delta from the base hashes, or gets None if nothing changed. A forced delta
+        replaces the files on the core device whatever they hold.
+        """
+        files = self.files()
+        changed = sorted(filename for filename, (data, _) in files.items() if content_hash(data) != base.get(filename))
+        removed = sorted(filename for filename in base if filename not in files)
+
+        if not changed and not removed:
+            return None
+
+        envelope = Envelope()
+        for filename in changed:
+            envelope.add(filename, *files[filename])
+
+        delta = {'configDeltaVersion': DELTA_VERSION, 'sequence': sequence, 'envelope': json.loads(envelope.to_json()),
+                 'removed': removed, 'restart': restart}
+        if not force:
+            delta['base'] = {filename: base.get(filename) for filename in changed + removed}
+
+        return delta
+
+def archive_hashes(archive_files):
+    """ Gets the hash of each configuration file in the built artifacts archives, such as the layer archives """
+    hashes = {}
+
+    for archive_file in archive_files:
+        with zipfile.ZipFile(archive_file) as archive:
+            hashes.update({name[len(CONFIG_PREFIX):]: content_hash(archive.read(name)) for name in archive.namelist()
+                           if name.startswith(CONFIG_PREFIX)})
+
+    return hashes
+
+def last_build_archives(cache_directory=CACHE_DIRECTORY):
+    """
+    Gets the inputs hash and the cached archives of the last component build: those of its layers, or that
+    of a build without layers. Gets None for both if they are not all cached.
+    """
+    last_build = ArtifactArchive('', cache_directory).load_last_build()
+    inputs_hashes = [layer['inputsHash'] for layer in last_build.get('layers', {}).values()] or\
+        [last_build.get('inputsHash')]
+    archive_files = [os.path.join(cache_directory, f'{inputs_hash}.zip') for inputs_hash in inputs_hashes]
+
+    if 'inputsHash' in last_build and all(os.path.isfile(archive_file) for archive_file in archive_files):
+        return last_build['inputsHash'], archive_files
+    return None, None
+
+def content_hash(data):
+    """ Gets the SHA-256 hash of file content """
+    return hashlib.sha256(data).hexdigest()
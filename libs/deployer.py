@@ -0,0 +1,215 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for deploying a component version to a single Greengrass core device.
+
+The components of the existing deployment are diffed with those of the target deployment. If nothing would
+change and the existing deployment completed, no deployment is created, because every deployment makes the
+core device resolve its components again and restart those that changed.
+"""
+
+import copy
+import json
+import time
+from libs.component_versions import ComponentVersionResolver
+from libs.deployment_diff import diff_components, format_diff
+from libs.deployment_watcher import DeploymentWatcher
+from libs.tracing import tracer
+
+class DeploymentError(Exception):
+    """ A deployment to a Greengrass core device could not be performed """
+
+class Deployer():
+    """ API for deploying a component version to a single Greengrass core device """
+
+    COMPONENT_DOCKER_APPLICATION_MANAGER = 'aws.greengrass.DockerApplicationManager'
+    COMPONENT_SECRET_MANAGER = 'aws.greengrass.SecretManager'
+
+    def __init__(self, greengrassv2_client, gdk_config, account, secret_arns):
+        """ The secret ARNs are those of the Home Assistant secret and of any shard secrets """
+        self.greengrassv2_client = greengrassv2_client
+        self.region = gdk_config.region()
+        self.component_name = gdk_config.name()
+        self.account = account
+        self.secret_arns = secret_arns
+        self.resolver = ComponentVersionResolver(greengrassv2_client, self.region)
+
+    def get_newest_component_version(self, component_name):
+        """ Gets the newest version of a component that satisfies the recipe's requirement for it """
+        try:
+            return self.resolver.resolve(component_name)
+        except Exception as e:
+            print(f'Failed to get component versions for {component_name}\nException: {e}')
+            raise DeploymentError(f'Failed to get component versions for {component_name}') from e
+
+    @tracer.traced('Deployer.get_deployment')
+    def get_deployment(self, thing_name):
+        """ Gets the details of the existing deployment """
+        thing_arn = f'arn:aws:iot:{self.region}:{self.account}:thing/{thing_name}'
+
+        print(f'Searching for existing single Thing deployment for {thing_name}')
+
+        try:
+            # Get the latest deployment for the specified core device name
+            response = self.greengrassv2_client.list_deployments(
+                targetArn=thing_arn,
+                historyFilter='LATEST_ONLY',
+                maxResults=1
+            )
+        except Exception as e:
+            print(f'Failed to list deployments\nException: {e}')
+            raise DeploymentError('Failed to list deployments') from e
+
+        # We expect to update an existing deployment, not create a new one
+        if len(response['deployments']) == 0:
+            print(f'No existing Thing deployment for core device {thing_name}. Abort.')
+            raise DeploymentError('No existing Thing deployment')
+
+        # We expect at most one result in the list
+        deployment_id = response['deployments'][0]['deploymentId']
+
+        try:
+            response = self.greengrassv2_client.get_deployment(deploymentId=deployment_id)
+
+            if 'deploymentName' in response:
+                print(f'Found existing named deployment "{response["deploymentName"]}"')
+            else:
+                print(f'Found existing unnamed deployment {deployment_id}')
+        except Exception as e:
+            print(f'Failed to get deployment\nException: {e}')
+            raise DeploymentError('Failed to get deployment') from e
+
+        return response
+
+    @tracer.traced('Deployer.update_deployment')
+    def update_deployment(self, deployment, version):
+        """ Updates the current deployment with the desired versions of the components """
+
+        # If Docker Application manager is not in the deployment, add the latest version
+        if self.COMPONENT_DOCKER_APPLICATION_MANAGER not in deployment['components']:
+            manager_version = self.get_newest_component_version(self.COMPONENT_DOCKER_APPLICATION_MANAGER)
+            print(f'Adding {self.COMPONENT_DOCKER_APPLICATION_MANAGER} {manager_version} to the deployment')
+            deployment['components'].update({self.COMPONENT_DOCKER_APPLICATION_MANAGER:
+                                             {'componentVersion': manager_version}})
+
+        # If Secret manager is not in the deployment, add the latest version
+        if self.COMPONENT_SECRET_MANAGER not in deployment['components']:
+            manager_version = self.get_newest_component_version(self.COMPONENT_SECRET_MANAGER)
+            print(f'Adding {self.COMPONENT_SECRET_MANAGER} {manager_version} to the deployment')
+            cloud_secrets = [{"arn": secret_arn} for secret_arn in self.secret_arns]
+        else:
+            # If it's already in the deployment, use the current version
+            manager_version = deployment['components'][self.COMPONENT_SECRET_MANAGER]['componentVersion']
+            merge_str = deployment['components'][self.COMPONENT_SECRET_MANAGER]['configurationUpdate']['merge']
+            cloud_secrets = json.loads(merge_str)['cloudSecrets']
+
+            # Add our secrets to the list of configured secrets
+            for secret_arn in self.secret_arns:
+                if secret_arn not in merge_str:
+                    print(f'Adding secret {secret_arn} to Secret Manager configuration')
+                    cloud_secrets.append({"arn": secret_arn})
+
+        # Update Secret Manager with the appropriate version and configuration
+        deployment['components'].update({self.COMPONENT_SECRET_MANAGER: {
+            'componentVersion': manager_version,
+            'configurationUpdate': {'merge': '{"cloudSecrets":' + json.dumps(cloud_secrets) + '}'}}
+        })
+
+        # Add or update our component to the specified version
+        if self.component_name not in deployment['components']:
+            print(f'Adding {self.component_name} {version} to the deployment')
+        else:
+            print(f'Updating deployment with {self.component_name} {version}')
+        deployment['components'].update({self.component_name: {'componentVersion': version}})
+
+    @tracer.traced('Deployer.create_deployment')
+    def create_deployment(self, deployment, thing_name):
+        """ Creates a deployment of the component to the given Greengrass core device """
+
+        # Give the deployment a name if it doesn't already have one
+        if 'deploymentName' in deployment:
+            deployment_name = deployment['deploymentName']
+        else:
+            deployment_name = f'Deployment for {thing_name}'
+            print(f'Renaming deployment to "{deployment_name}"')
+
+        try:
+            # We deploy to a single Thing and hence without an IoT job configuration
+            # Deploy with default deployment policies and no tags
+            response = self.greengrassv2_client.create_deployment(
+                targetArn=deployment['targetArn'],
+                deploymentName=deployment_name,
+                components=deployment['components']
+            )
+        except Exception as e:
+            print(f'Failed to create deployment\nException: {e}')
+            raise DeploymentError('Failed to create deployment') from e
+
+        return response['deploymentId']
+
+    @tracer.traced('Deployer.wait_for_deployment_to_finish')
+    def wait_for_deployment_to_finish(self, deployment_id, thing_name, watcher, timeout):
+        """ Waits for the deployment to complete """
+        try:
+            deployment_status = watcher.wait(deployment_id, [thing_name], timeout)
+        except Exception as e:
+            print(f'Failed to get deployment\nException: {e}')
+            raise DeploymentError('Failed to get deployment') from e
+
+        print(f'Made {watcher.api_calls} Greengrass API calls ({watcher.throttles} throttled) '
+              f'over {watcher.elapsed:.1f} seconds')
+
+        if deployment_status == 'COMPLETED':
+            print(f'Deployment to {thing_name} completed successfully in {watcher.elapsed:.1f} seconds')
+        elif deployment_status == 'ACTIVE':
+            print(f'Deployment to {thing_name} timed out')
+            raise DeploymentError('Deployment timed out')
+        else:
+            print(f'Deployment to {thing_name} error: {deployment_status}')
+            raise DeploymentError(f'Deployment error: {deployment_status}')
+
+    def plan(self, thing_name, version):
+        """
+        Gets the existing deployment, updated with the desired versions of the components, and the changes
+        from the existing deployment. Makes no changes in the cloud.
+        """
+        deployment = self.get_deployment(thing_name)
+        current_components = copy.deepcopy(deployment['components'])
+        self.update_deployment(deployment, version)
+        changes = diff_components(current_components, deployment['components'])
+
+        if changes:
+            print(f'Deployment changes for {thing_name}:')
+            for line in format_diff(changes):
+                print(f'  {line}')
+        else:
+            print(f'No deployment changes for {thing_name}')
+
+        return deployment, changes
+
+    def deploy(self, thing_name, version, watcher, timeout=DeploymentWatcher.DEFAULT_TIMEOUT):
+        """
+        Deploys the component version to a core device and waits for the deployment to finish, unless the
+        core device already has it. Returns a summary of the result. Raises DeploymentError if the deployment fails.
+        """
+        snapshot = time.monotonic()
+        print(f'Attempting deployment of version {version} to core device {thing_name}')
+
+        with tracer.span('Deployer.deploy', thingName=thing_name) as span:
+            # Get the latest (single Thing) deployment for the specified core device, and update its components
+            deployment, changes = self.plan(thing_name, version)
+
+            if not changes and deployment.get('deploymentStatus') == 'COMPLETED':
+                print(f'The existing deployment to {thing_name} is already complete. Skipping the deployment.')
+                span['attributes']['unchanged'] = True
+                return {'deploymentId': deployment.get('deploymentId'),
+                        'elapsed': round(time.monotonic() - snapshot, 1), 'unchanged': True, 'changes': changes}
+
+            # Create a new deployment
+            deployment_id = self.create_deployment(deployment, thing_name)
+            print(f'Deployment {deployment_id} successfully created. Waiting for completion ...')
+            self.wait_for_deployment_to_finish(deployment_id, thing_name, watcher, timeout)
+
+        return {'deploymentId': deployment_id, 'elapsed': round(time.monotonic() - snapshot, 1), 'unchanged': False,
+                'changes': changes}
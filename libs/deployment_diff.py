@@ -0,0 +1,65 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for diffing the components of Greengrass deployments.
+
+The diff is structural: configuration merges, which Greengrass holds as JSON strings, are compared as the
+JSON values that they hold, so that formatting differences are not changes. Each change has the path of
+the value that changed, the operation (add, remove or replace) and the old and new values.
+"""
+
+import json
+
+OP_ADD = 'add'
+OP_REMOVE = 'remove'
+OP_REPLACE = 'replace'
+
+def diff_components(current, target):
+    """ Gets the changes from the current components of a deployment to the target components """
+    return diff_values(normalize(current), normalize(target), [])
+
+def normalize(components):
+    """ Gets the components with their configuration merges parsed from JSON """
+    normalized = {}
+
+    for name, component in components.items():
+        normalized[name] = dict(component)
+        configuration_update = component.get('configurationUpdate')
+        if configuration_update and 'merge' in configuration_update:
+            normalized[name]['configurationUpdate'] = dict(configuration_update,
+                                                           merge=json.loads(configuration_update['merge']))
+
+    return normalized
+
+def diff_values(current, target, path):
+    """ Gets the changes from one JSON value to another, recursing into objects and comparing the rest whole """
+    if isinstance(current, dict) and isinstance(target, dict):
+        changes = []
+        for key in sorted(set(current) | set(target)):
+            if key not in current:
+                changes.append({'path': path + [key], 'op': OP_ADD, 'value': target[key]})
+            elif key not in target:
+                changes.append({'path': path + [key], 'op': OP_REMOVE, 'oldValue': current[key]})
+            else:
+                changes += diff_values(current[key], target[key], path + [key])
+        return changes
+
+    if current != target:
+        return [{'path': path, 'op': OP_REPLACE, 'oldValue': current, 'value': target}]
+    return []
+
+def format_diff(changes):
+    """ Gets the changes as human readable lines """
+    lines = []
+
+    for change in changes:
+        path = '/'.join(change['path'])
+        if change['op'] == OP_ADD:
+            lines.append(f'+ {path}: {json.dumps(change["value"])}')
+        elif change['op'] == OP_REMOVE:
+            lines.append(f'- {path}: {json.dumps(change["oldValue"])}')
+        else:
+            lines.append(f'~ {path}: {json.dumps(change["oldValue"])} -> {json.dumps(change["value"])}')
+
+    return lines
@@ -0,0 +1,111 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for watching a Greengrass deployment until it finishes.
+"""
+
+import random
+import time
+from botocore.exceptions import ClientError
+
+class DeploymentWatcher():
+    """ Polls a Greengrass deployment, with exponential backoff and jitter, until it finishes """
+
+    DEFAULT_TIMEOUT = 900
+    DEFAULT_POLL_INTERVAL = 2.0
+    DEFAULT_MAX_POLL_INTERVAL = 30.0
+    BACKOFF_MULTIPLIER = 1.5
+    THROTTLING_ERROR_CODES = ['ThrottlingException', 'TooManyRequestsException', 'RequestLimitExceeded']
+    DEVICE_TERMINAL_STATUSES = ['COMPLETED', 'SUCCEEDED', 'FAILED', 'CANCELED', 'REJECTED', 'TIMED_OUT']
+    DEVICE_FAILURE_STATUSES = ['FAILED', 'CANCELED', 'REJECTED', 'TIMED_OUT']
+
+    def __init__(self, greengrassv2_client, poll_interval=DEFAULT_POLL_INTERVAL,
+                 max_poll_interval=DEFAULT_MAX_POLL_INTERVAL):
+        self.greengrassv2_client = greengrassv2_client
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.api_calls = 0
+        self.throttles = 0
+        self.elapsed = 0.0
+        self.device_statuses = {}
+
+    def wait(self, deployment_id, core_device_thing_names=None, timeout=DEFAULT_TIMEOUT):
+        """
+        Waits for the deployment to leave the ACTIVE state, or for every tracked core device to
+        reach a terminal status. Returns the final deployment status, which is ACTIVE on timeout.
+        """
+        core_device_thing_names = core_device_thing_names or []
+        self.device_statuses = {thing_name: None for thing_name in core_device_thing_names}
+        last_observed = None
+        interval = self.poll_interval
+        snapshot = time.monotonic()
+        deployment_status = 'ACTIVE'
+
+        while True:
+            try:
+                deployment_status = self._call(self.greengrassv2_client.get_deployment,
+                                               deploymentId=deployment_id)['deploymentStatus']
+                for thing_name in core_device_thing_names:
+                    if self.device_statuses[thing_name] not in self.DEVICE_TERMINAL_STATUSES:
+                        self.device_statuses[thing_name] = self._get_device_status(deployment_id, thing_name)
+                observed = (deployment_status, dict(self.device_statuses))
+                # Poll quickly again after a change, otherwise back off
+                interval = self.poll_interval if observed != last_observed else self._next(interval)
+                last_observed = observed
+            except ClientError as e:
+                if e.response['Error']['Code'] not in self.THROTTLING_ERROR_CODES:
+                    raise e
+                self.throttles += 1
+                interval = self.max_poll_interval
+                print(f'Throttled while polling deployment {deployment_id}. Backing off for {interval:.1f} seconds')
+
+            self.elapsed = time.monotonic() - snapshot
+
+            if deployment_status != 'ACTIVE' or self._devices_finished() or self.elapsed >= timeout:
+                break
+
+            time.sleep(min(self._jitter(interval), max(timeout - self.elapsed, 0)))
+
+        if deployment_status == 'ACTIVE' and self._devices_finished():
+            deployment_status = 'FAILED' if self.failed_devices() else 'COMPLETED'
+
+        return deployment_status
+
+    def failed_devices(self):
+        """ Gets the tracked core devices that reached a failure status """
+        return [thing_name for thing_name, status in self.device_statuses.items()
+                if status in self.DEVICE_FAILURE_STATUSES]
+
+    def _get_device_status(self, deployment_id, thing_name):
+        """ Gets the execution status of the deployment on a core device, or None if not yet known """
+        response = self._call(self.greengrassv2_client.list_effective_deployments,
+                              coreDeviceThingName=thing_name)
+
+        for effective_deployment in response['effectiveDeployments']:
+            if effective_deployment['deploymentId'] == deployment_id:
+                status = effective_deployment['coreDeviceExecutionStatus']
+                if status != self.device_statuses[thing_name]:
+                    print(f'Core device {thing_name} deployment status: {status}')
+                return status
+
+        return None
+
+    def _devices_finished(self):
+        """ Determines whether all tracked core devices have reached a terminal status """
+        return len(self.device_statuses) > 0 and\
+            all(status in self.DEVICE_TERMINAL_STATUSES for status in self.device_statuses.values())
+
+    def _next(self, interval):
+        """ Gets the next poll interval, growing exponentially up to the maximum """
+        return min(interval * self.BACKOFF_MULTIPLIER, self.max_poll_interval)
+
+    @staticmethod
+    def _jitter(interval):
+        """ Applies "equal jitter" so that many watchers do not poll in lockstep """
+        return interval / 2 + random.uniform(0, interval / 2)
+
+    def _call(self, method, **kwargs):
+        """ Calls a Greengrass API method, counting the call """
+        self.api_calls += 1
+        return method(**kwargs)
@@ -0,0 +1,78 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for the device profiles that tune Home Assistant and its container to a class of core device.
+
+A profile generates a Home Assistant package holding recorder and logger settings, which is merged into
+the configuration through the packages directory, and sets resource limits and log rotation on the
+Home Assistant service of the Docker Compose file. The recorder is the biggest source of disk I/O and
+CPU on small cores, so the profiles mostly trade recorder history and write frequency against flash
+wear. The history integration reads from the recorder, so its window is the recorder's purge window.
+
+The resource limits are service settings of Docker Compose file format 2, which older Docker Compose 1.x
+releases reject in a version 3 file, so applying a profile sets the file format version to 2.4.
+"""
+
+import yaml
+
+PACKAGE_FILE = 'config/packages/device_profile.yaml'
+PROFILE_NONE = 'none'
+COMPOSE_FILE_VERSION = '2.4'
+
+def log_rotation(max_size, max_file):
+    """ Gets the Docker logging settings that rotate the container log """
+    return {'driver': 'json-file', 'options': {'max-size': max_size, 'max-file': str(max_file)}}
+
+PROFILES = {
+    'low-flash-wear': {
+        'description': 'SD card cores: infrequent recorder commits, a short history and few recorded entities',
+        'recorder': {'commit_interval': 30, 'purge_keep_days': 3, 'auto_purge': True,
+                     'exclude': {'domains': ['automation', 'script', 'sun', 'update', 'weather'],
+                                 'event_types': ['call_service']}},
+        'logger': {'default': 'warning'},
+        'compose': {'mem_limit': '1g', 'cpus': 2, 'logging': log_rotation('1m', 2)}
+    },
+    'in-memory': {
+        'description': 'No recorder writes to flash at all. History is lost whenever Home Assistant restarts.',
+        'recorder': {'db_url': 'sqlite:///:memory:', 'commit_interval': 30, 'purge_keep_days': 1,
+                     'exclude': {'domains': ['automation', 'script', 'sun', 'update', 'weather'],
+                                 'event_types': ['call_service']}},
+        'logger': {'default': 'warning'},
+        'compose': {'mem_limit': '1536m', 'cpus': 2, 'logging': log_rotation('1m', 2)}
+    },
+    'balanced': {
+        'description': 'The recorder defaults of Home Assistant, with container limits and log rotation',
+        'recorder': {'commit_interval': 5, 'purge_keep_days': 10, 'auto_purge': True},
+        'logger': {'default': 'warning'},
+        'compose': {'mem_limit': '2g', 'logging': log_rotation('10m', 3)}
+    },
+    'high-throughput': {
+        'description': 'SSD or server cores: frequent recorder commits and a long history, without limits',
+        'recorder': {'commit_interval': 1, 'purge_keep_days': 30, 'auto_purge': True},
+        'logger': {'default': 'info'},
+        'compose': {'logging': log_rotation('50m', 5)}
+    }
+}
+
+class DeviceProfile():
+    """ A named device profile, which generates the Home Assistant package and Docker Compose settings """
+
+    def __init__(self, name):
+        self.name = name
+        self.profile = PROFILES[name]
+
+    def package(self):
+        """ Gets the Home Assistant package of the profile's recorder and logger settings """
+        return {'recorder': self.profile['recorder'], 'logger': self.profile['logger']}
+
+    def apply(self, compose):
+        """ Sets the profile's resource limits and log rotation on the Home Assistant service of a compose file """
+        compose['version'] = COMPOSE_FILE_VERSION
+        compose['services']['homeassistant'].update(self.profile['compose'])
+        return compose
+
+    def package_text(self):
+        """ Gets the YAML text of the Home Assistant package """
+        return f'# Generated by gdk_build.py from the {self.name} device profile. Do not edit.\n' +\
+            yaml.safe_dump(self.package(), sort_keys=False)
@@ -0,0 +1,110 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for the versioned envelope format of the Home Assistant configuration secret.
+
+An envelope is a JSON object with an "envelopeVersion" and a "files" object. Each file entry holds the
+file's data as text or base64, an optional compression algorithm and an optional file mode:
+
+{"envelopeVersion": 1, "files": {"secrets.yaml": {"encoding": "text", "data": "..."},
+                                 "cert.p12": {"encoding": "base64", "compression": "zlib", "mode": 384,
+                                              "data": "..."}}}
+
+Secrets created before the envelope format are a flat {filename: contents} JSON object.
+"""
+
+import base64
+import io
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ENVELOPE_VERSION = 1
+SECRET_SIZE_LIMIT = 65536
+ENCODING_TEXT = 'text'
+ENCODING_BASE64 = 'base64'
+COMPRESSION_NONE = 'none'
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSIONS = [COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_ZSTD]
+# The core device decodes the secret with the standard library only, as zstandard is not in its requirements
+EDGE_COMPRESSIONS = [COMPRESSION_NONE, COMPRESSION_ZLIB]
+
+class Envelope():
+    """ Builds the envelope of files for the Home Assistant configuration secret """
+
+    def __init__(self, compression=COMPRESSION_ZLIB):
+        if compression == COMPRESSION_ZSTD and zstandard is None:
+            raise ValueError('zstd compression requires the zstandard package')
+        if compression not in COMPRESSIONS:
+            raise ValueError(f'Unknown compression {compression}')
+
+        self.compression = compression
+        self.files = {}
+        self.raw_bytes = 0
+        self.serialized = None
+
+    def add(self, filename, data, mode=None):
+        """ Adds a file, choosing the smallest of its text and compressed representations """
+        self.raw_bytes += len(data)
+        entry = None
+
+        try:
+            entry = {'encoding': ENCODING_TEXT, 'data': data.decode('utf-8')}
+        except UnicodeDecodeError:
+            entry = {'encoding': ENCODING_BASE64, 'data': base64.b64encode(data).decode('ascii')}
+
+        if self.compression != COMPRESSION_NONE:
+            compressed = {'encoding': ENCODING_BASE64, 'compression': self.compression,
+                          'data': base64.b64encode(compress(data, self.compression)).decode('ascii')}
+            if json_size(compressed) < json_size(entry):
+                entry = compressed
+
+        if mode is not None:
+            entry['mode'] = mode
+
+        self.files[filename] = entry
+        self.serialized = None
+
+    def write(self, stream):
+        """ Streams the envelope as JSON to a text stream, one chunk at a time """
+        envelope = {'envelopeVersion': ENVELOPE_VERSION, 'files': self.files}
+        for chunk in json.JSONEncoder(ensure_ascii=False).iterencode(envelope):
+            stream.write(chunk)
+
+    def to_json(self):
+        """ Gets the envelope as a JSON string, serializing it only once """
+        if self.serialized is None:
+            buffer = io.StringIO()
+            self.write(buffer)
+            self.serialized = buffer.getvalue()
+
+        return self.serialized
+
+    def size(self):
+        """ Gets the size of the envelope as stored in Secrets Manager """
+        return len(self.to_json().encode('utf-8'))
+
+    def report(self):
+        """ Reports the compression ratio, and the headroom against the secret size limit """
+        size = self.size()
+        ratio = self.raw_bytes / size if size else 0
+        headroom = SECRET_SIZE_LIMIT - size
+        print(f'Secret is {size} bytes for {len(self.files)} files of {self.raw_bytes} bytes '
+              f'(compression ratio {ratio:.2f}). Headroom is {headroom} bytes of the {SECRET_SIZE_LIMIT} byte limit.')
+        return size
+
+def json_size(value):
+    """ Gets the size in bytes of a value serialized as JSON """
+    return len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+def compress(data, compression):
+    """ Compresses data with the given algorithm """
+    if compression == COMPRESSION_ZSTD:
+        return zstandard.ZstdCompressor(level=19).compress(data)
+    return zlib.compress(data, 9)
@@ -0,0 +1,170 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for rolling out a component version to a fleet of Greengrass core devices.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from libs.tracing import tracer
+
+class RateLimiter():
+    """ Thread-safe token bucket that limits the rate of API calls """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Blocks until a token is available, then takes it """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def attach(self, client):
+        """ Makes every API call of a boto3 client first take a token """
+        client.meta.events.register('before-parameter-build', lambda **kwargs: self.acquire())
+        return client
+
+class FleetRollout():
+    """
+    Rolls out to a fleet of core devices in stages: an optional canary stage, followed by waves.
+    Each stage deploys concurrently on a bounded thread pool. A circuit breaker stops the rollout
+    when a canary fails, or when the failures exceed the maximum failure rate of the devices in the
+    stages started so far. Measuring against the started stages, rather than the finished devices,
+    stops a single early failure from tripping the breaker.
+    """
+
+    STATUS_SUCCEEDED = 'SUCCEEDED'
+    STATUS_FAILED = 'FAILED'
+    STATUS_SKIPPED = 'SKIPPED'
+
+    def __init__(self, deploy, concurrency=10, max_failure_rate=0.1):
+        """ The deploy callable takes a thing name, and returns a result dictionary or raises on failure """
+        self.deploy = deploy
+        self.concurrency = concurrency
+        self.max_failure_rate = max_failure_rate
+        self.thing_names = []
+        self.results = {}
+        self.tripped = False
+        self.lock = threading.Lock()
+
+    def run(self, thing_names, canary_size=0, wave_size=0):
+        """ Rolls out to the core devices, returning the per-device results in the order given """
+        self.thing_names = list(thing_names)
+        self.results = {}
+        self.tripped = False
+        started = 0
+
+        for stage, stage_thing_names in self.stages(thing_names, canary_size, wave_size):
+            if self.tripped:
+                self._skip(stage_thing_names)
+                continue
+
+            print(f'Starting {stage} with {len(stage_thing_names)} core device(s)')
+            started += len(stage_thing_names)
+            self._run_stage(stage, stage_thing_names, started)
+
+            if stage == 'canary' and self.failed():
+                print('Canary deployment failed. Circuit breaker open.')
+                self.tripped = True
+
+        return [self.results[thing_name] for thing_name in self.thing_names]
+
+    @staticmethod
+    def stages(thing_names, canary_size, wave_size):
+        """ Splits the core devices into a canary stage and waves """
+        stages = []
+        remaining = list(thing_names)
+
+        if canary_size > 0:
+            stages.append(('canary', remaining[:canary_size]))
+            remaining = remaining[canary_size:]
+
+        wave_size = wave_size if wave_size > 0 else max(len(remaining), 1)
+        for i in range(0, len(remaining), wave_size):
+            stages.append((f'wave {i // wave_size + 1}', remaining[i:i + wave_size]))
+
+        return stages
+
+    def failed(self):
+        """ Gets the core devices whose deployment failed """
+        return [result['thingName'] for result in self.results.values() if result['status'] == self.STATUS_FAILED]
+
+    def failure_rate(self):
+        """ Gets the failure rate across the core devices that have finished deploying """
+        finished = [result for result in self.results.values() if result['status'] != self.STATUS_SKIPPED]
+        return len(self.failed()) / len(finished) if finished else 0.0
+
+    def summary(self):
+        """ Gets a summary of the rollout, suitable for JSON serialization """
+        counts = {}
+        for result in self.results.values():
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+
+        return {'circuitBreakerTripped': self.tripped, 'counts': counts,
+                'failureRate': round(self.failure_rate(), 3),
+                'devices': [self.results[thing_name] for thing_name in self.thing_names]}
+
+    def _run_stage(self, stage, thing_names, started):
+        """ Deploys to the core devices of one stage concurrently """
+        with tracer.span('FleetRollout.stage', stage=stage, devices=len(thing_names)),\
+                ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            deploy_one = tracer.bind(self._deploy_one)
+            futures = {executor.submit(deploy_one, thing_name): thing_name for thing_name in thing_names}
+
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+
+                future.result()
+
+                with self.lock:
+                    failures = len(self.failed())
+                    if not self.tripped and stage != 'canary' and failures > self.max_failure_rate * started:
+                        print(f'{failures} failure(s) exceed {self.max_failure_rate:.0%} of {started} '
+                              'core device(s). Circuit breaker open.')
+                        self.tripped = True
+                        for pending in futures:
+                            pending.cancel()
+
+        # Devices whose deployments were cancelled by the circuit breaker never started
+        self._skip([thing_name for thing_name in thing_names if thing_name not in self.results])
+
+    def _deploy_one(self, thing_name):
+        """ Deploys to one core device, recording the outcome """
+        snapshot = time.monotonic()
+
+        if self.tripped:
+            result = {'thingName': thing_name, 'status': self.STATUS_SKIPPED}
+        else:
+            try:
+                result = {'thingName': thing_name, 'status': self.STATUS_SUCCEEDED}
+                result.update(self.deploy(thing_name))
+            except Exception as e:
+                result = {'thingName': thing_name, 'status': self.STATUS_FAILED, 'error': str(e),
+                          'elapsed': round(time.monotonic() - snapshot, 1)}
+
+        with self.lock:
+            self.results[thing_name] = result
+
+    def _skip(self, thing_names):
+        """ Records core devices that were not deployed to """
+        with self.lock:
+            for thing_name in thing_names:
+                self.results[thing_name] = {'thingName': thing_name, 'status': self.STATUS_SKIPPED}
@@ -2,16 +2,24 @@
 # SPDX-License-Identifier: Apache-2.0
 
 """
-API for the GDK configuration file
+API for the GDK configuration file.
+
+The component is published to the region in the publish section, which is the primary region. The publish
+section can also list further regions, to which the component is published as well:
+
+"publish": {"bucket": "greengrass-home-assistant", "region": "us-east-1", "regions": ["us-east-1", "eu-west-1"]}
 """
 
+import copy
 import json
+from libs.tracing import tracer
 
 class GdkConfig():
     """ API for the GDK configuration file """
 
     GDK_CONFIG_JSON = 'gdk-config.json'
 
+    @tracer.traced('GdkConfig.load')
     def __init__(self):
         """ Gets the GDK configuration file as a dictionary """
         with open(self.GDK_CONFIG_JSON, encoding="utf-8") as gdk_config_file:
@@ -29,3 +37,19 @@ class GdkConfig():
     def region(self):
         """ Gets the component region from the GDK configuration """
         return self.json['component'][self.component_name]['publish']['region']
+
+    def replica_regions(self):
+        """ Gets the regions other than the primary region that the component is published to """
+        regions = self.json['component'][self.component_name]['publish'].get('regions', [])
+        return [region for region in dict.fromkeys(regions) if region != self.region()]
+
+    def bucket(self):
+        """ Gets the prefix of the name of the artifact bucket from the GDK configuration """
+        return self.json['component'][self.component_name]['publish']['bucket']
+
+    def for_region(self, region):
+        """ Gets a copy of the GDK configuration with the given region as the primary region """
+        gdk_config = copy.copy(self)
+        gdk_config.json = copy.deepcopy(self.json)
+        gdk_config.json['component'][self.component_name]['publish']['region'] = region
+        return gdk_config
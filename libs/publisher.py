@@ -0,0 +1,121 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for publishing a built component version to a region, as "gdk component publish" does for the primary
+region.
+
+Each artifact archive in the recipe, such as each artifacts layer, is uploaded to the artifact bucket of the
+region, which is named BUCKET-REGION-ACCOUNT as by GDK, unless the bucket already holds an identical archive.
+Layers are at keys named by their content hash, so a layer that is unchanged since an earlier component
+version is not uploaded again. The bucket is created if it does not exist. The component version is then
+created from the recipe rendered for the region.
+"""
+
+import functools
+import os
+import re
+import time
+from botocore.exceptions import ClientError
+from libs.archive import file_hash
+from libs.aws import aws_clients
+from libs.tracing import tracer
+
+FILE_RECIPE = 'greengrass-build/recipes/recipe.yaml'
+REGION_RECIPE_FORMAT = 'greengrass-build/regions/{}/recipe.yaml'
+ARTIFACT_URI = re.compile(r's3://BUCKET_NAME/([^\s"\']+)')
+
+class PublishError(Exception):
+    """ A component version could not be published to a region """
+
+class Publisher():
+    """ API for publishing a built component version to a region """
+
+    def __init__(self, gdk_config, region, account):
+        self.region = region
+        self.bucket = f'{gdk_config.bucket()}-{region}-{account}'
+        self.s3_client = aws_clients.client('s3', region)
+        self.greengrassv2_client = aws_clients.client('greengrassv2', region)
+
+    def publish(self, recipe_filename, artifacts_directory):
+        """
+        Publishes the component version of the recipe, uploading its artifact archives from the artifacts
+        directory. Returns a summary of the result. Raises PublishError if the component version cannot
+        be created.
+        """
+        snapshot = time.monotonic()
+
+        with open(recipe_filename, encoding='utf-8') as file:
+            recipe_str = file.read()
+
+        keys = ARTIFACT_URI.findall(recipe_str)
+        if not keys or 'COMPONENT_VERSION' in recipe_str:
+            raise PublishError(f'{recipe_filename} has no artifact or component version. '
+                               'Set the version in gdk-config.json.')
+
+        with tracer.span('Publisher.upload', region=self.region, artifacts=len(keys)) as span:
+            archive_files = [os.path.join(artifacts_directory, os.path.basename(key)) for key in keys]
+            span['attributes']['uploaded'] = sum(self.upload(archive_file, key)
+                                                 for archive_file, key in zip(archive_files, keys))
+
+        with tracer.span('Publisher.create_component_version', region=self.region):
+            status = self.create_component_version(recipe_str.replace('BUCKET_NAME', self.bucket))
+
+        return {'region': self.region, 'status': status, 'artifacts': len(keys),
+                'uploaded': span['attributes']['uploaded'], 'elapsed': round(time.monotonic() - snapshot, 1)}
+
+    def upload(self, archive_file, key):
+        """ Uploads the archive, unless the bucket holds an identical one. Returns whether it was uploaded. """
+        sha256 = archive_hash(archive_file)
+
+        try:
+            response = self.s3_client.head_object(Bucket=self.bucket, Key=key)
+            if response.get('Metadata', {}).get('sha256') == sha256:
+                print(f'{self.region}: s3://{self.bucket}/{key} is identical. Skipping the upload.')
+                return False
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ['404', 'NoSuchKey', 'NoSuchBucket']:
+                raise
+            self.create_bucket()
+
+        print(f'{self.region}: Uploading {archive_file} ({os.path.getsize(archive_file)} bytes) '
+              f'to s3://{self.bucket}/{key}')
+        self.s3_client.upload_file(archive_file, self.bucket, key, ExtraArgs={'Metadata': {'sha256': sha256}})
+        return True
+
+    def create_bucket(self):
+        """ Creates the artifact bucket if it does not exist """
+        try:
+            self.s3_client.head_bucket(Bucket=self.bucket)
+            return
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ['404', 'NoSuchBucket']:
+                raise
+
+        print(f'{self.region}: Creating bucket {self.bucket}')
+        location = {} if self.region == 'us-east-1' else\
+            {'CreateBucketConfiguration': {'LocationConstraint': self.region}}
+        self.s3_client.create_bucket(Bucket=self.bucket, **location)
+
+    def create_component_version(self, recipe_str):
+        """ Creates the component version, and gets its state. An existing version is left as is. """
+        try:
+            response = self.greengrassv2_client.create_component_version(inlineRecipe=recipe_str.encode('utf-8'))
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConflictException':
+                print(f'{self.region}: The component version already exists')
+                return 'EXISTS'
+            raise PublishError(f'Failed to create the component version: {e}') from e
+
+        print(f'{self.region}: Created {response["arn"]}')
+        return response['status']['componentState']
+
+def recipe_file(region):
+    """ Gets the recipe rendered for a region, or the recipe of a single region build """
+    region_recipe_file = REGION_RECIPE_FORMAT.format(region)
+    return region_recipe_file if os.path.isfile(region_recipe_file) else FILE_RECIPE
+
+@functools.lru_cache(maxsize=None)
+def archive_hash(archive_file):
+    """ Gets the SHA-256 hash of an artifact archive, hashing it once for all regions """
+    return file_hash(archive_file)
@@ -0,0 +1,124 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for resolving Docker image tags to immutable digests, using the OCI distribution API.
+
+A tag such as homeassistant/home-assistant:stable is resolved to the digest of its manifest. For a
+multi-architecture image that is the digest of the image index, which Docker resolves to the right
+image for each core device, and the digest of each architecture's image is reported too. Anonymous
+pulls are supported through the registry's bearer token flow.
+
+The registry endpoints can be overridden, so that a resolver can be pointed at a local stand-in.
+"""
+
+import hashlib
+import json
+import re
+import urllib.error
+import urllib.parse
+import urllib.request
+
+DOCKER_HUB = 'registry-1.docker.io'
+MEDIA_TYPES_INDEX = ['application/vnd.oci.image.index.v1+json',
+                     'application/vnd.docker.distribution.manifest.list.v2+json']
+MEDIA_TYPES_MANIFEST = ['application/vnd.oci.image.manifest.v1+json',
+                        'application/vnd.docker.distribution.manifest.v2+json']
+
+class RegistryError(Exception):
+    """ An image tag could not be resolved to a digest """
+
+class RegistryResolver():
+    """ Resolves image tags to digests through the OCI distribution API """
+
+    def __init__(self, endpoints=None, timeout=10):
+        """ Endpoints map a registry name to the base URL to use for it, such as http://localhost:5000 """
+        self.endpoints = endpoints or {}
+        self.timeout = timeout
+
+    def resolve(self, image):
+        """
+        Gets the digest of an image reference and, for a multi-architecture image, the digest of each
+        platform's image, keyed by platform such as linux/arm64/v8
+        """
+        registry, repository, tag = parse_image_reference(image)
+        url = f'{self.endpoints.get(registry, "https://" + registry)}/v2/{repository}/manifests/{tag}'
+        body, headers = self.get(url, ', '.join(MEDIA_TYPES_INDEX + MEDIA_TYPES_MANIFEST))
+
+        digest = 'sha256:' + hashlib.sha256(body).hexdigest()
+        if headers.get('Docker-Content-Digest', digest) != digest:
+            raise RegistryError(f'Manifest of {image} does not match its digest {headers["Docker-Content-Digest"]}')
+
+        manifest = json.loads(body)
+        platforms = {}
+        if manifest.get('mediaType', headers.get('Content-Type')) in MEDIA_TYPES_INDEX or 'manifests' in manifest:
+            for entry in manifest['manifests']:
+                platform = entry.get('platform', {})
+                if platform.get('os') == 'unknown':
+                    # Attestation manifests are not images
+                    continue
+                name = '/'.join(part for part in [platform.get('os'), platform.get('architecture'),
+                                                  platform.get('variant')] if part)
+                platforms[name] = entry['digest']
+
+        return {'digest': digest, 'platforms': platforms}
+
+    def get(self, url, accept, token=None):
+        """ Gets a URL, following the bearer token challenge of the registry if there is one """
+        headers = {'Accept': accept}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout) as response:
+                return response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            challenge = e.headers.get('WWW-Authenticate', '')
+            if e.code == 401 and token is None and challenge.lower().startswith('bearer '):
+                return self.get(url, accept, self.get_token(challenge))
+            raise RegistryError(f'Failed to get {url}: HTTP {e.code}') from e
+        except (urllib.error.URLError, OSError) as e:
+            raise RegistryError(f'Failed to get {url}: {e}') from e
+
+    def get_token(self, challenge):
+        """ Gets an anonymous bearer token for the realm, service and scope of a challenge """
+        parameters = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+        if 'realm' not in parameters:
+            raise RegistryError(f'Unsupported authentication challenge {challenge}')
+
+        query = urllib.parse.urlencode({key: value for key, value in parameters.items() if key != 'realm'})
+        try:
+            with urllib.request.urlopen(parameters['realm'] + '?' + query, timeout=self.timeout) as response:
+                token_response = json.load(response)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise RegistryError(f'Failed to get a registry token from {parameters["realm"]}: {e}') from e
+
+        return token_response.get('token') or token_response['access_token']
+
+def parse_image_reference(image):
+    """ Splits an image reference into its registry, repository and tag, applying the Docker Hub defaults """
+    name, tag = split_tag(image)
+    parts = name.split('/')
+
+    if len(parts) > 1 and ('.' in parts[0] or ':' in parts[0] or parts[0] == 'localhost'):
+        registry, repository = parts[0], '/'.join(parts[1:])
+    else:
+        registry, repository = DOCKER_HUB, name
+
+    if registry == DOCKER_HUB and '/' not in repository:
+        repository = 'library/' + repository
+
+    return registry, repository, tag
+
+def split_tag(image):
+    """ Splits an image reference into its name and its tag, which defaults to latest """
+    # A colon before the last slash separates a registry host from its port, not a tag
+    if ':' in image.split('/')[-1]:
+        name, tag = image.rsplit(':', 1)
+        return name, tag
+
+    return image, 'latest'
+
+def pin(image, digest):
+    """ Gets the image reference pinned to a digest, dropping the tag """
+    return f'{split_tag(image)[0]}@{digest}'
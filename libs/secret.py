@@ -3,19 +3,48 @@
 
 """
 API for Home Assistant configuration secret in Secrets Manager.
+
+A configuration too large for one secret is split into shard secrets. The Home Assistant secret then
+holds a small index that lists the shards, with the version ID and SHA-256 hash of each:
+
+{"shardedVersion": 1, "sha256": "...", "shards": [{"name": "greengrass-home-assistant-shard-0",
+                                                   "arn": "...", "versionId": "...", "sha256": "..."}]}
+
+The Home Assistant secret is tagged with its number of shards, and with the shards that its last update
+stopped using. Those shards are kept until the next update, for core devices and deployments that still
+hold the index that listed them, and are then scheduled for deletion. A shard scheduled for deletion is
+restored if it is needed again.
+
+The index lists the shard ARNs in the primary region. A replica of the index is copied from it word for word,
+so the ARN of each shard is taken to be in the region of the index it is listed in.
 """
 
-import boto3
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from libs.aws import aws_clients
+from libs.envelope import SECRET_SIZE_LIMIT
+from libs.tracing import tracer
 
 class Secret():
     """ API for Home Assistant configuration secret in Secrets Manager. """
 
     SECRET_NAME = 'greengrass-home-assistant'
     SECRET_DESCRIPTION = 'Secure configuration for the Home Assistant component on Greengrass'
+    SHARD_NAME_FORMAT = SECRET_NAME + '-shard-{}'
+    SHARD_DESCRIPTION = 'Shard {} of the secure configuration for the Home Assistant component on Greengrass'
+    SHARDED_VERSION = 1
+    MAX_SHARDS = 8
+    MAX_SIZE = MAX_SHARDS * SECRET_SIZE_LIMIT
+    SHARD_RECOVERY_WINDOW_DAYS = 7
+    SHARD_COUNT_TAG = 'ShardCount'
+    RETIRED_SHARDS_TAG = 'RetiredShards'
 
     def __init__(self, region):
-        self.secretsmanager_client = boto3.client('secretsmanager', region_name=region)
+        self.secretsmanager_client = aws_clients.client('secretsmanager', region)
 
+    @tracer.traced('Secret.get')
     def get(self):
         """ Gets a secret from Secrets Manager """
         try:
@@ -27,37 +56,234 @@ class Secret():
 
         return response
 
+    @tracer.traced('Secret.current_version_id')
+    def current_version_id(self):
+        """ Gets the ID of the current version of the Home Assistant secret, without getting its value """
+        try:
+            print(f'Describing the Home Assistant secret {self.SECRET_NAME}')
+            response = self.secretsmanager_client.describe_secret(SecretId=self.SECRET_NAME)
+        except Exception as e:
+            print(f'Failed to describe secret\nException: {e}')
+            raise e
+
+        return next(version_id for version_id, stages in response['VersionIdsToStages'].items()
+                    if 'AWSCURRENT' in stages)
+
+    @tracer.traced('Secret.put')
     def put(self, secret_string):
-        """ Creates or updates the Home Assistant secret in Secrets Manager """
-        if self.exists():
-            try:
-                print(f'Updating the Home Assistant secret {self.SECRET_NAME}')
-                response = self.secretsmanager_client.update_secret(SecretId=self.SECRET_NAME,
-                                                                    SecretString=secret_string,
-                                                                    Description=self.SECRET_DESCRIPTION)
-            except Exception as e:
-                print(f'Failed to update the Home Assistant secret\nException: {e}')
-                raise e
-            print('Successfully updated the Home Assistant secret')
+        """
+        Creates or updates the Home Assistant secret in Secrets Manager. A secret larger than the Secrets
+        Manager size limit is split into shard secrets, which are put concurrently, and the Home Assistant
+        secret becomes the index of the shards. The secret is described first, to find whether it exists and
+        which shards earlier updates left, so that a secret that is not sharded takes two API calls.
+        """
+        size = len(secret_string.encode('utf-8'))
+        if size > self.MAX_SIZE:
+            print(f'Secret is {size} bytes, exceeding the {self.MAX_SIZE} byte limit of {self.MAX_SHARDS} shards')
+            raise ValueError(f'Secret is {size} bytes, exceeding the {self.MAX_SIZE} byte limit')
+
+        tags = self.get_tags()
+        chunks = []
+
+        if size > SECRET_SIZE_LIMIT:
+            chunks = self.split(secret_string, SECRET_SIZE_LIMIT)
+            print(f'Secret is {size} bytes, so splitting it into {len(chunks)} shards')
+
+            with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+                futures = [executor.submit(tracer.bind(self.put_secret), self.SHARD_NAME_FORMAT.format(i), chunk,
+                                           self.SHARD_DESCRIPTION.format(i)) for i, chunk in enumerate(chunks)]
+                responses = [future.result() for future in futures]
+
+            index = {'shardedVersion': self.SHARDED_VERSION, 'sha256': content_hash(secret_string),
+                     'shards': [{'name': self.SHARD_NAME_FORMAT.format(i), 'arn': response['ARN'],
+                                 'versionId': response['VersionId'], 'sha256': content_hash(chunk)}
+                                for i, (chunk, response) in enumerate(zip(chunks, responses))]}
+            secret_string = json.dumps(index)
+
+        # The shards that this update stops using are retired, and those retired by the last update are deleted
+        old_tags = {self.SHARD_COUNT_TAG: '0', self.RETIRED_SHARDS_TAG: '', **(tags or {})}
+        retired = [int(i) for i in old_tags[self.RETIRED_SHARDS_TAG].split() if int(i) >= len(chunks)]
+        new_tags = {self.SHARD_COUNT_TAG: str(len(chunks)), self.RETIRED_SHARDS_TAG:
+                    ' '.join(str(i) for i in range(len(chunks), int(old_tags[self.SHARD_COUNT_TAG])))}
+
+        if tags is None:
+            response = self.create_secret(self.SECRET_NAME, secret_string, self.SECRET_DESCRIPTION, new_tags)
         else:
+            response = self.put_secret(self.SECRET_NAME, secret_string, self.SECRET_DESCRIPTION)
+            if new_tags != {key: old_tags[key] for key in new_tags}:
+                self.secretsmanager_client.tag_resource(
+                    SecretId=self.SECRET_NAME, Tags=[{'Key': key, 'Value': value} for key, value in new_tags.items()])
+
+        self.delete_shards(retired)
+        return response
+
+    def get_tags(self):
+        """ Gets the tags of the Home Assistant secret, or None if it does not exist """
+        try:
+            response = self.secretsmanager_client.describe_secret(SecretId=self.SECRET_NAME)
+        except Exception as e:
+            if self.not_found(e):
+                return None
+            print(f'Failed to describe the Home Assistant secret {self.SECRET_NAME}\nException: {e}')
+            raise e
+
+        return {tag['Key']: tag['Value'] for tag in response.get('Tags', [])}
+
+    @tracer.traced('Secret.delete_shards')
+    def delete_shards(self, shards):
+        """
+        Schedules the deletion of shard secrets, given by number, removing any replicas first, as Secrets
+        Manager requires. A failure is reported as a warning, since the index no longer lists these shards.
+        """
+        for name in [self.SHARD_NAME_FORMAT.format(i) for i in shards]:
+            try:
+                print(f'Scheduling the deletion of the retired shard secret {name}')
+                replicas = self.secretsmanager_client.describe_secret(SecretId=name).get('ReplicationStatus', [])
+                if replicas:
+                    self.secretsmanager_client.remove_regions_from_replication(
+                        SecretId=name, RemoveReplicaRegions=[replica['Region'] for replica in replicas])
+                self.secretsmanager_client.delete_secret(SecretId=name,
+                                                         RecoveryWindowInDays=self.SHARD_RECOVERY_WINDOW_DAYS)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if not self.not_found(e):
+                    print(f'WARNING: Failed to delete the retired shard secret {name}.\nException: {e}')
+
+    @tracer.traced('Secret.replicate')
+    def replicate(self, regions):
+        """
+        Replicates the Home Assistant secret, and any shard secrets, to the regions that do not already have
+        a replica. Secrets Manager then replicates each update of a secret to its replicas.
+        """
+        for arn in secret_arns(self.get()):
             try:
-                print(f'Creating Home Assistant secret {self.SECRET_NAME}')
-                response = self.secretsmanager_client.create_secret(Name=self.SECRET_NAME,
-                                                                    SecretString=secret_string,
-                                                                    Description=self.SECRET_DESCRIPTION)
+                replicas = self.secretsmanager_client.describe_secret(SecretId=arn).get('ReplicationStatus', [])
+                missing = [region for region in regions if region not in [replica['Region'] for replica in replicas]]
+                if missing:
+                    print(f'Replicating secret {arn} to {", ".join(missing)}')
+                    self.secretsmanager_client.replicate_secret_to_regions(
+                        SecretId=arn, AddReplicaRegions=[{'Region': region} for region in missing])
+                else:
+                    print(f'Secret {arn} is already replicated to {", ".join(regions)}')
             except Exception as e:
-                print(f'Failed to create the Home Assistant secret\nException: {e}')
+                print(f'Failed to replicate secret {arn}\nException: {e}')
                 raise e
-            print('Successfully created the Home Assistant secret')
+
+    def put_secret(self, name, secret_string, description):
+        """
+        Creates or updates a secret. Tries the update first, because the secret usually exists, and only
+        creates the secret if it is not found. This takes at most two API calls, regardless of how many
+        secrets are in the account.
+        """
+        try:
+            print(f'Updating the Home Assistant secret {name}')
+            response = self.update_secret(name, secret_string, description)
+            print(f'Successfully updated the Home Assistant secret {name}')
+            return response
+        except Exception as e:
+            if not self.not_found(e):
+                print(f'Failed to update the Home Assistant secret {name}\nException: {e}')
+                raise e
+
+        return self.create_secret(name, secret_string, description)
+
+    def create_secret(self, name, secret_string, description, tags=None):
+        """ Creates a secret, with any tags given """
+        try:
+            print(f'Creating Home Assistant secret {name}')
+            response = self.secretsmanager_client.create_secret(
+                Name=name, SecretString=secret_string, Description=description,
+                **({'Tags': [{'Key': key, 'Value': value} for key, value in tags.items()]} if tags else {}))
+        except Exception as e:
+            print(f'Failed to create the Home Assistant secret {name}\nException: {e}')
+            raise e
+        print(f'Successfully created the Home Assistant secret {name}')
 
         return response
 
+    def update_secret(self, name, secret_string, description):
+        """ Updates a secret, first restoring it if it is scheduled for deletion, as an unused shard may be """
+        try:
+            return self.secretsmanager_client.update_secret(SecretId=name, SecretString=secret_string,
+                                                            Description=description)
+        except Exception as e:
+            if not self.scheduled_for_deletion(e):
+                raise e
+
+        print(f'Restoring the Home Assistant secret {name}, which was scheduled for deletion')
+        self.secretsmanager_client.restore_secret(SecretId=name)
+        return self.secretsmanager_client.update_secret(SecretId=name, SecretString=secret_string,
+                                                        Description=description)
+
     def exists(self):
         """ Determines whether the Home Assistant secret already exists in Secrets Manager """
-        response = self.secretsmanager_client.list_secrets()
+        try:
+            self.secretsmanager_client.describe_secret(SecretId=self.SECRET_NAME)
+        except Exception as e:
+            if self.not_found(e):
+                return False
+            raise e
+
+        return True
+
+    @staticmethod
+    def not_found(exception):
+        """ Determines whether an exception is a Secrets Manager "resource not found" error """
+        return isinstance(exception, ClientError) and\
+            exception.response['Error']['Code'] == 'ResourceNotFoundException'
+
+    @staticmethod
+    def scheduled_for_deletion(exception):
+        """ Determines whether an exception is the Secrets Manager error for a secret scheduled for deletion """
+        return isinstance(exception, ClientError) and\
+            exception.response['Error']['Code'] == 'InvalidRequestException' and\
+            'deletion' in exception.response['Error'].get('Message', '')
+
+    @staticmethod
+    def split(secret_string, limit):
+        """ Splits a string into chunks of at most limit UTF-8 bytes, without splitting any character """
+        data = secret_string.encode('utf-8')
+        chunks = []
+        start = 0
+
+        while start < len(data):
+            end = min(start + limit, len(data))
+            # Back off to the first byte of a multi-byte character, which is not a 10xxxxxx continuation byte
+            while end < len(data) and data[end] & 0xC0 == 0x80:
+                end -= 1
+            chunks.append(data[start:end].decode('utf-8'))
+            start = end
+
+        return chunks
+
+def regional_arn(arn, regional_secret_arn):
+    """
+    Gets the ARN of the replica of a secret in the region of another secret. A replica ARN differs from the
+    primary ARN only in its region. Identifiers that are not ARNs are got as they are.
+    """
+    parts, regional_parts = arn.split(':'), regional_secret_arn.split(':')
+    if len(parts) < 7 or len(regional_parts) < 7:
+        return arn
+
+    parts[3] = regional_parts[3]
+    return ':'.join(parts)
+
+def secret_arns(secret_value):
+    """
+    Gets the ARNs of the Home Assistant secret and of any shard secrets listed in its index, in the region
+    of the Home Assistant secret
+    """
+    arns = [secret_value['ARN']]
+
+    try:
+        index = json.loads(secret_value['SecretString'])
+    except (KeyError, TypeError, ValueError):
+        return arns
+
+    if isinstance(index, dict) and 'shardedVersion' in index:
+        arns.extend(regional_arn(shard['arn'], secret_value['ARN']) for shard in index['shards'])
 
-        for secret in response['SecretList']:
-            if secret['Name'] == self.SECRET_NAME:
-                return True
+    return arns
 
-        return False
+def content_hash(secret_string):
+    """ Gets the SHA-256 hash of the secret content """
+    return hashlib.sha256(secret_string.encode('utf-8')).hexdigest()
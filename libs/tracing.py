@@ -0,0 +1,16 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Tracing for the developer machine scripts.
+
+The scripts share the tracer of the edge runtime, in artifacts/tracing.py. This module adds the counting
+of the AWS API calls of boto3 clients, in the span that makes each call.
+"""
+
+from artifacts.tracing import tracer
+
+def count_api_calls(client):
+    """ Counts every API call of a boto3 client in the current span, and returns the client """
+    client.meta.events.register('before-parameter-build', lambda **kwargs: tracer.api_call())
+    return client
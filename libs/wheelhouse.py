@@ -0,0 +1,82 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+API for building the wheelhouse of Python packages that the component installs on the core device.
+
+The wheels are downloaded once per target platform and Python version, into a directory cached under
+the hash of the requirements and targets, and are shipped in the artifacts archive. The core device
+then installs them without reaching PyPI.
+
+The awscrt package has version-specific wheels before Python 3.11, and abi3 wheels from Python 3.11,
+so the default targets are each of CPython 3.8 to 3.10, and 3.11 for 3.11 and later, on 64-bit Intel
+and ARM cores. The wheels of pure Python packages are shared by all the targets, so each older Python
+version adds only its awscrt wheels. Cores with other platforms or Python versions fall back to
+installing from PyPI.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+CACHE_DIRECTORY = '.build-cache/wheelhouse/'
+MARKER_FILE = '.wheelhouse.json'
+PLATFORMS = ['manylinux2014_x86_64', 'manylinux2014_aarch64']
+PYTHON_VERSIONS = ['3.8', '3.9', '3.10', '3.11']
+
+class Wheelhouse():
+    """ Downloads the wheels for the target platforms, reusing the cached wheelhouse if nothing changed """
+
+    def __init__(self, requirements_file, cache_directory=CACHE_DIRECTORY):
+        self.requirements_file = requirements_file
+        self.cache_directory = cache_directory
+        self.targets = [(platform, python_version) for platform in PLATFORMS for python_version in PYTHON_VERSIONS]
+
+    def key(self):
+        """ Gets the hash of the requirements and the targets """
+        with open(self.requirements_file, 'rb') as requirements:
+            digest = hashlib.sha256(requirements.read())
+        digest.update(json.dumps(self.targets).encode('utf-8'))
+        return digest.hexdigest()
+
+    def build(self, reuse=True):
+        """ Gets the wheelhouse directory, downloading the wheels unless the cached wheelhouse can be reused """
+        directory = os.path.join(self.cache_directory, self.key())
+        marker_file = os.path.join(directory, MARKER_FILE)
+
+        if reuse and os.path.isfile(marker_file):
+            print(f'Requirements are unchanged. Reusing the cached wheelhouse {directory}')
+            return directory
+
+        temp_directory = directory + '.tmp'
+        shutil.rmtree(temp_directory, ignore_errors=True)
+        os.makedirs(temp_directory)
+        missing = [target for target in self.targets if not self.download(target, temp_directory)]
+
+        with open(os.path.join(temp_directory, MARKER_FILE), 'w', encoding='utf-8') as marker:
+            json.dump({'targets': self.targets, 'missing': missing}, marker)
+
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(temp_directory, directory)
+        print(f'Created wheelhouse {directory} with {len(os.listdir(directory)) - 1} wheels')
+
+        return directory
+
+    def download(self, target, directory):
+        """ Downloads the wheels for one platform and Python version, returning whether that succeeded """
+        platform, python_version = target
+        print(f'Downloading wheels for {platform}, Python {python_version}')
+
+        try:
+            subprocess.run([sys.executable, '-m', 'pip', 'download', '--quiet', '--only-binary=:all:',
+                            '--platform', platform, '--python-version', python_version, '--implementation', 'cp',
+                            '--dest', directory, '-r', self.requirements_file], check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f'Failed to download wheels for {platform}, Python {python_version}. '
+                  f'Cores with this platform will install from PyPI.\nException: {e}')
+            return False
+
+        return True
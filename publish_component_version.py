@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Publishes the built component version to the region in gdk-config.json and every further region that it
+lists, concurrently. This should be called after "gdk component build", in place of "gdk component publish".
+The component version must be set in gdk-config.json, rather than NEXT_PATCH.
+
+The artifacts layers are built once and uploaded to the artifact bucket of each region, skipping those that the
+bucket already holds, and the component version is created from the recipe rendered for each region. A
+failure in one region does not stop the others. A table of the results is printed at the end.
+
+Example execution:
+python3 publish_component_version.py
+python3 publish_component_version.py --regions eu-west-1 --summary publish.json
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from libs.aws import aws_clients
+from libs.gdk_config import GdkConfig
+from libs.publisher import Publisher, recipe_file
+from libs.tracing import tracer
+
+DIRECTORY_BUILD = 'greengrass-build/artifacts/'
+
+def publish_to_region(region):
+    """ Publishes the component version to one region, getting the result rather than raising """
+    with tracer.span('publish_to_region', region=region):
+        try:
+            publisher = Publisher(gdk_config, region, account)
+            return publisher.publish(recipe_file(region), artifacts_directory)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f'{region}: Failed to publish\nException: {e}')
+            return {'region': region, 'status': 'FAILED', 'error': str(e)}
+
+def print_results(results):
+    """ Prints a table of the results of every region """
+    print(f'{"Region":<16} {"Status":<10} {"Uploaded":>9} {"Seconds":>7}')
+    for result in results:
+        uploaded = f'{result["uploaded"]}/{result["artifacts"]}' if 'uploaded' in result else '-'
+        print(f'{result["region"]:<16} {result["status"]:<10} {uploaded:>9} {result.get("elapsed", 0):>7.1f} '
+              f'{result.get("error", "")}'.rstrip())
+
+
+gdk_config = GdkConfig()
+
+parser = argparse.ArgumentParser(description=f'Publish the built {gdk_config.name()} component to each region')
+parser.add_argument('--regions', nargs='+', help='Regions to publish to (default: all in gdk-config.json)')
+parser.add_argument('--summary', help='File to write the JSON per-region result summary to')
+args = parser.parse_args()
+
+regions = args.regions or [gdk_config.region()] + list(gdk_config.replica_regions())
+artifacts_directory = DIRECTORY_BUILD + gdk_config.name() + '/' + gdk_config.version() + '/'
+
+if gdk_config.version() == 'NEXT_PATCH':
+    print('Publishing to several regions needs the same version in each. Set the version in gdk-config.json.')
+    sys.exit(1)
+
+if not os.path.isdir(artifacts_directory):
+    print(f'{artifacts_directory} does not exist. Run "gdk component build" first.')
+    sys.exit(1)
+
+account = aws_clients.account_id()
+print(f'Publishing {gdk_config.name()} {gdk_config.version()} to {", ".join(regions)}')
+
+with tracer.span('publish', regions=len(regions)):
+    with ThreadPoolExecutor(len(regions)) as executor:
+        region_results = list(executor.map(tracer.bind(publish_to_region), regions))
+
+print_results(region_results)
+
+if args.summary:
+    with open(args.summary, 'w', encoding="utf-8") as summary_file:
+        json.dump({'regions': region_results}, summary_file, indent=2)
+    print(f'Wrote publish summary to {args.summary}')
+
+tracer.report()
+
+if any(result['status'] == 'FAILED' for result in region_results):
+    sys.exit(1)
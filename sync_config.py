@@ -0,0 +1,125 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Publishes a config-only update of the Home Assistant configuration to a Greengrass core device, without
+publishing and deploying a new component version. This should be called after "gdk component build" and
+a deployment of the built version, and then after each change to artifacts/config.
+
+The files that differ from those last synced to the core device, or else from those of the last build,
+are published as a config delta to the homeassistant/THING_NAME/config AWS IoT Core topic. The edge agent
+of the component applies the delta and reloads Home Assistant, publishing the outcome to the
+homeassistant/THING_NAME/config/result topic. The delta is refused if the files on the core device are
+not those it expects to replace, unless it is forced.
+
+Example execution:
+python3 sync_config.py MyCoreDeviceThingName
+python3 sync_config.py MyCoreDeviceThingName --dry-run
+python3 sync_config.py MyCoreDeviceThingName --force --restart
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from libs.archive import ArtifactArchive
+from libs.aws import aws_clients
+from libs.config_sync import ConfigDelta, MESSAGE_SIZE_LIMIT, TOPIC_FORMAT, archive_hashes, last_build_archives
+from libs.gdk_config import GdkConfig
+from libs.tracing import tracer
+
+DIRECTORY_ARTIFACTS = 'artifacts/'
+DIRECTORY_GENERATED = '.build-cache/generated/'
+FILE_STATE = '.build-cache/config_sync.json'
+
+def load_state():
+    """ Loads the record of the configuration last synced to each core device """
+    try:
+        with open(FILE_STATE, encoding='utf-8') as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(state):
+    """ Saves the record of the configuration last synced to each core device """
+    os.makedirs(os.path.dirname(FILE_STATE), exist_ok=True)
+    with open(FILE_STATE, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file, indent=2)
+
+def base_hashes(inputs_hash, archive_files):
+    """ Gets the hashes of the configuration on the core device: that last synced, or else that of the last build """
+    synced = all_state.get(args.coreDeviceThingName, {})
+
+    if inputs_hash is not None and synced.get('build') == inputs_hash:
+        print('Comparing with the configuration last synced to the core device')
+        return synced['hashes']
+
+    if archive_files is not None:
+        print(f'Comparing with the configuration of the last build {inputs_hash[:12]}')
+        return archive_hashes(archive_files)
+
+    if args.force:
+        print('There is no cached build archive. Publishing every configuration file.')
+        return {}
+
+    print('There is no cached build archive to compare with. Run "gdk component build", or use --force.')
+    sys.exit(1)
+
+def publish(delta):
+    """ Publishes the config delta to the core device through AWS IoT Core """
+    region = gdk_config.region()
+    endpoint = aws_clients.client('iot', region).describe_endpoint(endpointType='iot:Data-ATS')['endpointAddress']
+    iot_data_client = aws_clients.client('iot-data', region, endpoint_url=f'https://{endpoint}')
+    topic = TOPIC_FORMAT.format(args.coreDeviceThingName)
+
+    iot_data_client.publish(topic=topic, qos=1, payload=json.dumps(delta).encode('utf-8'))
+    print(f'Published config delta {delta["sequence"]} to {topic}. The outcome is published to {topic}/result.')
+
+
+parser = argparse.ArgumentParser(description='Publish a config-only update to a Greengrass core device')
+parser.add_argument('coreDeviceThingName', help='Greengrass core device to update')
+parser.add_argument('--force', action='store_true', help='Replace the files on the core device whatever they hold')
+parser.add_argument('--restart', action='store_true', help='Restart Home Assistant rather than reloading it')
+parser.add_argument('--dry-run', action='store_true', help='Report the config delta without publishing it')
+args = parser.parse_args()
+
+gdk_config = GdkConfig()
+all_state = load_state()
+
+with tracer.span('build_delta'):
+    last_inputs_hash, last_archive_files = last_build_archives()
+    config_delta = ConfigDelta(ArtifactArchive(DIRECTORY_ARTIFACTS, extra_directories={'': DIRECTORY_GENERATED}))
+    # Sequence numbers only increase, so that the core device ignores redelivered deltas
+    sequence = max(int(time.time() * 1000), all_state.get(args.coreDeviceThingName, {}).get('sequence', 0) + 1)
+    delta_json = config_delta.build(base_hashes(last_inputs_hash, last_archive_files), sequence, args.force,
+                                    args.restart)
+
+if delta_json is None:
+    print('The configuration is unchanged. Nothing to sync.')
+    sys.exit(0)
+
+size = len(json.dumps(delta_json).encode('utf-8'))
+print(f'Config delta has {len(delta_json["envelope"]["files"])} changed files '
+      f'({", ".join(delta_json["envelope"]["files"])}) and {len(delta_json["removed"])} removed files, in {size} bytes')
+
+if size > MESSAGE_SIZE_LIMIT:
+    print(f'Config delta exceeds the {MESSAGE_SIZE_LIMIT} byte message size limit. '
+          'Publish a component version instead.')
+    sys.exit(1)
+
+if args.dry_run:
+    print('Dry run. Not publishing the config delta.')
+    sys.exit(0)
+
+with tracer.span('publish'):
+    try:
+        publish(delta_json)
+    except Exception as e:
+        print(f'Failed to publish the config delta\nException: {e}')
+        sys.exit(1)
+
+all_state[args.coreDeviceThingName] = {'build': last_inputs_hash, 'sequence': delta_json['sequence'],
+                                       'hashes': config_delta.hashes()}
+save_state(all_state)
+tracer.report()
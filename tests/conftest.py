@@ -0,0 +1,38 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Shared fixtures for the unit tests
+"""
+import boto3
+import pytest
+from botocore.stub import Stubber
+from libs.aws import aws_clients
+from libs.component_versions import ComponentVersionResolver
+from libs.tracing import tracer
+
+@pytest.fixture(autouse=True)
+def fixture_aws_clients():
+    """ Start every test without cached AWS clients, so that each test's boto3 mocks take effect """
+    aws_clients.reset()
+    yield
+    aws_clients.reset()
+
+@pytest.fixture(autouse=True)
+def fixture_tracer():
+    """ Start every test without any finished tracing spans """
+    tracer.reset()
+
+@pytest.fixture(autouse=True)
+def fixture_component_version_cache(tmp_path, monkeypatch):
+    """ Keep the component version cache out of the repository, and start every test with it empty """
+    monkeypatch.setattr(ComponentVersionResolver, 'CACHE_FILE', str(tmp_path / 'component_versions.json'))
+
+@pytest.fixture(name='stubber')
+def fixture_stubber():
+    """ Stubbed Greengrass V2 botocore client """
+    client = boto3.client('greengrassv2', region_name='us-east-1',
+                          aws_access_key_id='testing', aws_secret_access_key='testing')
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
@@ -0,0 +1,29 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.agent module
+"""
+import os
+import runpy
+import sys
+import pytest
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(name='ipc_client', autouse=True)
+def fixture_ipc_client(monkeypatch, mocker):
+    """ Run without the Greengrass IPC client, nor the core device thing name """
+    monkeypatch.syspath_prepend(os.path.join(REPOSITORY, 'artifacts'))
+    monkeypatch.delenv('AWS_IOT_THING_NAME', raising=False)
+    return mocker.patch('awsiot.greengrasscoreipc.clientv2.GreengrassCoreIPCClientV2')
+
+def test_agent_no_thing_name(ipc_client, capsys):
+    """ The agent exits with an error, rather than subscribing to the topics of no thing """
+    sys.argv[1:] = ['--url', 'http://localhost:8123/']
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('artifacts.agent')
+
+    assert system_exit.value.code == 1
+    assert 'No core device thing name' in capsys.readouterr().err
+    ipc_client.assert_not_called()
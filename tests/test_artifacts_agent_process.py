@@ -0,0 +1,63 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.agent_process module
+"""
+import os
+import pathlib
+import runpy
+import signal
+import subprocess
+import sys
+import time
+import pytest
+from artifacts.agent_process import is_agent, stop_agent
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(name='agent')
+def fixture_agent(tmp_path, monkeypatch):
+    """ Run a stand-in agent script in the work directory, recording its process ID """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'agent.py').write_text('import time\ntime.sleep(60)\n', encoding='utf-8')
+    agent = subprocess.Popen([sys.executable, '-u', 'agent.py'])  # pylint: disable=consider-using-with
+    (tmp_path / 'agent.pid').write_text(str(agent.pid), encoding='utf-8')
+    # Wait for the child process to execute the script, in place of the test process it was forked from
+    deadline = time.monotonic() + 10
+    while b'agent.py' not in pathlib.Path(f'/proc/{agent.pid}/cmdline').read_bytes() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield agent
+    agent.kill()
+    agent.wait()
+
+def test_is_agent(agent):
+    """ A process is the agent only if it is running agent.py """
+    assert is_agent(agent.pid)
+    assert not is_agent(os.getpid())
+    assert not is_agent(-1)
+
+def test_stop_agent(agent, tmp_path):
+    """ The agent is sent SIGTERM, and its process ID file is removed """
+    assert stop_agent()
+    assert agent.wait(timeout=10) == -signal.SIGTERM
+    assert not (tmp_path / 'agent.pid').exists()
+    assert not stop_agent()
+
+def test_stop_agent_reused_pid(mocker, tmp_path, monkeypatch, capsys):
+    """ A process ID that now belongs to another process is not killed """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'agent.pid').write_text(str(os.getpid()), encoding='utf-8')
+    kill = mocker.patch('os.kill')
+
+    assert not stop_agent()
+    kill.assert_not_called()
+    assert not (tmp_path / 'agent.pid').exists()
+    assert 'is not the agent' in capsys.readouterr().out
+
+def test_stop_agent_script(agent, monkeypatch, capsys):
+    """ The Shutdown and Recover lifecycle steps stop the agent with the script """
+    monkeypatch.syspath_prepend(os.path.join(REPOSITORY, 'artifacts'))
+    runpy.run_module('artifacts.stop_agent')
+    assert agent.wait(timeout=10) == -signal.SIGTERM
+    assert 'Stopped the agent' in capsys.readouterr().out
@@ -0,0 +1,85 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.bootstrap_venv module
+"""
+import json
+import os
+import runpy
+import subprocess
+import sys
+import pytest
+
+@pytest.fixture(name='work_directory')
+def fixture_work_directory(tmp_path, monkeypatch):
+    """ Run in a component work directory holding the requirements and a wheelhouse """
+    (tmp_path / 'requirements.txt').write_text('awsiotsdk==1.22.1\n', encoding='utf-8')
+    (tmp_path / 'wheelhouse').mkdir()
+    monkeypatch.chdir(tmp_path)
+    sys.argv[1:] = ['venv', 'requirements.txt', 'wheelhouse']
+    return tmp_path
+
+def fake_venv(command, check):
+    """ Pretend to create a virtual environment, or to install packages into it """
+    assert check
+    if command[1:3] == ['-m', 'venv']:
+        os.makedirs(os.path.join(command[-1], 'bin'), exist_ok=True)
+        with open(os.path.join(command[-1], 'bin', 'python'), 'w', encoding='utf-8'):
+            pass
+
+def pip_commands(run):
+    """ Gets the pip install commands that were run """
+    return [call.args[0] for call in run.call_args_list if 'pip' in call.args[0]]
+
+def test_builds_offline_then_reuses(mocker, work_directory, capsys):
+    """ The first install builds from the wheelhouse, and the next reuses the virtual environment """
+    run = mocker.patch('subprocess.run', side_effect=fake_venv)
+    runpy.run_module('artifacts.bootstrap_venv')
+
+    assert len(pip_commands(run)) == 1
+    assert '--no-index' in pip_commands(run)[0]
+    marker = json.loads((work_directory / 'venv' / '.requirements.json').read_text(encoding='utf-8'))
+    assert marker['source'] == 'wheelhouse'
+    capsys.readouterr()
+
+    run.reset_mock()
+    runpy.run_module('artifacts.bootstrap_venv')
+    run.assert_not_called()
+    assert 'Reusing the virtual environment' in capsys.readouterr().out
+
+def test_rebuilds_when_requirements_change(mocker, work_directory):
+    """ Changed requirements rebuild the virtual environment """
+    run = mocker.patch('subprocess.run', side_effect=fake_venv)
+    runpy.run_module('artifacts.bootstrap_venv')
+    (work_directory / 'requirements.txt').write_text('awsiotsdk==1.23.0\n', encoding='utf-8')
+    run.reset_mock()
+    runpy.run_module('artifacts.bootstrap_venv')
+    assert run.call_args_list[0].args[0][1:4] == ['-m', 'venv', '--clear']
+
+def test_falls_back_to_pypi(mocker, work_directory):
+    """ If the wheelhouse lacks a wheel for the core, the requirements are installed from PyPI """
+    def offline_fails(command, check):
+        if '--no-index' in command:
+            raise subprocess.CalledProcessError(1, command)
+        fake_venv(command, check)
+
+    run = mocker.patch('subprocess.run', side_effect=offline_fails)
+    runpy.run_module('artifacts.bootstrap_venv')
+
+    assert '--no-index' not in pip_commands(run)[-1]
+    marker = json.loads((work_directory / 'venv' / '.requirements.json').read_text(encoding='utf-8'))
+    assert marker['source'] == 'PyPI'
+
+def test_fails_when_pypi_unreachable(mocker, work_directory):
+    """ The install fails if neither the wheelhouse nor PyPI can provide the requirements """
+    def pip_fails(command, check):
+        if 'pip' in command:
+            raise subprocess.CalledProcessError(1, command)
+        fake_venv(command, check)
+
+    (work_directory / 'wheelhouse').rmdir()
+    mocker.patch('subprocess.run', side_effect=pip_fails)
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('artifacts.bootstrap_venv')
+    assert system_exit.value.code == 1
@@ -0,0 +1,120 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.config_sync module, against a local stand-in for Greengrass IPC
+"""
+import json
+import os
+from types import SimpleNamespace
+import pytest
+from awsiot.greengrasscoreipc.model import QOS
+from artifacts.config_sync import ConfigConflict, ConfigSync
+from artifacts.files import content_hash
+from libs.envelope import Envelope
+
+THING_NAME = 'MyCoreDevice'
+ORIGINAL = b'automation: old\n'
+
+class FakeIpcClient():
+    """ Local stand-in for the Greengrass IPC client, delivering messages to the subscriber """
+
+    def __init__(self):
+        self.handlers = {}
+        self.published = []
+
+    def subscribe_to_iot_core(self, topic_name, qos, on_stream_event):
+        """ Record the subscription """
+        assert qos == QOS.AT_LEAST_ONCE
+        self.handlers[topic_name] = on_stream_event
+
+    def publish_to_iot_core(self, topic_name, qos, payload):
+        """ Record the published message """
+        assert qos == QOS.AT_LEAST_ONCE
+        self.published.append((topic_name, json.loads(payload)))
+
+    def deliver(self, topic_name, message):
+        """ Deliver a message to the subscriber of a topic """
+        self.handlers[topic_name](SimpleNamespace(message=SimpleNamespace(payload=json.dumps(message).encode())))
+
+@pytest.fixture(name='sync')
+def fixture_sync(tmp_path, mocker):
+    """ Config sync of a configuration directory holding automations.yaml, with reloads mocked """
+    (tmp_path / 'config').mkdir()
+    (tmp_path / 'config' / 'automations.yaml').write_bytes(ORIGINAL)
+    mocker.patch('artifacts.config_sync.reload', return_value=['automation.reload'])
+    return ConfigSync(FakeIpcClient(), THING_NAME, str(tmp_path / 'config'), str(tmp_path / 'config_sync.json'))
+
+def delta(files, sequence=1, removed=None, base=None):
+    """ Create a config delta """
+    envelope = Envelope()
+    for filename, data in files.items():
+        envelope.add(filename, data)
+
+    config_delta = {'configDeltaVersion': 1, 'sequence': sequence, 'envelope': json.loads(envelope.to_json()),
+                    'removed': removed or []}
+    if base is not None:
+        config_delta['base'] = base
+    return config_delta
+
+def test_subscribe_and_apply(sync, tmp_path):
+    """ A delivered delta is written, Home Assistant is reloaded and the outcome is published """
+    sync.subscribe()
+    files = {'automations.yaml': b'automation: new\n', 'scripts/lights.yaml': b'lights: on\n'}
+    base = {'automations.yaml': content_hash(ORIGINAL), 'scripts/lights.yaml': None}
+    sync.ipc_client.deliver('homeassistant/MyCoreDevice/config', delta(files, base=base))
+
+    for filename, data in files.items():
+        assert (tmp_path / 'config' / filename).read_bytes() == data
+    topic, result = sync.ipc_client.published[0]
+    assert topic == 'homeassistant/MyCoreDevice/config/result'
+    assert result['status'] == 'applied' and result['sequence'] == 1
+    assert result['written'] == sorted(files) and result['actions'] == ['automation.reload']
+
+def test_conflict(sync, tmp_path):
+    """ Nothing is written if a file differs from what the delta expects to replace """
+    sync.subscribe()
+    sync.ipc_client.deliver('homeassistant/MyCoreDevice/config',
+                            delta({'automations.yaml': b'automation: new\n', 'scenes.yaml': b'scene: []\n'},
+                                  base={'automations.yaml': content_hash(b'other'), 'scenes.yaml': None}))
+
+    assert (tmp_path / 'config' / 'automations.yaml').read_bytes() == ORIGINAL
+    assert not (tmp_path / 'config' / 'scenes.yaml').exists()
+    assert sync.ipc_client.published[0][1] == {'status': 'conflict', 'error': 'automations.yaml'}
+
+    # A forced delta has no base, so it is applied whatever the files hold
+    assert sync.apply(delta({'automations.yaml': b'automation: new\n'}))['status'] == 'applied'
+
+def test_rollback(sync, tmp_path, mocker):
+    """ If a write fails, the files already written are restored """
+    write_atomic = mocker.patch('artifacts.config_sync.write_atomic', side_effect=[None, OSError('disk full'), None])
+
+    with pytest.raises(OSError):
+        sync.apply(delta({'automations.yaml': b'automation: new\n', 'scenes.yaml': b'scene: []\n'}))
+
+    restored = write_atomic.call_args_list[-1].args
+    assert restored[0] == os.path.join(str(tmp_path / 'config'), 'automations.yaml') and restored[1] == ORIGINAL
+    assert sync.load_state() == {}
+
+def test_sequence_and_removal(sync, tmp_path):
+    """ Files are removed, and a redelivered or older delta is ignored """
+    assert sync.apply(delta({}, 5, ['automations.yaml']))['removed'] == ['automations.yaml']
+    assert not (tmp_path / 'config' / 'automations.yaml').exists()
+
+    assert sync.apply(delta({'automations.yaml': ORIGINAL}, 5))['status'] == 'ignored'
+    assert sync.apply(delta({'automations.yaml': ORIGINAL}, 4))['status'] == 'ignored'
+    assert not (tmp_path / 'config' / 'automations.yaml').exists()
+
+def test_invalid_delta(sync, tmp_path):
+    """ Unsupported versions and filenames outside the configuration directory fail """
+    with pytest.raises(ValueError):
+        sync.apply(dict(delta({}), configDeltaVersion=2))
+    with pytest.raises(ValueError):
+        sync.apply(delta({'../escape.yaml': b'x'}))
+    with pytest.raises(ConfigConflict):
+        sync.apply(delta({'automations.yaml': b'x'}, base={'automations.yaml': None}))
+
+    sync.subscribe()
+    sync.ipc_client.deliver('homeassistant/MyCoreDevice/config', dict(delta({}), configDeltaVersion=2))
+    assert sync.ipc_client.published[0][1]['status'] == 'failed'
+    assert not (tmp_path / 'escape.yaml').exists()
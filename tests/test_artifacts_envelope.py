@@ -0,0 +1,83 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.envelope module
+"""
+import hashlib
+import json
+import pytest
+from artifacts.envelope import unpack, is_envelope, is_shard_index, reassemble
+from libs.envelope import Envelope
+
+def test_unpack_flat():
+    """ The flat format of older secrets is still understood """
+    secret_json = {'secrets.yaml': 'foo', 'place/cert.pem': 'bar'}
+    assert not is_envelope(secret_json)
+    assert unpack(secret_json) == ({'secrets.yaml': b'foo', 'place/cert.pem': b'bar'}, {})
+
+def test_unpack_flat_file_named_like_envelope_key():
+    """ A flat secret with a file named like an envelope key is not mistaken for an envelope """
+    secret_json = {'envelopeVersion': '1', 'files': 'foo'}
+    assert not is_envelope(secret_json)
+
+@pytest.mark.parametrize('compression', ['none', 'zlib'])
+def test_round_trip(compression):
+    """ Files added to an envelope unpack to the same data and modes """
+    envelope = Envelope(compression)
+    envelope.add('a.yaml', b'text: \xc3\xa9\n' * 100, 0o644)
+    envelope.add('b.p12', bytes(range(256)) * 4, 0o600)
+    envelope.add('c.yaml', b'')
+    files, modes = unpack(json.loads(envelope.to_json()))
+    assert files == {'a.yaml': b'text: \xc3\xa9\n' * 100, 'b.p12': bytes(range(256)) * 4, 'c.yaml': b''}
+    assert modes == {'a.yaml': 0o644, 'b.p12': 0o600}
+
+def test_unsupported_version():
+    """ A newer envelope version is rejected rather than misread """
+    with pytest.raises(ValueError):
+        unpack({'envelopeVersion': 2, 'files': {}})
+
+def test_unknown_compression():
+    """ An unknown compression is rejected """
+    with pytest.raises(ValueError):
+        unpack({'envelopeVersion': 1, 'files': {'a': {'encoding': 'base64', 'compression': 'lzma', 'data': ''}}})
+
+def test_envelope_report(capsys):
+    """ The report gives the compression ratio and headroom """
+    envelope = Envelope()
+    envelope.add('a.yaml', b'a' * 10000)
+    size = envelope.report()
+    assert size == len(envelope.to_json())
+    assert f'Headroom is {65536 - size} bytes' in capsys.readouterr().out
+
+def sha256(string):
+    """ Gets the SHA-256 hash of a string """
+    return hashlib.sha256(string.encode('utf-8')).hexdigest()
+
+def shard_index(shard_strings):
+    """ Creates the index of a secret split into the given shards """
+    return {'shardedVersion': 1, 'sha256': sha256(''.join(shard_strings)),
+            'shards': [{'name': f'shard-{i}', 'arn': f'arn-{i}', 'versionId': 'v1', 'sha256': sha256(shard_string)}
+                       for i, shard_string in enumerate(shard_strings)]}
+
+def test_reassemble():
+    """ Shards are joined in index order and parsed """
+    shard_strings = ['{"envelopeVersion": 1, ', '"files": {}}']
+    index = shard_index(shard_strings)
+    assert is_shard_index(index)
+    assert not is_envelope(index)
+    assert reassemble(index, shard_strings) == {'envelopeVersion': 1, 'files': {}}
+
+@pytest.mark.parametrize('shard_strings', [['{"files": ', '[]}'], ['{"files": '], ['{}}', '{"files": ']])
+def test_reassemble_rejects_mismatch(shard_strings):
+    """ Reassembly fails if a shard is corrupt, missing or out of order """
+    index = shard_index(['{"files": ', '{}}'])
+    with pytest.raises(ValueError):
+        reassemble(index, shard_strings)
+
+def test_reassemble_unsupported_version():
+    """ Reassembly fails for an unknown sharded version """
+    index = shard_index(['{}'])
+    index['shardedVersion'] = 2
+    with pytest.raises(ValueError):
+        reassemble(index, ['{}'])
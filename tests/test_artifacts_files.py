@@ -0,0 +1,67 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.files module
+"""
+import os
+import pytest
+from artifacts.files import append_record, load_records, materialize, write_atomic, MANIFEST_FILE
+
+@pytest.fixture(autouse=True)
+def fixture_config_directory(tmp_path, monkeypatch):
+    """ Run in an empty config directory """
+    monkeypatch.chdir(tmp_path)
+
+def test_materialize_counts():
+    """ Counts files and bytes written, skipped and removed """
+    stats = materialize({'a.yaml': 'aaa', 'b/c.pem': b'\x00\x01'})
+    assert stats == {'written': 2, 'writtenBytes': 5, 'skipped': 0, 'skippedBytes': 0, 'removed': 0}
+    stats = materialize({'a.yaml': 'aaa', 'd.yaml': 'd'})
+    assert stats == {'written': 1, 'writtenBytes': 1, 'skipped': 1, 'skippedBytes': 3, 'removed': 1}
+    assert not os.path.exists('b/c.pem')
+    with open('b/../a.yaml', encoding='utf-8') as file:
+        assert file.read() == 'aaa'
+
+def test_materialize_keep():
+    """ Files no longer wanted are kept if asked to, such as those written with another manifest """
+    materialize({'a.yaml': 'aaa', 'b.yaml': 'bbb'})
+    assert materialize({}, keep={'b.yaml'})['removed'] == 1
+    assert not os.path.exists('a.yaml') and os.path.exists('b.yaml')
+
+def test_materialize_rewrites_missing_file():
+    """ A file in the manifest that was deleted from disk is written again """
+    materialize({'a.yaml': 'aaa'})
+    os.remove('a.yaml')
+    assert materialize({'a.yaml': 'aaa'})['written'] == 1
+    assert os.path.isfile('a.yaml')
+
+def test_materialize_ignores_corrupt_manifest():
+    """ A corrupt manifest causes every file to be written """
+    materialize({'a.yaml': 'aaa'})
+    with open(MANIFEST_FILE, 'w', encoding='utf-8') as file:
+        file.write('{')
+    assert materialize({'a.yaml': 'aaa'})['written'] == 1
+
+@pytest.mark.parametrize('filename', ['../escape.yaml', '/etc/passwd', 'a/../../escape.yaml'])
+def test_materialize_rejects_escaping_filenames(filename):
+    """ Files cannot be created outside the config directory """
+    with pytest.raises(ValueError):
+        materialize({filename: 'x'})
+
+def test_append_record():
+    """ Only the most recent records are kept """
+    assert not load_records('records.jsonl')
+    for index in range(4):
+        append_record('records.jsonl', {'index': index}, limit=3)
+    assert load_records('records.jsonl') == [{'index': 1}, {'index': 2}, {'index': 3}]
+
+def test_write_atomic_leaves_no_partial_file(mocker):
+    """ A failed write leaves the existing file intact and no temporary file behind """
+    write_atomic('a.yaml', b'old')
+    mocker.patch('os.replace', side_effect=OSError('mocked error'))
+    with pytest.raises(OSError):
+        write_atomic('a.yaml', b'new')
+    assert os.listdir('.') == ['a.yaml']
+    with open('a.yaml', encoding='utf-8') as file:
+        assert file.read() == 'old'
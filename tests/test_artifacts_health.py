@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.health module
+"""
+import json
+import subprocess
+import urllib.error
+import pytest
+from artifacts.health import container_state, container_ready, http_ready, wait_until_ready
+
+RUNNING = {'status': 'running', 'health': None, 'restarts': 0, 'image': 'sha256:abc'}
+
+@pytest.fixture(name='clock')
+def fixture_clock(mocker):
+    """ A fake clock that advances only when the health checks sleep """
+    clock = mocker.patch('artifacts.health.time')
+    clock.monotonic.return_value = 0.0
+
+    def sleep(seconds):
+        clock.monotonic.return_value += seconds
+
+    clock.sleep.side_effect = sleep
+    return clock
+
+def inspect_output(state, restart_count=0):
+    """ Create the output of docker inspect for a container in the given state """
+    return json.dumps([{'State': state, 'RestartCount': restart_count, 'Image': 'sha256:abc'}])
+
+def test_container_state(mocker):
+    """ The status, health, restart count and image are read from docker inspect """
+    run = mocker.patch('subprocess.run')
+    run.return_value.stdout = inspect_output({'Status': 'running', 'Health': {'Status': 'starting'}}, 2)
+
+    assert container_state() == {'status': 'running', 'health': 'starting', 'restarts': 2, 'image': 'sha256:abc'}
+    assert run.call_args.args[0] == ['docker', 'inspect', 'homeassistant']
+
+def test_container_state_missing(mocker):
+    """ There is no state for a container that does not exist """
+    mocker.patch('subprocess.run', side_effect=subprocess.CalledProcessError(1, 'docker'))
+    assert container_state() is None
+
+@pytest.mark.parametrize('state, ready', [
+    (None, False),
+    ({'status': 'restarting', 'health': None}, False),
+    ({'status': 'running', 'health': None}, True),
+    ({'status': 'running', 'health': 'starting'}, False),
+    ({'status': 'running', 'health': 'healthy'}, True)
+])
+def test_container_ready(state, ready):
+    """ A container is ready when it is running, and healthy if it has a health check """
+    assert container_ready(state) == ready
+
+@pytest.mark.parametrize('error, ready', [
+    (urllib.error.HTTPError('url', 401, 'Unauthorized', None, None), True),
+    (urllib.error.HTTPError('url', 503, 'Unavailable', None, None), False),
+    (urllib.error.URLError('Connection refused'), False)
+])
+def test_http_ready_errors(mocker, error, ready):
+    """ Any response but a server error shows that the HTTP server is up """
+    mocker.patch('urllib.request.urlopen', side_effect=error)
+    assert http_ready() == ready
+
+@pytest.mark.usefixtures('clock')
+def test_wait_until_ready(mocker):
+    """ The container and then the HTTP server are polled until both are ready """
+    mocker.patch('artifacts.health.container_state', side_effect=[None, RUNNING, RUNNING, RUNNING])
+    mocker.patch('artifacts.health.http_ready', side_effect=[False, True])
+
+    result = wait_until_ready(60)
+
+    assert result == {'ready': True, 'containerSeconds': 0.5, 'httpSeconds': 1.5, 'polls': 3, 'restarts': 0,
+                      'image': 'sha256:abc'}
+
+def test_wait_until_ready_backs_off_and_times_out(mocker, clock):
+    """ Polls back off exponentially, and stop once the timeout would expire """
+    mocker.patch('artifacts.health.container_state', return_value={**RUNNING, 'status': 'restarting', 'restarts': 4})
+
+    result = wait_until_ready(60)
+
+    assert [call.args[0] for call in clock.sleep.call_args_list] == [0.5, 1, 2, 4, 8, 10, 10, 10, 10]
+    assert not result['ready']
+    assert result['restarts'] == 4
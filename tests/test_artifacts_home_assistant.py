@@ -0,0 +1,49 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.home_assistant module
+"""
+import ssl
+from artifacts.home_assistant import read_token, reload, reload_services
+
+def test_reload_services():
+    """ Each file is reloaded by its integration, other YAML by a full reload, and anything else by a restart """
+    assert reload_services(['automations.yaml', 'scripts.yaml']) == ['automation.reload', 'script.reload']
+    assert reload_services(['automations.yaml', 'packages/lights.yaml']) == ['homeassistant.reload_all']
+    assert reload_services(['automations.yaml', 'cert.pem']) == ['homeassistant.restart']
+    assert reload_services(['automations.yaml'], restart=True) == ['homeassistant.restart']
+    assert not reload_services([])
+
+def test_read_token(tmp_path):
+    """ The token is read from secrets.yaml """
+    secrets_file = tmp_path / 'secrets.yaml'
+    assert read_token(str(secrets_file)) is None
+    secrets_file.write_text('other: 1\ngreengrass_access_token: "abc.def"  # For config sync\n', encoding='utf-8')
+    assert read_token(str(secrets_file)) == 'abc.def'
+
+def test_reload(tmp_path, mocker):
+    """ Services are called with the token, and the container is restarted if that fails or there is no token """
+    secrets_file = tmp_path / 'secrets.yaml'
+    secrets_file.write_text('greengrass_access_token: abc\n', encoding='utf-8')
+    urlopen = mocker.patch('urllib.request.urlopen')
+    urlopen.return_value.__enter__.return_value.read.return_value = b'[]'
+    run = mocker.patch('subprocess.run')
+
+    assert reload(['automations.yaml'], secrets_file=str(secrets_file)) == ['automation.reload']
+    request = urlopen.call_args.args[0]
+    assert request.full_url == 'http://localhost:8123/api/services/automation/reload'
+    assert request.get_header('Authorization') == 'Bearer abc'
+    run.assert_not_called()
+
+    # A server with its own SSL certificate is called at its HTTPS URL, without verifying the certificate
+    assert reload(['automations.yaml'], secrets_file=str(secrets_file), url='https://localhost:8123/') == \
+        ['automation.reload']
+    assert urlopen.call_args.args[0].full_url == 'https://localhost:8123/api/services/automation/reload'
+    assert urlopen.call_args.kwargs['context'].verify_mode == ssl.CERT_NONE
+
+    urlopen.side_effect = OSError('refused')
+    assert reload(['automations.yaml'], secrets_file=str(secrets_file)) == ['docker restart']
+    run.assert_called_once_with(['docker', 'restart', 'homeassistant'], check=True)
+
+    assert reload(['automations.yaml'], secrets_file=str(tmp_path / 'missing.yaml')) == ['docker restart']
@@ -4,10 +4,15 @@
 """
 Unit tests for the artifacts.install module
 """
+import hashlib
+import os
 import runpy
 import sys
 import json
 import pytest
+from artifacts.secret import MAX_STALENESS_SECONDS
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 def secret_json():
     """ Create secret as a JSON dictionary """
@@ -15,21 +20,54 @@ def secret_json():
 
     return json.loads(secret_string)
 
-def test_install_succeeds(mocker):
-    """ Confirm that Home Assistant installs correctly """
-    sys.path.append('artifacts')
-    get_secret = mocker.patch('secret.get_secret', return_value=secret_json())
-    os_chdir = mocker.patch('os.chdir')
-    os_makedirs = mocker.patch('os.makedirs')
-    file = mocker.patch('builtins.open', mocker.mock_open(read_data='rubbish'))
+@pytest.fixture(name='work_directory')
+def fixture_work_directory(tmp_path, monkeypatch):
+    """ Run in a component work directory with an empty config directory """
+    # Run the module from the repository, but in the work directory
+    monkeypatch.syspath_prepend(REPOSITORY)
+    monkeypatch.syspath_prepend(os.path.join(REPOSITORY, 'artifacts'))
+    (tmp_path / 'config').mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def run_install(mocker, work_directory, secret):
+    """ Run the install with the given secret """
+    os.chdir(work_directory)
+    get_secret = mocker.patch('secret.get_secret', return_value=secret)
     sys.argv[1:] = ['my_secret_arn']
     runpy.run_module('artifacts.install')
+    get_secret.assert_called_once_with('my_secret_arn', None, MAX_STALENESS_SECONDS)
+
+def test_install_succeeds(mocker, work_directory):
+    """ Confirm that Home Assistant installs correctly """
+    run_install(mocker, work_directory, secret_json())
+
+    assert (work_directory / 'config' / 'secrets.yaml').read_text(encoding='utf-8') == 'foo'
+    assert (work_directory / 'config' / 'place' / 'cert.pem').read_text(encoding='utf-8') == 'bar'
+
+def test_install_skips_unchanged_and_removes_deleted(mocker, work_directory, capsys):
+    """ A reinstall writes only changed files, and removes files no longer in the secret """
+    run_install(mocker, work_directory, secret_json())
+    mtime = (work_directory / 'config' / 'secrets.yaml').stat().st_mtime_ns
+    capsys.readouterr()
 
-    get_secret.assert_called_once()
-    os_chdir.assert_any_call('config')
-    os_makedirs.assert_any_call('place', exist_ok=True)
-    file.assert_any_call('secrets.yaml', 'w', encoding="utf-8")
-    file.assert_any_call('place/cert.pem', 'w', encoding="utf-8")
+    run_install(mocker, work_directory, {'secrets.yaml': 'foo', 'other.yaml': 'baz'})
+
+    assert (work_directory / 'config' / 'secrets.yaml').stat().st_mtime_ns == mtime
+    assert (work_directory / 'config' / 'other.yaml').read_text(encoding='utf-8') == 'baz'
+    assert not (work_directory / 'config' / 'place' / 'cert.pem').exists()
+    assert 'Wrote 1 files (3 bytes), skipped 1 unchanged files (3 bytes), removed 1 files' in capsys.readouterr().out
+
+def test_install_envelope(mocker, work_directory):
+    """ Confirm that Home Assistant installs from a secret in the envelope format """
+    secret = {'envelopeVersion': 1, 'files': {
+        'secrets.yaml': {'encoding': 'text', 'data': 'foo', 'mode': 0o640},
+        'cert.der': {'encoding': 'base64', 'data': 'AAEC'}}}
+    run_install(mocker, work_directory, secret)
+
+    assert (work_directory / 'config' / 'secrets.yaml').read_text(encoding='utf-8') == 'foo'
+    assert (work_directory / 'config' / 'secrets.yaml').stat().st_mode & 0o777 == 0o640
+    assert (work_directory / 'config' / 'cert.der').read_bytes() == b'\x00\x01\x02'
 
 def test_install_missing_argument():
     """ Confirm that the install fails if the secret ARN argument is missing  """
@@ -42,3 +80,25 @@ def test_install_missing_argument():
         runpy.run_module('artifacts.install')
         assert system_exit.type == SystemExit
         assert system_exit.code == 1
+
+def test_install_sharded(mocker, work_directory):
+    """ Confirm that Home Assistant installs from a configuration split into shard secrets """
+    secret_string = json.dumps({'envelopeVersion': 1, 'files': {'secrets.yaml': {'encoding': 'text', 'data': 'foo'}}})
+    shard_strings = [secret_string[:20], secret_string[20:]]
+    index = {'shardedVersion': 1, 'sha256': hashlib.sha256(secret_string.encode()).hexdigest(),
+             'shards': [{'name': f'shard-{i}', 'arn': f'arn-{i}', 'versionId': 'v1',
+                         'sha256': hashlib.sha256(shard_string.encode()).hexdigest()}
+                        for i, shard_string in enumerate(shard_strings)]}
+    get_shard_strings = mocker.patch('secret.get_shard_strings', return_value=shard_strings)
+    run_install(mocker, work_directory, index)
+
+    get_shard_strings.assert_called_once_with(index['shards'], 'my_secret_arn', MAX_STALENESS_SECONDS)
+    assert (work_directory / 'config' / 'secrets.yaml').read_text(encoding='utf-8') == 'foo'
+
+def test_install_max_staleness(mocker, work_directory):
+    """ The expected version and staleness limit given as arguments are passed on """
+    get_secret = mocker.patch('secret.get_secret', return_value=secret_json())
+    sys.argv[1:] = ['my_secret_arn', 'v1', '3600']
+    runpy.run_module('artifacts.install')
+    get_secret.assert_called_once_with('my_secret_arn', 'v1', 3600.0)
+    assert (work_directory / 'config' / 'secrets.yaml').read_text(encoding='utf-8') == 'foo'
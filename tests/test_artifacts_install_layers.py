@@ -0,0 +1,80 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.install_layers module
+"""
+import json
+import os
+import runpy
+import sys
+import pytest
+from libs.archive import ArtifactLayers
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(name='source')
+def fixture_source(tmp_path, monkeypatch):
+    """ Artifacts to build layers of, and a component work directory to install them in """
+    monkeypatch.syspath_prepend(os.path.join(REPOSITORY, 'artifacts'))
+    source = tmp_path / 'artifacts'
+    (source / 'config' / 'themes').mkdir(parents=True)
+    (source / 'install.py').write_text('print("install")\n', encoding='utf-8')
+    (source / 'config' / 'configuration.yaml').write_text('homeassistant:\n', encoding='utf-8')
+    (source / 'config' / 'themes' / 'dark.yaml').write_text('dark: {}\n', encoding='utf-8')
+    os.chmod(source / 'install.py', 0o755)
+    (tmp_path / 'work').mkdir()
+    monkeypatch.chdir(tmp_path / 'work')
+    return source
+
+def install(source, tmp_path, version):
+    """ Build the layers of the artifacts into the artifacts path of a version, and install them """
+    artifacts_path = tmp_path / 'packages' / version
+    ArtifactLayers(str(source), str(tmp_path / 'cache')).build(str(artifacts_path), version)
+    sys.argv[1:] = [str(artifacts_path)]
+    runpy.run_module('artifacts.install_layers')
+
+def test_install_layers(source, tmp_path, capsys):
+    """ Only changed layers are installed, and files no longer in any layer are removed """
+    install(source, tmp_path, '1.0.0')
+    work = tmp_path / 'work'
+    assert (work / 'config' / 'themes' / 'dark.yaml').read_text(encoding='utf-8') == 'dark: {}\n'
+    assert os.stat(work / 'install.py').st_mode & 0o777 == 0o755
+    assert sorted(json.loads((work / 'layers.json').read_text(encoding='utf-8'))) == ['assets', 'config', 'runtime']
+    assert 'Installed 3 changed layers (assets, config, runtime)' in capsys.readouterr().out
+
+    # Files that Home Assistant creates are left alone
+    (work / 'config' / 'home-assistant_v2.db').write_bytes(b'history')
+    (source / 'config' / 'configuration.yaml').write_text('homeassistant: {}\n', encoding='utf-8')
+    install(source, tmp_path, '1.0.1')
+    output = capsys.readouterr().out
+    assert 'Layer runtime is unchanged. Skipping it.' in output
+    assert 'Installed 1 changed layers (config)' in output
+    assert (work / 'config' / 'configuration.yaml').read_text(encoding='utf-8') == 'homeassistant: {}\n'
+    assert (work / 'config' / 'home-assistant_v2.db').exists()
+
+    # A layer that is no longer built has its files removed
+    (source / 'config' / 'themes' / 'dark.yaml').unlink()
+    install(source, tmp_path, '1.0.2')
+    assert 'Installed 1 changed layers (assets)' in capsys.readouterr().out
+    assert not (work / 'config' / 'themes' / 'dark.yaml').exists()
+    assert (work / 'config' / 'configuration.yaml').exists()
+
+def test_install_layers_file_moves(source, tmp_path):
+    """ A file that moves from one layer to another is not removed by the layer it left """
+    (source / 'config' / 'www').mkdir()
+    install(source, tmp_path, '1.0.0')
+    (source / 'config' / 'configuration.yaml').rename(source / 'config' / 'www' / 'configuration.yaml')
+    (source / 'config' / 'themes' / 'dark.yaml').rename(source / 'config' / 'dark.yaml')
+    install(source, tmp_path, '1.0.1')
+
+    assert (tmp_path / 'work' / 'config' / 'dark.yaml').exists()
+    assert (tmp_path / 'work' / 'config' / 'www' / 'configuration.yaml').exists()
+    assert not (tmp_path / 'work' / 'config' / 'themes' / 'dark.yaml').exists()
+
+def test_install_layers_no_argument():
+    """ The artifacts path is required """
+    sys.argv[1:] = []
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('artifacts.install_layers')
+    assert system_exit.value.code == 1
@@ -0,0 +1,97 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.migrate_recorder module
+"""
+import os
+import runpy
+import sqlite3
+import subprocess
+import sys
+import pytest
+
+SQLITE_DATABASE = 'config/home-assistant_v2.db'
+
+@pytest.fixture(name='work_directory')
+def fixture_work_directory(tmp_path, monkeypatch):
+    """ Run in a component work directory with a small SQLite recorder database """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'config').mkdir()
+    connection = sqlite3.connect(SQLITE_DATABASE)
+    connection.executescript("""
+        CREATE TABLE states_meta (metadata_id INTEGER PRIMARY KEY, entity_id VARCHAR(255));
+        CREATE TABLE states (state_id INTEGER PRIMARY KEY, state VARCHAR(255), last_updated_ts FLOAT,
+                             metadata_id INTEGER REFERENCES states_meta(metadata_id), context_id_bin BLOB);
+        CREATE TABLE schema_changes (change_id INTEGER PRIMARY KEY, schema_version INTEGER);
+        INSERT INTO states_meta VALUES (1, 'sensor.temperature');
+        INSERT INTO states VALUES (1, '21.5', 1700000000.25, 1, X'00ff'), (2, 'it''s \\ on', 1700000001.5, 1, NULL);
+        INSERT INTO schema_changes VALUES (1, 47);
+    """)
+    connection.commit()
+    connection.close()
+    return tmp_path
+
+def write_sql(engine):
+    """ Writes the migration SQL of the SQLite database, without applying it """
+    sys.argv[1:] = [engine, '--no-apply']
+    runpy.run_module('artifacts.migrate_recorder')
+    with open('recorder_migration.sql', encoding='utf-8') as sql_file:
+        return sql_file.read()
+
+@pytest.mark.usefixtures('work_directory')
+def test_write_sql_mariadb(mocker):
+    """ The rows are loaded with the referenced tables first, with MariaDB literals """
+    run = mocker.patch('subprocess.run')
+    sql = write_sql('mariadb')
+    run.assert_not_called()
+
+    assert sql.startswith('SET NAMES utf8mb4;\nSET FOREIGN_KEY_CHECKS = 0;\nSTART TRANSACTION;\n')
+    assert sql.index('INSERT INTO `states_meta`') < sql.index('INSERT INTO `states`')
+    assert sql.index('DELETE FROM `states`') < sql.index('DELETE FROM `states_meta`')
+    assert "(1, '21.5', 1700000000.25, 1, X'00ff')" in sql
+    assert "(2, 'it''s \\\\ on', 1700000001.5, 1, NULL)" in sql
+    assert 'setval' not in sql
+    assert sql.endswith('COMMIT;\nSET FOREIGN_KEY_CHECKS = 1;\n')
+
+@pytest.mark.usefixtures('work_directory')
+def test_write_sql_postgresql(capsys):
+    """ PostgreSQL literals are untyped strings, and the identity sequences continue after the rows """
+    sql = write_sql('postgresql')
+    assert 'states: 2 rows' in capsys.readouterr().out
+    assert 'TRUNCATE "schema_changes", "states_meta", "states";\n' in sql
+    assert "('1', '21.5', '1700000000.25', '1', '\\x00ff'),\n('2', 'it''s \\ on', '1700000001.5', '1', NULL);" in sql
+    assert "SELECT setval(pg_get_serial_sequence('\"states\"', 'state_id'), " in sql
+
+def test_migrate(mocker, work_directory):
+    """ Home Assistant is stopped, the rows are loaded in the database container, and the SQLite database renamed """
+    run = mocker.patch('subprocess.run')
+    sys.argv[1:] = ['postgresql']
+    runpy.run_module('artifacts.migrate_recorder')
+
+    commands = [call.args[0][:4] for call in run.call_args_list]
+    assert commands == [['docker', 'stop', 'homeassistant'], ['docker', 'exec', '-i', 'recorder-db'],
+                        ['docker', 'start', 'homeassistant']]
+    assert 'psql' in run.call_args_list[1].args[0][-1]
+    assert os.path.isfile(work_directory / (SQLITE_DATABASE + '.migrated'))
+    assert not os.path.exists(work_directory / SQLITE_DATABASE)
+    assert not os.path.exists(work_directory / 'recorder_migration.sql')
+
+    # The migration runs once
+    with pytest.raises(SystemExit):
+        runpy.run_module('artifacts.migrate_recorder')
+    assert run.call_count == 3
+
+@pytest.mark.usefixtures('work_directory')
+def test_migrate_failure(mocker, capsys):
+    """ Home Assistant is started again if the load fails, and the SQLite database is kept """
+    run = mocker.patch('subprocess.run', side_effect=[None, subprocess.CalledProcessError(1, 'psql'), None])
+    sys.argv[1:] = ['postgresql']
+
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('artifacts.migrate_recorder')
+
+    assert system_exit.value.code == 1
+    assert run.call_args.args[0] == ['docker', 'start', 'homeassistant']
+    assert 'Failed to migrate' in capsys.readouterr().err
+    assert os.path.isfile(SQLITE_DATABASE)
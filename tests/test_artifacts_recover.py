@@ -0,0 +1,77 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.recover module
+"""
+import os
+import runpy
+import subprocess
+import pytest
+from artifacts.files import append_record, load_records, materialize
+from artifacts.snapshot import save_snapshot
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(name='work_directory', autouse=True)
+def fixture_work_directory(tmp_path, monkeypatch, mocker):
+    """ Run in a component work directory after a failed startup, with the container state mocked """
+    monkeypatch.syspath_prepend(os.path.join(REPOSITORY, 'artifacts'))
+    monkeypatch.chdir(tmp_path)
+    install('good')
+    append_record('startup.jsonl', {'ready': False, 'readySeconds': 600.2})
+    mocker.patch('health.container_state', return_value={'status': 'running', 'health': 'unhealthy', 'restarts': 3,
+                                                         'image': 'sha256:bad'})
+    return tmp_path
+
+def install(content):
+    """ Install a Docker Compose file and configuration """
+    materialize({'docker-compose.yml': f'image: {content}\n', 'config/configuration.yaml': f'{content}: true\n'},
+                manifest_file='.layer_config_manifest.json')
+
+def read(filename):
+    """ Read a file """
+    with open(filename, encoding='utf-8') as file:
+        return file.read()
+
+def test_recover_rollback(mocker, capsys):
+    """ The last-known-good snapshot is restored and the container recreated, and the rollback is recorded """
+    save_snapshot('sha256:good')
+    install('bad')
+    run = mocker.patch('subprocess.run')
+    runpy.run_module('artifacts.recover')
+
+    run.assert_called_once_with(['docker-compose', 'up', '-d', '--force-recreate'], check=True)
+    assert read('docker-compose.yml') == 'image: good\n'
+    assert read('config/configuration.yaml') == 'good: true\n'
+    assert 'Rolled back to the last-known-good snapshot: restored 2 files' in capsys.readouterr().out
+
+    record = load_records('rollback.jsonl')[0]
+    assert record['rolledBack'] and record['restored'] == 2 and record['removed'] == 0
+    assert record['reason'] == 'Home Assistant was not ready after 600 seconds, with the container unhealthy ' \
+                               'after 3 restarts'
+    assert record['restoreSeconds'] <= record['seconds']
+
+def test_recover_rollback_fails(mocker):
+    """ The Docker Compose project is stopped if it cannot be recreated from the snapshot """
+    save_snapshot()
+    install('bad')
+    run = mocker.patch('subprocess.run', side_effect=[subprocess.CalledProcessError(1, 'docker-compose'), None])
+    runpy.run_module('artifacts.recover')
+
+    assert run.call_args.args[0] == ['docker-compose', 'down']
+    assert not load_records('rollback.jsonl')[0]['rolledBack']
+
+@pytest.mark.parametrize('snapshot', [False, True])
+def test_recover_no_rollback(mocker, capsys, snapshot):
+    """ The Docker Compose project is stopped if there is no snapshot, or nothing differs from it """
+    if snapshot:
+        save_snapshot()
+    mocker.patch('health.container_state', return_value=None)
+    run = mocker.patch('subprocess.run')
+    runpy.run_module('artifacts.recover')
+
+    run.assert_called_once_with(['docker-compose', 'down'], check=True)
+    record = load_records('rollback.jsonl')[0]
+    assert not record['rolledBack'] and record['reason'].endswith('with no container')
+    assert ('last known good' in capsys.readouterr().out) == snapshot
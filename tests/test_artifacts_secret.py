@@ -5,23 +5,46 @@
 Unit tests for the artifacts.secret module
 """
 import json
+import time
+from unittest.mock import call
 import pytest
-from artifacts.secret import get_secret
+from artifacts.secret import get_secret, get_shard_strings, CACHE_FILE, MAX_STALENESS_SECONDS
 
-def test_get_secret_succeeds(mocker):
-    """ Check a successful get_secret call """
+SECRET_STRING = '{\"password\": \"junk\"}'
+
+@pytest.fixture(autouse=True)
+def fixture_work_directory(tmp_path, monkeypatch):
+    """ Run in an empty component work directory, so the secret cache starts empty """
+    monkeypatch.chdir(tmp_path)
+
+@pytest.fixture(name='ipc_client')
+def fixture_ipc_client(mocker):
+    """ Mocked Greengrass IPC client holding a locally stored secret """
     ipc_client_class = mocker.patch('artifacts.secret.GreengrassCoreIPCClientV2')
     ipc_client = ipc_client_class.return_value
-    secret_string = '{\"password\": \"junk\"}'
-    ipc_client.get_secret_value.return_value.secret_value.secret_string = secret_string
+    ipc_client.get_secret_value.return_value.secret_value.secret_string = SECRET_STRING
+    ipc_client.get_secret_value.return_value.version_id = 'v1'
+    return ipc_client
+
+def write_cache(confirmed):
+    """ Write a secret cache record, as if the secret was last confirmed current at the given time """
+    with open(CACHE_FILE, 'w', encoding='utf-8') as cache_file:
+        json.dump({'foobar': {'versionId': 'v1', 'sha256': 'whatever', 'confirmed': confirmed}}, cache_file)
+
+def read_cache():
+    """ Read the secret cache """
+    with open(CACHE_FILE, encoding='utf-8') as cache_file:
+        return json.load(cache_file)
+
+def test_get_secret_succeeds(ipc_client):
+    """ Check a successful get_secret call """
     secret = get_secret('foobar')
     ipc_client.get_secret_value.assert_called_once_with(secret_id='foobar', refresh=True)
-    assert secret == json.loads(secret_string)
+    assert secret == json.loads(SECRET_STRING)
+    assert read_cache()['foobar']['versionId'] == 'v1'
 
-def test_get_secret_fails(mocker):
+def test_get_secret_fails(ipc_client):
     """ Check a get_secret call that fails due to exception """
-    ipc_client_class = mocker.patch('artifacts.secret.GreengrassCoreIPCClientV2')
-    ipc_client = ipc_client_class.return_value
     ipc_client.get_secret_value.side_effect = Exception('mocked exception')
 
     # Exception should be caught and result in sys.exit(1)
@@ -31,3 +54,72 @@ def test_get_secret_fails(mocker):
         assert system_exit.code == 1
 
     ipc_client.get_secret_value.assert_called_once_with(secret_id='foobar', refresh=True)
+
+def test_get_secret_expected_version_skips_refresh(ipc_client):
+    """ The locally stored secret is used without a refresh when it is the expected version """
+    secret = get_secret('foobar', 'v1')
+    ipc_client.get_secret_value.assert_called_once_with(secret_id='foobar', refresh=False)
+    assert secret == json.loads(SECRET_STRING)
+
+def test_get_secret_unexpected_version_refreshes(ipc_client):
+    """ The secret is refreshed when the locally stored secret is not the expected version """
+    secret = get_secret('foobar', 'v2')
+    ipc_client.get_secret_value.assert_has_calls([call(secret_id='foobar', refresh=False),
+                                                  call(secret_id='foobar', refresh=True)])
+    assert secret == json.loads(SECRET_STRING)
+
+def test_get_secret_offline_uses_local(ipc_client):
+    """ The locally stored secret is used when the refresh fails and the cache is within the staleness limit """
+    confirmed = time.time() - 60
+    write_cache(confirmed)
+    response = ipc_client.get_secret_value.return_value
+    ipc_client.get_secret_value.side_effect = [Exception('offline'), response]
+    secret = get_secret('foobar')
+    ipc_client.get_secret_value.assert_has_calls([call(secret_id='foobar', refresh=True),
+                                                  call(secret_id='foobar', refresh=False)])
+    assert secret == json.loads(SECRET_STRING)
+    # A stale value is not recorded as confirmed
+    assert read_cache()['foobar']['confirmed'] == confirmed
+
+def test_get_secret_offline_too_stale(ipc_client):
+    """ The install fails when the refresh fails and the cache exceeds the staleness limit """
+    write_cache(time.time() - MAX_STALENESS_SECONDS - 60)
+    ipc_client.get_secret_value.side_effect = Exception('offline')
+    with pytest.raises(SystemExit):
+        get_secret('foobar')
+    ipc_client.get_secret_value.assert_called_once_with(secret_id='foobar', refresh=True)
+
+def shard_response(mocker, secret_id, refresh):
+    """ Locally stored shard secrets, where the string and version ID of each is derived from its ARN """
+    response = mocker.Mock()
+    response.secret_value.secret_string = f'{secret_id} refresh={refresh}'
+    response.version_id = f'{secret_id}-v1'
+    return response
+
+def test_get_shard_strings(ipc_client, mocker):
+    """ Shards are fetched in index order, skipping the refresh for those stored locally at the expected version """
+    ipc_client.get_secret_value.side_effect = lambda secret_id, refresh: shard_response(mocker, secret_id, refresh)
+    shards = [{'arn': f'shard-{i}', 'versionId': f'shard-{i}-v1' if i % 2 else 'old'} for i in range(5)]
+
+    shard_strings = get_shard_strings(shards, 'index')
+
+    assert shard_strings == [f'shard-{i} refresh={not i % 2}' for i in range(5)]
+    assert sorted(read_cache()) == [f'shard-{i}' for i in range(5)]
+
+def test_get_shard_strings_replica(ipc_client, mocker):
+    """ The shards listed by a replica of the index are fetched from their replicas in the region of the index """
+    ipc_client.get_secret_value.side_effect = lambda secret_id, refresh: shard_response(mocker, secret_id, refresh)
+    shards = [{'arn': f'arn:aws:secretsmanager:us-east-1:000011112222:secret:shard-{i}-abc', 'versionId': 'v1'}
+              for i in range(2)]
+
+    get_shard_strings(shards, 'arn:aws:secretsmanager:eu-west-1:000011112222:secret:greengrass-home-assistant-abc')
+
+    assert sorted(read_cache()) == [f'arn:aws:secretsmanager:eu-west-1:000011112222:secret:shard-{i}-abc'
+                                    for i in range(2)]
+
+def test_get_shard_strings_fails(ipc_client):
+    """ The install fails if any shard cannot be fetched """
+    ipc_client.get_secret_value.side_effect = Exception('mocked exception')
+    with pytest.raises(SystemExit) as system_exit:
+        get_shard_strings([{'arn': 'shard-0', 'versionId': 'v1'}, {'arn': 'shard-1', 'versionId': 'v1'}], 'index')
+    assert system_exit.value.code == 1
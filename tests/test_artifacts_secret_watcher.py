@@ -0,0 +1,99 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.secret_watcher module
+"""
+import hashlib
+import json
+import threading
+from unittest.mock import MagicMock, call
+import pytest
+from artifacts.files import materialize
+from artifacts.secret import load_cache
+from artifacts.secret_watcher import SecretWatcher
+from libs.envelope import Envelope
+
+SECRET_ARN = 'arn:secret'
+FILES = {'secrets.yaml': b'mqtt_password: old\n', 'cert.pem': b'CERT'}
+
+@pytest.fixture(name='ipc_client')
+def fixture_ipc_client(tmp_path, monkeypatch):
+    """ Run in a work directory where version v1 of the secret is installed, with a mocked IPC client """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'config').mkdir()
+    materialize(FILES, directory='config')
+    with open('secret_cache.json', 'w', encoding='utf-8') as cache_file:
+        json.dump({SECRET_ARN: {'versionId': 'v1', 'sha256': 'whatever', 'confirmed': 0}}, cache_file)
+
+    ipc_client = MagicMock()
+    respond(ipc_client, 'v1', FILES)
+    return ipc_client
+
+@pytest.fixture(name='reload', autouse=True)
+def fixture_reload(mocker):
+    """ Don't reload Home Assistant """
+    return mocker.patch('artifacts.secret_watcher.reload', return_value=['homeassistant.reload_all'])
+
+def respond(ipc_client, version_id, files):
+    """ Make the IPC client return a version of the secret holding the files """
+    envelope = Envelope()
+    for filename, data in files.items():
+        envelope.add(filename, data)
+    ipc_client.get_secret_value.return_value.version_id = version_id
+    ipc_client.get_secret_value.return_value.secret_value.secret_string = envelope.to_json()
+
+def test_unchanged(ipc_client, reload):
+    """ A poll of an unchanged secret refreshes it and does nothing else """
+    assert SecretWatcher(ipc_client, SECRET_ARN).poll() is None
+    ipc_client.get_secret_value.assert_called_once_with(secret_id=SECRET_ARN, refresh=True)
+    reload.assert_not_called()
+
+def test_changed(ipc_client, reload, tmp_path):
+    """ Only the changed files are rewritten and reloaded, and the version is recorded """
+    watcher = SecretWatcher(ipc_client, SECRET_ARN)
+    respond(ipc_client, 'v2', {'secrets.yaml': b'mqtt_password: new\n', 'cert.pem': b'CERT'})
+
+    assert watcher.poll() == {'versionId': 'v2', 'changed': ['secrets.yaml'], 'actions': ['homeassistant.reload_all']}
+    assert (tmp_path / 'config' / 'secrets.yaml').read_bytes() == b'mqtt_password: new\n'
+    reload.assert_called_once_with(['secrets.yaml'], secrets_file='config/secrets.yaml', url='http://localhost:8123/')
+    assert load_cache()[SECRET_ARN]['versionId'] == 'v2'
+    assert watcher.poll() is None
+
+    # A removed file is also reloaded
+    respond(ipc_client, 'v3', {'secrets.yaml': b'mqtt_password: new\n'})
+    assert watcher.poll()['changed'] == ['cert.pem']
+    assert not (tmp_path / 'config' / 'cert.pem').exists()
+
+def test_changed_sharded(ipc_client, mocker, tmp_path):
+    """ The shards of a sharded secret are fetched with the staleness limit set by the agent """
+    envelope = Envelope()
+    envelope.add('secrets.yaml', b'mqtt_password: sharded\n')
+    secret_string = envelope.to_json()
+    shard_strings = [secret_string[:20], secret_string[20:]]
+    index = {'shardedVersion': 1, 'sha256': hashlib.sha256(secret_string.encode()).hexdigest(),
+             'shards': [{'name': f'shard-{i}', 'arn': f'arn-{i}', 'versionId': f'v{i}',
+                         'sha256': hashlib.sha256(shard_string.encode()).hexdigest()}
+                        for i, shard_string in enumerate(shard_strings)]}
+    ipc_client.get_secret_value.return_value.version_id = 'v2'
+    ipc_client.get_secret_value.return_value.secret_value.secret_string = json.dumps(index)
+    fetch_secret_string = mocker.patch('artifacts.secret_watcher.fetch_secret_string', side_effect=shard_strings)
+    watcher = SecretWatcher(ipc_client, SECRET_ARN)
+    watcher.max_staleness = 3600
+
+    assert watcher.poll()['changed'] == ['cert.pem', 'secrets.yaml']
+    assert fetch_secret_string.call_args_list == [call(ipc_client, 'arn-0', 'v0', 3600),
+                                                  call(ipc_client, 'arn-1', 'v1', 3600)]
+    assert (tmp_path / 'config' / 'secrets.yaml').read_bytes() == b'mqtt_password: sharded\n'
+
+def test_run_backs_off(ipc_client, mocker):
+    """ The poll interval backs off while polls fail, and resets once one succeeds """
+    response = ipc_client.get_secret_value.return_value
+    ipc_client.get_secret_value.side_effect = [Exception('offline'), Exception('offline'), response]
+    stopped = MagicMock(spec=threading.Event)
+    stopped.wait.side_effect = [False, False, False, True]
+    mocker.patch('random.uniform', return_value=0)
+
+    SecretWatcher(ipc_client, SECRET_ARN, 10).run(stopped)
+
+    assert [wait.args[0] for wait in stopped.wait.call_args_list] == [5, 10, 20, 5]
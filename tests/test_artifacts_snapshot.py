@@ -0,0 +1,89 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.snapshot module
+"""
+import os
+import pytest
+from artifacts.files import load_manifest, materialize
+from artifacts.snapshot import load_snapshot, restore_snapshot, save_snapshot, snapshot_changes
+
+GOOD = {'docker-compose.yml': 'image: good\n', 'install.py': 'print("good")\n',
+        'config/configuration.yaml': 'good: true\n', 'config/themes/dark.yaml': 'dark: {}\n'}
+
+@pytest.fixture(name='work_directory', autouse=True)
+def fixture_work_directory(tmp_path, monkeypatch):
+    """ Run in a component work directory with the files of a good install """
+    monkeypatch.chdir(tmp_path)
+    install(GOOD, {'secrets.yaml': 'password: good\n'})
+    return tmp_path
+
+def install(layer_files, secret_files):
+    """ Install the files of a layer, and those created from the configuration secret """
+    materialize(layer_files, manifest_file='.layer_config_manifest.json')
+    materialize(secret_files, directory='config')
+
+def read(filename):
+    """ Read a file """
+    with open(filename, encoding='utf-8') as file:
+        return file.read()
+
+def test_save_snapshot(work_directory):
+    """ The config directory and Docker Compose file are linked into the snapshot, but not the scripts """
+    snapshot = save_snapshot('sha256:good')
+    assert sorted(snapshot['files']) == ['config/configuration.yaml', 'config/secrets.yaml', 'config/themes/dark.yaml',
+                                         'docker-compose.yml']
+    assert snapshot['linked'] == 4 and snapshot['copied'] == 0
+    assert os.path.samefile('config/configuration.yaml', 'last_known_good/config/configuration.yaml')
+    assert load_snapshot() == snapshot
+    assert not snapshot_changes(snapshot)[0] and not snapshot_changes(snapshot)[1]
+
+    # A newer snapshot replaces the last one
+    assert save_snapshot('sha256:newer')['image'] == 'sha256:newer'
+    assert load_snapshot()['image'] == 'sha256:newer'
+    assert not (work_directory / 'last_known_good.old').exists()
+
+def test_save_snapshot_copies(mocker):
+    """ Files are copied where the filesystem does not allow a hard link """
+    mocker.patch('os.link', side_effect=OSError('Operation not permitted'))
+    snapshot = save_snapshot()
+    assert snapshot['linked'] == 0 and snapshot['copied'] == 4
+    assert read('last_known_good/config/secrets.yaml') == 'password: good\n'
+
+def test_restore_snapshot():
+    """ The snapshot keeps its content while a bad install replaces files, and restoring it rolls them back """
+    snapshot = save_snapshot('sha256:good')
+    bad = {**GOOD, 'docker-compose.yml': 'image: bad\n', 'install.py': 'print("bad")\n',
+           'config/packages/bad.yaml': 'bad: true\n'}
+    del bad['config/themes/dark.yaml']
+    install(bad, {'secrets.yaml': 'password: bad\n'})
+    assert read('last_known_good/docker-compose.yml') == 'image: good\n'
+
+    assert restore_snapshot(snapshot) == {'restored': 3, 'removed': 1}
+    assert read('docker-compose.yml') == 'image: good\n'
+    assert read('config/secrets.yaml') == 'password: good\n'
+    assert read('config/themes/dark.yaml') == 'dark: {}\n'
+    assert not os.path.exists('config/packages/bad.yaml')
+    assert read('install.py') == 'print("bad")\n'
+    assert restore_snapshot(snapshot) == {'restored': 0, 'removed': 0}
+
+    # The manifests match the restored files, so the next install writes only what differs from them
+    assert 'config/packages/bad.yaml' not in load_manifest('.layer_config_manifest.json')
+    assert materialize(GOOD, manifest_file='.layer_config_manifest.json')['written'] == 1
+    assert materialize({'secrets.yaml': 'password: good\n'}, directory='config')['written'] == 0
+
+def test_restore_snapshot_modified_file():
+    """ A file that was modified without updating its manifest is restored """
+    snapshot = save_snapshot()
+    os.remove('config/configuration.yaml')
+    with open('config/configuration.yaml', 'w', encoding='utf-8') as file:
+        file.write('edited: true\n')
+
+    assert snapshot_changes(snapshot) == (['config/configuration.yaml'], [])
+    restore_snapshot(snapshot)
+    assert read('config/configuration.yaml') == 'good: true\n'
+
+def test_load_snapshot_missing():
+    """ There is no snapshot until one is saved """
+    assert load_snapshot() is None
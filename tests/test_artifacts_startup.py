@@ -0,0 +1,123 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.startup module
+"""
+import json
+import os
+import runpy
+import signal
+import subprocess
+import sys
+import pytest
+import yaml
+from artifacts.health import MAX_STARTUP_TIMEOUT, STARTUP_STEP_TIMEOUT
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(name='work_directory')
+def fixture_work_directory(tmp_path, monkeypatch):
+    """ Run in an empty component work directory """
+    monkeypatch.syspath_prepend(os.path.join(REPOSITORY, 'artifacts'))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('AWS_IOT_THING_NAME', raising=False)
+    sys.argv[1:] = ['--timeout', '300']
+    return tmp_path
+
+@pytest.fixture(name='popen', autouse=True)
+def fixture_popen(mocker):
+    """ Don't start the agent """
+    popen = mocker.patch('subprocess.Popen')
+    popen.return_value.pid = 4321
+    return popen
+
+def ready(image='sha256:abc'):
+    """ Create the result of waiting for Home Assistant to be ready """
+    return {'ready': True, 'containerSeconds': 2.0, 'httpSeconds': 30.0, 'polls': 7, 'restarts': 0, 'image': image}
+
+def startup_records(work_directory):
+    """ Read the startup records """
+    with open(work_directory / 'startup.jsonl', encoding='utf-8') as record_file:
+        return [json.loads(line) for line in record_file]
+
+def test_startup_ready(mocker, work_directory, popen, capsys):
+    """ Docker Compose is started, and the time to ready is reported and recorded """
+    run = mocker.patch('subprocess.run')
+    wait_until_ready = mocker.patch('health.wait_until_ready', return_value=ready())
+    runpy.run_module('artifacts.startup')
+
+    run.assert_called_once_with(['docker-compose', 'up', '-d'], check=True)
+    assert wait_until_ready.call_args.args[0] <= 300
+    assert wait_until_ready.call_args.args[1] == 'http://localhost:8123/'
+    output = capsys.readouterr()
+    assert 'Home Assistant is ready after' in output.out
+    assert 'No core device thing name' in output.err
+    records = startup_records(work_directory)
+    assert len(records) == 1
+    assert records[0]['ready'] and records[0]['image'] == 'sha256:abc' and records[0]['polls'] == 7
+    assert popen.call_args.args[0][-3:] == ['agent.py', '--url', 'http://localhost:8123/']
+    assert popen.call_args.kwargs['start_new_session']
+    assert (work_directory / 'agent.pid').read_text(encoding='utf-8') == '4321'
+    assert (work_directory / 'last_known_good' / 'snapshot.json').is_file()
+
+    # The next startup is compared with this one
+    # An HTTPS URL, for a server with its own SSL certificate, is probed and given to the agent
+    wait_until_ready = mocker.patch('health.wait_until_ready', return_value=ready('sha256:def'))
+    kill = mocker.patch('os.kill')
+    mocker.patch('agent_process.is_agent', return_value=True)
+    sys.argv[1:] = ['--secret-arn', 'arn:secret', '--secret-poll-interval', '60', '--secret-max-staleness', '3600',
+                    '--url', 'https://localhost:8123/', '--thing-name', 'MyCoreDevice']
+    runpy.run_module('artifacts.startup')
+    assert wait_until_ready.call_args.args[1] == 'https://localhost:8123/'
+    assert popen.call_args.args[0][-11:] == ['agent.py', '--url', 'https://localhost:8123/', '--thing-name',
+                                             'MyCoreDevice', '--secret-arn', 'arn:secret', '--secret-poll-interval',
+                                             '60.0', '--secret-max-staleness', '3600.0']
+    assert 'previous image' in capsys.readouterr().out
+    kill.assert_called_once_with(4321, signal.SIGTERM)
+    assert len(startup_records(work_directory)) == 2
+
+def test_startup_not_ready(mocker, work_directory):
+    """ The startup fails if Home Assistant is not ready within the timeout """
+    mocker.patch('subprocess.run')
+    mocker.patch('health.wait_until_ready', return_value={**ready(), 'ready': False, 'httpSeconds': None})
+
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('artifacts.startup')
+
+    assert system_exit.value.code == 1
+    assert not startup_records(work_directory)[0]['ready']
+    assert not (work_directory / 'last_known_good').exists()
+
+@pytest.mark.usefixtures('work_directory')
+def test_startup_compose_fails(mocker, popen):
+    """ The startup fails if Docker Compose fails """
+    mocker.patch('subprocess.run', side_effect=subprocess.CalledProcessError(1, 'docker-compose'))
+    wait_until_ready = mocker.patch('health.wait_until_ready')
+
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('artifacts.startup')
+
+    assert system_exit.value.code == 1
+    wait_until_ready.assert_not_called()
+    popen.assert_not_called()
+
+@pytest.mark.usefixtures('work_directory')
+def test_startup_timeout_too_long(mocker, capsys):
+    """ A timeout that leaves no margin within the Startup step's timeout is rejected before anything starts """
+    run = mocker.patch('subprocess.run')
+    sys.argv[1:] = ['--timeout', '850']
+
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('artifacts.startup')
+
+    assert system_exit.value.code == 1
+    assert 'exceeds the maximum of 840 seconds' in capsys.readouterr().err
+    run.assert_not_called()
+
+def test_startup_step_timeout():
+    """ The Startup step's timeout in the recipe is the one the maximum timeout is taken from """
+    with open(os.path.join(REPOSITORY, 'recipe.yaml'), encoding='utf-8') as recipe_file:
+        recipe = yaml.safe_load(recipe_file)
+    assert recipe['Manifests'][0]['Lifecycle']['Startup']['Timeout'] == STARTUP_STEP_TIMEOUT
+    assert recipe['ComponentConfiguration']['DefaultConfiguration']['startupTimeout'] <= MAX_STARTUP_TIMEOUT
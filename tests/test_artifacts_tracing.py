@@ -0,0 +1,130 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the artifacts.tracing module
+"""
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+import pytest
+from botocore.stub import Stubber
+from artifacts.tracing import Tracer, TRACE_FILE_VARIABLE
+from libs.tracing import count_api_calls, tracer as shared_tracer
+
+def test_nested_spans():
+    """ Nested spans record their parent, path and the API calls made within them """
+    tracer = Tracer()
+    with tracer.span('outer', device='thing') as outer:
+        tracer.api_call()
+        with tracer.span('inner') as inner:
+            tracer.api_call()
+    assert inner['parentId'] == outer['spanId']
+    assert inner['path'] == 'outer > inner'
+    assert (outer['apiCalls'], inner['apiCalls']) == (2, 1)
+    assert outer['attributes'] == {'device': 'thing'}
+    assert [span['name'] for span in tracer.spans] == ['inner', 'outer']
+    assert outer['durationMs'] >= inner['durationMs'] >= 0
+    assert tracer.current() is None
+
+def test_error_outcome():
+    """ A span is an error if an exception escapes it, other than a successful exit """
+    tracer = Tracer()
+    with pytest.raises(ValueError):
+        with tracer.span('failed'):
+            raise ValueError('bad')
+    with pytest.raises(SystemExit):
+        with tracer.span('exited'):
+            sys.exit(0)
+    with pytest.raises(SystemExit):
+        with tracer.span('aborted'):
+            sys.exit(1)
+    assert [span['outcome'] for span in tracer.spans] == ['error', 'ok', 'error']
+    assert tracer.spans[0]['error'] == 'ValueError: bad'
+
+def test_traced():
+    """ Each call of a decorated function is a span """
+    tracer = Tracer()
+
+    @tracer.traced('work')
+    def work(value):
+        return value * 2
+
+    assert work(2) == 4
+    assert work(3) == 6
+    assert tracer.summary()[0]['count'] == 2
+
+def test_trace_file(tmp_path, monkeypatch):
+    """ Finished spans are appended to the trace file named by the environment variable """
+    monkeypatch.setenv(TRACE_FILE_VARIABLE, str(tmp_path / 'trace.jsonl'))
+    tracer = Tracer()
+    with tracer.span('outer'):
+        with tracer.span('inner'):
+            pass
+    with open(tmp_path / 'trace.jsonl', encoding='utf-8') as trace_file:
+        records = [json.loads(line) for line in trace_file]
+    assert [record['name'] for record in records] == ['inner', 'outer']
+    assert records[0]['parentId'] == records[1]['spanId']
+    assert 'path' not in records[0]
+
+def test_no_trace_file(tmp_path, monkeypatch):
+    """ Nothing is written without a trace file """
+    monkeypatch.delenv(TRACE_FILE_VARIABLE, raising=False)
+    monkeypatch.chdir(tmp_path)
+    with Tracer().span('span'):
+        pass
+    assert not list(tmp_path.iterdir())
+
+def test_bind_across_threads():
+    """ Spans and API calls in other threads count toward the span that bound the work """
+    tracer = Tracer()
+
+    def work(index):
+        with tracer.span('shard', index=index):
+            tracer.api_call()
+
+    with tracer.span('fetch') as fetch:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(tracer.bind(work), range(8)))
+    assert fetch['apiCalls'] == 8
+    assert {span['parentId'] for span in tracer.spans if span['name'] == 'shard'} == {fetch['spanId']}
+
+def test_bind_without_span():
+    """ Work bound outside any span runs as is """
+    tracer = Tracer()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(tracer.bind(tracer.current)).result() is None
+
+def test_report(capsys):
+    """ The summary aggregates spans by path, with nested spans indented under their parents """
+    tracer = Tracer()
+    with tracer.span('deploy'):
+        for _ in range(3):
+            with tracer.span('poll'):
+                tracer.api_call()
+    with pytest.raises(RuntimeError):
+        with tracer.span('deploy'):
+            raise RuntimeError()
+    summary = tracer.summary()
+    assert [(row['path'], row['count'], row['apiCalls'], row['errors']) for row in summary] ==\
+        [('deploy', 2, 3, 1), ('deploy > poll', 3, 3, 0)]
+    tracer.report()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'Trace summary:'
+    assert lines[2].split() == ['deploy', '2', f'{summary[0]["durationMs"]:.1f}', '3', '1']
+    assert lines[3].startswith('    poll')
+    tracer.reset()
+    assert not tracer.summary()
+
+def test_count_api_calls():
+    """ The API calls of a boto3 client count toward the current span of the shared tracer """
+    client = count_api_calls(boto3.client('secretsmanager', region_name='us-east-1',
+                                          aws_access_key_id='testing', aws_secret_access_key='testing'))
+    with Stubber(client) as stubber:
+        stubber.add_response('list_secrets', {'SecretList': []})
+        stubber.add_response('list_secrets', {'SecretList': []})
+        with shared_tracer.span('list') as span:
+            client.list_secrets()
+            client.list_secrets()
+    assert span['apiCalls'] == 2
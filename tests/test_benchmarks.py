@@ -0,0 +1,93 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the benchmarks package
+"""
+import json
+import runpy
+import sys
+import pytest
+from benchmarks.harness import measure, merge_baselines, regressions, select_metrics, written_bytes
+from benchmarks.scenarios import DeployComponentVersion, GdkRebuild, create_project
+
+BASELINE = {'wallSeconds': 1.0, 'apiCalls': 10, 'apiBytes': 1000, 'bytesWritten': 1000, 'peakMemoryBytes': 1000}
+
+@pytest.fixture(name='project')
+def fixture_project(tmp_path):
+    """ A small synthetic project """
+    create_project(str(tmp_path), 10)
+    return str(tmp_path)
+
+def test_regressions():
+    """ Metrics regress when they exceed their baseline beyond the tolerance """
+    results = {'a/small': dict(BASELINE, wallSeconds=1.5, apiCalls=11), 'b/small': dict(BASELINE)}
+
+    assert regressions(results, {'a/small': BASELINE}) == [
+        'a/small apiCalls: 11 exceeds the baseline 10 (limit 10)'
+    ]
+    assert len(regressions(results, {'a/small': BASELINE}, time_tolerance=1.2)) == 2
+    assert not regressions(results, {})
+
+def test_regressions_fast_scenario():
+    """ The wall time of a scenario that takes milliseconds regresses relative to its baseline """
+    results = {'a/small': {'wallSeconds': 0.0214}}
+    assert regressions(results, {'a/small': {'wallSeconds': 0.01}}) == [
+        'a/small wallSeconds: 0.0214 exceeds the baseline 0.01 (limit 0.015)'
+    ]
+
+def test_machine_baselines():
+    """ Wall times are kept apart from the other baselines, and merged with them for the checks """
+    results = {'a/small': dict(BASELINE)}
+    portable, machine = select_metrics(results, False), select_metrics(results, True)
+    assert machine == {'a/small': {'wallSeconds': 1.0}}
+    assert 'wallSeconds' not in portable['a/small']
+    assert merge_baselines(portable, machine) == results
+
+def test_written_bytes():
+    """ Only created and changed files count as written """
+    before = {'a': (10, 1), 'b': (20, 1)}
+    assert written_bytes(before, {'a': (10, 1), 'b': (30, 2), 'c': (5, 1)}) == 35
+
+def test_measure_deploy(project):
+    """ The deployment to one core device is measured, without reaching AWS """
+    metrics = measure(DeployComponentVersion(project, 1), repeat=1)
+
+    # List, get and create the deployment, three pages of versions of each of two components, STS and the secret,
+    # and poll the deployment and the device
+    assert metrics['apiCalls'] == 13
+    assert metrics['wallSeconds'] > 0
+    assert metrics['peakMemoryBytes'] > 0
+
+def test_measure_rebuild(project):
+    """ A rebuild with nothing changed restores everything from the build cache, resolving only the secret version """
+    metrics = measure(GdkRebuild(project, 10), repeat=1)
+
+    assert metrics['apiCalls'] == 1
+    assert metrics['bytesWritten'] > 0
+
+def test_history(mocker, tmp_path, capsys):
+    """ History query latencies are recorded under a label and compared with the other labels """
+    def urlopen(request, timeout):
+        assert request.headers['Authorization'] == 'Bearer token'
+        assert '/api/history/period/' in request.full_url and 'filter_entity_id=sensor.a%2Csensor.b' in request.full_url
+        assert timeout > 0
+        response = mocker.MagicMock()
+        response.__enter__.return_value.read.return_value = json.dumps([[{}] * 3, [{}] * 2]).encode('utf-8')
+        return response
+
+    mocker.patch('urllib.request.urlopen', side_effect=urlopen)
+    results_file = tmp_path / 'history.json'
+    results_file.write_text(json.dumps({'sqlite': {window: {'p50Ms': 1000.0, 'p95Ms': 2000.0, 'states': 5}
+                                                   for window in ['hour', 'day', 'week']}}), encoding='utf-8')
+    sys.argv[1:] = ['--token', 'token', '--entities', 'sensor.a', 'sensor.b', '--label', 'mariadb', '--repeat', '3',
+                    '--results', str(results_file)]
+    runpy.run_module('benchmarks.history')
+
+    results = json.loads(results_file.read_text(encoding='utf-8'))
+    assert list(results) == ['sqlite', 'mariadb']
+    assert results['mariadb']['week']['states'] == 5
+    assert results['mariadb']['week']['p95Ms'] >= results['mariadb']['week']['p50Ms']
+    output = capsys.readouterr().out
+    assert 'mariadb          week          5' in output
+    assert '-100%' in output
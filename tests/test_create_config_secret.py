@@ -4,27 +4,148 @@
 """
 Unit tests for the create_config_secret.py script
 """
+import json
+import os
 import runpy
+import sys
+import pytest
+from artifacts.envelope import unpack
 
 FILENAMES = ['foo.yml', 'foo/bar.yml']
 CONTENTS = 'rocinante'
+BINARY_FILENAME = 'cert.der'
+BINARY_CONTENTS = bytes(range(256))
 REGION = 'foobar'
-SECRET_STRING = '{"' + FILENAMES[0] + '":"' + CONTENTS +\
-                '","' + FILENAMES[1] + '":"' + CONTENTS + '"}'
 
-def test_create_config_secret(mocker):
-    """ Confirm that the secret string is correctly formed """
-    mocker.patch('glob.glob', return_value=FILENAMES)
+@pytest.fixture(name='secret_put')
+def fixture_secret_put(mocker, tmp_path, monkeypatch):
+    """ Mock the GDK config and the secret, and run in a directory with a populated secrets directory """
+    for filename in FILENAMES:
+        os.makedirs(os.path.dirname(tmp_path / 'secrets' / filename), exist_ok=True)
+        (tmp_path / 'secrets' / filename).write_text(CONTENTS, encoding='utf-8')
+        os.chmod(tmp_path / 'secrets' / filename, 0o644)
+    (tmp_path / 'secrets' / BINARY_FILENAME).write_bytes(BINARY_CONTENTS)
+    os.chmod(tmp_path / 'secrets' / BINARY_FILENAME, 0o600)
+    monkeypatch.chdir(tmp_path)
+
     gdk_config_init = mocker.patch('libs.gdk_config.GdkConfig.__init__', return_value=None)
     gdk_config_region = mocker.patch('libs.gdk_config.GdkConfig.region', return_value=REGION)
+    mocker.patch('libs.gdk_config.GdkConfig.replica_regions', return_value=[])
     secret_init = mocker.patch('libs.secret.Secret.__init__', return_value=None)
     secret_put = mocker.patch('libs.secret.Secret.put')
-    file = mocker.patch('builtins.open', mocker.mock_open(read_data=CONTENTS))
-    runpy.run_module('create_config_secret')
+    sys.argv[1:] = []
+
+    yield secret_put
 
-    file.assert_any_call(FILENAMES[0], encoding="utf-8")
-    file.assert_any_call(FILENAMES[1], encoding="utf-8")
     gdk_config_init.assert_called_once()
     gdk_config_region.assert_called_once()
     secret_init.assert_called_once_with(REGION)
-    secret_put.assert_called_once_with(SECRET_STRING)
+    secret_put.assert_called_once()
+
+@pytest.fixture(name='no_upload')
+def fixture_no_upload(mocker, tmp_path, monkeypatch):
+    """ Run in a directory with a secrets directory, expecting the script to stop before any upload """
+    (tmp_path / 'secrets').mkdir()
+    monkeypatch.chdir(tmp_path)
+    gdk_config_init = mocker.patch('libs.gdk_config.GdkConfig.__init__', return_value=None)
+    secret_init = mocker.patch('libs.secret.Secret.__init__', return_value=None)
+    sys.argv[1:] = []
+
+    yield tmp_path
+
+    gdk_config_init.assert_not_called()
+    secret_init.assert_not_called()
+
+def test_create_config_secret(secret_put):
+    """ Confirm that the secret string is correctly formed """
+    runpy.run_module('create_config_secret')
+
+    secret_json = json.loads(secret_put.call_args.args[0])
+    assert secret_json['envelopeVersion'] == 1
+    assert secret_json['files'][FILENAMES[0]] == {'encoding': 'text', 'data': CONTENTS, 'mode': 0o644}
+    assert secret_json['files'][BINARY_FILENAME]['encoding'] == 'base64'
+    files, modes = unpack(secret_json)
+    assert files == {FILENAMES[0]: CONTENTS.encode(), FILENAMES[1]: CONTENTS.encode(),
+                     BINARY_FILENAME: BINARY_CONTENTS}
+    assert modes[BINARY_FILENAME] == 0o600
+
+def test_create_config_secret_invalidates_build_cache(secret_put, tmp_path):
+    """ The secret identifiers cached by the component build are forgotten once the secret is updated """
+    (tmp_path / '.build-cache').mkdir()
+    (tmp_path / '.build-cache' / 'build.json').write_text(json.dumps({'secret': {'cached': 0}, 'steps': {}}),
+                                                          encoding='utf-8')
+    runpy.run_module('create_config_secret')
+
+    secret_put.assert_called_once()
+    assert json.loads((tmp_path / '.build-cache' / 'build.json').read_text(encoding='utf-8')) == {'steps': {}}
+
+def test_create_config_secret_replicates(secret_put, mocker):
+    """ The secret is replicated to the further regions in the GDK configuration """
+    mocker.patch('libs.gdk_config.GdkConfig.replica_regions', return_value=['mars'])
+    replicate = mocker.patch('libs.secret.Secret.replicate')
+    runpy.run_module('create_config_secret')
+
+    secret_put.assert_called_once()
+    replicate.assert_called_once_with(['mars'])
+
+def test_create_config_secret_compresses(secret_put, tmp_path):
+    """ Compressible files are stored compressed """
+    (tmp_path / 'secrets' / 'big.yaml').write_text('light: on\n' * 1000, encoding='utf-8')
+    runpy.run_module('create_config_secret')
+
+    secret_json = json.loads(secret_put.call_args.args[0])
+    assert secret_json['files']['big.yaml']['compression'] == 'zlib'
+    assert len(secret_put.call_args.args[0]) < 1000
+    assert unpack(secret_json)[0]['big.yaml'] == b'light: on\n' * 1000
+
+def test_create_config_secret_no_compression(secret_put, tmp_path):
+    """ Compression can be turned off """
+    (tmp_path / 'secrets' / 'big.yaml').write_text('light: on\n' * 1000, encoding='utf-8')
+    sys.argv[1:] = ['--compression', 'none']
+    runpy.run_module('create_config_secret')
+
+    secret_json = json.loads(secret_put.call_args.args[0])
+    assert secret_json['files']['big.yaml']['encoding'] == 'text'
+    assert 'compression' not in secret_json['files']['big.yaml']
+
+def test_create_config_secret_escapes(secret_put, tmp_path):
+    """ Quotes, backslashes, tabs and control characters are serialized correctly """
+    contents = 'password: "a\\b\tc\x01d"\r\n'
+    (tmp_path / 'secrets' / 'tricky.yaml').write_text(contents, encoding='utf-8', newline='')
+    sys.argv[1:] = ['--compression', 'none']
+    runpy.run_module('create_config_secret')
+
+    secret_json = json.loads(secret_put.call_args.args[0])
+    assert unpack(secret_json)[0]['tricky.yaml'] == contents.encode('utf-8')
+
+def test_create_config_secret_too_large(no_upload):
+    """ The script fails before any network call if the secret exceeds the size limit of all the shards """
+    (no_upload / 'secrets' / 'random.bin').write_bytes(os.urandom(600000))
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('create_config_secret')
+    assert system_exit.value.code == 1
+
+@pytest.mark.usefixtures('no_upload')
+def test_create_config_secret_zstd_refused():
+    """ zstd compression is refused, as the core device cannot decode it """
+    sys.argv[1:] = ['--compression', 'zstd']
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('create_config_secret')
+    assert system_exit.value.code == 2
+
+def test_create_config_secret_sharded(secret_put, tmp_path):
+    """ A secret larger than one Secrets Manager secret is still put, to be sharded """
+    (tmp_path / 'secrets' / 'random.bin').write_bytes(os.urandom(70000))
+    runpy.run_module('create_config_secret')
+
+    secret_string = secret_put.call_args.args[0]
+    assert len(secret_string) > 65536
+    assert unpack(json.loads(secret_string))[0]['random.bin'] == (tmp_path / 'secrets' / 'random.bin').read_bytes()
+
+def test_create_config_secret_round_trip_failure(no_upload, mocker):
+    """ The script fails before any network call if the secret does not reproduce the files on disk """
+    (no_upload / 'secrets' / 'a.yaml').write_text('a', encoding='utf-8')
+    mocker.patch('artifacts.envelope.unpack', return_value=({'a.yaml': b'b'}, {}))
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('create_config_secret')
+    assert system_exit.value.code == 1
@@ -7,19 +7,22 @@ Unit tests for deploy_component_version.py
 
 from unittest.mock import call
 import copy
+import json
 import runpy
 import sys
 import pytest
+from libs.aws import POLLING_CLIENT_CONFIG
 
 REGION = 'us-east-1'
 COMPONENT_NAME = 'Maynard'
-COMPONENT_VERSION = 'Aenima'
+COMPONENT_VERSION = '2.1.0'
 CORE_DEVICE_NAME = 'Tool'
 DEPLOYMENT_ID = 'jambi'
 DEPLOYMENT_NAME = f'Deployment for {CORE_DEVICE_NAME}'
 TARGET_ARN = f'arn:aws:iot:us-east-1:000011112222:thing/{CORE_DEVICE_NAME}'
 NEW_DEPLOYMENT_ID = 'the pot'
 SECRET_ARN = 'lateralus'
+SECRET_VERSION_ID = 'parabola'
 COMPONENT_DOCKER_APPLICATION_MANAGER = 'aws.greengrass.DockerApplicationManager'
 COMPONENT_SECRET_MANAGER = 'aws.greengrass.SecretManager'
 COMPONENTS = {
@@ -35,13 +38,15 @@ COMPONENTS = {
                 },
             }
 
-@pytest.fixture(name='boto3_client')
-def fixture_boto3_client(mocker):
-    """ Mocked boto3 client object """
+def mock_clients(mocker):
+    """ Mock the boto3 client object, the GDK configuration and the secret """
     boto3_client = mocker.patch('boto3.client')
     # Make our mock get returned by the client() method call
     boto3_client.return_value = boto3_client
 
+    # Don't actually sleep between deployment status polls
+    mocker.patch('time.sleep')
+
     # Mock the GDK configuration
     gdk_config_class = mocker.patch('libs.gdk_config.GdkConfig')
     gdk_config = gdk_config_class.return_value
@@ -51,7 +56,7 @@ def fixture_boto3_client(mocker):
     # Mock the secret
     secret_class = mocker.patch('libs.secret.Secret')
     secret = secret_class.return_value
-    secret.get.return_value = {'SecretString':'foobar', 'ARN': SECRET_ARN}
+    secret.get.return_value = {'SecretString':'foobar', 'ARN': SECRET_ARN, 'VersionId': SECRET_VERSION_ID}
 
     boto3_client.get_caller_identity.return_value.get.return_value = '000011112222'
     boto3_client.list_deployments.return_value = {'deployments': [{'deploymentId': DEPLOYMENT_ID}]}
@@ -59,13 +64,28 @@ def fixture_boto3_client(mocker):
                                                 'components': copy.deepcopy(COMPONENTS),
                                                 'targetArn': TARGET_ARN, 'deploymentStatus': 'whatever'}
     boto3_client.create_deployment.return_value = {'deploymentId': NEW_DEPLOYMENT_ID}
+    boto3_client.list_effective_deployments.return_value = {'effectiveDeployments': []}
     boto3_client.list_component_versions.return_value = {'componentVersions': [{'componentName': COMPONENT_NAME,
                                                                           'componentVersion': COMPONENT_VERSION}]}
+    return boto3_client, gdk_config_class
+
+@pytest.fixture(name='boto3_client')
+def fixture_boto3_client(mocker):
+    """ Mocked boto3 client object """
+    boto3_client, gdk_config_class = mock_clients(mocker)
     yield boto3_client
 
     gdk_config_class.assert_called_once()
     boto3_client.list_deployments.assert_called_once()
 
+@pytest.fixture(name='fleet_client')
+def fixture_fleet_client(mocker):
+    """ Mocked boto3 client object, for deployments to a fleet of core devices """
+    boto3_client, gdk_config_class = mock_clients(mocker)
+    yield boto3_client
+
+    gdk_config_class.assert_called_once()
+
 def confirm_exit():
     """ Confirm program hits sys.exit(1) """
     sys.argv[1:] = [COMPONENT_VERSION, CORE_DEVICE_NAME]
@@ -125,11 +145,13 @@ def test_fails_if_second_get_deployment_exception(boto3_client):
     boto3_client.create_deployment.assert_called_once_with(targetArn=TARGET_ARN, deploymentName=DEPLOYMENT_NAME,
                                                            components=COMPONENTS)
 
-def test_fails_if_deployment_times_out(mocker, boto3_client):
+def test_fails_if_deployment_times_out(mocker, boto3_client, capsys):
     """ Should exit abruptly if the deployment times out """
     boto3_client.get_deployment.return_value['deploymentStatus'] = 'ACTIVE'
-    mocker.patch('time.time', side_effect=[0, 0, 900])
+    # Only the watcher's clock reaches the deadline, whatever other clock calls the deployment makes
+    mocker.patch('libs.deployment_watcher.time').monotonic.side_effect = [0, 900]
     confirm_exit()
+    assert f'Deployment to {CORE_DEVICE_NAME} timed out' in capsys.readouterr().out
     calls=[call(deploymentId=DEPLOYMENT_ID), call(deploymentId=NEW_DEPLOYMENT_ID)]
     boto3_client.get_deployment.assert_has_calls(calls)
     boto3_client.create_deployment.assert_called_once_with(targetArn=TARGET_ARN, deploymentName=DEPLOYMENT_NAME,
@@ -150,10 +172,40 @@ def test_succeeds_named_add(boto3_client):
     del boto3_client.get_deployment.return_value['components'][COMPONENT_NAME]
     confirm_success(boto3_client)
 
+def confirm_unchanged(boto3_client):
+    """ Confirm program exit with no error and no deployment created """
+    sys.argv[1:] = [COMPONENT_VERSION, CORE_DEVICE_NAME]
+    runpy.run_module('deploy_component_version')
+    boto3_client.get_deployment.assert_called_once_with(deploymentId=DEPLOYMENT_ID)
+    boto3_client.create_deployment.assert_not_called()
+
 def test_succeeds_named_exists(boto3_client):
-    """ Successful deployment to a named deployment, component already in the deployment """
+    """ No deployment is created if a completed named deployment already has the component version """
+    boto3_client.get_deployment.return_value['deploymentStatus'] = 'COMPLETED'
+    confirm_unchanged(boto3_client)
+
+def test_succeeds_named_update(boto3_client, capsys):
+    """ Successful deployment to a named deployment, updating the component version, with the change printed """
     boto3_client.get_deployment.return_value['deploymentStatus'] = 'COMPLETED'
+    boto3_client.get_deployment.return_value['components'][COMPONENT_NAME]['componentVersion'] = '2.0.0'
     confirm_success(boto3_client)
+    assert f'~ {COMPONENT_NAME}/componentVersion: "2.0.0" -> "{COMPONENT_VERSION}"' in capsys.readouterr().out
+
+def test_dry_run(boto3_client, capsys):
+    """ A dry run prints the changes, as JSON too, without creating a deployment """
+    boto3_client.get_deployment.return_value['deploymentStatus'] = 'FAILED'
+    del boto3_client.get_deployment.return_value['components'][COMPONENT_SECRET_MANAGER]
+    sys.argv[1:] = [COMPONENT_VERSION, CORE_DEVICE_NAME, '--dryRun', '--json']
+    runpy.run_module('deploy_component_version')
+
+    boto3_client.create_deployment.assert_not_called()
+    output = capsys.readouterr().out
+    changes = json.loads(next(line for line in output.splitlines() if line.startswith('{')))
+    secret_manager = {'componentVersion': COMPONENT_VERSION,
+                      'configurationUpdate': {'merge': {'cloudSecrets': [{'arn': SECRET_ARN}]}}}
+    assert changes == {'thingName': CORE_DEVICE_NAME,
+                       'changes': [{'path': [COMPONENT_SECRET_MANAGER], 'op': 'add', 'value': secret_manager}]}
+    assert f'+ {COMPONENT_SECRET_MANAGER}: ' in output
 
 def test_succeeds_unnamed_add(boto3_client):
     """ Successful deployment to an unnamed deployment, first time adding the component """
@@ -163,10 +215,10 @@ def test_succeeds_unnamed_add(boto3_client):
     confirm_success(boto3_client)
 
 def test_succeeds_unnamed_exists(boto3_client):
-    """ Successful deployment to an unnamed deployment, component already in the deployment """
+    """ No deployment is created if a completed unnamed deployment already has the component version """
     boto3_client.get_deployment.return_value['deploymentStatus'] = 'COMPLETED'
     del boto3_client.get_deployment.return_value['deploymentName']
-    confirm_success(boto3_client)
+    confirm_unchanged(boto3_client)
 
 def test_succeeds_add_docker_application_manager(boto3_client):
     """ Successful deployment, adding the Docker application manager component """
@@ -187,3 +239,122 @@ def test_succeeds_add_secret_manager_no_secret(boto3_client):
     # Erase the secret
     secret_manager['configurationUpdate']['merge'] = '{\"cloudSecrets\":[]}'
     confirm_success(boto3_client)
+
+def test_succeeds_sharded_secret(boto3_client, mocker):
+    """ Successful deployment, adding the shard secrets of a sharded configuration to Secret manager """
+    boto3_client.get_deployment.return_value['deploymentStatus'] = 'COMPLETED'
+    index = {'shardedVersion': 1, 'sha256': 'x', 'shards': [{'arn': 'reflection'}, {'arn': 'ticks'}]}
+    mocker.patch('libs.secret.Secret').return_value.get.return_value = {'SecretString': json.dumps(index),
+                                                                        'ARN': SECRET_ARN,
+                                                                        'VersionId': SECRET_VERSION_ID}
+    sys.argv[1:] = [COMPONENT_VERSION, CORE_DEVICE_NAME]
+    runpy.run_module('deploy_component_version')
+
+    components = boto3_client.create_deployment.call_args.kwargs['components']
+    cloud_secrets = json.loads(components[COMPONENT_SECRET_MANAGER]['configurationUpdate']['merge'])['cloudSecrets']
+    assert cloud_secrets == [{'arn': SECRET_ARN}, {'arn': 'reflection'}, {'arn': 'ticks'}]
+
+def test_fails_if_core_device_fails(boto3_client):
+    """ Should exit abruptly if the core device reports a failed deployment """
+    boto3_client.get_deployment.return_value['deploymentStatus'] = 'ACTIVE'
+    boto3_client.list_effective_deployments.return_value = {'effectiveDeployments': [
+        {'deploymentId': NEW_DEPLOYMENT_ID, 'coreDeviceExecutionStatus': 'FAILED'}
+    ]}
+    confirm_exit()
+    boto3_client.list_effective_deployments.assert_called_with(coreDeviceThingName=CORE_DEVICE_NAME)
+
+def test_succeeds_when_core_device_succeeds(boto3_client):
+    """ Successful deployment, reported by the core device before the deployment leaves ACTIVE """
+    boto3_client.get_deployment.return_value['deploymentStatus'] = 'ACTIVE'
+    boto3_client.list_effective_deployments.return_value = {'effectiveDeployments': [
+        {'deploymentId': NEW_DEPLOYMENT_ID, 'coreDeviceExecutionStatus': 'SUCCEEDED'}
+    ]}
+    confirm_success(boto3_client)
+
+def test_fleet_thing_group(fleet_client, tmp_path):
+    """ Fleet deployment to every core device of a thing group, writing a summary """
+    fleet_client.get_deployment.return_value['deploymentStatus'] = 'COMPLETED'
+    fleet_client.get_deployment.return_value['components'][COMPONENT_NAME]['componentVersion'] = '2.0.0'
+    # Each core device's existing deployment is separate
+    deployment = fleet_client.get_deployment.return_value
+    fleet_client.get_deployment.side_effect = lambda **_: copy.deepcopy(deployment)
+    fleet_client.list_things_in_thing_group.side_effect = [{'things': ['a', 'b'], 'nextToken': 'more'},
+                                                           {'things': ['c']}]
+    summary = tmp_path / 'summary.json'
+    sys.argv[1:] = [COMPONENT_VERSION, '--thingGroup', 'Band', '--canary', '1', '--summary', str(summary)]
+    runpy.run_module('deploy_component_version')
+    fleet_client.list_things_in_thing_group.assert_has_calls([
+        call(thingGroupName='Band', recursive=True),
+        call(thingGroupName='Band', recursive=True, nextToken='more')])
+    assert fleet_client.list_deployments.call_count == 3
+    assert fleet_client.create_deployment.call_count == 3
+    result = json.loads(summary.read_text(encoding='utf-8'))
+    assert result['counts'] == {'SUCCEEDED': 3}
+    assert [device['thingName'] for device in result['devices']] == ['a', 'b', 'c']
+    # The account ID is resolved once, and the clients are shared, with deployments polled through their own client
+    fleet_client.get_caller_identity.assert_called_once()
+    assert [args[0][0] for args in fleet_client.call_args_list] == ['iot', 'greengrassv2', 'greengrassv2', 'sts']
+    assert fleet_client.call_args_list[2].kwargs['config'] is POLLING_CLIENT_CONFIG
+
+def test_fleet_things_file_failure(fleet_client, tmp_path):
+    """ Fleet deployment from a thing names file exits abruptly if any core device fails """
+    fleet_client.get_deployment.return_value['deploymentStatus'] = 'FAILED'
+    things_file = tmp_path / 'things.txt'
+    things_file.write_text('# Canary\nx\n\ny\n', encoding='utf-8')
+    sys.argv[1:] = [COMPONENT_VERSION, '--thingsFile', str(things_file), '--canary', '1']
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('deploy_component_version')
+    assert system_exit.value.code == 1
+    # The failed canary stops the rollout
+    assert fleet_client.create_deployment.call_count == 1
+
+def test_fails_if_no_core_devices(fleet_client):
+    """ Should exit abruptly if no core devices are given, before any AWS client is created """
+    sys.argv[1:] = [COMPONENT_VERSION]
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('deploy_component_version')
+    assert system_exit.value.code == 1
+    fleet_client.list_deployments.assert_not_called()
+    fleet_client.assert_not_called()
+
+def test_all_regions(mocker, tmp_path):
+    """ Deployment to the thing group in every region, where a failure in one region does not stop the others """
+    boto3_client, gdk_config_class = mock_clients(mocker)
+    gdk_config = gdk_config_class.return_value
+    gdk_config.replica_regions.return_value = ['mars']
+
+    def for_region(region):
+        region_config = mocker.MagicMock()
+        region_config.name.return_value = COMPONENT_NAME
+        region_config.region.return_value = region
+        return region_config
+    gdk_config.for_region.side_effect = for_region
+
+    def secret(region):
+        if region == 'mars':
+            raise ValueError('replication pending')
+        return mocker.MagicMock(**{'get.return_value': {'ARN': SECRET_ARN, 'VersionId': SECRET_VERSION_ID}})
+    mocker.patch('libs.secret.Secret', side_effect=secret)
+
+    boto3_client.get_deployment.return_value['deploymentStatus'] = 'COMPLETED'
+    boto3_client.get_deployment.return_value['components'][COMPONENT_NAME]['componentVersion'] = '2.0.0'
+    boto3_client.list_things_in_thing_group.return_value = {'things': ['a', 'a']}
+
+    # Only a thing group can be deployed to in every region
+    sys.argv[1:] = [COMPONENT_VERSION, CORE_DEVICE_NAME, '--allRegions']
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('deploy_component_version')
+    assert system_exit.value.code == 1
+    boto3_client.assert_not_called()
+
+    summary = tmp_path / 'summary.json'
+    sys.argv[1:] = [COMPONENT_VERSION, '--thingGroup', 'Band', '--allRegions', '--summary', str(summary)]
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('deploy_component_version')
+    assert system_exit.value.code == 1
+
+    regions = json.loads(summary.read_text(encoding='utf-8'))['regions']
+    assert regions[REGION]['status'] == 'SUCCEEDED'
+    assert regions[REGION]['counts'] == {'SUCCEEDED': 1}
+    assert regions['mars'] == {'status': 'FAILED', 'error': 'replication pending'}
+    boto3_client.create_deployment.assert_called_once()
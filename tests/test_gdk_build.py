@@ -1,8 +1,17 @@
 """
 Unit tests for the gdk_build.py script
 """
+import json
 import runpy
+import shutil
+import sys
+import time
+import zipfile
 import pytest
+import yaml
+from libs.archive import ArtifactArchive
+from libs.publisher import ARTIFACT_URI
+from libs.registry import RegistryError
 
 NAME = 'FooBar'
 VERSION = 'rubbish'
@@ -11,16 +20,19 @@ REGION = 'neverland'
 DIRECTORY_ARTIFACTS = 'artifacts/'
 DIRECTORY_BUILD = 'greengrass-build/artifacts/'
 FILE_RECIPE_TEMPLATE = 'recipe.yaml'
+LAYERS = {'runtime': {'file': 'home-assistant-runtime-0123456789abcdef.zip'}}
 FILE_RECIPE = 'greengrass-build/recipes/recipe.yaml'
 FILE_DOCKER_COMPOSE = DIRECTORY_ARTIFACTS + 'docker-compose.yml'
-FILE_ZIP_BASE = 'home-assistant'
-FILE_ZIP_EXT = 'zip'
 
 SECRET_ARN = 'rhubarb'
+SECRET_VERSION_ID = 'custard'
 IMAGE = 'homeassistant/home-assistant:latest'
+DIGEST = 'sha256:' + 'a' * 64
+PINNED_IMAGE = 'homeassistant/home-assistant@' + DIGEST
 
-def recipe(name, version, secret_arn, image):
+def recipe(name, version, secret_arn, image, secret_version_id=SECRET_VERSION_ID):
     """ Create a recipe string fragment """
+    secret_arns = json.dumps([secret_arn])
     recipe_str =\
     f"""
     {{
@@ -28,9 +40,13 @@ def recipe(name, version, secret_arn, image):
     "ComponentVersion": "{version}",
     "ComponentConfiguration": {{
         "DefaultConfiguration": {{
-        "secretArn": "{secret_arn}"
+        "secretArn": "{secret_arn}",
+        "resources": {secret_arns}
         }}
     }},
+    "Lifecycle": {{
+        "Install": "python3 -u install.py {secret_arn} {secret_version_id}"
+    }},
     "Manifests": [
         {{
         "Artifacts": [
@@ -65,6 +81,7 @@ def fixture_gdk_config(mocker):
     gdk_config = gdk_config_class.return_value
     gdk_config.name.return_value = NAME
     gdk_config.version.return_value = VERSION
+    gdk_config.region.return_value = REGION
 
     yield gdk_config
 
@@ -76,7 +93,7 @@ def fixture_secret(mocker):
     """ Mock the GDK config """
     secret_class = mocker.patch('libs.secret.Secret')
     secret = secret_class.return_value
-    secret.get.return_value = {'SecretString':'foobar', 'ARN': SECRET_ARN}
+    secret.get.return_value = {'SecretString':'foobar', 'ARN': SECRET_ARN, 'VersionId': SECRET_VERSION_ID}
 
     yield secret
 
@@ -88,11 +105,16 @@ def fixture_file(mocker):
     """ Mock the file handling """
     # Complicated mock: four calls to the file mock, each needing their own side effect
     m = m_docker = mocker.mock_open(read_data=docker_compose(IMAGE))
-    m_recipe_template = mocker.mock_open(read_data=recipe('COMPONENT_NAME', 'COMPONENT_VERSION',\
-                                                          '$SECRET_ARN', '$DOCKER_IMAGE'))
+    recipe_template = recipe('COMPONENT_NAME', 'COMPONENT_VERSION', '$SECRET_ARN', '$DOCKER_IMAGE',
+                             '$SECRET_VERSION_ID').replace(json.dumps(['$SECRET_ARN']), '$SECRET_ARNS')
+    m_recipe_template = mocker.mock_open(read_data=recipe_template)
     m_recipe = mocker.mock_open()
     m.side_effect=[m_docker.return_value, m_recipe_template.return_value, m_recipe.return_value, m_recipe.return_value]
     file = mocker.patch('builtins.open', m)
+    # The registry is unreachable, so the image tag is used as is. Pinning is exercised with real files, below
+    mocker.patch('libs.registry.RegistryResolver').return_value.resolve.side_effect = RegistryError('offline')
+    # The build cache is exercised with real files, below
+    sys.argv[1:] = ['--no-cache']
 
     yield file
 
@@ -103,30 +125,287 @@ def fixture_file(mocker):
 
 def test_specific_version(mocker, gdk_config, secret, file):
     """ Confirm GDK build correctly assembles the recipe and the archive when version is specified in GDK config """
-    make_archive = mocker.patch('shutil.make_archive')
+    artifact_layers = mocker.patch('libs.archive.ArtifactLayers')
+    artifact_layers.return_value.build.return_value = LAYERS
+    wheelhouse = mocker.patch('libs.wheelhouse.Wheelhouse')
     runpy.run_module('gdk_build')
 
     recipe_str = recipe(NAME, VERSION, SECRET_ARN, IMAGE)
     file().write.assert_called_once_with(recipe_str)
-    archive_name = DIRECTORY_BUILD + NAME + '/' + VERSION + '/' + FILE_ZIP_BASE
-    make_archive.assert_called_once_with(archive_name, FILE_ZIP_EXT, DIRECTORY_ARTIFACTS)
-    assert gdk_config.name.call_count == 2
-    assert gdk_config.version.call_count == 3
+    wheelhouse.assert_called_once_with(DIRECTORY_ARTIFACTS + 'requirements.txt')
+    wheelhouse.return_value.build.assert_called_once_with(reuse=False)
+    artifact_layers.assert_called_once_with(DIRECTORY_ARTIFACTS,
+                                            extra_directories={'wheelhouse': wheelhouse.return_value.build()})
+    artifact_layers.return_value.build.assert_called_once_with(DIRECTORY_BUILD + NAME + '/' + VERSION + '/',
+                                                               VERSION, reuse=False)
+    assert gdk_config.name.call_count == 3
+    assert gdk_config.version.call_count == 5
     assert gdk_config.region.call_count == 1
     assert secret.get.call_count == 1
 
 
 def test_next_patch(mocker, gdk_config, secret, file):
     """ Confirm GDK build correctly assembles the recipe and the archive when NEXT_PATCH is specified in GDK config """
-    make_archive = mocker.patch('shutil.make_archive')
+    artifact_layers = mocker.patch('libs.archive.ArtifactLayers')
+    artifact_layers.return_value.build.return_value = LAYERS
+    mocker.patch('libs.wheelhouse.Wheelhouse')
     gdk_config.version.return_value = 'NEXT_PATCH'
     runpy.run_module('gdk_build')
 
     recipe_str = recipe(NAME, 'COMPONENT_VERSION', SECRET_ARN, IMAGE)
     file().write.assert_called_once_with(recipe_str)
-    archive_name = DIRECTORY_BUILD + NAME + '/NEXT_PATCH/' + FILE_ZIP_BASE
-    make_archive.assert_called_once_with(archive_name, FILE_ZIP_EXT, DIRECTORY_ARTIFACTS)
-    assert gdk_config.name.call_count == 2
-    assert gdk_config.version.call_count == 2
+    artifact_layers.return_value.build.assert_called_once_with(DIRECTORY_BUILD + NAME + '/NEXT_PATCH/',
+                                                               'NEXT_PATCH', reuse=False)
+    assert gdk_config.name.call_count == 3
+    assert gdk_config.version.call_count == 4
     assert gdk_config.region.call_count == 1
     assert secret.get.call_count == 1
+
+
+@pytest.mark.usefixtures('gdk_config')
+def test_sharded_secret(mocker, secret, file):
+    """ Confirm the recipe access control covers the shard secrets of a sharded configuration """
+    mocker.patch('libs.archive.ArtifactLayers').return_value.build.return_value = LAYERS
+    mocker.patch('libs.wheelhouse.Wheelhouse')
+    index = {'shardedVersion': 1, 'sha256': 'x', 'shards': [{'arn': 'apple'}, {'arn': 'banana'}]}
+    secret.get.return_value['SecretString'] = json.dumps(index)
+    runpy.run_module('gdk_build')
+
+    recipe_str = recipe(NAME, VERSION, SECRET_ARN, IMAGE).replace(json.dumps([SECRET_ARN]),
+                                                                   json.dumps([SECRET_ARN, 'apple', 'banana']))
+    file().write.assert_called_once_with(recipe_str)
+
+
+@pytest.fixture(name='project')
+def fixture_project(mocker, tmp_path, monkeypatch):
+    """ Run repeated builds in a copy of the project's recipe template and artifacts, with an empty build cache """
+    shutil.copy(FILE_RECIPE_TEMPLATE, tmp_path / FILE_RECIPE_TEMPLATE)
+    (tmp_path / DIRECTORY_ARTIFACTS / 'config').mkdir(parents=True)
+    (tmp_path / FILE_DOCKER_COMPOSE).write_text(docker_compose(IMAGE), encoding='utf-8')
+    (tmp_path / DIRECTORY_ARTIFACTS / 'config' / 'automations.yaml').write_text('[]\n', encoding='utf-8')
+    (tmp_path / DIRECTORY_ARTIFACTS / 'requirements.txt').write_text('awsiotsdk\n', encoding='utf-8')
+    (tmp_path / DIRECTORY_ARTIFACTS / 'install.py').write_text('print("install")\n', encoding='utf-8')
+    (tmp_path / 'greengrass-build' / 'recipes').mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    sys.argv[1:] = []
+    # Don't download wheels
+    mocker.patch('subprocess.run')
+    resolver = mocker.patch('libs.registry.RegistryResolver').return_value
+    resolver.resolve.return_value = {'digest': DIGEST, 'platforms': {'linux/amd64': 'sha256:' + 'b' * 64}}
+
+    gdk_config = mocker.patch('libs.gdk_config.GdkConfig').return_value
+    gdk_config.name.return_value = NAME
+    gdk_config.version.return_value = VERSION
+    gdk_config.region.return_value = REGION
+    return tmp_path
+
+@pytest.fixture(name='project_secret')
+def fixture_project_secret(mocker):
+    """ Mock the secret, for repeated builds """
+    secret = mocker.patch('libs.secret.Secret').return_value
+    secret.get.return_value = {'SecretString':'foobar', 'ARN': SECRET_ARN, 'VersionId': SECRET_VERSION_ID}
+    secret.current_version_id.return_value = SECRET_VERSION_ID
+    return secret
+
+def clean_build(project):
+    """ Remove the build output, as GDK does before each build """
+    shutil.rmtree(project / 'greengrass-build')
+    (project / 'greengrass-build' / 'recipes').mkdir(parents=True)
+
+def test_build_cache(mocker, project_secret, project, capsys):
+    """ A rebuild skips the secret call and restores the recipe, and rebuilds only the changed layer """
+    spy_write = mocker.spy(ArtifactArchive, 'write')
+    runpy.run_module('gdk_build')
+    recipe_str = (project / FILE_RECIPE).read_text(encoding='utf-8')
+    assert f'resources: ["{SECRET_ARN}"]' in recipe_str
+    assert f'install.py {{configuration:/secretArn}} {SECRET_VERSION_ID}' in recipe_str
+    assert spy_write.call_count == 4
+    manifest = yaml.safe_load(recipe_str)['Manifests'][0]
+    layer_keys = [artifact['Uri'][len('s3://BUCKET_NAME/'):] for artifact in manifest['Artifacts'][1:]]
+    assert [key.split('-')[2] for key in layer_keys] == ['runtime', 'project', 'config', 'wheelhouse']
+    assert f'{{artifacts:path}}/{layer_keys[0].split("/")[-1]} .' in manifest['Lifecycle']['Install']['Script']
+    assert all((project / DIRECTORY_BUILD / NAME / VERSION / key.split('/')[-1]).is_file() for key in layer_keys)
+    capsys.readouterr()
+
+    clean_build(project)
+    runpy.run_module('gdk_build')
+    output = capsys.readouterr().out
+    assert project_secret.get.call_count == 1
+    assert (project / FILE_RECIPE).read_text(encoding='utf-8') == recipe_str
+    assert 'Restored the cached recipe' in output
+    assert '0 of 4 layers changed since the last build' in output
+    assert 'Trace summary:' in output
+    assert spy_write.call_count == 4
+
+    # Iterating on one automation file rebuilds only the configuration layer, which the new recipe lists
+    (project / DIRECTORY_ARTIFACTS / 'config' / 'automations.yaml').write_text('[{}]\n', encoding='utf-8')
+    clean_build(project)
+    runpy.run_module('gdk_build')
+    output = capsys.readouterr().out
+    assert 'Restored the cached recipe' not in output
+    assert '1 of 4 layers changed since the last build' in output
+    assert spy_write.call_count == 5
+    assert project_secret.get.call_count == 1
+    new_recipe_str = (project / FILE_RECIPE).read_text(encoding='utf-8')
+    assert [key for key in ARTIFACT_URI.findall(new_recipe_str) if key not in recipe_str] ==\
+        [key for key in ARTIFACT_URI.findall(new_recipe_str) if 'config' in key]
+
+@pytest.mark.usefixtures('project')
+def test_build_no_cache(mocker, project_secret, capsys):
+    """ With --no-cache, every step runs, including the secret call """
+    runpy.run_module('gdk_build')
+    spy_write = mocker.spy(ArtifactArchive, 'write')
+    capsys.readouterr()
+
+    sys.argv[1:] = ['--no-cache']
+    runpy.run_module('gdk_build')
+    assert 'Restored the cached recipe' not in capsys.readouterr().out
+    assert project_secret.get.call_count == 2
+    assert spy_write.call_count == 4
+
+@pytest.mark.usefixtures('project')
+def test_build_secret_new_version(project, project_secret):
+    """ Each build resolves the current secret version, and gets the secret again once it changes """
+    runpy.run_module('gdk_build')
+    project_secret.current_version_id.return_value = 'trifle'
+    project_secret.get.return_value = dict(project_secret.get.return_value, VersionId='trifle')
+    clean_build(project)
+    runpy.run_module('gdk_build')
+    assert project_secret.current_version_id.call_count == 2
+    assert project_secret.get.call_count == 2
+    assert 'install.py {configuration:/secretArn} trifle' in (project / FILE_RECIPE).read_text(encoding='utf-8')
+
+def archived_file(project, name):
+    """ Gets a file in the built layer archives listed in the recipe """
+    for key in ARTIFACT_URI.findall((project / FILE_RECIPE).read_text(encoding='utf-8')):
+        with zipfile.ZipFile(project / DIRECTORY_BUILD / NAME / VERSION / key.split('/')[-1]) as archive:
+            if name in archive.namelist():
+                return archive.read(name).decode('utf-8')
+    raise KeyError(name)
+
+def archived_docker_compose(project):
+    """ Gets the Docker Compose file in the built archive """
+    return archived_file(project, 'docker-compose.yml')
+
+@pytest.mark.usefixtures('project_secret')
+def test_build_pins_image(mocker, project, capsys):
+    """ The image tag is resolved to its digest, which is pinned in the recipe and the archived compose file """
+    resolver_class = mocker.patch('libs.registry.RegistryResolver')
+    resolver_class.return_value.resolve.return_value = {'digest': DIGEST, 'platforms': {'linux/arm64/v8': 'x'}}
+    runpy.run_module('gdk_build')
+
+    assert f'- Uri: docker:{PINNED_IMAGE}\n' in (project / FILE_RECIPE).read_text(encoding='utf-8')
+    assert archived_docker_compose(project) == docker_compose(PINNED_IMAGE)
+    assert (project / FILE_DOCKER_COMPOSE).read_text(encoding='utf-8') == docker_compose(IMAGE)
+    assert 'linux/arm64/v8: x' in capsys.readouterr().out
+    resolver_class.return_value.resolve.assert_called_once_with(IMAGE)
+
+    # The digest is cached briefly, because tags move
+    clean_build(project)
+    runpy.run_module('gdk_build')
+    resolver_class.return_value.resolve.assert_called_once_with(IMAGE)
+    mocker.patch('time.time', return_value=time.time() + 11 * 60)
+    clean_build(project)
+    runpy.run_module('gdk_build')
+    assert resolver_class.return_value.resolve.call_count == 2
+
+@pytest.mark.usefixtures('project_secret')
+def test_build_unresolved_image(mocker, project):
+    """ If the registry cannot be reached, the recipe and the archive keep the image tag """
+    runpy.run_module('gdk_build')
+    mocker.patch('libs.registry.RegistryResolver').return_value.resolve.side_effect = RegistryError('offline')
+    clean_build(project)
+    sys.argv[1:] = ['--no-cache']
+    runpy.run_module('gdk_build')
+
+    assert f'- Uri: docker:{IMAGE}\n' in (project / FILE_RECIPE).read_text(encoding='utf-8')
+    assert archived_docker_compose(project) == docker_compose(IMAGE)
+
+@pytest.mark.usefixtures('project_secret')
+def test_build_pinned_image(mocker, project):
+    """ An image that is already pinned to a digest is used as is """
+    (project / FILE_DOCKER_COMPOSE).write_text(docker_compose(PINNED_IMAGE), encoding='utf-8')
+    resolver_class = mocker.patch('libs.registry.RegistryResolver')
+    runpy.run_module('gdk_build')
+
+    assert f'- Uri: docker:{PINNED_IMAGE}\n' in (project / FILE_RECIPE).read_text(encoding='utf-8')
+    resolver_class.return_value.resolve.assert_not_called()
+
+@pytest.mark.usefixtures('project_secret')
+def test_build_device_profile(project, monkeypatch):
+    """ The device profile generates the package and compose limits in the archive, and is recorded in the recipe """
+    (project / DIRECTORY_ARTIFACTS / 'config' / 'packages').mkdir()
+    (project / DIRECTORY_ARTIFACTS / 'config' / 'packages' / 'device_profile.yaml').write_text('{}\n', encoding='utf-8')
+    runpy.run_module('gdk_build')
+    assert 'deviceProfile: none\n' in (project / FILE_RECIPE).read_text(encoding='utf-8')
+    assert archived_file(project, 'config/packages/device_profile.yaml') == '{}\n'
+
+    clean_build(project)
+    monkeypatch.setenv('HA_DEVICE_PROFILE', 'balanced')
+    sys.argv[1:] = ['--profile', 'low-flash-wear']
+    runpy.run_module('gdk_build')
+    assert 'deviceProfile: low-flash-wear\n' in (project / FILE_RECIPE).read_text(encoding='utf-8')
+    package = yaml.safe_load(archived_file(project, 'config/packages/device_profile.yaml'))
+    assert package['recorder']['commit_interval'] == 30
+    compose = yaml.safe_load(archived_docker_compose(project))
+    assert compose['services']['homeassistant']['image'] == PINNED_IMAGE
+    assert compose['services']['homeassistant']['mem_limit'] == '1g'
+
+    # The environment variable selects the profile when the option is not given
+    clean_build(project)
+    sys.argv[1:] = []
+    runpy.run_module('gdk_build')
+    assert 'deviceProfile: balanced\n' in (project / FILE_RECIPE).read_text(encoding='utf-8')
+    compose = yaml.safe_load(archived_docker_compose(project))
+    assert compose['services']['homeassistant']['mem_limit'] == '2g'
+
+@pytest.mark.usefixtures('project_secret')
+def test_build_recorder_database(project, capsys):
+    """ The recorder database service is added to the archived compose file, alongside the device profile """
+    sys.argv[1:] = ['--recorder-database', 'mariadb', '--profile', 'low-flash-wear']
+    runpy.run_module('gdk_build')
+
+    assert 'recorderDatabase: mariadb\n' in (project / FILE_RECIPE).read_text(encoding='utf-8')
+    assert 'db_url: !secret recorder_db_url' in archived_file(project, 'config/packages/recorder_database.yaml')
+    services = yaml.safe_load(archived_docker_compose(project))['services']
+    assert services['homeassistant']['image'] == PINNED_IMAGE
+    assert services['homeassistant']['mem_limit'] == '1g'
+    assert services['recorder-db']['image'].startswith('mariadb:')
+    assert 'WARNING: secrets/recorder_database.env does not exist' in capsys.readouterr().out
+
+@pytest.mark.usefixtures('project_secret', 'project')
+def test_build_recorder_database_in_memory():
+    """ The in-memory device profile cannot be combined with a recorder database """
+    sys.argv[1:] = ['--recorder-database', 'postgresql', '--profile', 'in-memory']
+
+    with pytest.raises(SystemExit) as system_exit:
+        runpy.run_module('gdk_build')
+
+    assert system_exit.value.code == 1
+
+def test_build_regions(mocker, project, capsys):
+    """
+    A recipe is rendered for each region, with the secret replica in that region, from the one archive. The
+    shards listed by a replica of a sharded index are in the region of the replica.
+    """
+    mocker.patch('libs.gdk_config.GdkConfig').return_value.configure_mock(**{
+        'name.return_value': NAME, 'version.return_value': VERSION, 'region.return_value': REGION,
+        'replica_regions.return_value': ['mars']})
+    arn_format = 'arn:aws:secretsmanager:{}:000011112222:secret:{}'
+    index = {'shardedVersion': 1, 'sha256': 'x', 'shards': [{'arn': arn_format.format(REGION, 'shard-0')}]}
+    secrets = {REGION: {'ARN': SECRET_ARN, 'VersionId': SECRET_VERSION_ID},
+               'mars': {'ARN': arn_format.format('mars', 'rhubarb'), 'VersionId': 'lagging',
+                        'SecretString': json.dumps(index)}}
+    mocker.patch('libs.secret.Secret', side_effect=lambda region: mocker.Mock(**{
+        'get.return_value': secrets[region], 'current_version_id.return_value': secrets[region]['VersionId']}))
+    spy_write = mocker.spy(ArtifactArchive, 'write')
+    runpy.run_module('gdk_build')
+
+    recipe_str = (project / FILE_RECIPE).read_text(encoding='utf-8')
+    assert (project / 'greengrass-build' / 'regions' / REGION / 'recipe.yaml').read_text(encoding='utf-8') == recipe_str
+    mars_recipe_str = (project / 'greengrass-build' / 'regions' / 'mars' / 'recipe.yaml').read_text(encoding='utf-8')
+    assert f'resources: ["{arn_format.format("mars", "rhubarb")}", "{arn_format.format("mars", "shard-0")}"]' \
+        in mars_recipe_str
+    assert 'install.py {configuration:/secretArn} lagging' in mars_recipe_str
+    assert spy_write.call_count == 4
+    assert 'WARNING: The secret replica in mars is not the version in neverland' in capsys.readouterr().out
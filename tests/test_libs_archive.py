@@ -0,0 +1,116 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the libs.archive module
+"""
+import os
+import time
+import zipfile
+import pytest
+from libs.archive import ArtifactArchive, ArtifactLayers, LAYERS, MAX_CACHED_ARCHIVES, layer_of
+
+@pytest.fixture(name='source')
+def fixture_source(tmp_path):
+    """ A directory of artifacts, including compiled Python that must not be archived """
+    source = tmp_path / 'artifacts'
+    (source / 'config').mkdir(parents=True)
+    (source / '__pycache__').mkdir()
+    (source / 'install.py').write_text('print("install")\n', encoding='utf-8')
+    (source / 'config' / 'configuration.yaml').write_text('homeassistant:\n', encoding='utf-8')
+    (source / '__pycache__' / 'install.cpython-311.pyc').write_bytes(b'\x00')
+    os.chmod(source / 'install.py', 0o700)
+    os.chmod(source / 'config' / 'configuration.yaml', 0o600)
+    return source
+
+def archive_of(source, tmp_path):
+    """ Creates an archive builder with a cache directory alongside the source """
+    return ArtifactArchive(str(source), str(tmp_path / 'cache'))
+
+def test_archive_is_reproducible(source, tmp_path):
+    """ Identical inputs produce byte-identical archives, whatever the file timestamps """
+    archive_of(source, tmp_path).write(str(tmp_path / 'first.zip'))
+    os.utime(source / 'install.py', (0, 0))
+    archive_of(source, tmp_path).write(str(tmp_path / 'second.zip'))
+
+    assert (tmp_path / 'first.zip').read_bytes() == (tmp_path / 'second.zip').read_bytes()
+
+    with zipfile.ZipFile(tmp_path / 'first.zip') as archive:
+        assert archive.namelist() == ['config/configuration.yaml', 'install.py']
+        assert [info.date_time for info in archive.infolist()] == [(1980, 1, 1, 0, 0, 0)] * 2
+        assert [info.external_attr >> 16 & 0o777 for info in archive.infolist()] == [0o644, 0o755]
+        assert archive.read('install.py') == b'print("install")\n'
+
+def test_inputs_hash(source, tmp_path):
+    """ The inputs hash changes with content and permissions, but not with timestamps """
+    original = archive_of(source, tmp_path).inputs_hash()
+    os.utime(source / 'install.py', (0, 0))
+    assert archive_of(source, tmp_path).inputs_hash() == original
+    os.chmod(source / 'install.py', 0o644)
+    assert archive_of(source, tmp_path).inputs_hash() != original
+    os.chmod(source / 'install.py', 0o755)
+    (source / 'config' / 'configuration.yaml').write_text('homeassistant: {}\n', encoding='utf-8')
+    assert archive_of(source, tmp_path).inputs_hash() != original
+
+def test_archive_extra_directories(source, tmp_path):
+    """ Extra directories are archived under their path in the archive, and are part of the inputs hash """
+    wheelhouse = tmp_path / 'wheels'
+    wheelhouse.mkdir()
+    (wheelhouse / 'awscrt.whl').write_bytes(b'wheel')
+    archive = ArtifactArchive(str(source), str(tmp_path / 'cache'), {'wheelhouse': str(wheelhouse)})
+    archive.write(str(tmp_path / 'out.zip'))
+
+    with zipfile.ZipFile(tmp_path / 'out.zip') as zip_file:
+        assert zip_file.namelist() == ['config/configuration.yaml', 'install.py', 'wheelhouse/awscrt.whl']
+
+    original = archive.inputs_hash()
+    (wheelhouse / 'awscrt.whl').write_bytes(b'other wheel')
+    assert ArtifactArchive(str(source), str(tmp_path / 'cache'), {'wheelhouse': str(wheelhouse)}).inputs_hash() !=\
+        original
+
+def test_archive_extra_directory_overrides_source(source, tmp_path):
+    """ A file of an extra directory replaces the source file with the same path in the archive """
+    generated = tmp_path / 'generated'
+    generated.mkdir()
+    (generated / 'install.py').write_text('print("generated")\n', encoding='utf-8')
+    ArtifactArchive(str(source), str(tmp_path / 'cache'), {'': str(generated)}).write(str(tmp_path / 'out.zip'))
+
+    with zipfile.ZipFile(tmp_path / 'out.zip') as zip_file:
+        assert zip_file.namelist() == ['config/configuration.yaml', 'install.py']
+        assert zip_file.read('install.py') == b'print("generated")\n'
+
+def test_layer_of():
+    """ Files are split into layers by their path in the archive """
+    assert layer_of('install.py') == 'runtime'
+    assert layer_of('docker-compose.yml') == 'project'
+    assert layer_of('scripts/tool.py') == 'project'
+    assert layer_of('wheelhouse/awscrt.whl') == 'wheelhouse'
+    assert layer_of('config/configuration.yaml') == 'config'
+    assert layer_of('config/custom_components/hacs/__init__.py') == 'assets'
+
+def test_build_layers(source, tmp_path, capsys):
+    """ Each layer is archived and named by its content hash, and a change rebuilds and renames only its layer """
+    layers = ArtifactLayers(str(source), str(tmp_path / 'cache')).build(str(tmp_path / 'build'), '1.0.0')
+    assert list(layers) == ['runtime', 'config']
+    assert all(layer['changed'] and not layer['reused'] for layer in layers.values())
+    with zipfile.ZipFile(tmp_path / 'build' / layers['config']['file']) as archive:
+        assert archive.namelist() == ['config/configuration.yaml']
+    assert layers['config']['file'] == f'home-assistant-config-{layers["config"]["sha256"][:16]}.zip'
+    capsys.readouterr()
+
+    (source / 'config' / 'configuration.yaml').write_text('homeassistant: {}\n', encoding='utf-8')
+    changed = ArtifactLayers(str(source), str(tmp_path / 'cache')).build(str(tmp_path / 'build'), '1.0.1')
+    assert changed['runtime'] == dict(layers['runtime'], changed=False, reused=True)
+    assert changed['config']['changed'] and changed['config']['file'] != layers['config']['file']
+    assert '1 of 2 layers changed since the last build' in capsys.readouterr().out
+
+def test_build_layers_prunes_cache(source, tmp_path):
+    """ Only the most recently used layer archives are kept in the cache, including those of unchanged layers """
+    for i in range(MAX_CACHED_ARCHIVES * len(LAYERS) + 2):
+        (source / 'install.py').write_text(f'print({i})\n', encoding='utf-8')
+        layers = ArtifactLayers(str(source), str(tmp_path / 'cache')).build(str(tmp_path / 'build'), f'1.0.{i}')
+        # Make sure that modification times differ on filesystems with coarse timestamps
+        time.sleep(0.01)
+
+    assert len(list((tmp_path / 'cache').glob('*.zip'))) == MAX_CACHED_ARCHIVES * len(LAYERS)
+    assert (tmp_path / 'cache' / f'{layers["config"]["inputsHash"]}.zip').is_file()
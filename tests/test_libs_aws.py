@@ -0,0 +1,73 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the libs.aws module
+"""
+import threading
+import pytest
+from libs.aws import AwsClients, CLIENT_CONFIG, POLLING_CLIENT_CONFIG
+
+@pytest.fixture(name='boto3_client')
+def fixture_boto3_client(mocker):
+    """ Mocked boto3 client function, creating a distinct client each call """
+    return mocker.patch('boto3.client', side_effect=lambda *args, **kwargs: mocker.MagicMock())
+
+def test_client_cached_per_service_and_region(boto3_client):
+    """ Clients are created once per service and region, with the pooling and retry configuration """
+    clients = AwsClients()
+    secretsmanager_client = clients.client('secretsmanager', 'us-east-1')
+
+    assert clients.client('secretsmanager', 'us-east-1') is secretsmanager_client
+    assert clients.client('secretsmanager', 'eu-west-1') is not secretsmanager_client
+    assert clients.client('greengrassv2', 'us-east-1') is not secretsmanager_client
+    assert boto3_client.call_count == 3
+    boto3_client.assert_any_call('secretsmanager', region_name='us-east-1', config=CLIENT_CONFIG)
+
+def test_client_cached_per_config(boto3_client):
+    """ A client with another configuration, such as that for polling, is separate from the default client """
+    clients = AwsClients()
+    greengrassv2_client = clients.client('greengrassv2', 'us-east-1')
+    polling_client = clients.client('greengrassv2', 'us-east-1', config=POLLING_CLIENT_CONFIG)
+
+    assert polling_client is not greengrassv2_client
+    assert clients.client('greengrassv2', 'us-east-1', config=POLLING_CLIENT_CONFIG) is polling_client
+    boto3_client.assert_called_with('greengrassv2', region_name='us-east-1', config=POLLING_CLIENT_CONFIG)
+
+def test_client_lazy(boto3_client):
+    """ Creating the factory creates no clients """
+    AwsClients()
+    boto3_client.assert_not_called()
+
+def test_client_thread_safe(boto3_client):
+    """ Concurrent first use creates one client """
+    clients = AwsClients()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(clients.client('iot', 'us-east-1'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert boto3_client.call_count == 1
+    assert all(result is results[0] for result in results)
+
+def test_account_id_cached(boto3_client):
+    """ The account ID is resolved on first use only """
+    clients = AwsClients()
+    boto3_client.assert_not_called()
+    sts_client = clients.client('sts')
+    sts_client.get_caller_identity.return_value = {'Account': '000011112222'}
+
+    assert clients.account_id() == '000011112222'
+    assert clients.account_id() == '000011112222'
+    sts_client.get_caller_identity.assert_called_once()
+
+def test_reset(boto3_client):
+    """ Reset forgets the clients and account ID """
+    clients = AwsClients()
+    iot_client = clients.client('iot')
+    clients.reset()
+    assert clients.client('iot') is not iot_client
+    assert clients.account is None
+    assert boto3_client.call_count == 2
@@ -0,0 +1,100 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the libs.component_versions module
+"""
+import time
+import pytest
+from libs.component_versions import ComponentVersionResolver, load_requirements, satisfies, version_key
+
+REGION = 'us-east-1'
+COMPONENT = 'aws.greengrass.SecretManager'
+COMPONENT_ARN = f'arn:aws:greengrass:{REGION}:aws:components:{COMPONENT}'
+
+def add_pages(stubber, pages):
+    """ Queue list_component_versions responses, one per page of versions """
+    for i, page in enumerate(pages):
+        response = {'componentVersions': [{'componentName': COMPONENT, 'componentVersion': version,
+                                           'arn': f'{COMPONENT_ARN}:versions:{version}'} for version in page]}
+        request = {'arn': COMPONENT_ARN}
+        if i > 0:
+            request['nextToken'] = str(i)
+        if i < len(pages) - 1:
+            response['nextToken'] = str(i + 1)
+        stubber.add_response('list_component_versions', response, request)
+
+def test_resolve_pages_and_sorts(stubber):
+    """ Every page is listed, and the newest version by semantic version wins, not the first listed """
+    add_pages(stubber, [['2.0.9', '2.0.10-rc.1'], ['2.0.10', '1.9.0'], ['10.0.0-beta']])
+    resolver = ComponentVersionResolver(stubber.client, REGION)
+    assert resolver.resolve(COMPONENT, '>=2.0.0') == '2.0.10'
+    assert resolver.api_calls == 3
+
+def test_resolve_uses_recipe_requirement(stubber):
+    """ The requirement comes from the recipe's ComponentDependencies by default """
+    add_pages(stubber, [['1.9.0', '3.0.0']])
+    resolver = ComponentVersionResolver(stubber.client, REGION)
+    resolver.requirements[COMPONENT] = '>=1.0.0 <3.0.0'
+    assert resolver.resolve(COMPONENT) == '1.9.0'
+
+def test_resolve_no_satisfying_version(stubber):
+    """ Resolution fails if no version satisfies the requirement """
+    add_pages(stubber, [['1.9.0']])
+    resolver = ComponentVersionResolver(stubber.client, REGION)
+    with pytest.raises(ValueError):
+        resolver.resolve(COMPONENT, '^2.0.0')
+
+def test_resolve_cached_on_disk(stubber, mocker):
+    """ Repeat resolutions, even by another resolver, make no API calls until the cache expires """
+    add_pages(stubber, [['2.1.0']])
+    assert ComponentVersionResolver(stubber.client, REGION).resolve(COMPONENT) == '2.1.0'
+
+    resolver = ComponentVersionResolver(stubber.client, REGION)
+    for _ in range(10):
+        assert resolver.resolve(COMPONENT) == '2.1.0'
+    assert resolver.api_calls == 0
+
+    mocker.patch('time.time', return_value=time.time() + ComponentVersionResolver.CACHE_TTL_SECONDS + 1)
+    add_pages(stubber, [['2.1.0', '2.2.0']])
+    assert resolver.resolve(COMPONENT) == '2.2.0'
+    assert resolver.api_calls == 1
+
+def test_load_requirements():
+    """ Requirements are read from the repository's recipe """
+    requirements = load_requirements('recipe.yaml')
+    assert requirements == {'aws.greengrass.DockerApplicationManager': '>=2.0.0',
+                            'aws.greengrass.SecretManager': '>=2.0.0'}
+    assert load_requirements('missing.yaml') == {}
+
+def test_version_key():
+    """ Versions sort by semantic version precedence """
+    versions = ['1.0.0', '1.0.0-alpha', '1.0.0-alpha.1', '1.0.0-alpha.beta', '1.0.0-beta', '1.0.0-beta.2',
+                '1.0.0-beta.11', '1.0.0-rc.1', '0.9.10', '0.9.9', '1.10.0', '1.2.0']
+    assert sorted(versions, key=version_key) == ['0.9.9', '0.9.10', '1.0.0-alpha', '1.0.0-alpha.1',
+                                                 '1.0.0-alpha.beta', '1.0.0-beta', '1.0.0-beta.2',
+                                                 '1.0.0-beta.11', '1.0.0-rc.1', '1.0.0', '1.2.0', '1.10.0']
+
+@pytest.mark.parametrize('version, requirement, expected', [
+    ('2.0.0', '>=2.0.0', True),
+    ('1.9.9', '>=2.0.0', False),
+    ('2.5.0', '>=2.0.0 <3.0.0', True),
+    ('3.0.0', '>=2.0.0 <3.0.0', False),
+    ('2.9.0', '^2.1.0', True),
+    ('3.0.0', '^2.1.0', False),
+    ('0.2.5', '^0.2.3', True),
+    ('0.3.0', '^0.2.3', False),
+    ('2.1.9', '~2.1.0', True),
+    ('2.2.0', '~2.1.0', False),
+    ('2.0.0', '2.0.0', True),
+    ('2.0.1', '=2.0.0', False),
+    ('1.0.0', '1.0.0 || >=3.0.0', True),
+    ('3.1.0', '1.0.0 || >=3.0.0', True),
+    ('2.0.0', '1.0.0 || >=3.0.0', False),
+    ('5.0.0', '*', True),
+    ('3.0.0-rc.1', '>=2.0.0', False),
+    ('3.0.0-rc.2', '>=3.0.0-rc.1', True),
+])
+def test_satisfies(version, requirement, expected):
+    """ Requirements follow the npm-style syntax of Greengrass recipes """
+    assert satisfies(version, requirement) == expected
@@ -0,0 +1,64 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the libs.config_sync module
+"""
+from artifacts.envelope import unpack
+from libs.archive import ArtifactArchive, ArtifactLayers
+from libs.config_sync import ConfigDelta, archive_hashes, content_hash, last_build_archives
+
+def artifacts(tmp_path):
+    """ Create artifacts with a configuration, and a generated package that replaces its template """
+    (tmp_path / 'artifacts' / 'config' / 'packages').mkdir(parents=True)
+    (tmp_path / 'artifacts' / 'config' / 'automations.yaml').write_bytes(b'automation: []\n')
+    (tmp_path / 'artifacts' / 'config' / 'packages' / 'profile.yaml').write_bytes(b'{}\n')
+    (tmp_path / 'artifacts' / 'install.py').write_bytes(b'pass\n')
+    (tmp_path / 'generated' / 'config' / 'packages').mkdir(parents=True)
+    (tmp_path / 'generated' / 'config' / 'packages' / 'profile.yaml').write_bytes(b'recorder: {}\n')
+    return ArtifactArchive(str(tmp_path / 'artifacts'), str(tmp_path / 'cache'), {'': str(tmp_path / 'generated')})
+
+def test_config_delta(tmp_path):
+    """ Only changed and removed configuration files are in the delta, with their base hashes """
+    config_delta = ConfigDelta(artifacts(tmp_path))
+    hashes = config_delta.hashes()
+    assert sorted(hashes) == ['automations.yaml', 'packages/profile.yaml']
+    assert hashes['packages/profile.yaml'] == content_hash(b'recorder: {}\n')
+    assert config_delta.build(hashes, 1) is None
+
+    base = dict(hashes, **{'automations.yaml': 'old', 'scenes.yaml': 'gone'})
+    delta = config_delta.build(base, 7, restart=True)
+    files, modes = unpack(delta['envelope'])
+    assert files == {'automations.yaml': b'automation: []\n'} and modes == {'automations.yaml': 0o644}
+    assert delta['removed'] == ['scenes.yaml'] and delta['sequence'] == 7 and delta['restart']
+    assert delta['base'] == {'automations.yaml': 'old', 'scenes.yaml': 'gone'}
+
+    assert 'base' not in config_delta.build({}, 8, force=True)
+
+def test_last_build_archives(tmp_path):
+    """ The configuration hashes are read from the cached archive of the last build """
+    archive = artifacts(tmp_path)
+    assert last_build_archives(str(tmp_path / 'cache')) == (None, None)
+
+    # The last build of a component version without layers is that of a single archive
+    (tmp_path / 'cache').mkdir()
+    inputs_hash = archive.inputs_hash()
+    archive.write(str(tmp_path / 'cache' / f'{inputs_hash}.zip'))
+    archive.save_last_build({'inputsHash': inputs_hash, 'version': '1.0.0'})
+    assert last_build_archives(str(tmp_path / 'cache')) ==\
+        (inputs_hash, [str(tmp_path / 'cache' / f'{inputs_hash}.zip')])
+    assert archive_hashes([str(tmp_path / 'cache' / f'{inputs_hash}.zip')]) == ConfigDelta(archive).hashes()
+
+def test_last_build_layers(tmp_path):
+    """ The configuration hashes are read from the cached archives of the layers of the last build """
+    archive = artifacts(tmp_path)
+    (tmp_path / 'artifacts' / 'config' / 'themes').mkdir()
+    (tmp_path / 'artifacts' / 'config' / 'themes' / 'dark.yaml').write_bytes(b'dark: {}\n')
+    layers = ArtifactLayers(str(tmp_path / 'artifacts'), str(tmp_path / 'cache'), {'': str(tmp_path / 'generated')})
+    layers.build(str(tmp_path / 'build'), '1.0.0')
+
+    inputs_hash, archive_files = last_build_archives(str(tmp_path / 'cache'))
+    assert inputs_hash == layers.inputs_hash()
+    assert len(archive_files) == 3
+    assert archive_hashes(archive_files) == ConfigDelta(archive).hashes()
+    assert 'themes/dark.yaml' in archive_hashes(archive_files)
@@ -0,0 +1,45 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the libs.deployment_diff module
+"""
+from libs.deployment_diff import diff_components, format_diff
+
+SECRET_MANAGER = 'aws.greengrass.SecretManager'
+CURRENT = {
+    'Nucleus': {'componentVersion': '2.12.0'},
+    SECRET_MANAGER: {'componentVersion': '2.1.0', 'configurationUpdate': {'merge': '{"cloudSecrets":[{"arn": "a"}]}'}},
+    'Old': {'componentVersion': '1.0.0'}
+}
+
+def test_unchanged():
+    """ Merges are compared as JSON values, so reformatting is not a change """
+    merge = '{ "cloudSecrets" : [ {"arn":"a"} ] }'
+    target = dict(CURRENT, **{SECRET_MANAGER: {'componentVersion': '2.1.0', 'configurationUpdate': {'merge': merge}}})
+    assert not diff_components(CURRENT, target)
+
+def test_changes():
+    """ Added, removed and replaced values are listed, and formatted a line each """
+    target = {
+        'Nucleus': {'componentVersion': '2.13.0'},
+        SECRET_MANAGER: {'componentVersion': '2.1.0',
+                         'configurationUpdate': {'merge': '{"cloudSecrets":[{"arn": "a"}, {"arn": "b"}]}'}},
+        'New': {'componentVersion': '1.0.0'}
+    }
+    changes = diff_components(CURRENT, target)
+
+    assert changes == [
+        {'path': ['New'], 'op': 'add', 'value': {'componentVersion': '1.0.0'}},
+        {'path': ['Nucleus', 'componentVersion'], 'op': 'replace', 'oldValue': '2.12.0', 'value': '2.13.0'},
+        {'path': ['Old'], 'op': 'remove', 'oldValue': {'componentVersion': '1.0.0'}},
+        {'path': [SECRET_MANAGER, 'configurationUpdate', 'merge', 'cloudSecrets'], 'op': 'replace',
+         'oldValue': [{'arn': 'a'}], 'value': [{'arn': 'a'}, {'arn': 'b'}]}
+    ]
+    assert format_diff(changes) == [
+        '+ New: {"componentVersion": "1.0.0"}',
+        '~ Nucleus/componentVersion: "2.12.0" -> "2.13.0"',
+        '- Old: {"componentVersion": "1.0.0"}',
+        f'~ {SECRET_MANAGER}/configurationUpdate/merge/cloudSecrets: '
+        '[{"arn": "a"}] -> [{"arn": "a"}, {"arn": "b"}]'
+    ]
@@ -0,0 +1,109 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the libs.deployment_watcher module
+"""
+import pytest
+from botocore.exceptions import ClientError
+from libs.deployment_watcher import DeploymentWatcher
+
+REGION = 'us-east-1'
+DEPLOYMENT_ID = 'a1b2c3d4-5678-90ab-cdef-EXAMPLE11111'
+CORE_DEVICE_NAME = 'Tool'
+
+@pytest.fixture(name='sleep')
+def fixture_sleep(mocker):
+    """ Don't actually sleep between polls """
+    return mocker.patch('time.sleep')
+
+def add_get_deployment(stubber, status):
+    """ Queue a get_deployment response with the given status """
+    stubber.add_response('get_deployment', {'deploymentId': DEPLOYMENT_ID, 'deploymentStatus': status},
+                         {'deploymentId': DEPLOYMENT_ID})
+
+def add_list_effective_deployments(stubber, status):
+    """ Queue a list_effective_deployments response with the given core device status """
+    effective_deployments = []
+    if status is not None:
+        effective_deployments.append({'deploymentId': DEPLOYMENT_ID, 'deploymentName': 'foo',
+                                      'targetArn': 'bar', 'coreDeviceExecutionStatus': status,
+                                      'creationTimestamp': 0, 'modifiedTimestamp': 0})
+    stubber.add_response('list_effective_deployments', {'effectiveDeployments': effective_deployments},
+                         {'coreDeviceThingName': CORE_DEVICE_NAME})
+
+def test_completes(stubber, sleep):
+    """ Polls until the deployment completes """
+    add_get_deployment(stubber, 'ACTIVE')
+    add_get_deployment(stubber, 'ACTIVE')
+    add_get_deployment(stubber, 'COMPLETED')
+    watcher = DeploymentWatcher(stubber.client)
+    assert watcher.wait(DEPLOYMENT_ID) == 'COMPLETED'
+    assert watcher.api_calls == 3
+    assert sleep.call_count == 2
+
+def test_backs_off_while_unchanged(stubber, sleep, mocker):
+    """ Poll interval grows while nothing changes, capped at the maximum """
+    mocker.patch('random.uniform', return_value=0)
+    for _ in range(5):
+        add_get_deployment(stubber, 'ACTIVE')
+    add_get_deployment(stubber, 'FAILED')
+    mocker.patch.object(DeploymentWatcher, 'BACKOFF_MULTIPLIER', 2)
+    watcher = DeploymentWatcher(stubber.client, poll_interval=2, max_poll_interval=5)
+    assert watcher.wait(DEPLOYMENT_ID) == 'FAILED'
+    # Equal jitter with zero random component sleeps for half of each interval
+    assert [c.args[0] for c in sleep.call_args_list] == [1, 2, 2.5, 2.5, 2.5]
+
+def test_honors_throttling(stubber, sleep, mocker):
+    """ Throttling errors back off to the maximum interval and are retried """
+    mocker.patch('random.uniform', return_value=0)
+    stubber.add_client_error('get_deployment', service_error_code='ThrottlingException', http_status_code=429)
+    add_get_deployment(stubber, 'COMPLETED')
+    watcher = DeploymentWatcher(stubber.client, max_poll_interval=20)
+    assert watcher.wait(DEPLOYMENT_ID) == 'COMPLETED'
+    assert watcher.throttles == 1
+    assert watcher.api_calls == 2
+    sleep.assert_called_once_with(10)
+
+def test_raises_other_errors(stubber, sleep):
+    """ Non-throttling errors are raised to the caller """
+    stubber.add_client_error('get_deployment', service_error_code='ResourceNotFoundException',
+                             http_status_code=404)
+    watcher = DeploymentWatcher(stubber.client)
+    with pytest.raises(ClientError):
+        watcher.wait(DEPLOYMENT_ID)
+    sleep.assert_not_called()
+
+def test_times_out(stubber, sleep, mocker):
+    """ Returns ACTIVE when the timeout expires, never sleeping past the timeout """
+    mocker.patch('time.monotonic', side_effect=[0, 5, 10])
+    mocker.patch('random.uniform', return_value=0)
+    add_get_deployment(stubber, 'ACTIVE')
+    add_get_deployment(stubber, 'ACTIVE')
+    watcher = DeploymentWatcher(stubber.client, poll_interval=30, max_poll_interval=30)
+    assert watcher.wait(DEPLOYMENT_ID, timeout=10) == 'ACTIVE'
+    sleep.assert_called_once_with(5)
+    assert watcher.elapsed == 10
+
+def test_tracks_core_device_success(stubber, sleep):
+    """ Finishes when the tracked core device succeeds, even if the deployment is still ACTIVE """
+    add_get_deployment(stubber, 'ACTIVE')
+    add_list_effective_deployments(stubber, None)
+    add_get_deployment(stubber, 'ACTIVE')
+    add_list_effective_deployments(stubber, 'IN_PROGRESS')
+    add_get_deployment(stubber, 'ACTIVE')
+    add_list_effective_deployments(stubber, 'SUCCEEDED')
+    watcher = DeploymentWatcher(stubber.client)
+    assert watcher.wait(DEPLOYMENT_ID, [CORE_DEVICE_NAME]) == 'COMPLETED'
+    assert watcher.device_statuses == {CORE_DEVICE_NAME: 'SUCCEEDED'}
+    assert watcher.api_calls == 6
+    assert sleep.call_count == 2
+
+def test_tracks_core_device_failure(stubber, sleep):
+    """ Reports failure when a tracked core device fails """
+    add_get_deployment(stubber, 'ACTIVE')
+    add_list_effective_deployments(stubber, 'FAILED')
+    watcher = DeploymentWatcher(stubber.client)
+    assert watcher.wait(DEPLOYMENT_ID, [CORE_DEVICE_NAME]) == 'FAILED'
+    assert watcher.failed_devices() == [CORE_DEVICE_NAME]
+    sleep.assert_not_called()
@@ -0,0 +1,43 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the libs.device_profile module
+"""
+import pytest
+import yaml
+from libs.device_profile import DeviceProfile, PROFILES
+
+COMPOSE = {'version': '3', 'services': {'homeassistant': {'image': 'foo', 'mem_limit': '8g'}}}
+
+@pytest.mark.parametrize('name', list(PROFILES))
+def test_profile_package(name):
+    """ Every profile sets the recorder and logger, and log rotation on the Home Assistant service """
+    profile = DeviceProfile(name)
+    assert set(profile.package()) == {'recorder', 'logger'}
+    assert profile.package()['recorder']['purge_keep_days'] > 0
+    service = profile.apply({'services': {'homeassistant': {'image': 'foo', 'restart': 'always'}}})['services']
+    assert service['homeassistant']['image'] == 'foo'
+    assert service['homeassistant']['logging']['driver'] == 'json-file'
+
+def test_in_memory_profile():
+    """ The in-memory profile keeps the recorder database out of flash """
+    assert DeviceProfile('in-memory').package()['recorder']['db_url'] == 'sqlite:///:memory:'
+
+def test_unknown_profile():
+    """ An unknown profile is rejected """
+    with pytest.raises(KeyError):
+        DeviceProfile('turbo')
+
+def test_package_text():
+    """ The package text is marked as generated, and holds the package """
+    package_text = DeviceProfile('low-flash-wear').package_text()
+    assert package_text.startswith('# Generated by gdk_build.py from the low-flash-wear device profile')
+    assert yaml.safe_load(package_text) == DeviceProfile('low-flash-wear').package()
+
+def test_apply_replaces_limits():
+    """ The profile's limits replace those of the compose file, in a file format that Docker Compose 1.x accepts """
+    compose = DeviceProfile('low-flash-wear').apply(yaml.safe_load(yaml.safe_dump(COMPOSE)))
+    assert compose['version'] == '2.4'
+    assert compose['services']['homeassistant']['mem_limit'] == '1g'
+    assert compose['services']['homeassistant']['cpus'] == 2
@@ -0,0 +1,62 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Property-based tests for the libs.envelope module
+"""
+import io
+import json
+from hypothesis import given, settings, strategies as st
+from artifacts.envelope import unpack
+from libs.envelope import Envelope, COMPRESSION_NONE, COMPRESSION_ZLIB
+
+# Filenames are relative paths, possibly in subdirectories, with awkward characters
+FILENAME = st.lists(st.text(st.characters(blacklist_categories=['Cs'], blacklist_characters='/\x00'),
+                            min_size=1, max_size=12).filter(lambda part: part not in ['.', '..']),
+                    min_size=1, max_size=3).map('/'.join)
+
+# Text with quotes, backslashes, tabs, control characters and non-ASCII, as well as arbitrary bytes
+TEXT = st.text(st.characters(blacklist_categories=['Cs'])).map(lambda text: text.encode('utf-8'))
+DATA = st.one_of(TEXT, st.binary(max_size=2048), st.sampled_from([b'"\\\t\r\n\x00\x1f\x7f', b'\\u0000']))
+MODE = st.one_of(st.none(), st.integers(min_value=0, max_value=0o777))
+FILES = st.dictionaries(FILENAME, st.tuples(DATA, MODE), max_size=8)
+
+def build(files, compression):
+    """ Build an envelope of the given files """
+    envelope = Envelope(compression)
+    for filename, (data, mode) in files.items():
+        envelope.add(filename, data, mode)
+    return envelope
+
+@settings(max_examples=200)
+@given(files=FILES, compression=st.sampled_from([COMPRESSION_NONE, COMPRESSION_ZLIB]))
+def test_round_trip(files, compression):
+    """ Any files survive serialization and unpacking unchanged """
+    secret_string = build(files, compression).to_json()
+    unpacked, modes = unpack(json.loads(secret_string))
+    assert unpacked == {filename: data for filename, (data, _) in files.items()}
+    assert modes == {filename: mode for filename, (_, mode) in files.items() if mode is not None}
+
+@given(files=FILES)
+def test_streamed_json_matches(files):
+    """ The streamed JSON is identical to the JSON string, and its size is measured in UTF-8 bytes """
+    envelope = build(files, COMPRESSION_ZLIB)
+    stream = io.StringIO()
+    envelope.write(stream)
+    assert stream.getvalue() == envelope.to_json()
+    assert envelope.size() == len(envelope.to_json().encode('utf-8'))
+
+@given(data=DATA)
+def test_compression_never_grows(data):
+    """ Compression is only used when it makes the stored file smaller """
+    compressed = build({'a': (data, None)}, COMPRESSION_ZLIB)
+    uncompressed = build({'a': (data, None)}, COMPRESSION_NONE)
+    assert compressed.size() <= uncompressed.size()
+
+def test_serialization_is_cached_until_add():
+    """ The JSON is serialized once, and again only after a file is added """
+    envelope = build({'a': (b'a', None)}, COMPRESSION_NONE)
+    assert envelope.to_json() is envelope.to_json()
+    first = envelope.to_json()
+    envelope.add('b', b'b')
+    assert envelope.to_json() != first
@@ -0,0 +1,114 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the libs.fleet module
+"""
+import threading
+import boto3
+from botocore.stub import Stubber
+from libs.deployer import DeploymentError
+from libs.fleet import FleetRollout, RateLimiter
+
+THING_NAMES = [f'core-{i}' for i in range(10)]
+
+def fake_deploy(failing=()):
+    """ Deploy callable that fails for chosen core devices, recording the calls """
+    calls = []
+    lock = threading.Lock()
+
+    def deploy(thing_name):
+        with lock:
+            calls.append(thing_name)
+        if thing_name in failing:
+            raise DeploymentError('Deployment error: FAILED')
+        return {'deploymentId': f'id-{thing_name}'}
+
+    deploy.calls = calls
+    return deploy
+
+def test_stages():
+    """ Splits into a canary stage and waves """
+    stages = FleetRollout.stages(THING_NAMES, 1, 4)
+    assert stages == [('canary', ['core-0']), ('wave 1', THING_NAMES[1:5]),
+                      ('wave 2', THING_NAMES[5:9]), ('wave 3', ['core-9'])]
+
+def test_stages_single_wave():
+    """ Without a wave size, everything after the canary is one wave """
+    assert FleetRollout.stages(THING_NAMES, 0, 0) == [('wave 1', THING_NAMES)]
+
+def test_all_succeed():
+    """ Every core device is deployed to, with results in the order given """
+    deploy = fake_deploy()
+    rollout = FleetRollout(deploy, concurrency=4)
+    results = rollout.run(THING_NAMES, 2, 3)
+    assert sorted(deploy.calls) == sorted(THING_NAMES)
+    assert [result['thingName'] for result in results] == THING_NAMES
+    assert all(result['status'] == 'SUCCEEDED' for result in results)
+    assert results[0]['deploymentId'] == 'id-core-0'
+    assert rollout.summary()['counts'] == {'SUCCEEDED': 10}
+    assert not rollout.tripped
+
+def test_canary_failure_stops_rollout():
+    """ A failed canary skips every wave """
+    deploy = fake_deploy(failing=['core-0'])
+    rollout = FleetRollout(deploy)
+    results = rollout.run(THING_NAMES, 1, 5)
+    assert deploy.calls == ['core-0']
+    assert results[0]['status'] == 'FAILED'
+    assert results[0]['error'] == 'Deployment error: FAILED'
+    assert all(result['status'] == 'SKIPPED' for result in results[1:])
+    assert rollout.tripped
+
+def test_failure_rate_trips_circuit_breaker():
+    """ Failures beyond the maximum failure rate skip the remaining waves """
+    deploy = fake_deploy(failing=['core-0', 'core-1'])
+    rollout = FleetRollout(deploy, concurrency=1, max_failure_rate=0.3)
+    results = rollout.run(THING_NAMES, 0, 5)
+    assert rollout.tripped
+    assert deploy.calls == THING_NAMES[:5]
+    assert [result['status'] for result in results[5:]] == ['SKIPPED'] * 5
+    assert rollout.summary()['counts'] == {'FAILED': 2, 'SUCCEEDED': 3, 'SKIPPED': 5}
+
+def test_failure_within_budget_continues():
+    """ Failures within the maximum failure rate do not stop the rollout """
+    deploy = fake_deploy(failing=['core-3'])
+    rollout = FleetRollout(deploy, concurrency=1, max_failure_rate=0.2)
+    rollout.run(THING_NAMES, 0, 5)
+    assert not rollout.tripped
+    assert len(deploy.calls) == 10
+    assert rollout.failed() == ['core-3']
+    assert rollout.summary()['failureRate'] == 0.1
+
+def test_circuit_breaker_cancels_pending(mocker):
+    """ Deployments that have not started when the breaker opens are skipped """
+    deploy = fake_deploy(failing=THING_NAMES)
+    rollout = FleetRollout(deploy, concurrency=1, max_failure_rate=0.0)
+    mocker.patch('builtins.print')
+    results = rollout.run(THING_NAMES, 0, 0)
+    assert rollout.tripped
+    assert len(deploy.calls) < len(THING_NAMES)
+    assert results[-1]['status'] == 'SKIPPED'
+
+def test_rate_limiter_waits_for_tokens(mocker):
+    """ Calls beyond the burst wait for the bucket to refill """
+    mocker.patch('time.monotonic', return_value=0)
+    sleep = mocker.patch('time.sleep', side_effect=lambda seconds: setattr(rate_limiter, 'tokens', 1))
+    rate_limiter = RateLimiter(2)
+    for _ in range(3):
+        rate_limiter.acquire()
+    sleep.assert_called_once_with(0.5)
+
+def test_rate_limiter_attaches_to_client(mocker):
+    """ Every API call of an attached client takes a token """
+    client = boto3.client('greengrassv2', region_name='us-east-1',
+                          aws_access_key_id='testing', aws_secret_access_key='testing')
+    rate_limiter = RateLimiter(100)
+    acquire = mocker.patch.object(rate_limiter, 'acquire')
+    rate_limiter.attach(client)
+    with Stubber(client) as stubber:
+        stubber.add_response('list_deployments', {'deployments': []})
+        stubber.add_response('list_deployments', {'deployments': []})
+        client.list_deployments()
+        client.list_deployments()
+    assert acquire.call_count == 2
@@ -43,3 +43,17 @@ def test_config_loads(mocker):
     assert gdk_config.name() == NAME
     assert gdk_config.version() == VERSION
     assert gdk_config.region() == REGION
+
+def test_config_regions(mocker):
+    """ Confirm that the replica regions exclude the primary region, and that a copy can target another region """
+    contents = CONTENTS.replace('"region": "' + REGION + '"', '"region": "' + REGION + '", "regions": ["' + REGION +
+                                '", "mars", "venus", "mars"]')
+    mocker.patch('builtins.open', mocker.mock_open(read_data=contents))
+
+    gdk_config = GdkConfig()
+
+    assert gdk_config.bucket() == 'blah'
+    assert gdk_config.replica_regions() == ['mars', 'venus']
+    assert gdk_config.for_region('mars').region() == 'mars'
+    assert gdk_config.for_region('mars').replica_regions() == [REGION, 'venus']
+    assert gdk_config.region() == REGION
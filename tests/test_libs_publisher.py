@@ -0,0 +1,85 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the libs.publisher module
+"""
+import pytest
+from botocore.exceptions import ClientError
+from libs.aws import aws_clients
+from libs.archive import file_hash
+from libs.publisher import Publisher, PublishError
+
+RECIPE = 'ComponentVersion: "1.0.0"\n- Uri: s3://BUCKET_NAME/layers/home-assistant-runtime-abc.zip\n' +\
+    '- Uri: s3://BUCKET_NAME/layers/home-assistant-config-def.zip\n'
+
+@pytest.fixture(name='boto3_client')
+def fixture_boto3_client(mocker):
+    """ Mocked boto3 client object, with a mocked GDK configuration """
+    aws_clients.reset()
+    boto3_client = mocker.patch('boto3.client')
+    boto3_client.return_value = boto3_client
+    boto3_client.create_component_version.return_value = {'arn': 'arn:component', 'status': {
+        'componentState': 'DEPLOYABLE'}}
+    yield boto3_client
+    aws_clients.reset()
+
+def publisher(mocker):
+    """ A publisher to eu-west-1 """
+    gdk_config = mocker.Mock(**{'bucket.return_value': 'bucket'})
+    return Publisher(gdk_config, 'eu-west-1', '000011112222')
+
+@pytest.fixture(name='files')
+def fixture_files(tmp_path):
+    """ A recipe and the directory of its layer archives """
+    (tmp_path / 'recipe.yaml').write_text(RECIPE, encoding='utf-8')
+    (tmp_path / 'build').mkdir()
+    (tmp_path / 'build' / 'home-assistant-runtime-abc.zip').write_bytes(b'runtime')
+    (tmp_path / 'build' / 'home-assistant-config-def.zip').write_bytes(b'config')
+    return str(tmp_path / 'recipe.yaml'), str(tmp_path / 'build')
+
+def client_error(code):
+    """ A client error with the given code """
+    return ClientError({'Error': {'Code': code}}, 'operation')
+
+def test_publish_new_bucket(mocker, boto3_client, files):
+    """ The bucket is created, the layers uploaded and the component version created with the bucket name """
+    boto3_client.head_object.side_effect = client_error('404')
+    boto3_client.head_bucket.side_effect = [client_error('404'), {}]
+
+    result = publisher(mocker).publish(*files)
+
+    assert result['status'] == 'DEPLOYABLE'
+    assert result['uploaded'] == 2 and result['artifacts'] == 2
+    boto3_client.create_bucket.assert_called_once_with(
+        Bucket='bucket-eu-west-1-000011112222', CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+    runtime_file = f'{files[1]}/home-assistant-runtime-abc.zip'
+    boto3_client.upload_file.assert_any_call(runtime_file, 'bucket-eu-west-1-000011112222',
+                                             'layers/home-assistant-runtime-abc.zip',
+                                             ExtraArgs={'Metadata': {'sha256': file_hash(runtime_file)}})
+    recipe = boto3_client.create_component_version.call_args.kwargs['inlineRecipe'].decode('utf-8')
+    assert 's3://bucket-eu-west-1-000011112222/layers/home-assistant-config-def.zip' in recipe
+
+def test_publish_existing(mocker, boto3_client, files):
+    """ A layer already in the bucket is not uploaded again, and an existing component version is left as is """
+    runtime_hash = file_hash(f'{files[1]}/home-assistant-runtime-abc.zip')
+    boto3_client.head_object.side_effect = lambda Bucket, Key: {'Metadata': {'sha256': runtime_hash if 'runtime' in Key
+                                                                             else 'other'}}
+    boto3_client.create_component_version.side_effect = client_error('ConflictException')
+
+    result = publisher(mocker).publish(*files)
+
+    assert result['status'] == 'EXISTS'
+    assert result['uploaded'] == 1
+    boto3_client.upload_file.assert_called_once()
+    assert boto3_client.upload_file.call_args.args[2] == 'layers/home-assistant-config-def.zip'
+
+def test_publish_failures(mocker, boto3_client, files, tmp_path):
+    """ A recipe without a version, or a rejected component version, fails to publish """
+    (tmp_path / 'next.yaml').write_text(RECIPE.replace('1.0.0', 'COMPONENT_VERSION'), encoding='utf-8')
+    with pytest.raises(PublishError):
+        publisher(mocker).publish(str(tmp_path / 'next.yaml'), files[1])
+
+    boto3_client.create_component_version.side_effect = client_error('ValidationException')
+    with pytest.raises(PublishError):
+        publisher(mocker).publish(*files)
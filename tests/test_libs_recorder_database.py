@@ -0,0 +1,44 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the libs.recorder_database module
+"""
+import pytest
+import yaml
+from libs.recorder_database import RecorderDatabase, ENGINES, SERVICE_NAME, VOLUME_NAME
+
+COMPOSE = {'version': '3', 'services': {'homeassistant': {'image': 'foo', 'network_mode': 'host'}}}
+
+@pytest.mark.parametrize('engine', list(ENGINES))
+def test_apply(engine):
+    """ The database service and its volume are added, and Home Assistant starts once the database is healthy """
+    compose = RecorderDatabase(engine).apply(yaml.safe_load(yaml.safe_dump(COMPOSE)))
+    service = compose['services'][SERVICE_NAME]
+    assert service['image'] == ENGINES[engine]['image']
+    assert service['network_mode'] == 'host'
+    assert service['env_file'] == ['config/recorder_database.env']
+    assert service['volumes'][0].startswith(VOLUME_NAME + ':/var/lib/')
+    assert compose['volumes'] == {VOLUME_NAME: {}}
+    assert compose['services']['homeassistant']['depends_on'] == {SERVICE_NAME: {'condition': 'service_healthy'}}
+    assert compose['version'] == '2.4'
+
+def test_package_text():
+    """ The recorder reads its database URL from secrets.yaml """
+    package_text = RecorderDatabase('mariadb').package_text()
+    assert package_text.startswith('# Generated by gdk_build.py for the mariadb recorder database')
+    assert 'recorder:\n  db_url: !secret recorder_db_url\n' in package_text
+
+def test_check_secrets(tmp_path):
+    """ Missing credentials are reported """
+    recorder_database = RecorderDatabase('postgresql')
+    problems = recorder_database.check_secrets(str(tmp_path))
+    assert len(problems) == 2
+    assert 'recorder_database.env does not exist' in problems[0]
+    assert 'postgresql://' in problems[1]
+
+    (tmp_path / 'recorder_database.env').write_text('POSTGRES_DB=ha\nPOSTGRES_USER=ha\n', encoding='utf-8')
+    (tmp_path / 'secrets.yaml').write_text('recorder_db_url: postgresql://ha:x@127.0.0.1/ha\n', encoding='utf-8')
+    assert recorder_database.check_secrets(str(tmp_path)) == [
+        f'{tmp_path / "recorder_database.env"} does not set POSTGRES_PASSWORD'
+    ]
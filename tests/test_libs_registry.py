@@ -0,0 +1,129 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the libs.registry module, against a local stand-in for a registry
+"""
+import hashlib
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from libs.registry import RegistryError, RegistryResolver, parse_image_reference, pin
+
+TOKEN = 'letmein'
+INDEX = {
+    'schemaVersion': 2,
+    'mediaType': 'application/vnd.oci.image.index.v1+json',
+    'manifests': [
+        {'digest': 'sha256:amd64', 'platform': {'os': 'linux', 'architecture': 'amd64'}},
+        {'digest': 'sha256:arm64', 'platform': {'os': 'linux', 'architecture': 'arm64', 'variant': 'v8'}},
+        {'digest': 'sha256:attestation', 'platform': {'os': 'unknown', 'architecture': 'unknown'}}
+    ]
+}
+MANIFEST = {'schemaVersion': 2, 'mediaType': 'application/vnd.oci.image.manifest.v1+json', 'layers': []}
+
+class Registry(BaseHTTPRequestHandler):
+    """ Serves manifests to anonymous bearer token holders, like Docker Hub """
+
+    manifests = {}
+    digests = {}
+    token_requests = []
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """ Serves a token or a manifest """
+        url = urllib.parse.urlparse(self.path)
+
+        if url.path == '/token':
+            self.token_requests.append(dict(urllib.parse.parse_qsl(url.query)))
+            self.respond(200, json.dumps({'token': TOKEN}).encode('utf-8'))
+        elif self.headers.get('Authorization') != f'Bearer {TOKEN}':
+            realm = f'http://{self.server.server_address[0]}:{self.server.server_address[1]}/token'
+            repository = url.path[len('/v2/'):url.path.rfind('/manifests/')]
+            self.respond(401, b'', {'WWW-Authenticate': f'Bearer realm="{realm}",service="registry",'
+                                                        f'scope="repository:{repository}:pull"'})
+        elif url.path in self.manifests:
+            body = json.dumps(self.manifests[url.path]).encode('utf-8')
+            digest = self.digests.get(url.path, 'sha256:' + hashlib.sha256(body).hexdigest())
+            self.respond(200, body, {'Docker-Content-Digest': digest})
+        else:
+            self.respond(404, b'')
+
+    def respond(self, code, body, headers=None):
+        """ Sends a response """
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """ Keeps the test output quiet """
+
+@pytest.fixture(name='registry')
+def fixture_registry():
+    """ Runs a local registry, and gets a resolver that resolves Docker Hub images against it """
+    Registry.manifests = {'/v2/library/nginx/manifests/stable': INDEX, '/v2/foo/bar/manifests/1.0': MANIFEST}
+    Registry.digests = {}
+    Registry.token_requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Registry)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+
+    yield RegistryResolver({'registry-1.docker.io': f'http://127.0.0.1:{server.server_address[1]}'})
+
+    server.shutdown()
+    server.server_close()
+
+def test_resolve_index(registry):
+    """ A multi-architecture image resolves to the digest of its index, and the digest of each platform """
+    image = registry.resolve('nginx:stable')
+
+    assert image['digest'] == 'sha256:' + hashlib.sha256(json.dumps(INDEX).encode('utf-8')).hexdigest()
+    assert image['platforms'] == {'linux/amd64': 'sha256:amd64', 'linux/arm64/v8': 'sha256:arm64'}
+    assert Registry.token_requests == [{'service': 'registry', 'scope': 'repository:library/nginx:pull'}]
+
+def test_resolve_manifest(registry):
+    """ A single-architecture image resolves to the digest of its manifest """
+    image = registry.resolve('foo/bar:1.0')
+
+    assert image['digest'] == 'sha256:' + hashlib.sha256(json.dumps(MANIFEST).encode('utf-8')).hexdigest()
+    assert image['platforms'] == {}
+
+def test_resolve_digest_mismatch(registry):
+    """ A manifest that does not match the digest the registry claims for it is rejected """
+    Registry.digests['/v2/foo/bar/manifests/1.0'] = 'sha256:other'
+
+    with pytest.raises(RegistryError, match='does not match'):
+        registry.resolve('foo/bar:1.0')
+
+def test_resolve_unknown_tag(registry):
+    """ A tag that the registry does not have can't be resolved """
+    with pytest.raises(RegistryError, match='HTTP 404'):
+        registry.resolve('foo/bar:2.0')
+
+def test_resolve_unreachable():
+    """ An unreachable registry can't resolve anything """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Registry)
+    port = server.server_address[1]
+    server.server_close()
+
+    with pytest.raises(RegistryError):
+        RegistryResolver({'localhost:5000': f'http://127.0.0.1:{port}'}, timeout=1).resolve('localhost:5000/foo')
+
+@pytest.mark.parametrize('image, reference', [
+    ('nginx', ('registry-1.docker.io', 'library/nginx', 'latest')),
+    ('homeassistant/home-assistant:2025.1.0', ('registry-1.docker.io', 'homeassistant/home-assistant', '2025.1.0')),
+    ('ghcr.io/home-assistant/home-assistant:stable', ('ghcr.io', 'home-assistant/home-assistant', 'stable')),
+    ('localhost:5000/foo', ('localhost:5000', 'foo', 'latest')),
+    ('localhost/foo:1.0', ('localhost', 'foo', '1.0'))
+])
+def test_parse_image_reference(image, reference):
+    """ Image references are split into registry, repository and tag, with the Docker Hub defaults """
+    assert parse_image_reference(image) == reference
+
+def test_pin():
+    """ Pinning an image replaces its tag with the digest """
+    assert pin('homeassistant/home-assistant:stable', 'sha256:abc') == 'homeassistant/home-assistant@sha256:abc'
+    assert pin('localhost:5000/foo', 'sha256:abc') == 'localhost:5000/foo@sha256:abc'
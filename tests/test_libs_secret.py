@@ -4,9 +4,13 @@
 """
 Unit tests for the libs.secret module
 """
-from unittest.mock import Mock
+from unittest.mock import Mock, call
+import json
+import time
 import pytest
-from libs.secret import Secret
+from botocore.exceptions import ClientError
+from artifacts.envelope import reassemble
+from libs.secret import Secret, secret_arns
 
 SECRET_STRING = 'foobar'
 REGION ='us-east-1'
@@ -21,8 +25,10 @@ def fixture_boto3_client(mocker):
 
 @pytest.fixture(name="secret")
 def fixture_secret():
-    """ Instantiates a Secret object """
-    return Secret(REGION)
+    """ Instantiates a Secret object, for a secret that exists and is not sharded """
+    secret = Secret(REGION)
+    secret.secretsmanager_client.describe_secret = Mock(return_value={'Name': Secret.SECRET_NAME})
+    return secret
 
 def test_secret_get_success(secret):
     """ Get should succeed if there's a secret """
@@ -39,52 +45,66 @@ def test_secret_get_fail(secret):
         secret.get()
     secret.secretsmanager_client.get_secret_value.assert_called_once()
 
+def test_secret_current_version_id(secret):
+    """ The current version ID is got from the version stages, without getting the secret value """
+    secret.secretsmanager_client.describe_secret = Mock(return_value={'VersionIdsToStages': {
+        'old': ['AWSPREVIOUS'], 'new': ['AWSCURRENT']}})
+    assert secret.current_version_id() == 'new'
+    secret.secretsmanager_client.describe_secret.assert_called_once_with(SecretId=secret.SECRET_NAME)
+
+def not_found_error(operation_name):
+    """ Creates a Secrets Manager "resource not found" error """
+    return ClientError({'Error': {'Code': 'ResourceNotFoundException', 'Message': 'mocked error'}}, operation_name)
+
+UNSHARDED_TAGS = [{'Key': Secret.SHARD_COUNT_TAG, 'Value': '0'}, {'Key': Secret.RETIRED_SHARDS_TAG, 'Value': ''}]
+
 def test_secret_put_create_success(secret):
     """ Put should succeed, with no exception generated """
-    secret_list = {'SecretList': []}
-    secret.secretsmanager_client.list_secrets = Mock(return_value = secret_list)
+    secret.secretsmanager_client.describe_secret = Mock(side_effect = not_found_error('DescribeSecret'))
+    secret.secretsmanager_client.update_secret = Mock()
     expected_response = {'ARN': 'mocked_arn'}
     secret.secretsmanager_client.create_secret = Mock(return_value = expected_response)
     response = secret.put(SECRET_STRING)
+    secret.secretsmanager_client.update_secret.assert_not_called()
     secret.secretsmanager_client.create_secret.assert_called_once_with(
         Name=secret.SECRET_NAME,
         SecretString=SECRET_STRING,
-        Description=secret.SECRET_DESCRIPTION
+        Description=secret.SECRET_DESCRIPTION,
+        Tags=UNSHARDED_TAGS
     )
     assert response == expected_response
 
 def test_secret_put_create_fail(secret):
     """ Put should fail, if the create gets an exception """
-    secret_list = {'SecretList': []}
-    secret.secretsmanager_client.list_secrets = Mock(return_value = secret_list)
+    secret.secretsmanager_client.describe_secret = Mock(side_effect = not_found_error('DescribeSecret'))
     secret.secretsmanager_client.create_secret = Mock(side_effect = Exception('mocked error'))
     with pytest.raises(Exception):
         secret.put(SECRET_STRING)
     secret.secretsmanager_client.create_secret.assert_called_once_with(
         Name=secret.SECRET_NAME,
         SecretString=SECRET_STRING,
-        Description=secret.SECRET_DESCRIPTION
+        Description=secret.SECRET_DESCRIPTION,
+        Tags=UNSHARDED_TAGS
     )
 
 def test_secret_put_update_success(secret):
     """ Put should succeed, with no exception generated """
-    secret_list = {'SecretList': [{'Name': secret.SECRET_NAME}]}
-    secret.secretsmanager_client.list_secrets = Mock(return_value = secret_list)
     expected_response = {'ARN': 'mocked_arn'}
     secret.secretsmanager_client.update_secret = Mock(return_value = expected_response)
+    secret.secretsmanager_client.create_secret = Mock()
     response = secret.put(SECRET_STRING)
     secret.secretsmanager_client.update_secret.assert_called_once_with(
         SecretId=secret.SECRET_NAME,
         SecretString=SECRET_STRING,
         Description=secret.SECRET_DESCRIPTION
     )
+    secret.secretsmanager_client.create_secret.assert_not_called()
     assert response == expected_response
 
 def test_secret_put_update_fail(secret):
-    """ Put should fail, if the update gets an exception """
-    secret_list = {'SecretList': [{'Name': secret.SECRET_NAME}]}
-    secret.secretsmanager_client.list_secrets = Mock(return_value = secret_list)
+    """ Put should fail, if the update gets an exception other than not found """
     secret.secretsmanager_client.update_secret = Mock(side_effect = Exception('mocked error'))
+    secret.secretsmanager_client.create_secret = Mock()
     with pytest.raises(Exception):
         secret.put(SECRET_STRING)
     secret.secretsmanager_client.update_secret.assert_called_once_with(
@@ -92,21 +112,233 @@ def test_secret_put_update_fail(secret):
         SecretString=SECRET_STRING,
         Description=secret.SECRET_DESCRIPTION
     )
+    secret.secretsmanager_client.create_secret.assert_not_called()
 
 def test_secret_exists_success(secret):
     """ Returns true if a secret exists """
-    secret_list = {'SecretList': [{'Name': secret.SECRET_NAME}]}
-    secret.secretsmanager_client.list_secrets = Mock(return_value = secret_list)
+    secret.secretsmanager_client.describe_secret = Mock(return_value = {'Name': secret.SECRET_NAME})
     assert secret.exists()
+    secret.secretsmanager_client.describe_secret.assert_called_once_with(SecretId=secret.SECRET_NAME)
 
-def test_secret_exists_fail_no_secrets(secret):
-    """ Returns false if there are no secrets """
-    secret_list = {'SecretList': []}
-    secret.secretsmanager_client.list_secrets = Mock(return_value = secret_list)
+def test_secret_exists_fail_missing_secret(secret):
+    """ Returns false if the secret is not found """
+    secret.secretsmanager_client.describe_secret = Mock(side_effect = not_found_error('DescribeSecret'))
     assert not secret.exists()
 
-def test_secret_exists_fail_missing_secret(secret):
-    """ Returns false if there are secrets, but not ours """
-    secret_list = {'SecretList': [{'Name': 'foobar'}]}
-    secret.secretsmanager_client.list_secrets = Mock(return_value = secret_list)
+def test_secret_exists_error(secret):
+    """ Raises other errors, such as access denied """
+    secret.secretsmanager_client.describe_secret = Mock(side_effect = Exception('mocked error'))
+    with pytest.raises(Exception):
+        secret.exists()
+
+def test_secret_put_too_large(secret):
+    """ Put should fail before any API call if the secret exceeds the size limit of all the shards """
+    secret.secretsmanager_client.update_secret = Mock()
+    with pytest.raises(ValueError):
+        secret.put('x' * (Secret.MAX_SIZE + 1))
+    secret.secretsmanager_client.update_secret.assert_not_called()
+
+def test_secret_put_sharded(secret):
+    """ A secret larger than the Secrets Manager limit is put as shards, with an index in the main secret """
+    client = ManySecretsClient(0)
+    secret.secretsmanager_client = client
+    secret_string = json.dumps({'files': 'é' * 70000}, ensure_ascii=False)
+
+    secret.put(secret_string)
+
+    index = json.loads(client.secrets[Secret.SECRET_NAME])
+    assert [shard['name'] for shard in index['shards']] == [Secret.SHARD_NAME_FORMAT.format(i) for i in range(3)]
+    shard_strings = [client.secrets[shard['name']] for shard in index['shards']]
+    assert all(len(shard_string.encode('utf-8')) <= 65536 for shard_string in shard_strings)
+    assert reassemble(index, shard_strings) == json.loads(secret_string)
+    assert secret_arns({'ARN': 'main', 'SecretString': client.secrets[Secret.SECRET_NAME]}) ==\
+        ['main'] + [Secret.SHARD_NAME_FORMAT.format(i) for i in range(3)]
+
+def test_secret_put_shrinks(secret):
+    """ Shards a smaller configuration stops using are kept until the next update, then scheduled for deletion """
+    client = ManySecretsClient(0)
+    secret.secretsmanager_client = client
+    secret.put('x' * 150000)
+    secret.put('x' * 70000)
+    assert not client.deleted
+    assert secret.get_tags() == {Secret.SHARD_COUNT_TAG: '2', Secret.RETIRED_SHARDS_TAG: '2'}
+
+    secret.put(SECRET_STRING)
+    assert sorted(client.deleted) == [Secret.SHARD_NAME_FORMAT.format(2)]
+    assert client.secrets[Secret.SECRET_NAME] == SECRET_STRING
+    secret.put(SECRET_STRING)
+    assert sorted(client.deleted) == [Secret.SHARD_NAME_FORMAT.format(i) for i in range(3)]
+    assert secret.get_tags() == {Secret.SHARD_COUNT_TAG: '0', Secret.RETIRED_SHARDS_TAG: ''}
+
+    # A configuration that grows again restores the shards it needs
+    secret.put('x' * 70000)
+    assert sorted(client.deleted) == [Secret.SHARD_NAME_FORMAT.format(2)]
+    assert len(json.loads(client.secrets[Secret.SECRET_NAME])['shards']) == 2
+
+def test_secret_put_shrinks_old_index_reader(secret):
+    """ A reader still holding the index from before a shrink can get every shard it lists """
+    client = ManySecretsClient(0)
+    secret.secretsmanager_client = client
+    old_secret_string = json.dumps({'files': {'configuration.yaml': 'x' * 150000}})
+    secret.put(old_secret_string)
+    old_index = json.loads(client.secrets[Secret.SECRET_NAME])
+    secret.put(SECRET_STRING)
+
+    shard_strings = [client.secrets[shard['name']] for shard in old_index['shards']]
+    assert reassemble(old_index, shard_strings) == json.loads(old_secret_string)
+
+def test_secret_put_shrinks_replicated(secret):
+    """ The replicas of a retired shard are removed before it is deleted, and a failure is only a warning """
+    client = Mock()
+    client.describe_secret.return_value = {'ReplicationStatus': [{'Region': 'eu-west-1'}],
+                                           'Tags': [{'Key': Secret.SHARD_COUNT_TAG, 'Value': '0'},
+                                                    {'Key': Secret.RETIRED_SHARDS_TAG, 'Value': '0'}]}
+    client.delete_secret.side_effect = Exception('mocked error')
+    secret.secretsmanager_client = client
+    secret.put(SECRET_STRING)
+
+    client.remove_regions_from_replication.assert_called_once_with(SecretId=Secret.SHARD_NAME_FORMAT.format(0),
+                                                                   RemoveReplicaRegions=['eu-west-1'])
+    client.delete_secret.assert_called_once_with(SecretId=Secret.SHARD_NAME_FORMAT.format(0),
+                                                 RecoveryWindowInDays=Secret.SHARD_RECOVERY_WINDOW_DAYS)
+    client.tag_resource.assert_called_once_with(SecretId=Secret.SECRET_NAME, Tags=UNSHARDED_TAGS)
+
+def test_secret_put_shard_fail(secret):
+    """ Put should fail, without writing the index, if a shard cannot be put """
+    secret.secretsmanager_client.update_secret = Mock(side_effect = Exception('mocked error'))
+    with pytest.raises(Exception):
+        secret.put('x' * 70000)
+    for update in secret.secretsmanager_client.update_secret.call_args_list:
+        assert update.kwargs['SecretId'] != Secret.SECRET_NAME
+
+def test_secret_replicate(secret):
+    """ The secret and its shards are replicated to the regions that lack a replica """
+    index = {'shardedVersion': 1, 'sha256': 'x', 'shards': [{'arn': 'shard-0'}]}
+    client = secret.secretsmanager_client
+    client.get_secret_value = Mock(return_value={'ARN': 'main', 'SecretString': json.dumps(index)})
+    client.describe_secret = Mock(side_effect=[{'ReplicationStatus': [{'Region': 'eu-west-1'}]}, {}])
+    client.replicate_secret_to_regions = Mock()
+
+    secret.replicate(['eu-west-1', 'ap-south-1'])
+
+    assert client.replicate_secret_to_regions.call_args_list == [
+        call(SecretId='main', AddReplicaRegions=[{'Region': 'ap-south-1'}]),
+        call(SecretId='shard-0', AddReplicaRegions=[{'Region': 'eu-west-1'}, {'Region': 'ap-south-1'}])]
+
+    client.describe_secret = Mock(side_effect=Exception('mocked error'))
+    with pytest.raises(Exception):
+        secret.replicate(['eu-west-1'])
+
+@pytest.mark.parametrize('secret_string', ['a' * 10, 'a' * 9 + '€', '€' * 7, '𝄞é' * 5])
+def test_secret_split(secret_string):
+    """ Splitting never exceeds the limit, nor breaks a multi-byte character """
+    chunks = Secret.split(secret_string, 4)
+    assert ''.join(chunks) == secret_string
+    assert all(0 < len(chunk.encode('utf-8')) <= 4 for chunk in chunks)
+
+def test_secret_arns_replica():
+    """ The shards listed by a replica of a sharded index are in the region of the replica """
+    arn_format = 'arn:aws:secretsmanager:{}:000011112222:secret:{}-AbCdEf'
+    index = {'shardedVersion': 1, 'sha256': 'x',
+             'shards': [{'arn': arn_format.format('us-east-1', Secret.SHARD_NAME_FORMAT.format(i))} for i in range(2)]}
+    replica_arn = arn_format.format('eu-west-1', Secret.SECRET_NAME)
+    assert secret_arns({'ARN': replica_arn, 'SecretString': json.dumps(index)}) ==\
+        [replica_arn] + [arn_format.format('eu-west-1', Secret.SHARD_NAME_FORMAT.format(i)) for i in range(2)]
+
+def test_secret_arns_unsharded():
+    """ An unsharded secret has only its own ARN """
+    assert secret_arns({'ARN': 'main', 'SecretString': '{"envelopeVersion": 1, "files": {}}'}) == ['main']
+    assert secret_arns({'ARN': 'main', 'SecretString': 'not json'}) == ['main']
+
+class ManySecretsClient():
+    """ Stubbed Secrets Manager client holding thousands of secrets, counting API calls """
+
+    PAGE_SIZE = 100
+
+    def __init__(self, count):
+        self.secrets = {f'secret-{i}': 'foo' for i in range(count)}
+        self.deleted = {}
+        self.tags = {}
+        self.calls = 0
+
+    def list_secrets(self, **kwargs):
+        """ Lists one page of secrets """
+        self.calls += 1
+        names = list(self.secrets)
+        start = int(kwargs.get('NextToken', 0))
+        response = {'SecretList': [{'Name': name} for name in names[start:start + self.PAGE_SIZE]]}
+        if start + self.PAGE_SIZE < len(names):
+            response['NextToken'] = str(start + self.PAGE_SIZE)
+        return response
+
+    def describe_secret(self, SecretId):
+        """ Describes one secret """
+        self.calls += 1
+        if SecretId not in self.secrets and SecretId not in self.deleted:
+            raise not_found_error('DescribeSecret')
+        return {'Name': SecretId, 'Tags': self.tags.get(SecretId, [])}
+
+    def update_secret(self, SecretId, SecretString, **_):
+        """ Updates one secret """
+        self.calls += 1
+        if SecretId in self.deleted:
+            raise ClientError({'Error': {'Code': 'InvalidRequestException', 'Message': 'You can\'t perform this '
+                                         'operation on the secret because it was marked for deletion.'}},
+                              'UpdateSecret')
+        if SecretId not in self.secrets:
+            raise not_found_error('UpdateSecret')
+        self.secrets[SecretId] = SecretString
+        return {'ARN': SecretId, 'VersionId': f'{SecretId}-v{self.calls}'}
+
+    def create_secret(self, Name, SecretString, Tags=None, **_):
+        """ Creates one secret """
+        self.calls += 1
+        self.secrets[Name] = SecretString
+        self.tags[Name] = Tags or []
+        return {'ARN': Name, 'VersionId': f'{Name}-v{self.calls}'}
+
+    def tag_resource(self, SecretId, Tags):
+        """ Adds or replaces tags of one secret """
+        self.calls += 1
+        keys = [tag['Key'] for tag in Tags]
+        self.tags[SecretId] = [tag for tag in self.tags.get(SecretId, []) if tag['Key'] not in keys] + Tags
+
+    def delete_secret(self, SecretId, RecoveryWindowInDays):
+        """ Schedules the deletion of one secret, which is then not listed """
+        self.calls += 1
+        assert RecoveryWindowInDays == Secret.SHARD_RECOVERY_WINDOW_DAYS
+        self.deleted[SecretId] = self.secrets.pop(SecretId)
+
+    def restore_secret(self, SecretId):
+        """ Cancels the deletion of one secret """
+        self.calls += 1
+        self.secrets[SecretId] = self.deleted.pop(SecretId)
+
+@pytest.mark.parametrize('count', [0, 10, 5000])
+def test_secret_benchmark_many_secrets(secret, count):
+    """ Existence check and put cost a constant number of API calls, however many secrets there are """
+    client = ManySecretsClient(count)
+    secret.secretsmanager_client = client
+
+    snapshot = time.perf_counter()
     assert not secret.exists()
+    assert client.calls == 1
+    secret.put(SECRET_STRING)
+    assert client.calls == 3
+    assert secret.exists()
+    assert client.calls == 4
+    secret.put(SECRET_STRING)
+    assert client.calls == 6
+    elapsed = time.perf_counter() - snapshot
+
+    # A full scan of the account, as previously needed, costs a call per page of secrets
+    pages = 0
+    request = {}
+    while True:
+        response = client.list_secrets(**request)
+        pages += 1
+        if 'NextToken' not in response:
+            break
+        request['NextToken'] = response['NextToken']
+    print(f'{count} secrets: 6 calls in {elapsed * 1000:.2f} ms, versus {pages} calls to scan the account once')
+    assert pages == max(1, -(-(count + 1) // ManySecretsClient.PAGE_SIZE))
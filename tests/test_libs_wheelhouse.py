@@ -0,0 +1,69 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the libs.wheelhouse module
+"""
+import json
+import os
+import subprocess
+import pytest
+from libs.wheelhouse import Wheelhouse, MARKER_FILE, PLATFORMS, PYTHON_VERSIONS
+
+@pytest.fixture(name='requirements')
+def fixture_requirements(tmp_path):
+    """ A requirements file """
+    requirements = tmp_path / 'requirements.txt'
+    requirements.write_text('awsiotsdk==1.22.1\n', encoding='utf-8')
+    return requirements
+
+def fake_download(command, check):
+    """ Pretend to download a wheel for the platform into the destination directory """
+    assert check
+    destination = command[command.index('--dest') + 1]
+    platform = command[command.index('--platform') + 1]
+    with open(os.path.join(destination, f'awscrt-{platform}.whl'), 'wb') as wheel:
+        wheel.write(b'wheel')
+
+def test_build_downloads_each_target(mocker, requirements, tmp_path):
+    """ Wheels are downloaded for every platform and Python version, into a directory named by the key """
+    run = mocker.patch('subprocess.run', side_effect=fake_download)
+    wheelhouse = Wheelhouse(str(requirements), str(tmp_path / 'cache'))
+    directory = wheelhouse.build()
+
+    assert directory == str(tmp_path / 'cache' / wheelhouse.key())
+    assert run.call_count == len(PLATFORMS) * len(PYTHON_VERSIONS)
+    assert sorted(os.listdir(directory)) == sorted([MARKER_FILE] + [f'awscrt-{platform}.whl' for platform in PLATFORMS])
+    assert {call.args[0][call.args[0].index('--python-version') + 1] for call in run.call_args_list} ==\
+        {'3.8', '3.9', '3.10', '3.11'}
+    command = run.call_args.args[0]
+    assert command[command.index('-r') + 1] == str(requirements)
+    assert '--only-binary=:all:' in command
+
+def test_build_reuses_cache(mocker, requirements, tmp_path):
+    """ A wheelhouse for unchanged requirements is reused, unless reuse is turned off """
+    run = mocker.patch('subprocess.run', side_effect=fake_download)
+    Wheelhouse(str(requirements), str(tmp_path / 'cache')).build()
+    run.reset_mock()
+
+    Wheelhouse(str(requirements), str(tmp_path / 'cache')).build()
+    run.assert_not_called()
+
+    Wheelhouse(str(requirements), str(tmp_path / 'cache')).build(reuse=False)
+    assert run.call_count == len(PLATFORMS) * len(PYTHON_VERSIONS)
+
+def test_build_after_requirements_change(mocker, requirements, tmp_path):
+    """ Changed requirements give a new wheelhouse """
+    mocker.patch('subprocess.run', side_effect=fake_download)
+    first = Wheelhouse(str(requirements), str(tmp_path / 'cache')).build()
+    requirements.write_text('awsiotsdk==1.23.0\n', encoding='utf-8')
+    second = Wheelhouse(str(requirements), str(tmp_path / 'cache')).build()
+    assert first != second
+
+def test_build_records_missing_targets(mocker, requirements, tmp_path):
+    """ A target without wheels does not fail the build, and is recorded as missing """
+    mocker.patch('subprocess.run', side_effect=subprocess.CalledProcessError(1, 'pip'))
+    directory = Wheelhouse(str(requirements), str(tmp_path / 'cache')).build()
+
+    with open(os.path.join(directory, MARKER_FILE), encoding='utf-8') as marker:
+        assert len(json.load(marker)['missing']) == len(PLATFORMS) * len(PYTHON_VERSIONS)
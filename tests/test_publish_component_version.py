@@ -0,0 +1,67 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the publish_component_version.py script
+"""
+import json
+import runpy
+import shutil
+import sys
+import pytest
+
+NAME = 'FooBar'
+VERSION = '1.0.0'
+
+@pytest.fixture(name='publisher')
+def fixture_publisher(tmp_path, monkeypatch, mocker):
+    """ Run in a project with a build in two regions, with the GDK configuration and publisher mocked """
+    (tmp_path / 'greengrass-build' / 'artifacts' / NAME / VERSION).mkdir(parents=True)
+    (tmp_path / 'greengrass-build' / 'artifacts' / NAME / VERSION / 'home-assistant-runtime-a.zip').write_bytes(b'zip')
+    monkeypatch.chdir(tmp_path)
+    sys.argv[1:] = ['--summary', 'summary.json']
+
+    gdk_config = mocker.patch('libs.gdk_config.GdkConfig').return_value
+    gdk_config.name.return_value = NAME
+    gdk_config.version.return_value = VERSION
+    gdk_config.region.return_value = 'us-east-1'
+    gdk_config.replica_regions.return_value = ['eu-west-1']
+    mocker.patch('libs.aws.aws_clients.account_id', return_value='000011112222')
+    return mocker.patch('libs.publisher.Publisher')
+
+def run():
+    """ Run the script, returning its exit code """
+    try:
+        runpy.run_module('publish_component_version')
+    except SystemExit as e:
+        return e.code
+    return 0
+
+def test_publish(publisher, tmp_path, capsys):
+    """ Every region is published to, with the single region recipe where no regional recipe was rendered """
+    publisher.return_value.publish.return_value = {'region': 'any', 'status': 'DEPLOYABLE', 'artifacts': 1,
+                                                   'uploaded': 1, 'elapsed': 1.0}
+    assert run() == 0
+
+    assert sorted(call.args[1] for call in publisher.call_args_list) == ['eu-west-1', 'us-east-1']
+    publish_args = {call.args for call in publisher.return_value.publish.call_args_list}
+    assert publish_args == {('greengrass-build/recipes/recipe.yaml', f'greengrass-build/artifacts/{NAME}/{VERSION}/')}
+    assert len(json.loads((tmp_path / 'summary.json').read_text(encoding='utf-8'))['regions']) == 2
+    assert 'DEPLOYABLE' in capsys.readouterr().out
+
+def test_publish_failure(publisher, tmp_path):
+    """ A failure in one region does not stop the others, and exits abruptly at the end """
+    publisher.side_effect = lambda _, region, account: publisher.return_value if region == 'us-east-1' else 1 / 0
+    publisher.return_value.publish.return_value = {'region': 'us-east-1', 'status': 'EXISTS', 'artifacts': 1,
+                                                   'uploaded': 0, 'elapsed': 0.5}
+    assert run() == 1
+
+    regions = json.loads((tmp_path / 'summary.json').read_text(encoding='utf-8'))['regions']
+    assert regions[0]['status'] == 'EXISTS'
+    assert regions[1] == {'region': 'eu-west-1', 'status': 'FAILED', 'error': 'division by zero'}
+
+def test_publish_no_build(publisher, tmp_path):
+    """ Nothing is published without a build """
+    shutil.rmtree(tmp_path / 'greengrass-build')
+    assert run() == 1
+    publisher.assert_not_called()
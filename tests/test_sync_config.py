@@ -0,0 +1,75 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Unit tests for the sync_config.py script
+"""
+import json
+import os
+import runpy
+import sys
+import pytest
+from libs.archive import ArtifactLayers
+
+REGION = 'foobar'
+THING_NAME = 'MyCoreDevice'
+
+@pytest.fixture(name='client')
+def fixture_client(tmp_path, monkeypatch, mocker):
+    """ Run in a project with a configuration and a build of it, with the AWS clients mocked """
+    (tmp_path / 'artifacts' / 'config').mkdir(parents=True)
+    (tmp_path / 'artifacts' / 'config' / 'automations.yaml').write_bytes(b'automation: []\n')
+    (tmp_path / '.build-cache' / 'archives').mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    ArtifactLayers('artifacts/').build('build', '1.0.0')
+
+    mocker.patch('libs.gdk_config.GdkConfig.__init__', return_value=None)
+    mocker.patch('libs.gdk_config.GdkConfig.region', return_value=REGION)
+    client = mocker.patch('libs.aws.aws_clients.client')
+    client.return_value.describe_endpoint.return_value = {'endpointAddress': 'abc-ats.iot.foobar.amazonaws.com'}
+    return client
+
+def run(*arguments):
+    """ Run the script, returning its exit code """
+    sys.argv[1:] = [THING_NAME, *arguments]
+    try:
+        runpy.run_module('sync_config')
+    except SystemExit as e:
+        return e.code
+    return 0
+
+def published(client):
+    """ Get the config deltas published """
+    return [json.loads(call.kwargs['payload']) for call in client.return_value.publish.call_args_list]
+
+def test_sync_config(client, tmp_path):
+    """ Only changes since the last build, and then since the last sync, are published """
+    assert run() == 0
+    (tmp_path / 'artifacts' / 'config' / 'automations.yaml').write_bytes(b'automation: [1]\n')
+    assert run('--dry-run') == 0
+    client.return_value.publish.assert_not_called()
+
+    assert run() == 0
+    client.assert_any_call('iot-data', REGION, endpoint_url='https://abc-ats.iot.foobar.amazonaws.com')
+    assert client.return_value.publish.call_args.kwargs['topic'] == 'homeassistant/MyCoreDevice/config'
+    delta = published(client)[0]
+    assert list(delta['envelope']['files']) == ['automations.yaml'] and list(delta['base']) == ['automations.yaml']
+
+    # The next sync compares with the configuration synced
+    (tmp_path / 'artifacts' / 'config' / 'scenes.yaml').write_bytes(b'scene: []\n')
+    assert run() == 0
+    assert list(published(client)[1]['envelope']['files']) == ['scenes.yaml']
+    assert published(client)[1]['sequence'] > delta['sequence']
+
+def test_sync_config_fails(client, tmp_path):
+    """ There must be a build to compare with, the delta must fit in a message and publishing must succeed """
+    (tmp_path / '.build-cache' / 'archives' / 'last_build.json').unlink()
+    assert run() == 1
+    (tmp_path / 'artifacts' / 'config' / 'large.bin').write_bytes(os.urandom(200 * 1024))
+    assert run('--force') == 1
+    client.return_value.publish.assert_not_called()
+
+    (tmp_path / 'artifacts' / 'config' / 'large.bin').unlink()
+    client.return_value.publish.side_effect = Exception('Denied')
+    assert run('--force', '--restart') == 1
+    assert published(client)[0]['restart'] and 'base' not in published(client)[0]